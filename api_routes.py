@@ -4,11 +4,25 @@ from flask import Blueprint, jsonify, request, session
 from datetime import datetime, timedelta
 import json
 
+from etag_cache import versionado
+
 # Criar blueprint para API
 api = Blueprint('api', __name__, url_prefix='/api')
 
+def usuario_api():
+    """user_id autenticado: token JWT (app Android) ou sessão (web)"""
+    if request.headers.get('Authorization'):
+        from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+        try:
+            verify_jwt_in_request()
+            return int(get_jwt_identity())
+        except Exception:
+            return None
+    return session.get('user_id')
+
 # ========== DASHBOARD API ==========
 @api.route('/dashboard')
+@versionado(diario=True)
 def api_dashboard():
     """API endpoint para dados do dashboard"""
     # Importações dinâmicas para evitar importação circular
@@ -109,11 +123,11 @@ def api_dashboard():
 
 # ========== PRODUTOS API ==========
 @api.route('/produtos')
+@versionado()
 def api_produtos():
     """API endpoint para listar produtos"""
     # Importações dinâmicas para evitar importação circular
-    from app import db
-    from app import Produto
+    from list_query import list_page
     
     try:
         # Verificar autenticação
@@ -124,23 +138,12 @@ def api_produtos():
             }), 401
         
         user_id = session['user_id']
-        produtos = Produto.query.filter_by(user_id=user_id).all()
+        pagina = list_page('produtos', request.args, user_id, serializador='produto')
         
         return jsonify({
             'success': True,
-            'data': [
-                {
-                    'id': produto.id,
-                    'nome': produto.nome,
-                    'descricao': produto.descricao,
-                    'preco': float(produto.preco),
-                    'estoque_atual': produto.estoque_atual,
-                    'estoque_minimo': produto.estoque_minimo,
-                    'categoria': produto.categoria,
-                    'codigo_barras': produto.codigo_barras,
-                    'created_at': produto.created_at.isoformat() if produto.created_at else None
-                } for produto in produtos
-            ]
+            'data': pagina.items,
+            'pagination': pagina.as_dict()
         })
     except Exception as e:
         return jsonify({
@@ -149,6 +152,7 @@ def api_produtos():
         }), 500
 
 @api.route('/produtos/<int:produto_id>')
+@versionado()
 def api_produto(produto_id):
     """API endpoint para produto específico"""
     # Importações dinâmicas para evitar importação circular
@@ -194,11 +198,11 @@ def api_produto(produto_id):
 
 # ========== CLIENTES API ==========
 @api.route('/clientes')
+@versionado()
 def api_clientes():
     """API endpoint para listar clientes"""
     # Importações dinâmicas para evitar importação circular
-    from app import db
-    from app import Cliente
+    from list_query import list_page
     
     try:
         # Verificar autenticação
@@ -209,20 +213,12 @@ def api_clientes():
             }), 401
         
         user_id = session['user_id']
-        clientes = Cliente.query.filter_by(user_id=user_id).all()
+        pagina = list_page('clientes', request.args, user_id, serializador='cliente')
         
         return jsonify({
             'success': True,
-            'data': [
-                {
-                    'id': cliente.id,
-                    'nome': cliente.nome,
-                    'email': cliente.email,
-                    'telefone': cliente.telefone,
-                    'endereco': cliente.endereco,
-                    'created_at': cliente.created_at.isoformat() if cliente.created_at else None
-                } for cliente in clientes
-            ]
+            'data': pagina.items,
+            'pagination': pagina.as_dict()
         })
     except Exception as e:
         return jsonify({
@@ -232,11 +228,11 @@ def api_clientes():
 
 # ========== VENDAS API ==========
 @api.route('/vendas')
+@versionado()
 def api_vendas():
     """API endpoint para listar vendas"""
     # Importações dinâmicas para evitar importação circular
-    from app import db
-    from app import Venda
+    from list_query import list_page
     
     try:
         # Verificar autenticação
@@ -247,24 +243,87 @@ def api_vendas():
             }), 401
         
         user_id = session['user_id']
-        vendas = Venda.query.filter_by(user_id=user_id)\
-            .order_by(Venda.data_venda.desc())\
-            .all()
+        pagina = list_page('vendas', request.args, user_id, serializador='venda')
         
         return jsonify({
             'success': True,
-                'data': [
-                    {
-                        'id': venda.id,
-                        'cliente_id': venda.cliente_id,
-                        'cliente_nome': venda.cliente.nome if venda.cliente else 'Cliente não informado',
-                        'valor_total': float(venda.valor_total),
-                        'valor_final': float(venda.valor_final),
-                        'data_venda': venda.data_venda.isoformat(),
-                        'status': venda.status,
-                        'forma_pagamento': venda.forma_pagamento
-                    } for venda in vendas
-                ]
+            'data': pagina.items,
+            'pagination': pagina.as_dict()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# ========== BUSCA API ==========
+@api.route('/busca')
+@versionado(usuario=usuario_api)
+def api_busca():
+    """Busca ranqueada (sem acentos, por prefixo) de produtos, clientes ou fornecedores"""
+    # Importações dinâmicas para evitar importação circular
+    from busca import buscar, INDICES, LIMITE_PADRAO
+    
+    try:
+        # Verificar autenticação (JWT ou sessão)
+        user_id = usuario_api()
+        if user_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'Não autenticado'
+            }), 401
+        
+        tipo = request.args.get('tipo') or 'produtos'
+        try:
+            limite = int(request.args.get('limite') or LIMITE_PADRAO)
+        except ValueError:
+            limite = None
+        if tipo not in INDICES or limite is None:
+            return jsonify({
+                'success': False,
+                'error': f"Parâmetros inválidos (tipo: {', '.join(INDICES)}; limite numérico)"
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': buscar(tipo, request.args.get('q') or '', user_id, limite)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# ========== SINCRONIZAÇÃO INCREMENTAL API ==========
+@api.route('/sync')
+def api_sync():
+    """Alterações desde o cursor (delta-sync) de várias entidades em uma resposta"""
+    # Importações dinâmicas para evitar importação circular
+    from sync_delta import delta, parse_tipos, resposta, SyncError, DEFAULT_LIMITE
+    
+    try:
+        # Verificar autenticação (JWT ou sessão)
+        user_id = usuario_api()
+        if user_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'Não autenticado'
+            }), 401
+        
+        try:
+            tipos = parse_tipos(request.args.get('tipos'))
+            limite = int(request.args.get('limite') or DEFAULT_LIMITE)
+        except (SyncError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        dados = delta(user_id, tipos, request.args.get('cursor'), limite)
+        return resposta({
+            'success': True,
+            'data': dados['alteracoes'],
+            'sync': {chave: dados[chave] for chave in ('cursor', 'has_more', 'reset')}
         })
     except Exception as e:
         return jsonify({
@@ -315,6 +374,7 @@ def api_auth_me():
 
 # ========== ESTATÍSTICAS API ==========
 @api.route('/stats')
+@versionado()
 def api_stats():
     """API endpoint para estatísticas gerais"""
     # Importações dinâmicas para evitar importação circular
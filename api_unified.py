@@ -9,6 +9,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_tok
 from datetime import datetime, timedelta
 import json
 
+from etag_cache import versionado
+
 # Criar blueprint unificado para API
 api = Blueprint('api', __name__, url_prefix='/api')
 
@@ -55,6 +57,7 @@ def get_current_user_id():
 # ========== DASHBOARD API ==========
 @api.route('/dashboard')
 @require_auth
+@versionado(diario=True, usuario=get_current_user_id)
 def api_dashboard():
     """API endpoint para dados do dashboard"""
     from app import db
@@ -148,6 +151,7 @@ def api_dashboard():
 # ========== PRODUTOS API ==========
 @api.route('/produtos', methods=['GET', 'POST'])
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_produtos():
     """API endpoint para CRUD de produtos"""
     from app import db
@@ -158,23 +162,12 @@ def api_produtos():
         
         if request.method == 'GET':
             # Listar produtos
-            produtos = Produto.query.filter_by(user_id=user_id).all()
+            import query_shapes
+            produtos = query_shapes.listar('produto', Produto.query.filter_by(user_id=user_id))
             
             return jsonify({
                 'success': True,
-                'data': [
-                    {
-                        'id': produto.id,
-                        'nome': produto.nome,
-                        'descricao': produto.descricao,
-                        'preco': float(produto.preco),
-                        'estoque_atual': produto.estoque_atual,
-                        'estoque_minimo': produto.estoque_minimo,
-                        'categoria': produto.categoria,
-                        'codigo_barras': produto.codigo_barras,
-                        'created_at': produto.created_at.isoformat() if produto.created_at else None
-                    } for produto in produtos
-                ]
+                'data': produtos
             })
         
         elif request.method == 'POST':
@@ -212,6 +205,7 @@ def api_produtos():
 
 @api.route('/produtos/<int:produto_id>', methods=['GET', 'PUT', 'DELETE'])
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_produto(produto_id):
     """API endpoint para operações específicas de produto"""
     from app import db
@@ -286,6 +280,7 @@ def api_produto(produto_id):
 # ========== CLIENTES API ==========
 @api.route('/clientes', methods=['GET', 'POST'])
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_clientes():
     """API endpoint para CRUD de clientes"""
     from app import db
@@ -296,20 +291,12 @@ def api_clientes():
         
         if request.method == 'GET':
             # Listar clientes
-            clientes = Cliente.query.filter_by(user_id=user_id).all()
+            import query_shapes
+            clientes = query_shapes.listar('cliente', Cliente.query.filter_by(user_id=user_id))
             
             return jsonify({
                 'success': True,
-                'data': [
-                    {
-                        'id': cliente.id,
-                        'nome': cliente.nome,
-                        'email': cliente.email,
-                        'telefone': cliente.telefone,
-                        'endereco': cliente.endereco,
-                        'created_at': cliente.created_at.isoformat() if cliente.created_at else None
-                    } for cliente in clientes
-                ]
+                'data': clientes
             })
         
         elif request.method == 'POST':
@@ -344,6 +331,7 @@ def api_clientes():
 
 @api.route('/clientes/<int:cliente_id>', methods=['GET', 'PUT', 'DELETE'])
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_cliente(cliente_id):
     """API endpoint para operações específicas de cliente"""
     from app import db
@@ -412,6 +400,7 @@ def api_cliente(cliente_id):
 # ========== VENDAS API ==========
 @api.route('/vendas', methods=['GET', 'POST'])
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_vendas():
     """API endpoint para CRUD de vendas"""
     from app import db
@@ -421,31 +410,49 @@ def api_vendas():
         user_id = get_current_user_id()
         
         if request.method == 'GET':
-            # Listar vendas
-            vendas = Venda.query.filter_by(user_id=user_id)\
-                .order_by(Venda.data_venda.desc())\
-                .all()
+            # Listar vendas (colunas + nome do cliente em um outer join, sem N+1)
+            import query_shapes
+            vendas = query_shapes.listar('venda', Venda.query.filter_by(user_id=user_id)
+                                         .order_by(Venda.data_venda.desc()))
             
             return jsonify({
                 'success': True,
-                'data': [
-                    {
-                        'id': venda.id,
-                        'cliente_id': venda.cliente_id,
-                        'cliente_nome': venda.cliente.nome if venda.cliente else 'Cliente não informado',
-                        'valor_total': float(venda.valor_total),
-                        'valor_final': float(venda.valor_final),
-                        'data_venda': venda.data_venda.isoformat(),
-                        'status': venda.status,
-                        'forma_pagamento': venda.forma_pagamento
-                    } for venda in vendas
-                ]
+                'data': vendas
             })
         
         elif request.method == 'POST':
             # Criar venda
             data = request.get_json()
             
+            if data.get('itens'):
+                # Venda com itens: checkout com baixa de estoque
+                from checkout import registrar_venda, parse_json_items, CheckoutError, EstoqueInsuficiente
+                try:
+                    venda = registrar_venda(
+                        user_id,
+                        parse_json_items(data['itens']),
+                        cliente_id=data.get('cliente_id'),
+                        forma_pagamento=data.get('forma_pagamento', 'dinheiro'),
+                        observacoes=data.get('observacoes'),
+                        cupom_codigo=data.get('cupom_codigo'),
+                    )
+                except CheckoutError as e:
+                    return jsonify({
+                        'success': False,
+                        'error': str(e)
+                    }), 409 if isinstance(e, EstoqueInsuficiente) else 400
+                
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'id': venda.id,
+                        'cliente_id': venda.cliente_id,
+                        'valor_total': float(venda.valor_total),
+                        'valor_final': float(venda.valor_final),
+                        'message': 'Venda criada com sucesso'
+                    }
+                }), 201
+            
             venda = Venda(
                 cliente_id=data.get('cliente_id'),
                 valor_total=float(data.get('valor_total', 0)),
@@ -514,6 +521,7 @@ def api_auth_me():
 # ========== ESTATÍSTICAS API ==========
 @api.route('/stats')
 @require_auth
+@versionado(usuario=get_current_user_id)
 def api_stats():
     """API endpoint para estatísticas gerais"""
     from app import db
@@ -545,35 +553,32 @@ def api_stats():
 @api.route('/cep/<string:cep>')
 def api_cep(cep):
     """API para buscar dados do CEP"""
-    import requests
+    from cep_service import consultar, CepIndisponivel
     
     try:
-        # Usar API ViaCEP
-        response = requests.get(f'https://viacep.com.br/ws/{cep}/json/')
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'erro' not in data:
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'cep': data.get('cep'),
-                        'logradouro': data.get('logradouro'),
-                        'bairro': data.get('bairro'),
-                        'localidade': data.get('localidade'),
-                        'uf': data.get('uf')
-                    }
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'CEP não encontrado'
-                }), 404
+        # Cache local / dataset offline; ViaCEP só na falta (timeout e circuit breaker)
+        data = consultar(cep)
+        if data:
+            return jsonify({
+                'success': True,
+                'data': {
+                    'cep': data.get('cep'),
+                    'logradouro': data.get('logradouro'),
+                    'bairro': data.get('bairro'),
+                    'localidade': data.get('cidade'),
+                    'uf': data.get('uf')
+                }
+            })
         else:
             return jsonify({
                 'success': False,
-                'error': 'Erro ao buscar CEP'
-            }), 500
+                'error': 'CEP não encontrado'
+            }), 404
+    except CepIndisponivel:
+        return jsonify({
+            'success': False,
+            'error': 'Serviço de CEP indisponível no momento'
+        }), 503
             
     except Exception as e:
         return jsonify({
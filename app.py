@@ -1,8 +1,7 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, Blueprint
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, Blueprint, send_file
 from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_caching import Cache
 from flask_oauthlib.client import OAuth
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -135,28 +134,11 @@ def format_cpf_cnpj(doc):
     return doc
 
 def get_cep_data(cep):
-    """Busca dados do CEP via API"""
+    """Busca dados do CEP (cache local, dataset offline ou ViaCEP; ver cep_service)"""
+    from cep_service import consultar, CepIndisponivel
     try:
-        # Remove caracteres não numéricos
-        cep = re.sub(r'[^0-9]', '', cep)
-        
-        if len(cep) != 8:
-            return None
-        
-        # Usa a API ViaCEP
-        response = requests.get(f'https://viacep.com.br/ws/{cep}/json/', timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'erro' not in data:
-                return {
-                    'logradouro': data.get('logradouro', ''),
-                    'bairro': data.get('bairro', ''),
-                    'cidade': data.get('localidade', ''),
-                    'uf': data.get('uf', ''),
-                    'cep': data.get('cep', '')
-                }
-    except Exception as e:
+        return consultar(cep)
+    except CepIndisponivel as e:
         print(f"Erro ao buscar CEP: {e}")
     
     return None
@@ -227,15 +209,15 @@ def datetime_filter(value, fmt='short'):
 app.jinja_env.filters['datetime'] = datetime_filter
 migrate = Migrate(app, db)
 
-# Configuração do Cache
-try:
-    cache = Cache(app, config={
-        'CACHE_TYPE': 'simple',  # Para desenvolvimento, use 'redis' em produção
-        'CACHE_DEFAULT_TIMEOUT': 300  # 5 minutos
-    })
-except Exception as e:
-    print(f"AVISO: Erro ao configurar cache: {e}")
-    cache = None
+# Configuração do Cache (CACHE_STORE_URL: Redis compartilhado entre workers; sem ele,
+# memória por processo com resultados guardados só por CACHE_LOCAL_TTL)
+from app_cache import cache, chave_args, register_cache_invalidation
+from etag_cache import versionado
+cache.init_app(app)
+
+# Latência, SQL por rota e N+1 (/metrics); antes dos demais hooks para medir tudo
+from instrumentation import instrumentation
+instrumentation.init_app(app)
 
 # ========== CONFIGURAÇÕES DE SEGURANÇA APRIMORADAS ==========
 
@@ -311,13 +293,17 @@ try:
         key_func=get_remote_address,
         # Em desenvolvimento, desabilita limites globais; em produção, aumenta tolerância e habilita cabeçalhos
         default_limits=[] if dev_mode else ["1000 per day", "200 per hour", "40 per minute"],
-        storage_uri="memory://",
+        storage_uri=app.config.get('RATELIMIT_STORAGE_URL', 'memory://'),
         headers_enabled=True
     )
 except Exception as e:
     print(f"AVISO: Erro ao configurar Rate Limiting: {e}")
     limiter = None
 
+# A coleta do Prometheus (a cada 15s) passaria do limite por hora
+if limiter:
+    limiter.exempt(app.view_functions['metrics'])
+
 # Configuração JWT para Mobile
 try:
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', secrets.token_hex(32))
@@ -359,17 +345,19 @@ app.config.update(
 @app.context_processor
 def inject_user_settings():
     uid = session.get('user_id')
+    # Mesmo Principal usado por login_required/require_plan nesta requisição
+    principal = get_principal(uid) if uid else None
     try:
-        settings = get_user_settings(uid) if uid else None
+        settings = principal.settings if principal else None
     except Exception:
         settings = None
     is_admin_flag = (session.get('role') == 'admin')
     try:
-        feature_reports = has_feature(uid, 'reports') if uid else False
+        feature_reports = principal.has_feature('reports') if principal else False
     except Exception:
         feature_reports = False
     try:
-        effective_plan_tier = get_plan_tier_for_user(uid) if uid else 'free'
+        effective_plan_tier = principal.plan_tier if principal else 'free'
     except Exception:
         effective_plan_tier = 'free'
     return dict(user_settings=settings, is_admin_flag=is_admin_flag, feature_reports=feature_reports, effective_plan_tier=effective_plan_tier)
@@ -406,7 +394,7 @@ def login_required(f):
             return redirect(url_for('auth.login'))
         # Enforce sessão única
         try:
-            user = User.query.get(session.get('user_id'))
+            user = get_principal(session.get('user_id')).user
             sess_token = session.get('active_session_id')
             if user and user.active_session_id and sess_token != user.active_session_id:
                 flash('Sua sessão foi substituída por um novo login. Faça login novamente.', 'warning')
@@ -470,6 +458,7 @@ def update_user_settings(user_id, **kwargs):
 
 # ===== Plano: helpers de recursos e cotas =====
 from plans import get_plan_tier_for_user, has_feature, require_plan, check_quota_exceeded, PLAN_FEATURES
+from principal import get_principal, register_plan_cache_invalidation
 
 # Helper de autorização
 def is_admin():
@@ -712,21 +701,28 @@ class AuditLog(db.Model):
     changes = db.Column(db.Text, nullable=True)  # JSON de mudanças
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
-def log_audit(user_id: int, entidade: str, entidade_id: int, acao: str, changes: dict | None = None):
+def log_audit(user_id: int, entidade: str, entidade_id: int, acao: str, changes: dict | None = None,
+              commit: bool = True):
+    """Registra a auditoria.
+
+    commit=False adiciona o registro à transação em curso; caso contrário o
+    evento vai para o audit_writer (gravação em lote), ou é gravado na hora
+    com AUDIT_ASYNC desligado.
+    """
+    from audit_writer import build_audit_event, audit_writer
     try:
-        user = User.query.get(user_id)
-        empresa_id = getattr(user, 'empresa_id', None) if user else None
-        payload = AuditLog(
-            user_id=user_id,
-            empresa_id=empresa_id,
-            entidade=entidade,
-            entidade_id=entidade_id,
-            acao=acao,
-            changes=json.dumps(changes or {})
-        )
-        db.session.add(payload)
-        db.session.commit()
+        evento = build_audit_event(user_id, entidade, entidade_id, acao, json.dumps(changes or {}))
+        if not commit:
+            db.session.add(AuditLog(**evento))
+        elif app.config.get('AUDIT_ASYNC'):
+            audit_writer.submit(evento)
+        else:
+            db.session.add(AuditLog(**evento))
+            db.session.commit()
     except Exception as e:
+        if not commit:
+            # Erros aqui devem desfazer a operação auditada junto
+            raise
         try:
             db.session.rollback()
         except Exception:
@@ -772,10 +768,19 @@ class Produto(db.Model):
     preco_compra = db.Column(db.Float)
     prazo_entrega = db.Column(db.String(50))
     observacoes_fornecedor = db.Column(db.Text)
+
+    # Snapshot da última venda finalizada (mantido pelo checkout; ver inventory_analytics)
+    ultima_venda_em = db.Column(db.DateTime, nullable=True)
     
     # Relacionamentos
     itens_venda = db.relationship('ItemVenda', backref='produto', lazy=True)
 
+    # Listagem paginada por (nome, id) dentro do tenant; produtos parados por última venda
+    __table_args__ = (
+        db.Index('ix_produto_user_nome', 'user_id', 'nome', 'id'),
+        db.Index('ix_produto_user_ultima_venda', 'user_id', 'ultima_venda_em'),
+    )
+
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
@@ -811,6 +816,9 @@ class Cliente(db.Model):
     # Relacionamentos
     vendas = db.relationship('Venda', backref='cliente', lazy=True)
 
+    # Listagem paginada por (nome, id) dentro do tenant
+    __table_args__ = (db.Index('ix_cliente_user_nome', 'user_id', 'nome', 'id'),)
+
 class Venda(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     data_venda = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -827,13 +835,19 @@ class Venda(db.Model):
     # Relacionamentos
     itens = db.relationship('ItemVenda', backref='venda', lazy=True, cascade='all, delete-orphan')
 
+    # Listagem paginada por (data_venda, id) dentro do tenant
+    __table_args__ = (db.Index('ix_venda_user_data', 'user_id', 'data_venda', 'id'),)
+
 class ItemVenda(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quantidade = db.Column(db.Integer, nullable=False)
     preco_unitario = db.Column(db.Float, nullable=False)
     subtotal = db.Column(db.Float, nullable=False)
     venda_id = db.Column(db.Integer, db.ForeignKey('venda.id'), nullable=False)
-    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
+
+    # Agregações por produto a partir das vendas (cobre produto_id e quantidade)
+    __table_args__ = (db.Index('ix_item_venda_venda_produto', 'venda_id', 'produto_id', 'quantidade'),)
 
 # Caixa: sessão de caixa diária
 class CaixaSessao(db.Model):
@@ -847,8 +861,24 @@ class CaixaSessao(db.Model):
     observacoes_fechamento = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
+    # Contadores mantidos a cada movimento/venda (caixa_contadores)
+    total_entradas = db.Column(db.Float, default=0.0, nullable=False)
+    total_saidas = db.Column(db.Float, default=0.0, nullable=False)
+    qtd_movimentos = db.Column(db.Integer, default=0, nullable=False)
+    vendas_qtd = db.Column(db.Integer, default=0, nullable=False)  # vendas finalizadas com a sessão aberta
+    vendas_total = db.Column(db.Float, default=0.0, nullable=False)
+    vendas_dinheiro = db.Column(db.Float, default=0.0, nullable=False)
+    vendas_cartao = db.Column(db.Float, default=0.0, nullable=False)
+    vendas_pix = db.Column(db.Float, default=0.0, nullable=False)
+    vendas_boleto = db.Column(db.Float, default=0.0, nullable=False)
+    vendas_transferencia = db.Column(db.Float, default=0.0, nullable=False)
+    reconciliado_em = db.Column(db.DateTime, nullable=True)  # última conferência com as tabelas
+
     movimentos = db.relationship('MovimentoCaixa', backref='sessao', lazy=True, cascade='all, delete-orphan')
 
+    # Sessão aberta do usuário (consultada a cada atualização do PDV)
+    __table_args__ = (db.Index('ix_caixa_sessao_user_status', 'user_id', 'status', 'data_abertura'),)
+
 class MovimentoCaixa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -944,6 +974,9 @@ class Compra(db.Model):
     itens = db.relationship('ItemCompra', backref='compra', lazy=True, cascade='all, delete-orphan')
     notas_fiscais = db.relationship('NotaFiscal', backref='compra', lazy=True)
 
+    # Listagem paginada por (data_compra, id) dentro do tenant
+    __table_args__ = (db.Index('ix_compra_user_data', 'user_id', 'data_compra', 'id'),)
+
 class ItemCompra(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quantidade = db.Column(db.Integer, nullable=False)
@@ -951,6 +984,7 @@ class ItemCompra(db.Model):
     subtotal = db.Column(db.Float, nullable=False)
     compra_id = db.Column(db.Integer, db.ForeignKey('compra.id'), nullable=False)
     produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    produto = db.relationship('Produto', lazy=True)
 
 class ProdutoAuxiliar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -1007,6 +1041,9 @@ class TicketSuporte(db.Model):
     anexos = db.Column(db.Text)  # JSON com paths dos anexos
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Listagem paginada por (data_abertura, id) dentro do tenant
+    __table_args__ = (db.Index('ix_ticket_suporte_user_data', 'user_id', 'data_abertura', 'id'),)
+
 class Cupom(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     codigo = db.Column(db.String(50), nullable=False, unique=True, index=True)
@@ -1026,6 +1063,20 @@ class Cupom(db.Model):
     # Relacionamentos
     vendas = db.relationship('Venda', backref='cupom', lazy=True)
 
+# Livro de resgates de cupons (um por venda); as estatísticas de uso vêm daqui
+class CupomResgate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cupom_id = db.Column(db.Integer, db.ForeignKey('cupom.id'), nullable=False)
+    venda_id = db.Column(db.Integer, db.ForeignKey('venda.id'), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    desconto = db.Column(db.Float, default=0.0, nullable=False)
+    valor_venda = db.Column(db.Float, default=0.0, nullable=False)  # valor antes do desconto
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_cupom_resgate_user_cupom', 'user_id', 'cupom_id'),
+    )
+
 class RespostaTicket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     mensagem = db.Column(db.Text, nullable=False)
@@ -1046,168 +1097,150 @@ class UserSettings(db.Model):
     plan_tier = db.Column(db.String(20), default='free', index=True)  # free | freepremium | premium
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Snapshot das estatísticas do painel administrativo por empresa
+class EmpresaStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresa.id'), nullable=False, unique=True, index=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON com todos os agregados
+    stale = db.Column(db.Boolean, default=True, nullable=False, index=True)  # marcado em escritas
+    computed_at = db.Column(db.DateTime, nullable=True)
+
+# Exportação executada em segundo plano (export_jobs)
+class ExportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)  # vendas | produtos | clientes | caixa_sessao
+    formato = db.Column(db.String(10), nullable=False)  # csv | excel | pdf
+    params = db.Column(db.Text, nullable=True)  # JSON (ex.: sessao_id, de, ate)
+    status = db.Column(db.String(20), default='pendente', nullable=False, index=True)  # pendente | executando | concluido | erro | expirado
+    progresso = db.Column(db.Integer, default=0, nullable=False)  # 0-100
+    linhas = db.Column(db.Integer, default=0, nullable=False)
+    total_linhas = db.Column(db.Integer, nullable=True)
+    arquivo = db.Column(db.String(255), nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+# Importação CSV em preparação/execução (import_staging)
+class ImportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)  # caixa_movimentos
+    params = db.Column(db.Text, nullable=True)  # JSON (ex.: sessao_id)
+    status = db.Column(db.String(20), default='pendente', nullable=False, index=True)  # pendente | importando | concluido | erro | expirado
+    arquivo = db.Column(db.String(255), nullable=True)  # CSV enviado (IMPORT_DIR)
+    headers = db.Column(db.Text, nullable=True)  # JSON com as colunas do CSV
+    default_map = db.Column(db.Text, nullable=True)  # JSON campo -> coluna sugerida
+    total_linhas = db.Column(db.Integer, default=0, nullable=False)
+    importadas = db.Column(db.Integer, default=0, nullable=False)
+    rejeitadas = db.Column(db.Integer, default=0, nullable=False)
+    arquivo_rejeicoes = db.Column(db.String(255), nullable=True)  # CSV com linha e motivo
+    erro = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+# Cache persistente de consultas de CEP (cep_service); encontrado=False é cache negativo
+class CepCache(db.Model):
+    cep = db.Column(db.String(8), primary_key=True)  # só dígitos
+    encontrado = db.Column(db.Boolean, default=True, nullable=False)
+    logradouro = db.Column(db.String(200), nullable=True)
+    bairro = db.Column(db.String(100), nullable=True)
+    cidade = db.Column(db.String(100), nullable=True)
+    uf = db.Column(db.String(2), nullable=True)
+    origem = db.Column(db.String(20), default='viacep', nullable=False)  # viacep | dataset
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    expira_em = db.Column(db.DateTime, nullable=True, index=True)  # None: não expira (dataset)
+
+# Resumo diário de vendas/compras por usuário (resumo_diario)
+class ResumoDiario(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresa.id'), nullable=True)
+    dia = db.Column(db.Date, nullable=False)
+    semana = db.Column(db.Date, nullable=False)  # segunda-feira da semana do dia
+    mes = db.Column(db.Date, nullable=False)  # primeiro dia do mês
+    vendas_qtd = db.Column(db.Integer, default=0, nullable=False)  # vendas finalizadas
+    vendas_valor = db.Column(db.Float, default=0.0, nullable=False)
+    compras_qtd = db.Column(db.Integer, default=0, nullable=False)
+    compras_valor = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'dia', name='uq_resumo_diario_user_dia'),
+        db.Index('ix_resumo_diario_empresa_dia', 'empresa_id', 'dia'),
+    )
+
+# Registro de alterações da sincronização incremental (sync_delta): uma linha
+# por registro vivo ou removido; o id é a sequência que o cursor acompanha
+class SyncAlteracao(db.Model):
+    __tablename__ = 'sync_alteracao'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entidade = db.Column(db.String(20), nullable=False)  # produtos | clientes | fornecedores | vendas
+    registro_id = db.Column(db.Integer, nullable=False)
+    removido = db.Column(db.Boolean, default=False, nullable=False)
+    alterado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sync_alteracao_user_seq', 'user_id', 'id'),
+        db.Index('ix_sync_alteracao_registro', 'user_id', 'entidade', 'registro_id'),
+        # SQLite: ids nunca reaproveitados (a sequência só cresce)
+        {'sqlite_autoincrement': True},
+    )
+
+from empresa_stats import register_stats_invalidation, get_empresa_stats
+register_stats_invalidation(db)
+from resumo_diario import register_resumo_diario
+register_resumo_diario(db, Venda, Compra)
+from caixa_contadores import register_caixa_contadores
+register_caixa_contadores(db, MovimentoCaixa, Venda)
+from sync_delta import register_sync_delta
+register_sync_delta(db)
+register_plan_cache_invalidation(User, Empresa, UserSettings)
+register_cache_invalidation(db)
+
+from audit_writer import audit_writer
+audit_writer.init_app(app)
+
 # ========== ADMIN DATA VIEWER ==========
 @app.route('/admin')
 @admin_required
 def admin_home():
-    from datetime import datetime, timedelta
     admin_user = User.query.get(session['user_id'])
-    company_user_ids = [u.id for u in User.query.filter_by(empresa_id=admin_user.empresa_id).all()]
-    
-    # Estatísticas Gerais
-    stats = {
-        'total_usuarios': User.query.filter_by(empresa_id=admin_user.empresa_id).count(),
-        'usuarios_ativos': User.query.filter(
-            User.created_at >= datetime.now() - timedelta(days=30),
-            User.empresa_id == admin_user.empresa_id
-        ).count(),
-        'usuarios_admin': User.query.filter_by(role='admin', empresa_id=admin_user.empresa_id).count(),
-    }
-    
-    # Estatísticas de Clientes
-    clientes_stats = {
-        'total': Cliente.query.filter(Cliente.user_id.in_(company_user_ids)).count(),
-        'novos_este_mes': Cliente.query.filter(
-            Cliente.created_at >= datetime.now().replace(day=1),
-            Cliente.user_id.in_(company_user_ids)
-        ).count(),
-        'sem_vendas': db.session.query(Cliente).outerjoin(Venda).filter(
-            Cliente.user_id.in_(company_user_ids),
-            Venda.id.is_(None)
-        ).count(),
-    }
-    
-    # Estatísticas de Produtos
-    produtos_stats = {
-        'total': Produto.query.filter(Produto.user_id.in_(company_user_ids)).count(),
-        'estoque_baixo': Produto.query.filter(
-            Produto.user_id.in_(company_user_ids),
-            Produto.estoque_atual <= Produto.estoque_minimo
-        ).count(),
-        'sem_estoque': Produto.query.filter(
-            Produto.user_id.in_(company_user_ids),
-            Produto.estoque_atual == 0
-        ).count(),
-        'valor_total_estoque': db.session.query(db.func.sum(Produto.estoque_atual * Produto.preco)).filter(
-            Produto.user_id.in_(company_user_ids)
-        ).scalar() or 0,
-    }
-    
-    # Estatísticas de Vendas
-    vendas_stats = {
-        'total_vendas': Venda.query.filter(Venda.user_id.in_(company_user_ids)).count(),
-        'vendas_este_mes': Venda.query.filter(
-            Venda.user_id.in_(company_user_ids),
-            Venda.data_venda >= datetime.now().replace(day=1),
-            Venda.status == 'finalizada'
-        ).count(),
-        'faturamento_mes': db.session.query(db.func.sum(Venda.valor_total)).filter(
-            Venda.user_id.in_(company_user_ids),
-            Venda.data_venda >= datetime.now().replace(day=1),
-            Venda.status == 'finalizada'
-        ).scalar() or 0,
-        'ticket_medio': db.session.query(db.func.avg(Venda.valor_total)).filter(
-            Venda.user_id.in_(company_user_ids),
-            Venda.status == 'finalizada'
-        ).scalar() or 0,
-    }
-    
-    # Estatísticas de Fornecedores
-    fornecedores_stats = {
-        'total': Fornecedor.query.filter(Fornecedor.user_id.in_(company_user_ids)).count(),
-        'ativos': Fornecedor.query.filter(Fornecedor.user_id.in_(company_user_ids), Fornecedor.status=='ativo').count(),
-        'inativos': Fornecedor.query.filter(Fornecedor.user_id.in_(company_user_ids), Fornecedor.status=='inativo').count(),
-    }
-    
-    # Estatísticas de Compras
-    compras_stats = {
-        'total': Compra.query.filter(Compra.user_id.in_(company_user_ids)).count(),
-        'pendentes': Compra.query.filter(Compra.user_id.in_(company_user_ids), Compra.status=='pendente').count(),
-        'confirmadas': Compra.query.filter(Compra.user_id.in_(company_user_ids), Compra.status=='confirmada').count(),
-        'valor_total_pendente': db.session.query(db.func.sum(Compra.valor_total)).filter(
-            Compra.user_id.in_(company_user_ids),
-            Compra.status == 'pendente'
-        ).scalar() or 0,
-    }
-    
-    # Estatísticas de Produtos Auxiliares
-    produtos_aux_stats = {
-        'total': ProdutoAuxiliar.query.filter(ProdutoAuxiliar.user_id.in_(company_user_ids)).count(),
-        'ativos': ProdutoAuxiliar.query.filter(ProdutoAuxiliar.user_id.in_(company_user_ids), ProdutoAuxiliar.status=='ativo').count(),
-        'estoque_baixo': ProdutoAuxiliar.query.filter(
-            ProdutoAuxiliar.user_id.in_(company_user_ids),
-            ProdutoAuxiliar.estoque_atual <= ProdutoAuxiliar.estoque_minimo
-        ).count(),
-    }
-    
-    # Estatísticas de Notas Fiscais
-    notas_stats = {
-        'total': NotaFiscal.query.filter(NotaFiscal.user_id.in_(company_user_ids)).count(),
-        'pendentes': NotaFiscal.query.filter(NotaFiscal.user_id.in_(company_user_ids), NotaFiscal.status=='pendente').count(),
-        'emitidas': NotaFiscal.query.filter(NotaFiscal.user_id.in_(company_user_ids), NotaFiscal.status=='emitida').count(),
-        'valor_total': db.session.query(db.func.sum(NotaFiscal.valor_total)).filter(NotaFiscal.user_id.in_(company_user_ids)).scalar() or 0,
-    }
-    
-    # Estatísticas de Suporte
-    suporte_stats = {
-        'tickets_abertos': TicketSuporte.query.filter(TicketSuporte.user_id.in_(company_user_ids), TicketSuporte.status.in_(['aberto', 'em_andamento'])).count(),
-        'tickets_resolvidos': TicketSuporte.query.filter(TicketSuporte.user_id.in_(company_user_ids), TicketSuporte.status=='resolvido').count(),
-        'tickets_fechados': TicketSuporte.query.filter(TicketSuporte.user_id.in_(company_user_ids), TicketSuporte.status=='fechado').count(),
-        'total_respostas': RespostaTicket.query.filter(RespostaTicket.user_id.in_(company_user_ids)).count(),
-    }
+    empresa_id = admin_user.empresa_id
     
-    # Dados para gráficos
-    # Vendas dos últimos 7 dias
-    vendas_7_dias = []
-    for i in range(7):
-        data = datetime.now().date() - timedelta(days=i)
-        vendas_dia = Venda.query.filter(
-            Venda.user_id.in_(company_user_ids),
-            db.func.date(Venda.data_venda) == data,
-            Venda.status == 'finalizada'
-        ).count()
-        vendas_7_dias.append({
-            'data': data.strftime('%d/%m'),
-            'vendas': vendas_dia
-        })
-    vendas_7_dias.reverse()
-    
-    # Top 5 produtos mais vendidos
-    top_produtos = db.session.query(
-        Produto.nome,
-        db.func.sum(ItemVenda.quantidade).label('total_vendido')
-    ).join(ItemVenda).join(Venda).filter(
-        Venda.user_id.in_(company_user_ids),
-        Venda.status == 'finalizada'
-    ).group_by(Produto.id, Produto.nome).order_by(
-        db.func.sum(ItemVenda.quantidade).desc()
-    ).limit(5).all()
+    # Snapshot da empresa (1 consulta) ou cálculo ao vivo com JOIN em User.empresa_id
+    empresa_stats = get_empresa_stats(empresa_id)
     
     # Usuários recentes
-    usuarios_recentes = User.query.filter_by(empresa_id=admin_user.empresa_id).order_by(User.created_at.desc()).limit(5).all()
+    usuarios_recentes = User.query.filter_by(empresa_id=empresa_id).order_by(User.created_at.desc()).limit(5).all()
     
     # Tickets recentes
-    tickets_recentes = TicketSuporte.query.filter(TicketSuporte.user_id.in_(company_user_ids)).order_by(TicketSuporte.data_abertura.desc()).limit(5).all()
+    tickets_recentes = TicketSuporte.query.join(User, User.id == TicketSuporte.user_id).filter(
+        User.empresa_id == empresa_id
+    ).order_by(TicketSuporte.data_abertura.desc()).limit(5).all()
     # Auditoria recente
-    audit_logs_recentes = AuditLog.query.filter(AuditLog.empresa_id == admin_user.empresa_id).order_by(AuditLog.created_at.desc()).limit(10).all()
+    audit_logs_recentes = AuditLog.query.filter(AuditLog.empresa_id == empresa_id).order_by(AuditLog.created_at.desc()).limit(10).all()
     
     return render_template('admin/index.html', 
-                         stats=stats,
-                         clientes_stats=clientes_stats,
-                         produtos_stats=produtos_stats,
-                         vendas_stats=vendas_stats,
-                         fornecedores_stats=fornecedores_stats,
-                         compras_stats=compras_stats,
-                         produtos_aux_stats=produtos_aux_stats,
-                         notas_stats=notas_stats,
-                         suporte_stats=suporte_stats,
-                         vendas_7_dias=vendas_7_dias,
-                         top_produtos=top_produtos,
+                         stats=empresa_stats['stats'],
+                         clientes_stats=empresa_stats['clientes_stats'],
+                         produtos_stats=empresa_stats['produtos_stats'],
+                         vendas_stats=empresa_stats['vendas_stats'],
+                         fornecedores_stats=empresa_stats['fornecedores_stats'],
+                         compras_stats=empresa_stats['compras_stats'],
+                         produtos_aux_stats=empresa_stats['produtos_aux_stats'],
+                         notas_stats=empresa_stats['notas_stats'],
+                         suporte_stats=empresa_stats['suporte_stats'],
+                         vendas_7_dias=empresa_stats['vendas_7_dias'],
+                         top_produtos=empresa_stats['top_produtos'],
                          usuarios_recentes=usuarios_recentes,
                          tickets_recentes=tickets_recentes,
                          audit_logs_recentes=audit_logs_recentes)
 
-
 MODEL_MAP = {
     'user': User,
     'cliente': Cliente,
@@ -1265,33 +1298,20 @@ def admin_table(table_name: str):
 @app.route('/admin/table/<string:table_name>/csv')
 @admin_required
 def admin_table_csv(table_name: str):
-    import csv
-    from io import StringIO
+    import export_engine
     model = MODEL_MAP.get(table_name)
     if not model:
         flash('Tabela não reconhecida.', 'error')
         return redirect(url_for('admin_home'))
     admin_user = User.query.get(session['user_id'])
-    company_user_ids = [u.id for u in User.query.filter_by(empresa_id=admin_user.empresa_id).all()]
-    query = model.query
+    where = None
     if model is User:
-        query = query.filter(User.empresa_id == admin_user.empresa_id)
+        where = User.empresa_id == admin_user.empresa_id
     elif hasattr(model, 'user_id'):
-        query = query.filter(model.user_id.in_(company_user_ids))
-    rows = query.all()
-    items = [serialize_model(r) for r in rows]
-    output = StringIO()
-    if items:
-        writer = csv.DictWriter(output, fieldnames=list(items[0].keys()))
-        writer.writeheader()
-        writer.writerows(items)
-    else:
-        writer = csv.writer(output)
-        writer.writerow([c.name for c in model.__table__.columns])
-    resp = make_response(output.getvalue())
-    resp.headers['Content-Type'] = 'text/csv; charset=utf-8'
-    resp.headers['Content-Disposition'] = f'attachment; filename={table_name}.csv'
-    return resp
+        company_user_ids = db.session.query(User.id).filter(User.empresa_id == admin_user.empresa_id)
+        where = model.user_id.in_(company_user_ids.scalar_subquery())
+    headers, rows = export_engine.table_rows(model, where)
+    return export_engine.csv_response(f'{table_name}.csv', headers, rows)
 
 # Rotas de Autenticação
 @app.route('/', methods=['GET', 'POST'])
@@ -1426,8 +1446,9 @@ def login():
 @app.route('/api/cep/<string:cep>')
 def api_cep(cep):
     """API para buscar dados do CEP"""
+    from cep_service import consultar, CepIndisponivel
     try:
-        data = get_cep_data(cep)
+        data = consultar(cep)
         if data:
             return jsonify({
                 'success': True,
@@ -1438,6 +1459,11 @@ def api_cep(cep):
                 'success': False,
                 'message': 'CEP não encontrado'
             }), 404
+    except CepIndisponivel:
+        return jsonify({
+            'success': False,
+            'message': 'Serviço de CEP indisponível no momento'
+        }), 503
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1936,78 +1962,13 @@ def logout():
 @main_bp.route('/dashboard', endpoint='dashboard')
 @login_required
 def dashboard():
+    from dashboard_stats import get_dashboard_stats
     user_id = session['user_id']
     
-    # Estatísticas básicas
-    total_produtos = Produto.query.filter_by(user_id=user_id).count()
-    total_clientes = Cliente.query.filter_by(user_id=user_id).count()
-    total_fornecedores = Fornecedor.query.filter_by(user_id=user_id, status='ativo').count()
-    total_produtos_auxiliares = ProdutoAuxiliar.query.filter_by(user_id=user_id, status='ativo').count()
-    
-    # Vendas do mês atual
-    inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    vendas_mes = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda >= inicio_mes,
-        Venda.status == 'finalizada'
-    ).all()
+    # Todos os KPIs em uma instrução + vendas recentes em outra
+    stats = get_dashboard_stats(user_id)
     
-    total_vendas_mes = sum(venda.valor_total for venda in vendas_mes)
-    
-    # Compras do mês atual
-    compras_mes = Compra.query.filter(
-        Compra.user_id == user_id,
-        Compra.data_compra >= inicio_mes
-    ).all()
-    
-    total_compras_mes = sum(compra.valor_total for compra in compras_mes)
-    
-    # Produtos com estoque baixo
-    produtos_estoque_baixo = Produto.query.filter(
-        Produto.user_id == user_id,
-        Produto.estoque_atual <= Produto.estoque_minimo
-    ).count()
-    
-    # Produtos auxiliares com estoque baixo
-    produtos_auxiliares_estoque_baixo = ProdutoAuxiliar.query.filter(
-        ProdutoAuxiliar.user_id == user_id,
-        ProdutoAuxiliar.estoque_atual <= ProdutoAuxiliar.estoque_minimo
-    ).count()
-    
-    # Tickets de suporte abertos
-    tickets_abertos = TicketSuporte.query.filter(
-        TicketSuporte.user_id == user_id,
-        TicketSuporte.status.in_(['aberto', 'em_andamento'])
-    ).count()
-    
-    # Vendas recentes
-    vendas_recentes = Venda.query.filter_by(user_id=user_id).order_by(Venda.data_venda.desc()).limit(5).all()
-    
-    # Gráfico de vendas dos últimos 7 dias
-    vendas_7_dias = []
-    for i in range(7):
-        data = datetime.now().date() - timedelta(days=i)
-        vendas_dia = Venda.query.filter(
-            Venda.user_id == user_id,
-            db.func.date(Venda.data_venda) == data,
-            Venda.status == 'finalizada'
-        ).count()
-        vendas_7_dias.append({'data': data.strftime('%d/%m'), 'vendas': vendas_dia})
-    
-    vendas_7_dias.reverse()
-    
-    return render_template('dashboard.html',
-                         total_produtos=total_produtos,
-                         total_clientes=total_clientes,
-                         total_fornecedores=total_fornecedores,
-                         total_produtos_auxiliares=total_produtos_auxiliares,
-                         total_vendas_mes=total_vendas_mes,
-                         total_compras_mes=total_compras_mes,
-                         produtos_estoque_baixo=produtos_estoque_baixo,
-                         produtos_auxiliares_estoque_baixo=produtos_auxiliares_estoque_baixo,
-                         tickets_abertos=tickets_abertos,
-                         vendas_recentes=vendas_recentes,
-                         vendas_7_dias=vendas_7_dias)
+    return render_template('dashboard.html', **stats.as_template_context())
 
 # ===== Páginas de planos e gestão =====
 @app.route('/planos')
@@ -2135,12 +2096,9 @@ def admin_delete_user(user_id):
 @app.route('/produtos')
 @login_required
 def produtos():
-    if is_admin():
-        produtos = Produto.query.order_by(Produto.nome).all()
-    else:
-        user_id = session['user_id']
-        produtos = Produto.query.filter_by(user_id=user_id).order_by(Produto.nome).all()
-    return render_template('produtos/list.html', produtos=produtos)
+    from list_query import list_page
+    pagina = list_page('produtos', request.args, session['user_id'], is_admin())
+    return render_template('produtos/list.html', produtos=pagina.items, pagina=pagina)
 
 @app.route('/produtos/novo', methods=['GET', 'POST'])
 @login_required
@@ -2186,15 +2144,13 @@ def novo_produto():
         )
         
         db.session.add(produto)
+        db.session.flush()  # obter produto.id para a auditoria, gravada no mesmo commit
+        log_audit(session['user_id'], 'produto', produto.id, 'create', {
+            'nome': produto.nome,
+            'preco': produto.preco,
+            'estoque_atual': produto.estoque_atual
+        }, commit=False)
         db.session.commit()
-        try:
-            log_audit(session['user_id'], 'produto', produto.id, 'create', {
-                'nome': produto.nome,
-                'preco': produto.preco,
-                'estoque_atual': produto.estoque_atual
-            })
-        except Exception as _:
-            pass
         
         flash('Produto cadastrado com sucesso!', 'success')
         return redirect(url_for('produtos'))
@@ -2243,15 +2199,12 @@ def editar_produto(id):
         produto.prazo_entrega = request.form.get('prazo_entrega')
         produto.observacoes_fornecedor = request.form.get('observacoes_fornecedor')
         
+        log_audit(session['user_id'], 'produto', produto.id, 'update', {
+            'nome': produto.nome,
+            'preco': produto.preco,
+            'estoque_atual': produto.estoque_atual
+        }, commit=False)
         db.session.commit()
-        try:
-            log_audit(session['user_id'], 'produto', produto.id, 'update', {
-                'nome': produto.nome,
-                'preco': produto.preco,
-                'estoque_atual': produto.estoque_atual
-            })
-        except Exception as _:
-            pass
         flash('Produto atualizado com sucesso!', 'success')
         return redirect(url_for('produtos'))
     
@@ -2272,13 +2225,10 @@ def editar_produto(id):
 def excluir_produto(id):
     produto = Produto.query.filter_by(id=id, user_id=session['user_id']).first_or_404()
     db.session.delete(produto)
+    log_audit(session['user_id'], 'produto', id, 'delete', {
+        'nome': produto.nome
+    }, commit=False)
     db.session.commit()
-    try:
-        log_audit(session['user_id'], 'produto', id, 'delete', {
-            'nome': produto.nome
-        })
-    except Exception as _:
-        pass
     flash('Produto excluído com sucesso!', 'success')
     return redirect(url_for('produtos'))
 
@@ -2286,12 +2236,9 @@ def excluir_produto(id):
 @app.route('/clientes')
 @login_required
 def clientes():
-    if is_admin():
-        clientes = Cliente.query.order_by(Cliente.nome).all()
-    else:
-        user_id = session['user_id']
-        clientes = Cliente.query.filter_by(user_id=user_id).order_by(Cliente.nome).all()
-    return render_template('clientes/list.html', clientes=clientes)
+    from list_query import list_page
+    pagina = list_page('clientes', request.args, session['user_id'], is_admin())
+    return render_template('clientes/list.html', clientes=pagina.items, pagina=pagina)
 
 @app.route('/clientes/novo', methods=['GET', 'POST'])
 @login_required
@@ -2550,12 +2497,21 @@ def excluir_cliente(id):
 @app.route('/vendas')
 @login_required
 def vendas():
-    if is_admin():
-        vendas = Venda.query.order_by(Venda.data_venda.desc()).all()
-    else:
-        user_id = session['user_id']
-        vendas = Venda.query.filter_by(user_id=user_id).order_by(Venda.data_venda.desc()).all()
-    return render_template('vendas/list.html', vendas=vendas)
+    from list_query import list_page
+    pagina = list_page('vendas', request.args, session['user_id'], is_admin())
+    # Resumo de todas as vendas filtradas (não só da página), em uma consulta
+    total, faturamento, pendentes = pagina.base_query.order_by(None).with_entities(
+        db.func.count(Venda.id),
+        db.func.coalesce(db.func.sum(Venda.valor_total), 0),
+        db.func.count(db.case((Venda.status == 'pendente', 1))),
+    ).one()
+    resumo = {
+        'total': total,
+        'faturamento': float(faturamento or 0),
+        'pendentes': pendentes,
+        'ticket_medio': float(faturamento or 0) / total if total else 0,
+    }
+    return render_template('vendas/list.html', vendas=pagina.items, pagina=pagina, resumo=resumo)
 
 @app.route('/vendas/nova', methods=['GET', 'POST'])
 @login_required
@@ -2568,104 +2524,35 @@ def nova_venda():
         if check_quota_exceeded(uid, 'vendas_mes_max', total_mes):
             flash('Limite mensal de vendas atingido para seu plano. Faça upgrade para registrar mais.', 'warning')
             return redirect(url_for('vendas'))
-        # Criar venda
-        venda = Venda(
-            cliente_id=int(request.form['cliente_id']) if request.form['cliente_id'] else None,
-            valor_total=0,  # Será calculado
-            valor_final=0,  # Será calculado
-            forma_pagamento=request.form['forma_pagamento'],
-            observacoes=request.form['observacoes'],
-            user_id=session['user_id']
-        )
-        
-        db.session.add(venda)
-        db.session.flush()  # Para obter o ID da venda
-        
-        # Processar itens da venda
-        total_venda = 0
-        for key, value in request.form.items():
-            if key.startswith('produto_') and value:
-                produto_id = key.split('_')[1]
-                quantidade = int(value)
-                
-                produto = Produto.query.filter_by(id=produto_id, user_id=session['user_id']).first()
-                if produto and produto.estoque_atual >= quantidade:
-                    # Criar item da venda
-                    item = ItemVenda(
-                        venda_id=venda.id,
-                        produto_id=produto.id,
-                        quantidade=quantidade,
-                        preco_unitario=produto.preco,
-                        subtotal=quantidade * produto.preco
-                    )
-                    
-                    db.session.add(item)
-                    
-                    # Atualizar estoque
-                    produto.estoque_atual -= quantidade
-                    total_venda += item.subtotal
-        
-        # Processar cupom se fornecido
-        cupom_id = None
-        valor_desconto = 0
-        valor_final = total_venda
-        
-        if request.form.get('cupom_codigo'):
-            from datetime import datetime
-            codigo_cupom = request.form['cupom_codigo'].upper().strip()
-            cupom = Cupom.query.filter_by(codigo=codigo_cupom, user_id=session['user_id']).first()
-            
-            if cupom and cupom.ativo:
-                agora = datetime.utcnow()
-                if agora >= cupom.data_inicio and agora <= cupom.data_fim:
-                    if not cupom.limite_uso or cupom.usos_realizados < cupom.limite_uso:
-                        # Verificar valor mínimo
-                        if total_venda >= cupom.valor_minimo_compra:
-                            # Calcular desconto
-                            if cupom.tipo_desconto == 'percentual':
-                                valor_desconto = total_venda * (cupom.valor_desconto / 100)
-                                if cupom.valor_maximo_desconto:
-                                    valor_desconto = min(valor_desconto, cupom.valor_maximo_desconto)
-                            else:
-                                valor_desconto = min(cupom.valor_desconto, total_venda)
-                            
-                            valor_final = total_venda - valor_desconto
-                            cupom_id = cupom.id
-                            
-                            # Atualizar uso do cupom
-                            cupom.usos_realizados += 1
-        
-        # Atualizar valores da venda
-        venda.valor_total = total_venda
-        venda.valor_desconto = valor_desconto
-        venda.valor_final = valor_final
-        venda.cupom_id = cupom_id
-        
-        db.session.commit()
+        from checkout import registrar_venda, parse_form_items, CheckoutError
         try:
-            log_audit(session['user_id'], 'venda', venda.id, 'add_sale', {
-                'valor_total': venda.valor_total,
-                'valor_final': venda.valor_final,
-                'itens': [
-                    {'produto_id': it.produto_id, 'quantidade': it.quantidade, 'subtotal': it.subtotal}
-                    for it in ItemVenda.query.filter_by(venda_id=venda.id).all()
-                ]
-            })
-        except Exception as _:
-            pass
+            registrar_venda(
+                uid,
+                parse_form_items(request.form),
+                cliente_id=int(request.form['cliente_id']) if request.form.get('cliente_id') else None,
+                forma_pagamento=request.form['forma_pagamento'],
+                observacoes=request.form.get('observacoes'),
+                cupom_codigo=request.form.get('cupom_codigo'),
+            )
+        except CheckoutError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('nova_venda'))
         flash('Venda realizada com sucesso!', 'success')
         return redirect(url_for('vendas'))
     
+    import query_shapes
     user_id = session['user_id']
-    produtos = Produto.query.filter_by(user_id=user_id).all()
-    clientes = Cliente.query.filter_by(user_id=user_id).all()
+    # Os produtos vêm sob demanda do seletor (/api/busca)
+    clientes = query_shapes.carregar(Cliente.query.filter_by(user_id=user_id), 'cliente_opcao').all()
     
-    return render_template('vendas/form.html', produtos=produtos, clientes=clientes)
+    return render_template('vendas/form.html', clientes=clientes)
 
 @app.route('/vendas/<int:id>')
 @login_required
 def detalhes_venda(id):
-    venda = Venda.query.filter_by(id=id, user_id=session['user_id']).first_or_404()
+    import query_shapes
+    venda = query_shapes.carregar(Venda.query.filter_by(id=id, user_id=session['user_id']),
+                                  'venda_detalhe').first_or_404()
     return render_template('vendas/detalhes.html', venda=venda)
 
 # Rotas de Fornecedores
@@ -2894,12 +2781,9 @@ def excluir_fornecedor(id):
 @app.route('/compras')
 @login_required
 def compras():
-    if is_admin():
-        compras = Compra.query.order_by(Compra.data_compra.desc()).all()
-    else:
-        user_id = session['user_id']
-        compras = Compra.query.filter_by(user_id=user_id).order_by(Compra.data_compra.desc()).all()
-    return render_template('compras/list.html', compras=compras)
+    from list_query import list_page
+    pagina = list_page('compras', request.args, session['user_id'], is_admin())
+    return render_template('compras/list.html', compras=pagina.items, pagina=pagina)
 
 @app.route('/compras/nova', methods=['GET', 'POST'])
 @login_required
@@ -2922,26 +2806,31 @@ def nova_compra():
         db.session.add(compra)
         db.session.flush()
         
-        # Processar itens da compra
-        total_compra = 0
+        # Processar itens da compra (produtos buscados em uma consulta)
+        quantidades = {}
         for key, value in request.form.items():
             if key.startswith('produto_') and value:
-                produto_id = key.split('_')[1]
-                quantidade = int(value)
+                quantidades[int(key.split('_')[1])] = int(value)
+        produtos = {}
+        if quantidades:
+            produtos = {p.id: p for p in Produto.query.filter(
+                Produto.id.in_(quantidades), Produto.user_id == session['user_id'])}
+        
+        total_compra = 0
+        for produto_id, quantidade in quantidades.items():
+            produto = produtos.get(produto_id)
+            if produto:
+                # Criar item da compra
+                item = ItemCompra(
+                    compra_id=compra.id,
+                    produto_id=produto.id,
+                    quantidade=quantidade,
+                    preco_unitario=produto.preco,
+                    subtotal=quantidade * produto.preco
+                )
                 
-                produto = Produto.query.filter_by(id=produto_id, user_id=session['user_id']).first()
-                if produto:
-                    # Criar item da compra
-                    item = ItemCompra(
-                        compra_id=compra.id,
-                        produto_id=produto.id,
-                        quantidade=quantidade,
-                        preco_unitario=produto.preco,
-                        subtotal=quantidade * produto.preco
-                    )
-                    
-                    db.session.add(item)
-                    total_compra += item.subtotal
+                db.session.add(item)
+                total_compra += item.subtotal
         
         # Atualizar valor total da compra
         compra.valor_total = total_compra
@@ -2952,29 +2841,38 @@ def nova_compra():
     
     user_id = session['user_id']
     # Não carregar produtos aqui - serão carregados via AJAX baseado no fornecedor selecionado
-    fornecedores = Fornecedor.query.filter_by(user_id=user_id, status='ativo').all()
+    import query_shapes
+    fornecedores = query_shapes.carregar(Fornecedor.query.filter_by(user_id=user_id, status='ativo'),
+                                         'fornecedor_opcao').all()
     
     return render_template('compras/form.html', produtos=[], fornecedores=fornecedores)
 
 @app.route('/api/produtos-por-fornecedor/<int:fornecedor_id>')
 @login_required
+@versionado()
 def api_produtos_por_fornecedor(fornecedor_id):
     """API para buscar produtos de um fornecedor específico"""
+    import busca
+    from sqlalchemy.orm import load_only
     try:
         # Buscar o fornecedor
         fornecedor = Fornecedor.query.filter_by(id=fornecedor_id, user_id=session['user_id']).first()
         if not fornecedor:
             return jsonify({'success': False, 'error': 'Fornecedor não encontrado'}), 404
         
-        # Buscar produtos que têm informações deste fornecedor
-        produtos = Produto.query.filter(
+        # Buscar produtos que têm informações deste fornecedor; no PostgreSQL o
+        # ILIKE usa o índice de trigramas de fornecedor_nome (busca.criar_indices)
+        colunas = load_only(Produto.nome, Produto.preco, Produto.estoque_atual, Produto.categoria,
+                            Produto.fornecedor_nome, Produto.preco_compra)
+        nome = busca.escapar_like(fornecedor.nome)
+        produtos = Produto.query.options(colunas).filter(
             Produto.user_id == session['user_id'],
-            Produto.fornecedor_nome.ilike(f'%{fornecedor.nome}%')
+            Produto.fornecedor_nome.ilike(f'%{nome}%', escape='\\')
         ).all()
         
         # Se não encontrar por nome, buscar por CNPJ se disponível
         if not produtos and fornecedor.cnpj:
-            produtos = Produto.query.filter(
+            produtos = Produto.query.options(colunas).filter(
                 Produto.user_id == session['user_id'],
                 Produto.fornecedor_cnpj == fornecedor.cnpj
             ).all()
@@ -2999,13 +2897,17 @@ def api_produtos_por_fornecedor(fornecedor_id):
 @app.route('/compras/<int:id>')
 @login_required
 def detalhes_compra(id):
-    compra = Compra.query.filter_by(id=id, user_id=session['user_id']).first_or_404()
+    import query_shapes
+    compra = query_shapes.carregar(Compra.query.filter_by(id=id, user_id=session['user_id']),
+                                   'compra_detalhe').first_or_404()
     return render_template('compras/detalhes.html', compra=compra)
 
 @app.route('/compras/confirmar/<int:id>')
 @login_required
 def confirmar_compra(id):
-    compra = Compra.query.filter_by(id=id, user_id=session['user_id']).first_or_404()
+    import query_shapes
+    compra = query_shapes.carregar(Compra.query.filter_by(id=id, user_id=session['user_id']),
+                                   'compra_confirmar').first_or_404()
     
     if compra.status == 'pendente':
         # Atualizar estoque dos produtos
@@ -3215,12 +3117,9 @@ def detalhes_nota_fiscal(id):
 @app.route('/suporte')
 @login_required
 def suporte():
-    if is_admin():
-        tickets = TicketSuporte.query.order_by(TicketSuporte.data_abertura.desc()).all()
-    else:
-        user_id = session['user_id']
-        tickets = TicketSuporte.query.filter_by(user_id=user_id).order_by(TicketSuporte.data_abertura.desc()).all()
-    return render_template('suporte/list.html', tickets=tickets)
+    from list_query import list_page
+    pagina = list_page('suporte', request.args, session['user_id'], is_admin())
+    return render_template('suporte/list.html', tickets=pagina.items, pagina=pagina)
 
 @app.route('/suporte/novo', methods=['GET', 'POST'])
 @login_required
@@ -3279,38 +3178,23 @@ def get_sessao_caixa_aberta(user_id):
 @app.route('/caixa')
 @login_required
 def caixa_dashboard():
+    from caixa_contadores import resumo_vendas, resumo_vendas_periodo
     user_id = session['user_id']
     sessao = get_sessao_caixa_aberta(user_id)
 
-    # Período de cálculo: sessão aberta ou dia atual
+    # Período de cálculo: sessão aberta (contadores da sessão) ou dia atual
     inicio = (sessao.data_abertura if sessao else datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0))
     fim = datetime.utcnow()
-
-    vendas = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda.between(inicio, fim),
-        Venda.status == 'finalizada'
-    ).all()
-
-    total_vendas = sum(v.valor_total for v in vendas)
-    qtd_vendas = len(vendas)
-    ticket_medio = (total_vendas / qtd_vendas) if qtd_vendas else 0
-
-    # Quebra por forma de pagamento
-    formas = ['dinheiro', 'cartao', 'pix', 'boleto', 'transferencia']
-    por_pagamento = {fp: sum(v.valor_total for v in vendas if (v.forma_pagamento or '').lower() == fp) for fp in formas}
+    resumo = resumo_vendas(sessao) if sessao else resumo_vendas_periodo(user_id, inicio, fim)
 
     # Movimentos do caixa (se houver sessão)
     movimentos = []
     if sessao:
         movimentos = MovimentoCaixa.query.filter_by(sessao_id=sessao.id).order_by(MovimentoCaixa.created_at.desc()).limit(10).all()
 
-    # Load produtos for the quick sale form
-    produtos = Produto.query.filter_by(user_id=user_id).order_by(Produto.nome).all()
-
+    # Produtos da venda rápida vêm sob demanda: /api/busca (nome) e /api/caixa/produto (scanner)
     return render_template('caixa/index.html', sessao=sessao, inicio=inicio, fim=fim,
-                           total_vendas=total_vendas, qtd_vendas=qtd_vendas, ticket_medio=ticket_medio,
-                           por_pagamento=por_pagamento, movimentos=movimentos, produtos=produtos)
+                           movimentos=movimentos, **resumo)
 
 @app.route('/caixa/abrir', methods=['POST'])
 @login_required
@@ -3350,6 +3234,7 @@ def abrir_caixa():
 @app.route('/caixa/fechar', methods=['POST'])
 @login_required
 def fechar_caixa():
+    from caixa_contadores import saldo_esperado, reconciliar
     user_id = session['user_id']
     sessao = get_sessao_caixa_aberta(user_id)
     if not sessao:
@@ -3371,12 +3256,12 @@ def fechar_caixa():
 
     observacoes = request.form.get('observacoes_fechamento') or None
 
-    # Conferência de caixa: saldo esperado vs informado
-    movimentos = MovimentoCaixa.query.filter_by(sessao_id=sessao.id).all()
-    entradas = sum(m.valor for m in movimentos if m.tipo == 'entrada')
-    saidas = sum(m.valor for m in movimentos if m.tipo == 'saida')
-    esperado = (sessao.saldo_inicial or 0) + entradas - saidas
-    diferenca = saldo_fechamento - esperado
+    # Conferência de caixa: saldo esperado (contadores da sessão) vs informado
+    diferenca = saldo_fechamento - saldo_esperado(sessao)
+    if abs(diferenca) > 0.01:
+        # Antes de recusar, confere os contadores com os movimentos
+        reconciliar([sessao.id])
+        diferenca = saldo_fechamento - saldo_esperado(sessao)
     if abs(diferenca) > 0.01:
         flash(f'Diferença no fechamento de R$ {diferenca:.2f}. Confira o caixa.', 'danger')
         return redirect(url_for('caixa_dashboard'))
@@ -3405,113 +3290,37 @@ def caixa_registrar_venda():
     produto_id = request.form.get('produto_id')
     quantidade_raw = request.form.get('quantidade')
 
-    # Caminho com produto selecionado: calcula total, cria ItemVenda e atualiza estoque
+    from checkout import registrar_venda, ItemCarrinho, CheckoutError
+
+    # Caminho com produto selecionado: ItemVenda e baixa de estoque
     if produto_id and quantidade_raw:
         try:
-            produto_id = int(produto_id)
-            quantidade = int(quantidade_raw)
+            itens = [ItemCarrinho(int(produto_id), int(quantidade_raw))]
         except ValueError:
             flash('Produto ou quantidade inválidos.', 'danger')
             return redirect(url_for('caixa_dashboard'))
-
-        if quantidade <= 0:
-            flash('Informe uma quantidade válida (>= 1).', 'warning')
-            return redirect(url_for('caixa_dashboard'))
-
-        produto = Produto.query.filter_by(id=produto_id, user_id=user_id).first()
-        if not produto:
-            flash('Produto não encontrado.', 'danger')
+        valor = None
+        descricao = None
+    else:
+        # Caminho sem produto: registro rápido por valor informado
+        try:
+            valor = float(request.form.get('valor', 0) or 0)
+        except ValueError:
+            flash('Valor inválido.', 'danger')
             return redirect(url_for('caixa_dashboard'))
-
-        if produto.estoque_atual < quantidade:
-            flash('Quantidade solicitada acima do estoque disponível.', 'warning')
+        if valor <= 0 or not forma_pagamento:
+            flash('Informe valor e forma de pagamento.', 'warning')
             return redirect(url_for('caixa_dashboard'))
+        itens = []
+        descricao = 'Venda rápida registrada no caixa'
 
-        if not forma_pagamento:
-            flash('Informe a forma de pagamento.', 'warning')
-            return redirect(url_for('caixa_dashboard'))
-
-        valor = float(produto.preco) * quantidade
-
-        venda = Venda(
-            data_venda=datetime.utcnow(),
-            valor_total=valor,
-            valor_desconto=0.0,
-            valor_final=valor,
-            status='finalizada',
-            forma_pagamento=forma_pagamento,
-            observacoes=observacoes,
-            user_id=user_id
-        )
-        db.session.add(venda)
-        db.session.flush()  # obter venda.id
-
-        item = ItemVenda(
-            quantidade=quantidade,
-            preco_unitario=float(produto.preco),
-            subtotal=valor,
-            venda_id=venda.id,
-            produto_id=produto.id
-        )
-        db.session.add(item)
-
-        # Atualiza estoque
-        produto.estoque_atual = produto.estoque_atual - quantidade
-        db.session.add(produto)
-
-        movimento = MovimentoCaixa(
-            tipo='entrada',
-            origem='venda',
-            valor=valor,
-            descricao=f'Venda rápida: {produto.nome} x{quantidade}',
-            forma_pagamento=forma_pagamento,
-            referencia_id=venda.id,
-            sessao_id=sessao.id,
-            user_id=user_id
-        )
-        db.session.add(movimento)
-        db.session.commit()
-
-        flash('Venda registrada com sucesso no caixa!', 'success')
-        return redirect(url_for('caixa_dashboard'))
-
-    # Caminho sem produto: manter registro rápido por valor informado
     try:
-        valor = float(request.form.get('valor', 0) or 0)
-    except ValueError:
-        flash('Valor inválido.', 'danger')
-        return redirect(url_for('caixa_dashboard'))
-
-    if valor <= 0 or not forma_pagamento:
-        flash('Informe valor e forma de pagamento.', 'warning')
+        registrar_venda(user_id, itens, forma_pagamento=forma_pagamento, observacoes=observacoes,
+                        valor_avulso=valor, sessao=sessao, descricao_movimento=descricao)
+    except CheckoutError as e:
+        flash(str(e), 'warning')
         return redirect(url_for('caixa_dashboard'))
 
-    venda = Venda(
-        data_venda=datetime.utcnow(),
-        valor_total=valor,
-        valor_desconto=0.0,
-        valor_final=valor,
-        status='finalizada',
-        forma_pagamento=forma_pagamento,
-        observacoes=observacoes,
-        user_id=user_id
-    )
-    db.session.add(venda)
-    db.session.flush()  # obter venda.id
-
-    movimento = MovimentoCaixa(
-        tipo='entrada',
-        origem='venda',
-        valor=valor,
-        descricao='Venda rápida registrada no caixa',
-        forma_pagamento=forma_pagamento,
-        referencia_id=venda.id,
-        sessao_id=sessao.id,
-        user_id=user_id
-    )
-    db.session.add(movimento)
-    db.session.commit()
-
     flash('Venda registrada com sucesso no caixa!', 'success')
     return redirect(url_for('caixa_dashboard'))
 
@@ -3519,30 +3328,29 @@ def caixa_registrar_venda():
 @csrf.exempt
 @login_required
 def api_caixa_dashboard():
+    from caixa_contadores import resumo_vendas, resumo_vendas_periodo
     user_id = session['user_id']
     sessao = get_sessao_caixa_aberta(user_id)
     inicio = (sessao.data_abertura if sessao else datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0))
     fim = datetime.utcnow()
-
-    vendas = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda.between(inicio, fim),
-        Venda.status == 'finalizada'
-    ).all()
-    total_vendas = sum(v.valor_total for v in vendas)
-    qtd_vendas = len(vendas)
-    ticket_medio = (total_vendas / qtd_vendas) if qtd_vendas else 0
-    formas = ['dinheiro', 'cartao', 'pix', 'boleto', 'transferencia']
-    por_pagamento = {fp: sum(v.valor_total for v in vendas if (v.forma_pagamento or '').lower() == fp) for fp in formas}
+    resumo = resumo_vendas(sessao) if sessao else resumo_vendas_periodo(user_id, inicio, fim)
 
     return jsonify({'success': True,
                     'sessao_aberta': bool(sessao),
                     'inicio': inicio.isoformat(),
                     'fim': fim.isoformat(),
-                    'total_vendas': total_vendas,
-                    'qtd_vendas': qtd_vendas,
-                    'ticket_medio': ticket_medio,
-                    'por_pagamento': por_pagamento})
+                    **resumo})
+
+@app.route('/api/caixa/produto')
+@csrf.exempt
+@login_required
+def api_caixa_produto():
+    """Produto pelo código lido no scanner (código de barras ou código gerado)"""
+    import catalogo_pdv
+    produto = catalogo_pdv.por_codigo(request.args.get('codigo'), session['user_id'])
+    if produto is None:
+        return jsonify({'success': False, 'error': 'Produto não encontrado'}), 404
+    return jsonify({'success': True, 'data': produto.as_dict()})
 
 # Listagem de sessões de caixa
 @app.route('/caixa/sessoes')
@@ -3562,18 +3370,20 @@ def caixa_sessoes():
 @app.route('/caixa/sessao/<int:sessao_id>')
 @login_required
 def caixa_sessao_detalhes(sessao_id):
+    from caixa_contadores import saldo_esperado
     user_id = session['user_id']
     sessao = CaixaSessao.query.filter_by(id=sessao_id, user_id=user_id).first_or_404()
     movimentos = MovimentoCaixa.query.filter_by(sessao_id=sessao.id).order_by(MovimentoCaixa.created_at.desc()).all()
-    entradas = sum(m.valor for m in movimentos if m.tipo == 'entrada')
-    saidas = sum(m.valor for m in movimentos if m.tipo == 'saida')
-    saldo_parcial = (sessao.saldo_inicial or 0) + entradas - saidas
-    return render_template('caixa/detalhes.html', sessao=sessao, movimentos=movimentos, entradas=entradas, saidas=saidas, saldo_parcial=saldo_parcial)
+    # Totais pelos contadores da sessão
+    return render_template('caixa/detalhes.html', sessao=sessao, movimentos=movimentos,
+                           entradas=sessao.total_entradas or 0, saidas=sessao.total_saidas or 0,
+                           saldo_parcial=saldo_esperado(sessao))
 
-# Importação de movimentos via CSV
+# Importação de movimentos via CSV (arquivo em IMPORT_DIR, não no cookie da sessão)
 @app.route('/caixa/sessao/<int:sessao_id>/importar', methods=['POST'])
 @login_required
 def importar_movimentos_caixa(sessao_id):
+    from import_staging import criar_staging, TIPO_CAIXA_MOVIMENTOS
     user_id = session['user_id']
     sessao = CaixaSessao.query.filter_by(id=sessao_id, user_id=user_id).first_or_404()
     file = request.files.get('arquivo')
@@ -3581,251 +3391,153 @@ def importar_movimentos_caixa(sessao_id):
         flash('Nenhum arquivo enviado.', 'warning')
         return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
     try:
-        # Ler CSV usando encoding seguro
-        stream = file.stream.read().decode('utf-8', errors='ignore')
-        reader = csv.DictReader(stream.splitlines())
-        headers = reader.fieldnames or []
-        rows = []
-        max_rows = 1000
-        for i, row in enumerate(reader):
-            if i >= max_rows:
-                break
-            rows.append({k: (row.get(k) or '').strip() for k in headers})
-        if not rows:
-            flash('CSV vazio ou inválido.', 'warning')
-            return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
-        default_map = {
-            'tipo': next((h for h in headers if h.lower() == 'tipo'), None),
-            'origem': next((h for h in headers if h.lower() == 'origem'), None),
-            'valor': next((h for h in headers if h.lower() in ['valor', 'amount']), None),
-            'descricao': next((h for h in headers if h.lower() == 'descricao'), None),
-            'forma_pagamento': next((h for h in headers if h.lower() in ['forma_pagamento', 'pagamento', 'payment_method']), None),
-            'referencia_id': next((h for h in headers if h.lower() in ['referencia_id', 'ref_id', 'id']), None),
-            'data': next((h for h in headers if h.lower() in ['data', 'date', 'created_at']), None)
-        }
-        session['csv_import_caixa'] = {
-            'sessao_id': sessao.id,
-            'headers': headers,
-            'rows': rows,
-            'default_map': default_map
-        }
-        flash(f'Pré-visualização carregada ({min(len(rows), max_rows)} linhas).', 'info')
-        return render_template('caixa/import_preview.html', sessao=sessao, headers=headers, rows=rows[:50], default_map=default_map, total_rows=len(rows))
+        job, preview = criar_staging(user_id, TIPO_CAIXA_MOVIMENTOS, file, {'sessao_id': sessao.id})
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
     except Exception as e:
         db.session.rollback()
         flash(f'Falha ao importar: {e}', 'danger')
         return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
+    flash(f'Pré-visualização carregada ({job.total_linhas} linhas).', 'info')
+    return render_template('caixa/import_preview.html', sessao=sessao, import_id=job.id,
+                           headers=json.loads(job.headers), rows=preview,
+                           default_map=json.loads(job.default_map), total_rows=job.total_linhas)
+
 @app.route('/caixa/sessao/<int:sessao_id>/importar/confirmar', methods=['POST'])
 @login_required
 def confirmar_importacao_movimentos_caixa(sessao_id):
+    from import_staging import obter_staging, importar_movimentos_caixa, TIPO_CAIXA_MOVIMENTOS
     user_id = session['user_id']
     sessao = CaixaSessao.query.filter_by(id=sessao_id, user_id=user_id).first_or_404()
-    data = session.get('csv_import_caixa')
-    if not data or data.get('sessao_id') != sessao.id:
+    job = obter_staging(request.form.get('import_id'), user_id, TIPO_CAIXA_MOVIMENTOS)
+    if not job or json.loads(job.params or '{}').get('sessao_id') != sessao.id:
         flash('Nenhum CSV em pré-visualização para esta sessão.', 'warning')
         return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
-    m = data.get('default_map', {})
-    mapping = {
-        'tipo': request.form.get('map_tipo') or m.get('tipo'),
-        'origem': request.form.get('map_origem') or m.get('origem'),
-        'valor': request.form.get('map_valor') or m.get('valor'),
-        'descricao': request.form.get('map_descricao') or m.get('descricao'),
-        'forma_pagamento': request.form.get('map_forma_pagamento') or m.get('forma_pagamento'),
-        'referencia_id': request.form.get('map_referencia_id') or m.get('referencia_id'),
-        'data': request.form.get('map_data') or m.get('data'),
-    }
+    m = json.loads(job.default_map or '{}')
+    mapping = {campo: request.form.get(f'map_{campo}') or m.get(campo) for campo in m}
 
-    imported = 0
-    rejected = []
-    for row in data.get('rows', []):
-        tipo_val = (row.get(mapping['tipo']) if mapping['tipo'] else '').strip().lower()
-        origem_val = (row.get(mapping['origem']) if mapping['origem'] else '').strip().lower()
-        valor_raw = (row.get(mapping['valor']) if mapping['valor'] else '').strip().replace(',', '.')
-        descricao_val = (row.get(mapping['descricao']) if mapping['descricao'] else '').strip()
-        forma_val = (row.get(mapping['forma_pagamento']) if mapping['forma_pagamento'] else '').strip()
-        ref_val = (row.get(mapping['referencia_id']) if mapping['referencia_id'] else '').strip()
-
-        try:
-            valor = float(valor_raw) if valor_raw else None
-        except Exception:
-            valor = None
-        if tipo_val not in ['entrada', 'saida'] or not origem_val or not valor or valor <= 0:
-            rejected.append({'row': row, 'reason': 'Campos obrigatórios inválidos'})
-            continue
-
-        descricao_final = descricao_val or ''
-        if '[IMPORTADO]' not in descricao_final:
-            descricao_final = (descricao_final + ' ').strip() + '[IMPORTADO]'
-
-        movimento = MovimentoCaixa(
-            tipo=tipo_val,
-            origem=origem_val,
-            valor=valor,
-            descricao=descricao_final,
-            forma_pagamento=(forma_val or None),
-            referencia_id=int(ref_val) if ref_val and ref_val.isdigit() else None,
-            sessao_id=sessao.id,
-            user_id=user_id
-        )
-        db.session.add(movimento)
-        imported += 1
     try:
-        db.session.commit()
+        resultado = importar_movimentos_caixa(job, sessao, mapping)
     except Exception as e:
-        db.session.rollback()
         flash(f'Falha ao confirmar importação: {e}', 'danger')
         return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
-    session.pop('csv_import_caixa', None)
-    session['csv_import_rejeicoes'] = {'count': len(rejected)}
-    flash(f'Importação confirmada: {imported} movimentos adicionados, {len(rejected)} rejeições.', 'success')
+    mensagem = f"Importação confirmada: {resultado['importadas']} movimentos adicionados, {resultado['rejeitadas']} rejeições."
+    if resultado['rejeitadas']:
+        link = url_for('importacao_rejeicoes', tipo=job.tipo, import_id=job.id)
+        mensagem += f" <a href='{link}' class='alert-link'>Baixar relatório de rejeições</a>."
+    flash(Markup(mensagem), 'success')
     return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
+# Importação em massa de produtos e clientes (CSV/XLSX), no mesmo fluxo em duas etapas
+@app.route('/<any(produtos, clientes):tipo>/importar', methods=['POST'])
+@login_required
+def importar_cadastros(tipo):
+    from import_staging import criar_staging, CAMPOS_CADASTRO
+    file = request.files.get('arquivo')
+    if not file:
+        flash('Nenhum arquivo enviado.', 'warning')
+        return redirect(url_for(tipo))
+    try:
+        job, preview = criar_staging(session['user_id'], tipo, file)
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for(tipo))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Falha ao importar: {e}', 'danger')
+        return redirect(url_for(tipo))
+
+    flash(f'Pré-visualização carregada ({job.total_linhas} linhas).', 'info')
+    return render_template('importacao/preview.html', tipo=tipo, import_id=job.id,
+                           campos=CAMPOS_CADASTRO[tipo], headers=json.loads(job.headers), rows=preview,
+                           default_map=json.loads(job.default_map), total_rows=job.total_linhas)
+
+@app.route('/<any(produtos, clientes):tipo>/importar/confirmar', methods=['POST'])
+@login_required
+def confirmar_importacao_cadastros(tipo):
+    from import_staging import obter_staging, importar_cadastro
+    job = obter_staging(request.form.get('import_id'), session['user_id'], tipo)
+    if not job:
+        flash('Nenhum arquivo em pré-visualização para importar.', 'warning')
+        return redirect(url_for(tipo))
+
+    m = json.loads(job.default_map or '{}')
+    mapping = {campo: request.form.get(f'map_{campo}') or m.get(campo) for campo in m}
+
+    try:
+        resultado = importar_cadastro(job, mapping)
+    except Exception as e:
+        flash(f'Falha ao confirmar importação: {e}', 'danger')
+        return redirect(url_for(tipo))
+
+    mensagem = f"Importação confirmada: {resultado['importadas']} {tipo} adicionados, {resultado['rejeitadas']} rejeições."
+    if resultado['rejeitadas']:
+        link = url_for('importacao_rejeicoes', tipo=job.tipo, import_id=job.id)
+        mensagem += f" <a href='{link}' class='alert-link'>Baixar relatório de rejeições</a>."
+    flash(Markup(mensagem), 'success')
+    return redirect(url_for(tipo))
+
+# Relatório de rejeições de qualquer importação (caixa, produtos, clientes)
+@app.route('/importacoes/<any(caixa_movimentos, produtos, clientes):tipo>/<import_id>/rejeicoes')
+@login_required
+def importacao_rejeicoes(tipo, import_id):
+    from import_staging import STATUS_CONCLUIDO
+    job = ImportJob.query.filter_by(id=import_id, user_id=session['user_id'], tipo=tipo,
+                                    status=STATUS_CONCLUIDO).first_or_404()
+    if not job.arquivo_rejeicoes or not os.path.exists(job.arquivo_rejeicoes):
+        flash('Relatório de rejeições indisponível ou expirado.', 'warning')
+        return redirect(url_for('caixa_sessoes' if tipo == 'caixa_movimentos' else tipo))
+    return send_file(job.arquivo_rejeicoes, mimetype='text/csv', as_attachment=True,
+                     download_name=f'rejeicoes_{job.id}.csv')
+
 @app.route('/caixa/sessao/<int:sessao_id>/exportar/<string:formato>')
 @login_required
 def exportar_caixa_sessao(sessao_id, formato):
+    import export_engine
     user_id = session['user_id']
     sessao = CaixaSessao.query.filter_by(id=sessao_id, user_id=user_id).first_or_404()
+    if formato not in export_engine.WRITERS:
+        flash('Formato de exportação inválido.', 'warning')
+        return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
+    de = ate = None
     de_str = request.args.get('de')
     ate_str = request.args.get('ate')
-    query = MovimentoCaixa.query.filter_by(sessao_id=sessao.id)
     if de_str:
         try:
             de = datetime.fromisoformat(de_str)
-            query = query.filter(MovimentoCaixa.created_at >= de)
         except Exception:
             pass
     if ate_str:
         try:
             ate = datetime.fromisoformat(ate_str)
-            query = query.filter(MovimentoCaixa.created_at <= ate)
         except Exception:
             pass
-    movimentos = query.order_by(MovimentoCaixa.created_at.asc()).all()
-
-    entradas = sum((m.valor or 0) for m in movimentos if m.tipo == 'entrada')
-    saidas = sum((m.valor or 0) for m in movimentos if m.tipo == 'saida')
-    saldo_parcial = (sessao.saldo_inicial or 0) + entradas - saidas
-
-    if formato == 'csv':
-        import io
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Sessão', sessao.id])
-        writer.writerow(['Início', sessao.data_abertura.isoformat() if sessao.data_abertura else '-'])
-        writer.writerow(['Fim', sessao.data_fechamento.isoformat() if sessao.data_fechamento else '-'])
-        writer.writerow([])
-        writer.writerow(['Data', 'Tipo', 'Origem', 'Forma pagamento', 'Origem dados', 'Valor', 'Descrição'])
-        for m in movimentos:
-            origem_dados = 'Importado' if (m.descricao and '[IMPORTADO]' in m.descricao) else 'Manual'
-            writer.writerow([
-                m.created_at.isoformat() if m.created_at else '',
-                m.tipo or '',
-                m.origem or '',
-                m.forma_pagamento or '',
-                origem_dados,
-                f'{(m.valor or 0):.2f}',
-                m.descricao or ''
-            ])
-        writer.writerow([])
-        writer.writerow(['Entradas', f'{entradas:.2f}'])
-        writer.writerow(['Saídas', f'{saidas:.2f}'])
-        writer.writerow(['Saldo parcial', f'{saldo_parcial:.2f}'])
-        resp = make_response(output.getvalue())
-        resp.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        resp.headers['Content-Disposition'] = f'attachment; filename="caixa_sessao_{sessao.id}.csv"'
-        return resp
-
-    elif formato == 'excel':
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Movimentos'
-        ws.append(['Sessão', sessao.id])
-        ws.append(['Início', sessao.data_abertura.strftime('%Y-%m-%d %H:%M') if sessao.data_abertura else '-'])
-        ws.append(['Fim', sessao.data_fechamento.strftime('%Y-%m-%d %H:%M') if sessao.data_fechamento else '-'])
-        ws.append([])
-        header = ['Data', 'Tipo', 'Origem', 'Forma pagamento', 'Origem dados', 'Valor', 'Descrição']
-        ws.append(header)
-        for cell in ws[ws.max_row]:
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color='EEEEEE', end_color='EEEEEE', fill_type='solid')
-            cell.alignment = Alignment(horizontal='center')
-        for m in movimentos:
-            origem_dados = 'Importado' if (m.descricao and '[IMPORTADO]' in m.descricao) else 'Manual'
-            ws.append([
-                m.created_at.strftime('%Y-%m-%d %H:%M') if m.created_at else '',
-                m.tipo or '',
-                m.origem or '',
-                m.forma_pagamento or '',
-                origem_dados,
-                float(f'{(m.valor or 0):.2f}'),
-                m.descricao or ''
-            ])
-        ws.append([])
-        ws.append(['Entradas', entradas])
-        ws.append(['Saídas', saidas])
-        ws.append(['Saldo parcial', saldo_parcial])
-        import io
-        bio = io.BytesIO()
-        wb.save(bio)
-        bio.seek(0)
-        resp = make_response(bio.read())
-        resp.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        resp.headers['Content-Disposition'] = f'attachment; filename="caixa_sessao_{sessao.id}.xlsx"'
-        return resp
-
-    elif formato == 'pdf':
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        styles = getSampleStyleSheet()
-        elements.append(Paragraph(f'Sessão do Caixa #{sessao.id}', styles['Title']))
-        elements.append(Paragraph(f'Início: {sessao.data_abertura.strftime("%d/%m/%Y %H:%M") if sessao.data_abertura else "-"}', styles['Normal']))
-        elements.append(Paragraph(f'Fim: {sessao.data_fechamento.strftime("%d/%m/%Y %H:%M") if sessao.data_fechamento else "-"}', styles['Normal']))
-        elements.append(Spacer(1, 12))
-        data_tbl = [['Data', 'Tipo', 'Origem', 'Forma pgto.', 'Origem dados', 'Valor', 'Descrição']]
-        for m in movimentos:
-            origem_dados = 'Importado' if (m.descricao and '[IMPORTADO]' in m.descricao) else 'Manual'
-            data_tbl.append([
-                m.created_at.strftime('%d/%m/%Y %H:%M') if m.created_at else '',
-                m.tipo or '',
-                m.origem or '',
-                m.forma_pagamento or '',
-                origem_dados,
-                f'R$ {(m.valor or 0):.2f}',
-                (m.descricao or '')[:80]
-            ])
-        table = Table(data_tbl, repeatRows=1)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.black),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('GRID', (0,0), (-1,-1), 0.25, colors.grey),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightyellow]),
-        ]))
-        elements.append(table)
-        elements.append(Spacer(1, 12))
-        elements.append(Paragraph(f'Entradas: R$ {entradas:.2f}', styles['Normal']))
-        elements.append(Paragraph(f'Saídas: R$ {saidas:.2f}', styles['Normal']))
-        elements.append(Paragraph(f'Saldo parcial: R$ {saldo_parcial:.2f}', styles['Normal']))
-        doc.build(elements)
-        pdf = buffer.getvalue()
-        buffer.close()
-        resp = make_response(pdf)
-        resp.headers['Content-Type'] = 'application/pdf'
-        resp.headers['Content-Disposition'] = f'attachment; filename="caixa_sessao_{sessao.id}.pdf"'
-        return resp
 
-    else:
-        flash('Formato de exportação inválido.', 'warning')
+    # Segundo plano: pedido explícito (?async=1) ou PDF grande demais para a requisição
+    em_segundo_plano = request.args.get('async') == '1'
+    if not em_segundo_plano and formato == 'pdf':
+        limite = app.config.get('EXPORT_SYNC_MAX_ROWS', 5000)
+        em_segundo_plano = export_engine.count_rows(export_engine.caixa_movimentos_stmt(sessao.id, de, ate), limite) > limite
+    if em_segundo_plano:
+        from export_jobs import criar_job, TIPO_CAIXA_SESSAO
+        criar_job(user_id, TIPO_CAIXA_SESSAO, formato, {
+            'sessao_id': sessao.id,
+            'de': de.isoformat() if de else None,
+            'ate': ate.isoformat() if ate else None,
+        })
+        link_relatorios = url_for('reports.relatorios')
+        flash(Markup(f"Exportação da sessão #{sessao.id} iniciada. O arquivo ficará disponível em <a href='{link_relatorios}#exportacoes' class='alert-link'>Relatórios</a>."), 'info')
         return redirect(url_for('caixa_sessao_detalhes', sessao_id=sessao.id))
 
+    return export_engine.file_response(
+        f'caixa_sessao_{sessao.id}.{export_engine.EXTENSOES[formato]}', formato,
+        lambda f: export_engine.write_caixa_sessao(f, formato, sessao, de, ate))
+
 @app.route('/api/produtos', methods=['GET', 'POST'])
 @csrf.exempt
 @jwt_required()
@@ -3834,23 +3546,12 @@ def api_produtos():
     user_id = int(get_jwt_identity())
     
     if request.method == 'GET':
-        # Listar produtos com paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 20, type=int), 100)
-        search = request.args.get('search', '', type=str)
-        categoria = request.args.get('categoria', '', type=str)
-        
-        query = Produto.query.filter_by(user_id=user_id)
-        
-        # Filtros
-        if search:
-            query = query.filter(Produto.nome.contains(search))
-        if categoria:
-            query = query.filter_by(categoria=categoria)
-        
-        # Paginação
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        produtos = pagination.items
+        # Listar produtos com paginação por cursor (?cursor=...; 'search' equivale a 'q')
+        from list_query import list_page
+        args = request.args.to_dict()
+        args.setdefault('q', args.get('search', ''))
+        pagina = list_page('produtos', args, user_id, per_page=20, max_per_page=100)
+        produtos = pagina.items
         
         return jsonify({
             'produtos': [{
@@ -3864,14 +3565,7 @@ def api_produtos():
                 'codigo_barras': p.codigo_barras,
                 'created_at': p.created_at.isoformat() if p.created_at else None
             } for p in produtos],
-            'pagination': {
-                'page': pagination.page,
-                'per_page': pagination.per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagina.as_dict()
         })
     
     elif request.method == 'POST':
@@ -3993,20 +3687,12 @@ def api_clientes():
     user_id = int(get_jwt_identity())
     
     if request.method == 'GET':
-        # Listar clientes com paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 20, type=int), 100)
-        search = request.args.get('search', '', type=str)
-        
-        query = Cliente.query.filter_by(user_id=user_id)
-        
-        # Filtros
-        if search:
-            query = query.filter(Cliente.nome.contains(search))
-        
-        # Paginação
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        clientes = pagination.items
+        # Listar clientes com paginação por cursor (?cursor=...; 'search' equivale a 'q')
+        from list_query import list_page
+        args = request.args.to_dict()
+        args.setdefault('q', args.get('search', ''))
+        pagina = list_page('clientes', args, user_id, per_page=20, max_per_page=100)
+        clientes = pagina.items
         
         return jsonify({
             'clientes': [{
@@ -4020,14 +3706,7 @@ def api_clientes():
                 'cep': c.cep,
                 'created_at': c.created_at.isoformat() if c.created_at else None
             } for c in clientes],
-            'pagination': {
-                'page': pagination.page,
-                'per_page': pagination.per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'pagination': pagina.as_dict()
         })
     
     elif request.method == 'POST':
@@ -4141,48 +3820,47 @@ def api_cliente(id):
 @app.route('/api/fornecedores')
 @csrf.exempt
 @login_required
+@versionado()
 def api_fornecedores():
     user_id = session['user_id']
-    fornecedores = Fornecedor.query.filter_by(user_id=user_id, status='ativo').all()
-    
-    return jsonify([{
-        'id': f.id,
-        'nome': f.nome,
-        'razao_social': f.razao_social,
-        'cnpj': f.cnpj
-    } for f in fornecedores])
+    import query_shapes
+    return jsonify(query_shapes.listar(
+        'fornecedor', Fornecedor.query.filter_by(user_id=user_id, status='ativo')))
 
 # API para categorias
 @app.route('/api/categorias', methods=['GET', 'POST'])
 @csrf.exempt
 @login_required
+@versionado()
 def api_categorias():
     if request.method == 'GET':
         # Buscar todas as categorias existentes no sistema (produtos e produtos auxiliares)
         user_id = session['user_id']
         
-        # Categorias de produtos
-        categorias_produtos = db.session.query(Produto.categoria).filter(
-            Produto.user_id == user_id,
-            Produto.categoria.isnot(None),
-            Produto.categoria != ''
-        ).distinct().all()
-        
-        # Categorias de produtos auxiliares
-        categorias_auxiliares = db.session.query(ProdutoAuxiliar.categoria).filter(
-            ProdutoAuxiliar.user_id == user_id,
-            ProdutoAuxiliar.categoria.isnot(None),
-            ProdutoAuxiliar.categoria != ''
-        ).distinct().all()
-        
-        # Combinar e remover duplicatas
-        todas_categorias = set()
-        todas_categorias.update([cat[0] for cat in categorias_produtos])
-        todas_categorias.update([cat[0] for cat in categorias_auxiliares])
-        
-        lista_categorias = sorted(list(todas_categorias))
+        def calcular():
+            # Categorias de produtos
+            categorias_produtos = db.session.query(Produto.categoria).filter(
+                Produto.user_id == user_id,
+                Produto.categoria.isnot(None),
+                Produto.categoria != ''
+            ).distinct().all()
+            
+            # Categorias de produtos auxiliares
+            categorias_auxiliares = db.session.query(ProdutoAuxiliar.categoria).filter(
+                ProdutoAuxiliar.user_id == user_id,
+                ProdutoAuxiliar.categoria.isnot(None),
+                ProdutoAuxiliar.categoria != ''
+            ).distinct().all()
+            
+            # Combinar e remover duplicatas
+            todas_categorias = set()
+            todas_categorias.update([cat[0] for cat in categorias_produtos])
+            todas_categorias.update([cat[0] for cat in categorias_auxiliares])
+            
+            return sorted(list(todas_categorias))
         
-        return jsonify(lista_categorias)
+        # Invalidada por escritas em Produto/ProdutoAuxiliar do tenant
+        return jsonify(cache.obter('categorias', user_id, calcular))
     
     elif request.method == 'POST':
         # Criar nova categoria com verificação de duplicação
@@ -4288,32 +3966,37 @@ def toggle_dark_mode():
 @require_plan('reports')
 def relatorios():
     user_id = session['user_id']
-    
-    # KPIs rápidos para o dashboard de relatórios
-    total_produtos = Produto.query.filter_by(user_id=user_id).count()
-    total_clientes = Cliente.query.filter_by(user_id=user_id).count()
-    
-    # Vendas do mês atual
     inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    vendas_mes = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda >= inicio_mes,
-        Venda.status == 'finalizada'
-    ).all()
     
-    receita_mes = sum(venda.valor_total for venda in vendas_mes)
+    def calcular():
+        # KPIs rápidos para o dashboard de relatórios
+        receita_mes = db.session.query(db.func.coalesce(db.func.sum(Venda.valor_total), 0)).filter(
+            Venda.user_id == user_id,
+            Venda.data_venda >= inicio_mes,
+            Venda.status == 'finalizada'
+        ).scalar()
+        return {
+            'total_produtos': Produto.query.filter_by(user_id=user_id).count(),
+            'total_clientes': Cliente.query.filter_by(user_id=user_id).count(),
+            'receita_mes': float(receita_mes or 0),
+            'produtos_estoque_baixo': Produto.query.filter(
+                Produto.user_id == user_id,
+                Produto.estoque_atual <= Produto.estoque_minimo
+            ).count(),
+        }
     
-    # Produtos com estoque baixo
-    produtos_estoque_baixo = Produto.query.filter(
-        Produto.user_id == user_id,
-        Produto.estoque_atual <= Produto.estoque_minimo
-    ).count()
+    kpis = cache.obter('relatorios_kpis', user_id, calcular, inicio_mes.strftime('%Y-%m'))
+    
+    # Exportações em segundo plano recentes (acompanhadas por polling na página)
+    exportacoes = (ExportJob.query.filter_by(user_id=user_id)
+                   .order_by(ExportJob.created_at.desc()).limit(10).all())
     
-    return render_template('relatorios/index.html',
-                         total_produtos=total_produtos,
-                         total_clientes=total_clientes,
-                         receita_mes=receita_mes,
-                         produtos_estoque_baixo=produtos_estoque_baixo)
+    return render_template('relatorios/index.html', exportacoes=exportacoes, **kpis)
+
+def _ultimos_meses_cache(user_id, ultimos_meses):
+    """Série de 12 meses do resumo diário, compartilhada por fluxo de caixa e sazonalidade"""
+    return cache.obter('ultimos_12_meses', user_id, lambda: ultimos_meses(12, user_id=user_id),
+                       datetime.now().strftime('%Y-%m'))
 
 # ==================== RELATÓRIOS FINANCEIROS ====================
 
@@ -4328,22 +4011,23 @@ def relatorio_pl():
     inicio = request.args.get('inicio', datetime.now().replace(day=1).strftime('%Y-%m-%d'))
     fim = request.args.get('fim', datetime.now().strftime('%Y-%m-%d'))
     
-    # Receitas
-    vendas = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda.between(inicio, fim),
-        Venda.status == 'finalizada'
-    ).all()
-    
-    receita_total = sum(v.valor_total for v in vendas)
-    
-    # Custos
-    compras = Compra.query.filter(
-        Compra.user_id == user_id,
-        Compra.data_compra.between(inicio, fim)
-    ).all()
+    def calcular():
+        # Receitas
+        vendas = Venda.query.filter(
+            Venda.user_id == user_id,
+            Venda.data_venda.between(inicio, fim),
+            Venda.status == 'finalizada'
+        ).all()
+        
+        # Custos
+        compras = Compra.query.filter(
+            Compra.user_id == user_id,
+            Compra.data_compra.between(inicio, fim)
+        ).all()
+        
+        return sum(v.valor_total for v in vendas), sum(c.valor_total for c in compras)
     
-    custo_total = sum(c.valor_total for c in compras)
+    receita_total, custo_total = cache.obter('relatorio_pl', user_id, calcular, inicio, fim)
     
     # Margem de lucro
     margem_lucro = receita_total - custo_total
@@ -4361,38 +4045,16 @@ def relatorio_pl():
 @login_required
 @require_plan('reports')
 def relatorio_fluxo_caixa():
+    from resumo_diario import ultimos_meses
     user_id = session['user_id']
     
-    # Últimos 12 meses
-    fluxo_mensal = []
-    for i in range(12):
-        mes = datetime.now() - timedelta(days=30*i)
-        inicio_mes = mes.replace(day=1)
-        fim_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        # Entradas (vendas)
-        vendas_mes = Venda.query.filter(
-            Venda.user_id == user_id,
-            Venda.data_venda.between(inicio_mes, fim_mes),
-            Venda.status == 'finalizada'
-        ).all()
-        
-        entradas = sum(v.valor_total for v in vendas_mes)
-        
-        # Saídas (compras)
-        compras_mes = Compra.query.filter(
-            Compra.user_id == user_id,
-            Compra.data_compra.between(inicio_mes, fim_mes)
-        ).all()
-        
-        saidas = sum(c.valor_total for c in compras_mes)
-        
-        fluxo_mensal.append({
-            'mes': inicio_mes.strftime('%Y-%m'),
-            'entradas': entradas,
-            'saidas': saidas,
-            'saldo': entradas - saidas
-        })
+    # Últimos 12 meses de calendário (resumo diário), do mais recente ao mais antigo
+    fluxo_mensal = [{
+        'mes': item['periodo'].strftime('%Y-%m'),
+        'entradas': item['vendas_valor'],
+        'saidas': item['compras_valor'],
+        'saldo': item['saldo']
+    } for item in reversed(_ultimos_meses_cache(user_id, ultimos_meses))]
     
     return render_template('relatorios/fluxo_caixa.html', fluxo_mensal=fluxo_mensal)
 
@@ -4405,17 +4067,21 @@ def relatorio_fluxo_caixa():
 def relatorio_top_produtos():
     user_id = session['user_id']
     
-    # Query para produtos mais vendidos
-    top_produtos = db.session.query(
-        Produto.nome,
-        db.func.sum(ItemVenda.quantidade).label('total_vendido'),
-        db.func.sum(ItemVenda.quantidade * ItemVenda.preco_unitario).label('receita_total')
-    ).join(ItemVenda).join(Venda).filter(
-        Venda.user_id == user_id,
-        Venda.status == 'finalizada'
-    ).group_by(Produto.id, Produto.nome).order_by(
-        db.func.sum(ItemVenda.quantidade).desc()
-    ).limit(10).all()
+    def calcular():
+        # Query para produtos mais vendidos
+        linhas = db.session.query(
+            Produto.nome,
+            db.func.sum(ItemVenda.quantidade).label('total_vendido'),
+            db.func.sum(ItemVenda.quantidade * ItemVenda.preco_unitario).label('receita_total')
+        ).join(ItemVenda).join(Venda).filter(
+            Venda.user_id == user_id,
+            Venda.status == 'finalizada'
+        ).group_by(Produto.id, Produto.nome).order_by(
+            db.func.sum(ItemVenda.quantidade).desc()
+        ).limit(10).all()
+        return [dict(linha._mapping) for linha in linhas]
+    
+    top_produtos = cache.obter('relatorio_top_produtos', user_id, calcular)
     
     return render_template('relatorios/top_produtos.html', top_produtos=top_produtos)
 
@@ -4424,26 +4090,15 @@ def relatorio_top_produtos():
 @login_required
 @require_plan('reports')
 def relatorio_sazonalidade():
+    from resumo_diario import ultimos_meses
     user_id = session['user_id']
     
-    # Vendas por mês (últimos 12 meses)
-    vendas_por_mes = []
-    for i in range(12):
-        mes = datetime.now() - timedelta(days=30*i)
-        inicio_mes = mes.replace(day=1)
-        fim_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        vendas_mes = Venda.query.filter(
-            Venda.user_id == user_id,
-            Venda.data_venda.between(inicio_mes, fim_mes),
-            Venda.status == 'finalizada'
-        ).all()
-        
-        vendas_por_mes.append({
-            'mes': inicio_mes.strftime('%Y-%m'),
-            'total': sum(v.valor_total for v in vendas_mes),
-            'quantidade': len(vendas_mes)
-        })
+    # Vendas por mês (últimos 12 meses de calendário, do mais recente ao mais antigo)
+    vendas_por_mes = [{
+        'mes': item['periodo'].strftime('%Y-%m'),
+        'total': item['vendas_valor'],
+        'quantidade': item['vendas_qtd']
+    } for item in reversed(_ultimos_meses_cache(user_id, ultimos_meses))]
     
     return render_template('relatorios/sazonalidade.html', vendas_por_mes=vendas_por_mes)
 
@@ -4454,81 +4109,32 @@ def relatorio_sazonalidade():
 @login_required
 @require_plan('reports')
 def relatorio_rotatividade_estoque():
+    from inventory_analytics import rotatividade_page
     user_id = session['user_id']
     
-    produtos_rotatividade = []
-    produtos = Produto.query.filter_by(user_id=user_id).all()
-    
-    for produto in produtos:
-        # Vendas do produto nos últimos 30 dias
-        inicio = datetime.now() - timedelta(days=30)
-        vendas_produto = db.session.query(
-            db.func.sum(ItemVenda.quantidade)
-        ).join(Venda).filter(
-            ItemVenda.produto_id == produto.id,
-            Venda.user_id == user_id,
-            Venda.data_venda >= inicio,
-            Venda.status == 'finalizada'
-        ).scalar() or 0
-        
-        # Rotatividade = vendas / estoque médio
-        estoque_medio = produto.estoque_atual
-        rotatividade = (vendas_produto / estoque_medio) if estoque_medio > 0 else 0
-        
-        produtos_rotatividade.append({
-            'produto': produto,
-            'vendas_30_dias': vendas_produto,
-            'estoque_atual': produto.estoque_atual,
-            'rotatividade': rotatividade
-        })
-    
-    # Ordenar por rotatividade
-    produtos_rotatividade.sort(key=lambda x: x['rotatividade'], reverse=True)
+    # Vendas de 30/90 dias, rotatividade, ordenação e paginação em SQL
+    pagina = cache.obter('relatorio_rotatividade', user_id,
+                         lambda: rotatividade_page(user_id, request.args), chave_args(request.args))
     
     return render_template('relatorios/rotatividade_estoque.html', 
-                         produtos_rotatividade=produtos_rotatividade)
+                         produtos_rotatividade=pagina.items,
+                         pagina=pagina)
 
 # Produtos Parados
 @reports_bp.route('/produtos-parados', endpoint='relatorio_produtos_parados')
 @login_required
 @require_plan('reports')
 def relatorio_produtos_parados():
+    from inventory_analytics import produtos_parados_page
     user_id = session['user_id']
     
-    # Produtos sem vendas nos últimos 90 dias
-    inicio = datetime.now() - timedelta(days=90)
-    
-    produtos_parados = []
-    produtos = Produto.query.filter_by(user_id=user_id).all()
-    
-    for produto in produtos:
-        # Verificar se teve vendas nos últimos 90 dias
-        vendas_recentes = db.session.query(ItemVenda).join(Venda).filter(
-            ItemVenda.produto_id == produto.id,
-            Venda.user_id == user_id,
-            Venda.data_venda >= inicio,
-            Venda.status == 'finalizada'
-        ).first()
-        
-        if not vendas_recentes and produto.estoque_atual > 0:
-            # Última venda
-            ultima_venda = db.session.query(Venda.data_venda).join(ItemVenda).filter(
-                ItemVenda.produto_id == produto.id,
-                Venda.user_id == user_id,
-                Venda.status == 'finalizada'
-            ).order_by(Venda.data_venda.desc()).first()
-            
-            produtos_parados.append({
-                'produto': produto,
-                'ultima_venda': ultima_venda[0] if ultima_venda else None,
-                'dias_sem_venda': (datetime.now() - ultima_venda[0]).days if ultima_venda else 999
-            })
-    
-    # Ordenar por dias sem venda
-    produtos_parados.sort(key=lambda x: x['dias_sem_venda'], reverse=True)
+    # Produtos com estoque e sem vendas nos últimos 90 dias (snapshot da última venda)
+    pagina = cache.obter('relatorio_produtos_parados', user_id,
+                         lambda: produtos_parados_page(user_id, request.args), chave_args(request.args))
     
     return render_template('relatorios/produtos_parados.html', 
-                         produtos_parados=produtos_parados)
+                         produtos_parados=pagina.items,
+                         pagina=pagina)
 
 # ==================== DASHBOARD EXECUTIVO ====================
 
@@ -4536,49 +4142,64 @@ def relatorio_produtos_parados():
 @app.route('/api/dashboard-kpis')
 @csrf.exempt
 @login_required
+@versionado(diario=True)
 def api_dashboard_kpis():
+    from resumo_diario import ultimos_meses
     user_id = session['user_id']
     
-    # Período atual vs anterior
+    def calcular():
+        # Mês atual e anterior em uma consulta ao resumo diário
+        anterior, atual = ultimos_meses(2, user_id=user_id)
+        receita_atual = atual['vendas_valor']
+        receita_anterior = anterior['vendas_valor']
+        
+        # Crescimento percentual
+        crescimento = ((receita_atual - receita_anterior) / receita_anterior * 100) if receita_anterior > 0 else 0
+        
+        # Outros KPIs
+        total_clientes = Cliente.query.filter_by(user_id=user_id).count()
+        produtos_estoque_baixo = Produto.query.filter(
+            Produto.user_id == user_id,
+            Produto.estoque_atual <= Produto.estoque_minimo
+        ).count()
+        
+        return {
+            'receita_atual': receita_atual,
+            'receita_anterior': receita_anterior,
+            'crescimento': crescimento,
+            'total_clientes': total_clientes,
+            'produtos_estoque_baixo': produtos_estoque_baixo,
+            'ticket_medio': receita_atual / atual['vendas_qtd'] if atual['vendas_qtd'] else 0
+        }
+    
+    # Cache por tenant; o mês entra na chave para virar junto com o calendário
+    return jsonify(cache.obter('dashboard_kpis', user_id, calcular, datetime.now().strftime('%Y-%m')))
+
+# Série de vendas/compras por dia, semana ou mês (resumo diário)
+@app.route('/api/serie-financeira')
+@login_required
+def api_serie_financeira():
+    from resumo_diario import serie, meses_atras
+    user_id = session['user_id']
     hoje = datetime.now().date()
-    inicio_mes_atual = hoje.replace(day=1)
-    inicio_mes_anterior = (inicio_mes_atual - timedelta(days=1)).replace(day=1)
-    fim_mes_anterior = inicio_mes_atual - timedelta(days=1)
-    
-    # Vendas do mês atual
-    vendas_atual = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda >= inicio_mes_atual,
-        Venda.status == 'finalizada'
-    ).all()
-    
-    # Vendas do mês anterior
-    vendas_anterior = Venda.query.filter(
-        Venda.user_id == user_id,
-        Venda.data_venda.between(inicio_mes_anterior, fim_mes_anterior),
-        Venda.status == 'finalizada'
-    ).all()
-    
-    receita_atual = sum(v.valor_total for v in vendas_atual)
-    receita_anterior = sum(v.valor_total for v in vendas_anterior)
-    
-    # Crescimento percentual
-    crescimento = ((receita_atual - receita_anterior) / receita_anterior * 100) if receita_anterior > 0 else 0
-    
-    # Outros KPIs
-    total_clientes = Cliente.query.filter_by(user_id=user_id).count()
-    produtos_estoque_baixo = Produto.query.filter(
-        Produto.user_id == user_id,
-        Produto.estoque_atual <= Produto.estoque_minimo
-    ).count()
+    
+    try:
+        fim = datetime.strptime(request.args['fim'], '%Y-%m-%d').date() if request.args.get('fim') else hoje
+        inicio = (datetime.strptime(request.args['inicio'], '%Y-%m-%d').date()
+                  if request.args.get('inicio') else meses_atras(fim, 11))
+        escopo = {'user_id': user_id}
+        # Administradores podem consultar a empresa inteira
+        if request.args.get('escopo') == 'empresa' and is_admin():
+            empresa_id = get_principal(user_id).user.empresa_id
+            if empresa_id is not None:
+                escopo = {'empresa_id': empresa_id}
+        itens = serie(inicio, fim, request.args.get('granularidade', 'mes'), **escopo)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     return jsonify({
-        'receita_atual': receita_atual,
-        'receita_anterior': receita_anterior,
-        'crescimento': crescimento,
-        'total_clientes': total_clientes,
-        'produtos_estoque_baixo': produtos_estoque_baixo,
-        'ticket_medio': receita_atual / len(vendas_atual) if vendas_atual else 0
+        'success': True,
+        'data': [{**item, 'periodo': item['periodo'].isoformat()} for item in itens]
     })
 
 # ==================== SISTEMA DE EXPORTAÇÃO ====================
@@ -4588,17 +4209,23 @@ def api_dashboard_kpis():
 @login_required
 @require_plan('reports')
 def exportar_relatorio(tipo, formato):
+    import export_engine
     user_id = session['user_id']
-    # Modo assíncrono opcional via stub de tasks
-    try:
-        if request.args.get('async') == '1':
-            from tasks.exports import export_report
-            result = export_report(tipo, user_id, formato)
-            link_relatorios = url_for('reports.relatorios')
-            flash(Markup(f"Exportação iniciada: {tipo} ({formato}). Status: {result.get('status')} — <a href='{link_relatorios}' class='alert-link'>Ver Relatórios</a>"), 'info')
-            return redirect(link_relatorios)
-    except Exception:
-        pass
+    if tipo not in export_engine.REPORTS or formato not in export_engine.WRITERS:
+        flash('Tipo de relatório inválido.', 'error')
+        return redirect(url_for('reports.relatorios'))
+
+    # Segundo plano: pedido explícito (?async=1) ou PDF grande demais para a requisição
+    em_segundo_plano = request.args.get('async') == '1'
+    if not em_segundo_plano and formato == 'pdf':
+        limite = app.config.get('EXPORT_SYNC_MAX_ROWS', 5000)
+        em_segundo_plano = export_engine.count_report(tipo, user_id, limite) > limite
+    if em_segundo_plano:
+        from export_jobs import criar_job
+        job = criar_job(user_id, tipo, formato)
+        link_relatorios = url_for('reports.relatorios')
+        flash(Markup(f"Exportação iniciada: {tipo} ({formato}). O arquivo ficará disponível em <a href='{link_relatorios}#exportacoes' class='alert-link'>Relatórios</a>."), 'info')
+        return redirect(link_relatorios)
     
     if formato == 'pdf':
         return exportar_pdf(tipo, user_id)
@@ -4608,60 +4235,41 @@ def exportar_relatorio(tipo, formato):
         return exportar_csv(tipo, user_id)
 
 def exportar_pdf(tipo, user_id):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Título
-    title = Paragraph(f"Relatório de {tipo.title()}", styles['Title'])
-    story.append(title)
-    story.append(Spacer(1, 12))
-    
-    # Dados baseados no tipo
-    if tipo == 'vendas':
-        vendas = Venda.query.filter_by(user_id=user_id).all()
-        data = [['Data', 'Cliente', 'Valor', 'Status']]
-        for venda in vendas:
-            data.append([
-                venda.data_venda.strftime('%d/%m/%Y'),
-                venda.cliente.nome if venda.cliente else 'N/A',
-                f"R$ {venda.valor_total:.2f}",
-                venda.status
-            ])
-    elif tipo == 'produtos':
-        produtos = Produto.query.filter_by(user_id=user_id).all()
-        data = [['Nome', 'Preço', 'Estoque', 'Categoria']]
-        for produto in produtos:
-            data.append([
-                produto.nome,
-                f"R$ {produto.preco:.2f}",
-                str(produto.estoque_atual),
-                produto.categoria or 'N/A'
-            ])
-    
-    # Criar tabela
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(table)
-    doc.build(story)
-    
-    buffer.seek(0)
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=relatorio_{tipo}.pdf'
-    
-    return response
+    import export_engine
+    return export_engine.file_response(
+        f'relatorio_{tipo}.pdf', 'pdf',
+        lambda f: export_engine.write_report(f, tipo, 'pdf', user_id))
+
+@reports_bp.route('/exportacoes/<string:job_id>', endpoint='exportacao_status')
+@login_required
+def exportacao_status(job_id):
+    from export_jobs import job_payload
+    job = ExportJob.query.filter_by(id=job_id, user_id=session['user_id']).first_or_404()
+    return jsonify(job_payload(job))
+
+@reports_bp.route('/exportacoes/<string:job_id>/download', endpoint='exportacao_download')
+@login_required
+def exportacao_download(job_id):
+    import export_engine
+    from export_jobs import STATUS_CONCLUIDO, nome_download
+    job = ExportJob.query.filter_by(id=job_id, user_id=session['user_id']).first_or_404()
+    if (job.status != STATUS_CONCLUIDO or not job.arquivo or not os.path.exists(job.arquivo)
+            or (job.expires_at and job.expires_at < datetime.utcnow())):
+        flash('Exportação indisponível ou expirada.', 'warning')
+        return redirect(url_for('reports.relatorios'))
+    return send_file(job.arquivo, mimetype=export_engine.MIMETYPES[job.formato],
+                     as_attachment=True, download_name=nome_download(job))
+
+# Acertos/faltas do cache compartilhado (somados entre os workers)
+@admin_bp.route('/cache/metricas', methods=['GET'], endpoint='admin_cache_metricas')
+@login_required
+@admin_required
+def admin_cache_metricas():
+    return jsonify({
+        'success': True,
+        'backend': type(cache.store).__name__ if cache.store else None,
+        'metricas': cache.metricas()
+    })
 
 @admin_bp.route('/auditoria', methods=['GET'], endpoint='admin_auditoria')
 @login_required
@@ -4699,115 +4307,24 @@ def admin_auditoria():
     return render_template('admin/auditoria.html', pagination=pagination, entidade=entidade, acao=acao, uid=uid, start=start, end=end)
 
 def exportar_excel(tipo, user_id):
-    buffer = BytesIO()
-    
-    # Criar workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Relatório {tipo.title()}"
-    
-    # Estilo do cabeçalho
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Dados baseados no tipo
-    if tipo == 'vendas':
-        vendas = Venda.query.filter_by(user_id=user_id).all()
-        headers = ['Data', 'Cliente', 'Valor', 'Status']
-        ws.append(headers)
-        
-        for venda in vendas:
-            ws.append([
-                venda.data_venda.strftime('%d/%m/%Y'),
-                venda.cliente.nome if venda.cliente else 'N/A',
-                venda.valor_total,
-                venda.status
-            ])
-    elif tipo == 'produtos':
-        produtos = Produto.query.filter_by(user_id=user_id).all()
-        headers = ['Nome', 'Preço', 'Estoque', 'Categoria']
-        ws.append(headers)
-        
-        for produto in produtos:
-            ws.append([
-                produto.nome,
-                produto.preco,
-                produto.estoque_atual,
-                produto.categoria or 'N/A'
-            ])
-    
-    # Aplicar estilo ao cabeçalho
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-    
-    # Ajustar largura das colunas
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename=relatorio_{tipo}.xlsx'
-    
-    return response
+    # Streaming: SELECT em lotes + openpyxl write-only (memória constante)
+    import export_engine
+    if tipo not in export_engine.REPORTS:
+        flash('Tipo de relatório inválido.', 'error')
+        return redirect(url_for('reports.relatorios'))
+    return export_engine.file_response(
+        f'relatorio_{tipo}.xlsx', 'excel',
+        lambda f: export_engine.write_report(f, tipo, 'excel', user_id))
 
 def exportar_csv(tipo, user_id):
-    buffer = BytesIO()
-    
-    # Dados baseados no tipo
-    if tipo == 'vendas':
-        vendas = Venda.query.filter_by(user_id=user_id).all()
-        data = []
-        for venda in vendas:
-            data.append({
-                'Data': venda.data_venda.strftime('%d/%m/%Y'),
-                'Cliente': venda.cliente.nome if venda.cliente else 'N/A',
-                'Valor': venda.valor_total,
-                'Status': venda.status
-            })
-    elif tipo == 'produtos':
-        produtos = Produto.query.filter_by(user_id=user_id).all()
-        data = []
-        for produto in produtos:
-            data.append({
-                'Nome': produto.nome,
-                'Preço': produto.preco,
-                'Estoque': produto.estoque_atual,
-                'Categoria': produto.categoria or 'N/A'
-            })
-    
-    # Converter para CSV usando implementação nativa do Python
-    import csv
-    import io
-    
-    output = io.StringIO()
-    if data:
-        writer = csv.DictWriter(output, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-    csv_string = output.getvalue()
-    output.close()
-    
-    response = make_response(csv_string)
-    response.headers['Content-Type'] = 'text/csv; charset=utf-8-sig'
-    response.headers['Content-Disposition'] = f'attachment; filename=relatorio_{tipo}.csv'
-    
-    return response
+    # Streaming: as linhas são enviadas em blocos à medida que o cursor avança
+    import export_engine
+    if tipo not in export_engine.REPORTS:
+        flash('Tipo de relatório inválido.', 'error')
+        return redirect(url_for('reports.relatorios'))
+    headers, rows = export_engine.report_rows(tipo, user_id)
+    return export_engine.csv_response(f'relatorio_{tipo}.csv', headers, rows,
+                                      content_type='text/csv; charset=utf-8-sig')
 
 # Rotas de Cupons
 @app.route('/cupons')
@@ -4815,8 +4332,10 @@ def exportar_csv(tipo, user_id):
 @require_plan('cupons')
 def cupons():
     user_id = session['user_id']
+    from cupom_service import estatisticas
     cupons = Cupom.query.filter_by(user_id=user_id).order_by(Cupom.created_at.desc()).all()
-    return render_template('cupons/list.html', cupons=cupons)
+    # Descontos concedidos por cupom, do livro de resgates
+    return render_template('cupons/list.html', cupons=cupons, estatisticas=estatisticas(user_id))
 
 @app.route('/cupons/novo', methods=['GET', 'POST'])
 @login_required
@@ -4986,42 +4505,29 @@ def excluir_cupom(id):
 @login_required
 def validar_cupom(codigo):
     """API para validar cupom e retornar informações"""
-    from datetime import datetime
-    
-    cupom = Cupom.query.filter_by(codigo=codigo.upper(), user_id=session['user_id']).first()
+    from cupom_service import validar
     
+    # Índice em memória dos cupons do tenant (invalidado por escritas em Cupom)
+    cupom, mensagem = validar(codigo, session['user_id'])
     if not cupom:
-        return jsonify({'valido': False, 'mensagem': 'Cupom não encontrado'})
-    
-    # Verificar se cupom está ativo
-    if not cupom.ativo:
-        return jsonify({'valido': False, 'mensagem': 'Cupom inativo'})
-    
-    # Verificar datas (apenas se cupom tiver período de validade definido)
-    if cupom.data_inicio and cupom.data_fim:
-        agora = datetime.utcnow()
-        if agora < cupom.data_inicio:
-            return jsonify({'valido': False, 'mensagem': 'Cupom ainda não é válido'})
-        
-        if agora > cupom.data_fim:
-            return jsonify({'valido': False, 'mensagem': 'Cupom expirado'})
-    
-    # Verificar limite de uso
-    if cupom.limite_uso and cupom.usos_realizados >= cupom.limite_uso:
-        return jsonify({'valido': False, 'mensagem': 'Cupom esgotado'})
+        return jsonify({'valido': False, 'mensagem': mensagem})
     
     # Retornar informações do cupom
     return jsonify({
         'valido': True,
-        'cupom': {
-            'id': cupom.id,
-            'codigo': cupom.codigo,
-            'descricao': cupom.descricao,
-            'tipo_desconto': cupom.tipo_desconto,
-            'valor_desconto': cupom.valor_desconto,
-            'valor_minimo_compra': cupom.valor_minimo_compra,
-            'valor_maximo_desconto': cupom.valor_maximo_desconto
-        }
+        'cupom': cupom.as_dict()
+    })
+
+# Cupons válidos pelo início do código (busca enquanto digita)
+@app.route('/api/cupons/sugestoes')
+@login_required
+def sugestoes_cupons():
+    from cupom_service import sugestoes
+    
+    cupons = sugestoes(request.args.get('q', ''), session['user_id'])
+    return jsonify({
+        'success': True,
+        'data': [cupom.as_dict() for cupom in cupons]
     })
 
 # Registrar blueprints após definir todas as rotas
@@ -0,0 +1,430 @@
+"""
+Cache compartilhado da aplicação, com namespace por tenant
+
+O Flask-Caching estava configurado como 'simple' (um dicionário por worker
+do gunicorn) e nada o usava. Este módulo guarda os resultados caros — KPIs
+do dashboard, listas de categorias, relatórios e o plano resolvido — em um
+backend compartilhado entre os workers (Redis):
+
+- as chaves têm namespace por tenant (user_id, o dono dos dados) e por
+  domínio: ``cache:u<id>:<dominio>:v<global>.<tenant>:<nome>[:partes]``;
+- invalidação por carimbo de versão: escritas nos modelos rastreados
+  incrementam o carimbo do tenant depois do commit; as chaves antigas
+  simplesmente deixam de ser lidas e expiram pelo TTL (nada é varrido);
+- single-flight: numa falta, só quem obtém a trava (SET NX) recalcula; os
+  demais aguardam o valor por até CACHE_LOCK_WAIT segundos, de modo que a
+  expiração de um relatório não manda todas as requisições ao banco;
+- métricas de acertos, faltas, esperas e erros por nome (cache.metricas()).
+
+O backend vem de CACHE_STORE_URL: redis://, rediss://, unix://, fakeredis://
+(testes) ou memory://. Se o Redis não responder, usa memória (por processo).
+Em memória cada worker tem os próprios carimbos e não vê as escritas dos
+outros; por isso os valores só ficam guardados por CACHE_LOCAL_TTL segundos
+(0, o padrão, desliga o cache de resultados e tudo é calculado na hora).
+"""
+
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from itertools import chain
+from urllib.parse import urlencode
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+from empresa_stats import TRACKED_MODELS
+
+# Domínios de carimbo: dados do tenant, plano (muda só com plano/papel),
+# cupons (índice do cupom_service) e catálogo (índice do catalogo_pdv)
+DADOS = 'dados'
+PLANO = 'plano'
+CUPONS = 'cupons'
+CATALOGO = 'catalogo'
+# Tenant do carimbo global de cada domínio
+GLOBAL = '*'
+
+# Modelos cujas escritas invalidam os dados do tenant (dono em user_id)
+MODELOS_DADOS = frozenset(nome for nome, attr in TRACKED_MODELS.items() if attr == 'user_id')
+# Domínio -> modelos cujas escritas (dono em user_id) mudam o carimbo do tenant
+MODELOS_POR_DOMINIO = {DADOS: MODELOS_DADOS, CUPONS: frozenset({'Cupom'}),
+                       CATALOGO: frozenset({'Produto'})}
+
+DEFAULT_TTL = 300
+# TTL dos resultados com o backend em memória (não compartilhado); 0 desativa
+LOCAL_TTL = 0
+LOCK_TTL = 30
+LOCK_WAIT = 10
+POLL_INTERVAL = 0.05
+# Intervalo de envio das métricas locais para o backend compartilhado
+METRICS_FLUSH_SECONDS = 5
+
+EVENTOS = ('hits', 'misses', 'esperas', 'timeouts', 'erros')
+
+_PENDENTES = '_app_cache_pendentes'
+
+
+def tenant(user_id) -> str:
+    return f'u{user_id}'
+
+
+def chave_args(args) -> str:
+    """Parte da chave para filtros da query string (ordem indiferente)"""
+    if not args:
+        return ''
+    itens = args.items(multi=True) if hasattr(args, 'getlist') else args.items()
+    return urlencode(sorted((k, v) for k, v in itens if v))
+
+
+class MemoryCacheStore:
+    """Backend em memória (por processo), com TTL e limite de entradas"""
+
+    compartilhado = False
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # chave -> (expira_em | None, valor)
+        self._hashes = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def _ler(self, chave, agora):
+        item = self._data.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em is not None and expira_em <= agora:
+            del self._data[chave]
+            return None
+        return valor
+
+    def _gravar(self, chave, valor, ttl):
+        self._data[chave] = (time.monotonic() + ttl if ttl else None, valor)
+        self._data.move_to_end(chave)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get_many(self, *chaves) -> list:
+        agora = time.monotonic()
+        with self._lock:
+            return [self._ler(chave, agora) for chave in chaves]
+
+    def set(self, chave, valor, ttl=None):
+        with self._lock:
+            self._gravar(chave, valor, ttl)
+
+    def add(self, chave, valor, ttl=None) -> bool:
+        with self._lock:
+            if self._ler(chave, time.monotonic()) is not None:
+                return False
+            self._gravar(chave, valor, ttl)
+            return True
+
+    def delete_if(self, chave, valor):
+        with self._lock:
+            if self._ler(chave, time.monotonic()) == valor:
+                del self._data[chave]
+
+    def incr(self, chave, inicial: int) -> int:
+        with self._lock:
+            valor = int(self._ler(chave, time.monotonic()) or inicial) + 1
+            self._gravar(chave, valor, None)
+            return valor
+
+    def hincrby_many(self, chave, contagens: dict):
+        with self._lock:
+            self._hashes[chave].update(contagens)
+
+    def hgetall(self, chave) -> dict:
+        with self._lock:
+            return dict(self._hashes.get(chave, {}))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._hashes.clear()
+
+
+class RedisCacheStore:
+    """Backend Redis: compartilhado entre workers; TTL por chave"""
+
+    compartilhado = True
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        if url.startswith('fakeredis://'):
+            import fakeredis
+            return cls(fakeredis.FakeRedis())
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get_many(self, *chaves) -> list:
+        return self.client.mget(chaves)
+
+    def set(self, chave, valor, ttl=None):
+        self.client.set(chave, valor, ex=ttl)
+
+    def add(self, chave, valor, ttl=None) -> bool:
+        return bool(self.client.set(chave, valor, ex=ttl, nx=True))
+
+    def delete_if(self, chave, valor):
+        # Só o dono libera a trava; a janela entre GET e DELETE é coberta pelo TTL
+        atual = self.client.get(chave)
+        if atual is not None and atual.decode() == valor:
+            self.client.delete(chave)
+
+    def incr(self, chave, inicial: int) -> int:
+        pipe = self.client.pipeline()
+        pipe.set(chave, inicial, nx=True)
+        pipe.incr(chave)
+        return pipe.execute()[1]
+
+    def hincrby_many(self, chave, contagens: dict):
+        pipe = self.client.pipeline(transaction=False)
+        for campo, valor in contagens.items():
+            pipe.hincrby(chave, campo, valor)
+        pipe.execute()
+
+    def hgetall(self, chave) -> dict:
+        return {k.decode(): int(v) for k, v in self.client.hgetall(chave).items()}
+
+    def clear(self, prefix: str = 'cache'):
+        for chave in self.client.scan_iter(match=f'{prefix}:*', count=1000):
+            self.client.delete(chave)
+
+
+def create_cache_store(uri: str | None = None, **kwargs):
+    """Cria o backend a partir da URI (memory://, redis://, rediss://, unix:// ou fakeredis://)"""
+    uri = uri or 'memory://'
+    if uri.startswith(('redis://', 'rediss://', 'unix://', 'fakeredis://')):
+        try:
+            store = RedisCacheStore.from_url(uri)
+            store.client.ping()
+            return store
+        except Exception as e:
+            print(f"AVISO: Redis indisponivel para o cache da aplicacao ({e}); usando memoria")
+    return MemoryCacheStore(max_entries=kwargs.get('max_entries', 10000))
+
+
+def _carimbo_inicial() -> int:
+    # Carimbos novos (ou perdidos por eviction) começam no relógio, nunca
+    # repetindo um valor que ainda tenha chaves vivas
+    return int(time.time() * 1000)
+
+
+class AppCache:
+    """Cache de resultados com carimbos de versão por tenant e single-flight"""
+
+    def __init__(self):
+        self.store = None
+        self.prefix = 'cache'
+        self.default_ttl = DEFAULT_TTL
+        self.local_ttl = LOCAL_TTL
+        self.lock_ttl = LOCK_TTL
+        self.lock_wait = LOCK_WAIT
+        self._contagens = Counter()
+        self._contagens_lock = threading.Lock()
+        self._ultimo_envio = time.monotonic()
+
+    def init_app(self, app):
+        self.store = create_cache_store(app.config.get('CACHE_STORE_URL'))
+        self.prefix = app.config.get('CACHE_KEY_PREFIX', 'cache')
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', DEFAULT_TTL)
+        self.local_ttl = app.config.get('CACHE_LOCAL_TTL', LOCAL_TTL)
+        self.lock_wait = app.config.get('CACHE_LOCK_WAIT', LOCK_WAIT)
+        app.extensions['app_cache'] = self
+
+    # ---------- carimbos de versão ----------
+
+    def _chave_versao(self, dominio, tenant_id) -> str:
+        return f'{self.prefix}:ver:{dominio}:{tenant_id}'
+
+    def versao(self, dominio: str, tenant_id: str) -> str:
+        """Carimbo ``<global>.<tenant>`` (memorizado durante a requisição)"""
+        memo = g.setdefault('_app_cache_versoes', {}) if has_app_context() else {}
+        versao = memo.get((dominio, tenant_id))
+        if versao is None:
+            chaves = (self._chave_versao(dominio, GLOBAL), self._chave_versao(dominio, tenant_id))
+            valores = self.store.get_many(*chaves)
+            for i, (chave, valor) in enumerate(zip(chaves, valores)):
+                if valor is None:
+                    inicial = _carimbo_inicial()
+                    self.store.add(chave, inicial)
+                    valores[i] = self.store.get_many(chave)[0] or inicial
+            versao = memo[(dominio, tenant_id)] = '.'.join(str(int(v)) for v in valores)
+        return versao
+
+    def invalidar(self, pares) -> None:
+        """Incrementa os carimbos ``(dominio, tenant)`` (GLOBAL = todos os tenants)"""
+        if self.store is None:
+            return
+        try:
+            for dominio, tenant_id in set(pares):
+                self.store.incr(self._chave_versao(dominio, tenant_id), _carimbo_inicial())
+        except Exception as e:
+            print(f"AVISO: falha ao invalidar o cache ({e})")
+        if has_app_context():
+            g.pop('_app_cache_versoes', None)
+
+    def agendar(self, session, pares) -> None:
+        """Invalida ``pares`` quando a transação da sessão for confirmada"""
+        if session is None:
+            self.invalidar(pares)
+        else:
+            session.info.setdefault(_PENDENTES, set()).update(pares)
+
+    # ---------- leitura com single-flight ----------
+
+    def chave(self, nome: str, user_id, *partes, dominio: str = DADOS) -> str:
+        tenant_id = tenant(user_id)
+        base = f'{self.prefix}:{tenant_id}:{dominio}:v{self.versao(dominio, tenant_id)}:{nome}'
+        return ':'.join([base, *(str(p) for p in partes)])
+
+    def obter(self, nome: str, user_id, calcular, *partes, ttl: int | None = None,
+              dominio: str = DADOS):
+        """Valor em cache de ``calcular()`` para o tenant; recalcula uma vez por falta.
+
+        ``partes`` entram na chave (filtros, página, data). Sem backend ou com
+        o backend fora do ar, apenas chama ``calcular()``. Com o backend em
+        memória o TTL é limitado a CACHE_LOCAL_TTL: as invalidações de outro
+        worker não chegam aqui.
+        """
+        if self.store is None:
+            return calcular()
+        ttl = ttl or self.default_ttl
+        if not getattr(self.store, 'compartilhado', False):
+            if not self.local_ttl:
+                return calcular()
+            ttl = min(ttl, self.local_ttl)
+        try:
+            chave = self.chave(nome, user_id, *partes, dominio=dominio)
+            bruto = self.store.get_many(chave)[0]
+        except Exception as e:
+            print(f"AVISO: cache indisponivel ({e}); calculando direto")
+            self._contar(nome, 'erros')
+            return calcular()
+        if bruto is not None:
+            self._contar(nome, 'hits')
+            return pickle.loads(bruto)
+        self._contar(nome, 'misses')
+        return self._calcular_unico(nome, chave, calcular, ttl)
+
+    def _calcular_unico(self, nome, chave, calcular, ttl):
+        trava = f'{chave}:lock'
+        token = uuid.uuid4().hex
+        limite = time.monotonic() + self.lock_wait
+        esperou = False
+        while True:
+            try:
+                dono = self.store.add(trava, token, self.lock_ttl)
+            except Exception:
+                self._contar(nome, 'erros')
+                return calcular()
+            if dono:
+                try:
+                    valor = calcular()
+                    self._gravar(nome, chave, valor, ttl)
+                    return valor
+                finally:
+                    try:
+                        self.store.delete_if(trava, token)
+                    except Exception:
+                        pass
+            if not esperou:
+                esperou = True
+                self._contar(nome, 'esperas')
+            if time.monotonic() >= limite:
+                # Quem tem a trava está demorando demais: não bloquear a requisição
+                self._contar(nome, 'timeouts')
+                return calcular()
+            time.sleep(POLL_INTERVAL)
+            try:
+                bruto = self.store.get_many(chave)[0]
+            except Exception:
+                bruto = None
+            if bruto is not None:
+                return pickle.loads(bruto)
+
+    def _gravar(self, nome, chave, valor, ttl):
+        try:
+            self.store.set(chave, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), ttl)
+        except Exception as e:
+            print(f"AVISO: falha ao gravar no cache ({e})")
+            self._contar(nome, 'erros')
+
+    # ---------- métricas ----------
+
+    def _contar(self, nome, evento):
+        with self._contagens_lock:
+            self._contagens[f'{nome}:{evento}'] += 1
+        if time.monotonic() - self._ultimo_envio >= METRICS_FLUSH_SECONDS or not self.store.compartilhado:
+            self._enviar_metricas()
+
+    def _enviar_metricas(self):
+        with self._contagens_lock:
+            contagens, self._contagens = self._contagens, Counter()
+            self._ultimo_envio = time.monotonic()
+        if not contagens:
+            return
+        try:
+            self.store.hincrby_many(f'{self.prefix}:metricas', contagens)
+        except Exception:
+            with self._contagens_lock:
+                self._contagens.update(contagens)
+
+    def metricas(self) -> dict:
+        """Contagens por nome (somadas entre os workers) e taxa de acerto"""
+        if self.store is None:
+            return {}
+        self._enviar_metricas()
+        por_nome = defaultdict(lambda: dict.fromkeys(EVENTOS, 0))
+        for campo, valor in self.store.hgetall(f'{self.prefix}:metricas').items():
+            nome, evento = campo.rsplit(':', 1)
+            por_nome[nome][evento] = int(valor)
+        for dados in por_nome.values():
+            leituras = dados['hits'] + dados['misses']
+            dados['hit_ratio'] = round(dados['hits'] / leituras, 4) if leituras else 0.0
+        return dict(por_nome)
+
+
+cache = AppCache()
+
+
+def _registrar_escritas(session, flush_context):
+    """after_flush: guarda os tenants com escritas em modelos rastreados"""
+    pares = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        nome = type(obj).__name__
+        for dominio, modelos in MODELOS_POR_DOMINIO.items():
+            if nome in modelos:
+                user_id = getattr(obj, 'user_id', None)
+                if user_id is not None:
+                    pares.add((dominio, tenant(user_id)))
+    if pares:
+        session.info.setdefault(_PENDENTES, set()).update(pares)
+
+
+def _publicar_versoes(session):
+    pares = session.info.pop(_PENDENTES, None)
+    if pares:
+        cache.invalidar(pares)
+
+
+def _descartar_versoes(session):
+    session.info.pop(_PENDENTES, None)
+
+
+def register_cache_invalidation(db):
+    """Liga os carimbos de versão às escritas da sessão do Flask-SQLAlchemy.
+
+    O carimbo só muda após o commit: antes disso, quem recalculasse ainda
+    leria os dados antigos e os gravaria sob o carimbo novo.
+    """
+    for nome, listener in (('after_flush', _registrar_escritas),
+                           ('after_commit', _publicar_versoes),
+                           ('after_rollback', _descartar_versoes)):
+        if not event.contains(db.session, nome, listener):
+            event.listen(db.session, nome, listener)
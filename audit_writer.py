@@ -0,0 +1,172 @@
+"""
+Gravação assíncrona e em lote da auditoria (AuditLog)
+
+log_audit() não abre mais uma segunda transação por escrita: o evento é
+montado na requisição (empresa_id vem do Principal já carregado) e colocado
+em uma fila em memória. Uma thread por processo grava os eventos em lotes
+com um único INSERT executemany (no Postgres o psycopg2 agrupa as linhas em
+VALUES múltiplos).
+
+- Memória limitada: a fila tem no máximo AUDIT_QUEUE_MAX eventos.
+- Back-pressure: com a fila cheia, quem chama espera até put_timeout e, se
+  ainda não houver espaço, grava o próprio evento de forma síncrona - nenhum
+  evento é descartado por falta de espaço.
+- Encerramento: stop() (registrado no atexit) drena a fila antes de sair.
+
+Com AUDIT_ASYNC=false (ou TESTING) log_audit volta a gravar na hora.
+"""
+
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert
+
+
+def build_audit_event(user_id, entidade, entidade_id, acao, changes_json) -> dict:
+    """Linha de AuditLog pronta para inserção (sem consultar o banco na requisição)"""
+    from flask import has_request_context
+    from principal import get_principal
+
+    empresa_id = None
+    if user_id:
+        if has_request_context():
+            user = get_principal(user_id).user
+        else:
+            from app import User
+            user = User.query.get(user_id)
+        empresa_id = getattr(user, 'empresa_id', None) if user else None
+    return {
+        'user_id': user_id,
+        'empresa_id': empresa_id,
+        'entidade': entidade,
+        'entidade_id': entidade_id,
+        'acao': acao,
+        'changes': changes_json,
+        'created_at': datetime.utcnow(),
+    }
+
+
+class AuditWriter:
+    """Fila limitada + thread de gravação em lote"""
+
+    def __init__(self, app=None, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, put_timeout: float = 0.5):
+        self.app = None
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.stats = {'enfileirados': 0, 'gravados': 0, 'sincronos': 0, 'falhas': 0}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_queue = app.config.get('AUDIT_QUEUE_MAX', self.max_queue)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self._reset()
+        atexit.register(self.stop)
+
+    def _reset(self):
+        # Chamado também após fork (workers do gunicorn): fila e thread são por processo
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stop = threading.Event()
+        self._worker = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._worker is None or not self._worker.is_alive():
+                self._stop.clear()
+                self._worker = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._worker.start()
+
+    def _contar(self, chave: str, n: int = 1) -> None:
+        # Requisições e a thread de gravação atualizam os mesmos contadores
+        with self._stats_lock:
+            self.stats[chave] += n
+
+    def estatisticas(self) -> dict:
+        """Cópia consistente dos contadores"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def submit(self, evento: dict) -> None:
+        """Enfileira o evento; com a fila cheia, grava-o de forma síncrona"""
+        self._ensure_worker()
+        try:
+            self._queue.put(evento, timeout=self.put_timeout)
+            self._contar('enfileirados')
+        except queue.Full:
+            self._contar('sincronos')
+            self._write([evento])
+
+    def _next_batch(self) -> list:
+        try:
+            lote = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(lote) < self.batch_size:
+            try:
+                lote.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            lote = self._next_batch()
+            if not lote:
+                continue
+            try:
+                self._write(lote)
+            finally:
+                for _ in lote:
+                    self._queue.task_done()
+
+    def _write(self, eventos: list) -> None:
+        from app import db, AuditLog
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(insert(AuditLog.__table__), eventos)
+            self._contar('gravados', len(eventos))
+        except Exception as e:
+            self._contar('falhas', len(eventos))
+            print(f"AVISO: falha ao gravar {len(eventos)} evento(s) de auditoria: {e}")
+
+    def flush(self) -> None:
+        """Bloqueia até que todos os eventos enfileirados sejam gravados"""
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drena a fila e encerra a thread (chamado no desligamento)"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._worker is not None and self._worker.is_alive():
+            self._worker.join(timeout)
+        # Sobras (thread não iniciada ou tempo esgotado): gravar aqui mesmo
+        restantes = []
+        while True:
+            try:
+                restantes.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if restantes and self.app is not None:
+            self._write(restantes)
+
+
+audit_writer = AuditWriter()
@@ -0,0 +1,9 @@
+"""
+Benchmarks e testes de carga
+
+- bench_dashboard.py: instruções SQL e tempo do dashboard;
+- bench_security_scan.py: scanner do SecurityMiddleware;
+- dados_sinteticos.py: gerador de tenants sintéticos (SQLite ou Postgres);
+- bench_rotas.py: rotas quentes pelo test client e por HTTP concorrente,
+  com baseline em JSON para detectar regressões.
+"""
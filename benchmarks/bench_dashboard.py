@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark do dashboard: conta as instruções SQL e mede o tempo de
+get_dashboard_stats() e da rota /dashboard com dados sintéticos em SQLite.
+
+Uso: python benchmarks/bench_dashboard.py [--vendas N] [--repeticoes N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_db_file = os.path.join(tempfile.mkdtemp(prefix='bench_dashboard_'), 'bench.db')
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{_db_file}')
+
+from sqlalchemy import event  # noqa: E402
+from app import (app, db, User, Empresa, Produto, Cliente, Venda, Compra,  # noqa: E402
+                 Fornecedor, ProdutoAuxiliar, TicketSuporte)
+from dashboard_stats import get_dashboard_stats  # noqa: E402
+
+# Limite de instruções para o cálculo dos KPIs (KPIs + vendas recentes)
+MAX_QUERIES_STATS = 2
+
+
+class QueryCounter:
+    """Conta instruções executadas no engine enquanto ativo"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def popular(n_vendas: int) -> int:
+    """Cria um usuário com produtos, clientes, vendas e compras"""
+    db.drop_all()
+    db.create_all()
+    empresa = Empresa(nome='Bench LTDA', plan_tier='premium')
+    db.session.add(empresa)
+    db.session.flush()
+    user = User(username='bench', email='bench@example.com', empresa=empresa.nome,
+                empresa_id=empresa.id, role='admin')
+    user.set_password('Bench@123')
+    db.session.add(user)
+    db.session.flush()
+
+    rnd = random.Random(42)
+    produtos = [Produto(nome=f'Produto {i}', preco=rnd.uniform(1, 500),
+                        estoque_atual=rnd.randint(0, 50), estoque_minimo=5,
+                        user_id=user.id) for i in range(200)]
+    clientes = [Cliente(nome=f'Cliente {i}', user_id=user.id) for i in range(100)]
+    fornecedor = Fornecedor(nome='Fornecedor', user_id=user.id)
+    db.session.add_all(produtos + clientes + [fornecedor])
+    db.session.add(ProdutoAuxiliar(nome='Aux', preco_unitario=1.0, user_id=user.id))
+    db.session.add(TicketSuporte(titulo='Ticket', descricao='...', user_id=user.id))
+    db.session.flush()
+
+    agora = datetime.now()
+    for i in range(n_vendas):
+        valor = rnd.uniform(10, 1000)
+        db.session.add(Venda(
+            data_venda=agora - timedelta(minutes=rnd.randint(0, 60 * 24 * 60)),
+            valor_total=valor, valor_final=valor, forma_pagamento='dinheiro',
+            user_id=user.id, cliente_id=rnd.choice(clientes).id,
+        ))
+    for i in range(n_vendas // 10):
+        db.session.add(Compra(data_compra=agora - timedelta(days=rnd.randint(0, 60)),
+                              valor_total=rnd.uniform(10, 1000),
+                              fornecedor_id=fornecedor.id, user_id=user.id))
+    db.session.commit()
+    return user.id
+
+
+def medir(func, repeticoes: int):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--vendas', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id = popular(args.vendas)
+
+        with QueryCounter(db.engine) as contador:
+            stats = get_dashboard_stats(user_id)
+        print(f"get_dashboard_stats: {contador.count} instrucoes SQL")
+        print(f"  vendas mes: {stats.total_vendas_mes:.2f} | 7 dias: "
+              f"{[d['vendas'] for d in stats.vendas_7_dias]}")
+        ms = medir(lambda: get_dashboard_stats(user_id), args.repeticoes)
+        print(f"  tempo medio: {ms:.2f} ms")
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['role'] = 'admin'
+        with QueryCounter(db.engine) as contador_rota:
+            resp = client.get('/dashboard')
+        print(f"GET /dashboard: status {resp.status_code}, "
+              f"{contador_rota.count} instrucoes SQL (inclui login e contexto)")
+        ms = medir(lambda: client.get('/dashboard'), args.repeticoes)
+        print(f"  tempo medio: {ms:.2f} ms")
+
+    if contador.count > MAX_QUERIES_STATS:
+        print(f"FALHA: esperado no maximo {MAX_QUERIES_STATS} instrucoes")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Benchmark das rotas quentes com dados sintéticos e baseline em JSON
+
+1. Gera os tenants (dados_sinteticos.py) ou reaproveita um banco já gerado
+   (--reusar).
+2. Fase test client: cada cenário roda --repeticoes vezes por tenant, em
+   sequência, pelo test client do Flask (após --aquecimento requisições
+   descartadas).
+3. Fase HTTP: --concorrencia threads disparam --requisicoes-http requisições
+   sorteadas entre os cenários contra um servidor (werkzeug, com threads, no
+   próprio processo) ou contra --url.
+4. Registra p50/p95/p99, instruções SQL por requisição (do cabeçalho
+   Server-Timing, ver instrumentation.py) e o pico de RSS; --salvar grava o
+   resultado como baseline e --comparar acusa regressões em relação a ela
+   (código de saída 1).
+
+Contra --url, o servidor precisa do mesmo SECRET_KEY (a sessão de cada
+tenant é assinada aqui), SERVER_TIMING=true, limites de requisição folgados
+e os dados gerados com os mesmos parâmetros; os cenários de escrita são
+pulados.
+
+Uso: python benchmarks/bench_rotas.py [--repeticoes N] [--concorrencia N]
+     [--requisicoes-http N] [--salvar baseline.json | --comparar baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks import dados_sinteticos  # noqa: E402
+
+VERSAO_BASELINE = 1
+# Regressão de latência só acima desta diferença absoluta (ruído de rotas rápidas)
+MIN_DIFERENCA_MS = 5.0
+
+_RE_SQL = re.compile(r'desc="(\d+) SQL"')
+
+
+@dataclass(frozen=True)
+class Cenario:
+    nome: str
+    caminho: str
+    metodo: str = 'GET'
+    admin: bool = False  # só com os administradores (relatórios são bloqueados a funcionários)
+    escrita: bool = False
+    peso: int = 1  # frequência relativa na fase HTTP
+
+
+CENARIOS = (
+    Cenario('dashboard', '/dashboard', peso=5),
+    Cenario('admin_home', '/admin', admin=True),
+    Cenario('relatorios', '/relatorios/', peso=2, admin=True),
+    Cenario('relatorio_pl', '/relatorios/pl', admin=True),
+    Cenario('relatorio_fluxo_caixa', '/relatorios/fluxo-caixa', admin=True),
+    Cenario('relatorio_top_produtos', '/relatorios/top-produtos', admin=True),
+    Cenario('relatorio_sazonalidade', '/relatorios/sazonalidade', admin=True),
+    Cenario('relatorio_rotatividade', '/relatorios/rotatividade-estoque', admin=True),
+    Cenario('relatorio_produtos_parados', '/relatorios/produtos-parados', admin=True),
+    Cenario('exportar_vendas_csv', '/relatorios/exportar/vendas/csv', admin=True),
+    Cenario('exportar_produtos_excel', '/relatorios/exportar/produtos/excel', admin=True),
+    Cenario('produtos', '/produtos', peso=3),
+    Cenario('clientes', '/clientes', peso=2),
+    Cenario('vendas', '/vendas', peso=3),
+    Cenario('nova_venda', '/vendas/nova', peso=3),
+    Cenario('nova_venda_post', '/vendas/nova', metodo='POST', escrita=True, peso=3),
+    Cenario('caixa', '/caixa', peso=3),
+    Cenario('api_caixa_dashboard', '/api/caixa/dashboard', peso=2),
+    Cenario('api_dashboard', '/api/dashboard', peso=2),
+    Cenario('api_dashboard_kpis', '/api/dashboard-kpis', peso=2),
+    Cenario('api_serie_financeira', '/api/serie-financeira'),
+    Cenario('api_produtos', '/api/produtos', peso=2),
+    Cenario('api_clientes', '/api/clientes'),
+    Cenario('api_vendas', '/api/vendas'),
+    Cenario('api_stats', '/api/stats'),
+)
+
+
+# ==================== MEDIÇÃO ====================
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil por interpolação linear (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    k = (len(valores) - 1) * p / 100
+    i = int(k)
+    if i + 1 >= len(valores):
+        return valores[-1]
+    return valores[i] + (valores[i + 1] - valores[i]) * (k - i)
+
+
+def rss_pico_mb() -> float | None:
+    """Pico de memória residente do processo (None fora do Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def instrucoes_sql(server_timing: str | None) -> int | None:
+    achado = _RE_SQL.search(server_timing or '')
+    return int(achado.group(1)) if achado else None
+
+
+class Amostras:
+    """Latências e instruções SQL por cenário (seguro entre threads)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.sql = defaultdict(list)
+        self.erros = defaultdict(int)
+
+    def registrar(self, nome: str, ms: float, status: int, sql: int | None) -> None:
+        with self.lock:
+            self.latencias[nome].append(ms)
+            if sql is not None:
+                self.sql[nome].append(sql)
+            if status >= 400:
+                self.erros[nome] += 1
+
+    def resumo(self) -> dict:
+        rotas = {}
+        for nome, valores in sorted(self.latencias.items()):
+            valores = sorted(valores)
+            sql = self.sql.get(nome) or []
+            rotas[nome] = {
+                'n': len(valores),
+                'erros': self.erros.get(nome, 0),
+                'media_ms': round(sum(valores) / len(valores), 2),
+                'p50_ms': round(percentil(valores, 50), 2),
+                'p95_ms': round(percentil(valores, 95), 2),
+                'p99_ms': round(percentil(valores, 99), 2),
+                'sql_media': round(sum(sql) / len(sql), 2) if sql else None,
+                'sql_max': max(sql) if sql else None,
+            }
+        return rotas
+
+
+# ==================== REQUISIÇÕES ====================
+
+def _dados_sessao(tenant: dict) -> dict:
+    return {'user_id': tenant['user_id'], 'username': tenant['username'], 'role': tenant['role']}
+
+
+def _corpo_venda(rnd, tenant: dict) -> dict:
+    """Formulário de nova venda com dois produtos do tenant"""
+    return {
+        'produto_0': str(rnd.choice(tenant['produtos'])), 'quantidade_0': '1',
+        'produto_1': str(rnd.choice(tenant['produtos'])), 'quantidade_1': '2',
+        'forma_pagamento': rnd.choice(('dinheiro', 'cartao', 'pix')),
+    }
+
+
+def _tenant_do_cenario(rnd, cenario: Cenario, tenants: list) -> dict:
+    if cenario.admin:
+        return rnd.choice([t for t in tenants if t['role'] == 'admin'])
+    return rnd.choice(tenants)
+
+
+def fase_test_client(app, cenarios, tenants: list, repeticoes: int, semente: int, aquecimento: int = 1) -> dict:
+    """Cada cenário, `repeticoes` vezes por tenant, em sequência.
+
+    As primeiras `aquecimento` requisições de cada par cenário/tenant (cache
+    frio, templates ainda não compilados) não entram nas amostras.
+    """
+    rnd = random.Random(semente)
+    amostras = Amostras()
+    clientes = {}
+    for tenant in tenants:
+        cliente = app.test_client()
+        with cliente.session_transaction() as sess:
+            sess.update(_dados_sessao(tenant))
+        clientes[tenant['user_id']] = cliente
+
+    for cenario in cenarios:
+        alvos = [t for t in tenants if t['role'] == 'admin'] if cenario.admin else tenants
+        for tenant in alvos:
+            cliente = clientes[tenant['user_id']]
+            for i in range(repeticoes + aquecimento):
+                corpo = _corpo_venda(rnd, tenant) if cenario.metodo == 'POST' else None
+                inicio = time.perf_counter()
+                resposta = cliente.open(cenario.caminho, method=cenario.metodo, data=corpo)
+                resposta.get_data()
+                ms = (time.perf_counter() - inicio) * 1000
+                if i < aquecimento:
+                    continue
+                amostras.registrar(cenario.nome, ms, resposta.status_code,
+                                   instrucoes_sql(resposta.headers.get('Server-Timing')))
+    return {'rotas': amostras.resumo(), 'rss_pico_mb': rss_pico_mb()}
+
+
+def _servidor_local(app):
+    """Servidor werkzeug com threads em uma porta livre; retorna (url, servidor)"""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # sem uma linha por requisição
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_port}', servidor
+
+
+def fase_http(app, url: str, cenarios, tenants: list, total: int, concorrencia: int, semente: int) -> dict:
+    """`total` requisições sorteadas (pelo peso) entre os cenários, em `concorrencia` threads"""
+    import requests
+
+    serializador = app.session_interface.get_signing_serializer(app)
+    nome_cookie = app.config.get('SESSION_COOKIE_NAME', 'session')
+    cookies = {t['user_id']: f"{nome_cookie}={serializador.dumps(_dados_sessao(t))}" for t in tenants}
+    rnd = random.Random(semente)
+    plano = [(c, _tenant_do_cenario(rnd, c, tenants))
+             for c in rnd.choices(cenarios, weights=[c.peso for c in cenarios], k=total)]
+    amostras = Amostras()
+    locais = threading.local()
+
+    def disparar(item):
+        cenario, tenant = item
+        if not hasattr(locais, 'http'):
+            locais.http = requests.Session()
+            locais.rnd = random.Random(f'{semente}-{threading.get_ident()}')
+        corpo = _corpo_venda(locais.rnd, tenant) if cenario.metodo == 'POST' else None
+        inicio = time.perf_counter()
+        try:
+            # Cookie no cabeçalho: SESSION_COOKIE_SECURE impediria o envio por http://
+            resposta = locais.http.request(cenario.metodo, url + cenario.caminho, data=corpo,
+                                           headers={'Cookie': cookies[tenant['user_id']]},
+                                           allow_redirects=False, timeout=60)
+            status, timing = resposta.status_code, resposta.headers.get('Server-Timing')
+        except requests.RequestException:
+            status, timing = 599, None
+        amostras.registrar(cenario.nome, (time.perf_counter() - inicio) * 1000, status,
+                           instrucoes_sql(timing))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(disparar, plano))
+    duracao = time.perf_counter() - inicio
+
+    todas = sorted(ms for valores in amostras.latencias.values() for ms in valores)
+    return {
+        'rotas': amostras.resumo(),
+        'total': {
+            'requisicoes': total,
+            'concorrencia': concorrencia,
+            'rps': round(total / duracao, 1) if duracao else None,
+            'p50_ms': round(percentil(todas, 50), 2),
+            'p95_ms': round(percentil(todas, 95), 2),
+            'p99_ms': round(percentil(todas, 99), 2),
+            'erros': sum(amostras.erros.values()),
+        },
+        'rss_pico_mb': rss_pico_mb(),
+    }
+
+
+# ==================== BASELINE ====================
+
+def comparar(atual: dict, baseline: dict, tolerancia: float) -> list:
+    """Regressões de `atual` em relação à baseline (mensagens).
+
+    Latência por rota: p50 da fase test client (o p95 de poucas amostras
+    oscila demais). Fase HTTP: p95 e vazão do total. Instruções SQL e erros
+    por rota, nas duas fases: qualquer aumento.
+    """
+    regressoes = []
+    if baseline.get('perfil') != atual.get('perfil'):
+        print("AVISO: perfil de dados diferente da baseline; a comparação pode não ser válida")
+
+    def piorou(valor, base):
+        return valor > base * (1 + tolerancia) and valor - base > MIN_DIFERENCA_MS
+
+    for fase in ('test_client', 'http'):
+        base_rotas = (baseline.get(fase) or {}).get('rotas', {})
+        for nome, medida in ((atual.get(fase) or {}).get('rotas') or {}).items():
+            base = base_rotas.get(nome)
+            if not base:
+                continue
+            if fase == 'test_client' and piorou(medida['p50_ms'], base['p50_ms']):
+                regressoes.append(f"{fase}/{nome}: p50 {medida['p50_ms']}ms > {base['p50_ms']}ms")
+            if (medida.get('sql_max') is not None and base.get('sql_max') is not None
+                    and medida['sql_max'] > base['sql_max']):
+                regressoes.append(f"{fase}/{nome}: {medida['sql_max']} instruções SQL > {base['sql_max']}")
+            if medida['erros'] > base['erros']:
+                regressoes.append(f"{fase}/{nome}: {medida['erros']} erros > {base['erros']}")
+
+    total, base_total = (atual.get('http') or {}).get('total'), (baseline.get('http') or {}).get('total')
+    if total and base_total:
+        if piorou(total['p95_ms'], base_total['p95_ms']):
+            regressoes.append(f"http: p95 {total['p95_ms']}ms > {base_total['p95_ms']}ms")
+        if total['rps'] and base_total['rps'] and total['rps'] * (1 + tolerancia) < base_total['rps']:
+            regressoes.append(f"http: {total['rps']} req/s < {base_total['rps']} req/s")
+    rss, base_rss = atual.get('rss_pico_mb'), baseline.get('rss_pico_mb')
+    if rss and base_rss and rss > base_rss * (1 + tolerancia):
+        regressoes.append(f"RSS de pico {rss}MB > {base_rss}MB")
+    return regressoes
+
+
+def imprimir(fase: str, resultado: dict) -> None:
+    print(f"\n== {fase} ==")
+    print(f"{'cenário':<30} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'sql':>6} {'erros':>5}")
+    for nome, m in resultado['rotas'].items():
+        sql = '-' if m['sql_media'] is None else f"{m['sql_media']:g}"
+        print(f"{nome:<30} {m['n']:>5} {m['p50_ms']:>8.1f} {m['p95_ms']:>8.1f} {m['p99_ms']:>8.1f} "
+              f"{sql:>6} {m['erros']:>5}")
+    if 'total' in resultado:
+        t = resultado['total']
+        print(f"total: {t['requisicoes']} req, {t['rps']} req/s, p50 {t['p50_ms']}ms, "
+              f"p95 {t['p95_ms']}ms, p99 {t['p99_ms']}ms, erros {t['erros']}")
+
+
+def _preparar_app():
+    """Importa o app com os limites de requisição desligados e o Server-Timing ligado"""
+    os.environ.setdefault('FLASK_ENV', 'development')  # sem limites globais do Flask-Limiter
+    import app as modulo
+    modulo.app.config.update(SERVER_TIMING=True, WTF_CSRF_ENABLED=False)
+    if getattr(modulo, 'security_middleware', None) is not None:
+        modulo.security_middleware.rate_limit = 10 ** 9
+    return modulo.app
+
+
+def _produtos_por_tenant(tenants: list) -> None:
+    from app import db, Produto
+    ids = defaultdict(list)
+    for produto_id, user_id in db.session.execute(db.select(Produto.id, Produto.user_id)):
+        ids[user_id].append(produto_id)
+    for tenant in tenants:
+        tenant['produtos'] = ids[tenant['user_id']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    dados_sinteticos.adicionar_argumentos(parser)
+    parser.add_argument('--reusar', action='store_true', help='usa os dados já gerados no banco')
+    parser.add_argument('--repeticoes', type=int, default=5, help='por cenário e tenant (test client)')
+    parser.add_argument('--aquecimento', type=int, default=1, help='requisições descartadas por cenário e tenant')
+    parser.add_argument('--requisicoes-http', type=int, default=500, help='0 pula a fase HTTP')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--url', help='servidor externo (padrão: servidor no próprio processo)')
+    parser.add_argument('--sem-escrita', action='store_true', help='pula os cenários que gravam')
+    parser.add_argument('--cenarios', help='lista separada por vírgulas (padrão: todos)')
+    parser.add_argument('--salvar', metavar='JSON', help='grava o resultado como baseline')
+    parser.add_argument('--comparar', metavar='JSON', help='compara com a baseline')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='folga de latência, vazão e RSS (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    print(f"Banco: {dados_sinteticos.configurar_banco(args.database_url)}")
+    app = _preparar_app()
+    cenarios = [c for c in CENARIOS if not (c.escrita and (args.sem_escrita or args.url))]
+    if args.cenarios:
+        escolhidos = set(args.cenarios.split(','))
+        cenarios = [c for c in cenarios if c.nome in escolhidos]
+
+    perfil = dados_sinteticos.perfil_dos_argumentos(args)
+    with app.app_context():
+        if args.reusar:
+            tenants = dados_sinteticos.tenants_existentes()
+        else:
+            gerado = dados_sinteticos.gerar(perfil, recriar=args.recriar)
+            tenants = gerado['tenants']
+            print(f"Dados gerados em {gerado['segundos']}s: {gerado['linhas']}")
+        if not tenants:
+            parser.error('nenhum tenant sintético no banco (rode sem --reusar)')
+        _produtos_por_tenant(tenants)
+        banco = app.extensions['sqlalchemy'].engine.dialect.name
+
+    # Fora do app_context: cada requisição abre o seu (e o seu g), como em produção
+    resultado = {
+        'versao': VERSAO_BASELINE,
+        'gerado_em': datetime.utcnow().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'banco': banco},
+        'perfil': None if args.reusar else perfil.__dict__,
+        'test_client': fase_test_client(app, cenarios, tenants, args.repeticoes, perfil.semente,
+                                        args.aquecimento),
+    }
+    imprimir('test client', resultado['test_client'])
+
+    if args.requisicoes_http > 0:
+        servidor = None
+        url = args.url.rstrip('/') if args.url else None
+        if url is None:
+            url, servidor = _servidor_local(app)
+        try:
+            resultado['http'] = fase_http(app, url, cenarios, tenants, args.requisicoes_http,
+                                          args.concorrencia, perfil.semente)
+        finally:
+            if servidor is not None:
+                servidor.shutdown()
+        imprimir(f'HTTP ({args.concorrencia} threads, {url})', resultado['http'])
+
+    resultado['rss_pico_mb'] = rss_pico_mb()
+    print(f"\nRSS de pico: {resultado['rss_pico_mb']} MB")
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Baseline gravada em {args.salvar}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        if regressoes:
+            print("\nREGRESSÕES:")
+            for mensagem in regressoes:
+                print(f"  {mensagem}")
+            sys.exit(1)
+        print("Sem regressões em relação à baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Gerador de tenants sintéticos para benchmarks e testes de carga
+
+Cria N empresas × usuários × produtos × clientes e meses de vendas (com
+itens), compras, sessões de caixa e movimentos, de forma determinística
+(semente fixa), em SQLite ou Postgres (DATABASE_URL / --database-url).
+
+As linhas entram por INSERT em lote (Core), que não passa pelos listeners do
+ORM; por isso, ao final, são recalculados o resumo_diario, os contadores do
+caixa e Produto.ultima_venda_em, e os carimbos do app_cache são invalidados.
+Os ids são atribuídos aqui (banco vazio); no Postgres as sequências são
+ajustadas depois.
+
+Uso: python benchmarks/dados_sinteticos.py [--empresas N] [--usuarios N]
+     [--produtos N] [--clientes N] [--meses N] [--vendas-dia N] [--recriar]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+LOTE = 5000
+SENHA = 'Bench@123'
+
+CATEGORIAS = ('Bebidas', 'Mercearia', 'Limpeza', 'Higiene', 'Padaria', 'Frios', 'Hortifruti',
+              'Açougue', 'Papelaria', 'Utilidades', 'Pet', 'Eletrônicos')
+FORMAS_PAGAMENTO = ('dinheiro', 'cartao', 'pix', 'boleto', 'transferencia')
+PESOS_PAGAMENTO = (30, 35, 28, 4, 3)
+# Horário de funcionamento das sessões de caixa sintéticas
+ABERTURA = (7, 55)
+FECHAMENTO = (20, 5)
+
+
+@dataclass
+class Perfil:
+    """Tamanho dos dados gerados (por usuário, exceto empresas e usuários)"""
+    empresas: int = 3
+    usuarios: int = 2  # por empresa
+    produtos: int = 500
+    clientes: int = 300
+    fornecedores: int = 5
+    meses: int = 6
+    vendas_dia: int = 20  # média por usuário
+    itens_max: int = 4  # itens por venda (1..itens_max)
+    compras_mes: int = 8
+    fracao_caixa: float = 0.3  # vendas lançadas pelo caixa (com MovimentoCaixa)
+    semente: int = 42
+
+
+def configurar_banco(database_url: str | None = None) -> str:
+    """Define DATABASE_URL antes de importar o app (SQLite temporário por padrão)"""
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    elif not os.environ.get('DATABASE_URL'):
+        arquivo = os.path.join(tempfile.mkdtemp(prefix='bench_saas_'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{arquivo}'
+    return os.environ['DATABASE_URL']
+
+
+class _Ids:
+    """Próximo id por tabela (banco vazio: começa em 1)"""
+
+    def __init__(self):
+        self.atual = {}
+
+    def __call__(self, tabela: str) -> int:
+        self.atual[tabela] = self.atual.get(tabela, 0) + 1
+        return self.atual[tabela]
+
+
+class _Gravador:
+    """Acumula linhas por modelo e grava em lotes na ordem das chaves estrangeiras
+
+    Cada linha filha deve ser adicionada depois da linha pai: um lote cheio
+    grava todas as pendências, pais primeiro.
+    """
+
+    def __init__(self, db, ordem):
+        self.db = db
+        self.ordem = ordem
+        self.pendentes = {modelo: [] for modelo in ordem}
+        self.total = dict.fromkeys((m.__tablename__ for m in ordem), 0)
+
+    def add(self, modelo, linha: dict) -> None:
+        self.pendentes[modelo].append(linha)
+        if len(self.pendentes[modelo]) >= LOTE:
+            self.gravar()
+
+    def gravar(self) -> None:
+        from sqlalchemy import insert
+        for modelo in self.ordem:
+            linhas = self.pendentes[modelo]
+            if linhas:
+                # executemany exige as mesmas chaves em todas as linhas do lote
+                chaves = set().union(*linhas)
+                for linha in linhas:
+                    for chave in chaves - linha.keys():
+                        linha[chave] = None
+                self.db.session.execute(insert(modelo.__table__), linhas)
+                self.total[modelo.__tablename__] += len(linhas)
+                self.pendentes[modelo] = []
+
+
+def _escolher_produto(rnd, produtos: list) -> dict:
+    # Vendas concentradas nos primeiros produtos; o último quinto nunca vende
+    # (alimenta os relatórios de top produtos e de produtos parados)
+    limite = max(1, int(len(produtos) * 0.8))
+    return produtos[min(int(rnd.paretovariate(0.6)) - 1, limite - 1)]
+
+
+def gerar(perfil: Perfil, recriar: bool = False, hoje: datetime | None = None) -> dict:
+    """Gera os dados do perfil no banco do app; retorna contagens e tenants.
+
+    Com `recriar`, apaga todas as tabelas antes; sem ele, o banco precisa
+    estar vazio (ValueError caso contrário).
+    """
+    from werkzeug.security import generate_password_hash
+    from app import (db, Empresa, User, Produto, Cliente, Fornecedor, Venda, ItemVenda,
+                     Compra, ItemCompra, CaixaSessao, MovimentoCaixa)
+
+    if recriar:
+        db.drop_all()
+    db.create_all()
+    if db.session.query(Empresa.id).first() is not None:
+        raise ValueError('Banco não está vazio: use --recriar (apaga tudo) ou --reusar.')
+
+    inicio = time.perf_counter()
+    rnd = random.Random(perfil.semente)
+    hoje = (hoje or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    primeiro_dia = hoje - timedelta(days=perfil.meses * 30)
+    ids = _Ids()
+    gravador = _Gravador(db, (Empresa, User, Produto, Cliente, Fornecedor, CaixaSessao, Venda,
+                              ItemVenda, MovimentoCaixa, Compra, ItemCompra))
+    senha_hash = generate_password_hash(SENHA)
+    tenants = []
+
+    for e in range(perfil.empresas):
+        empresa_id = ids('empresa')
+        nome_empresa = f'Empresa Bench {e + 1}'
+        gravador.add(Empresa, {'id': empresa_id, 'nome': nome_empresa, 'plan_tier': 'premium',
+                               'created_at': primeiro_dia})
+        for u in range(perfil.usuarios):
+            user_id = ids('user')
+            username = f'bench_e{e + 1}_u{u + 1}'
+            admin = u == 0  # o primeiro usuário é o dono da empresa; os demais, funcionários
+            gravador.add(User, {'id': user_id, 'username': username, 'email': f'{username}@bench.local',
+                                'password_hash': senha_hash, 'empresa': nome_empresa,
+                                'empresa_id': empresa_id, 'role': 'admin' if admin else 'user',
+                                'created_at': primeiro_dia})
+            tenants.append({'user_id': user_id, 'empresa_id': empresa_id, 'username': username,
+                            'role': 'admin' if admin else 'user'})
+            _gerar_tenant(perfil, rnd, ids, gravador, user_id, primeiro_dia, hoje)
+
+    gravador.gravar()
+    db.session.commit()
+    _ajustar_sequencias(db, gravador.total)
+    derivados = _recalcular_derivados(db)
+    return {
+        'perfil': asdict(perfil),
+        'linhas': gravador.total,
+        'derivados': derivados,
+        'tenants': tenants,
+        'segundos': round(time.perf_counter() - inicio, 2),
+    }
+
+
+def _gerar_tenant(perfil, rnd, ids, gravador, user_id, primeiro_dia, hoje):
+    from app import Produto, Cliente, Fornecedor, Venda, ItemVenda, Compra, ItemCompra, CaixaSessao, MovimentoCaixa
+
+    produtos = []
+    for i in range(perfil.produtos):
+        preco = round(rnd.uniform(2, 400), 2)
+        produto = {'id': ids('produto'), 'nome': f'Produto {i + 1:05d}', 'preco': preco,
+                   'preco_compra': round(preco * rnd.uniform(0.4, 0.8), 2),
+                   'estoque_atual': rnd.randint(0, 200), 'estoque_minimo': rnd.choice((0, 5, 10)),
+                   'categoria': CATEGORIAS[i % len(CATEGORIAS)],
+                   'codigo_barras': f'789{user_id:05d}{i + 1:05d}',
+                   'created_at': primeiro_dia, 'user_id': user_id}
+        gravador.add(Produto, produto)
+        produtos.append(produto)
+
+    clientes = []
+    for i in range(perfil.clientes):
+        cliente_id = ids('cliente')
+        gravador.add(Cliente, {'id': cliente_id, 'nome': f'Cliente {i + 1:05d}',
+                               'email': f'cliente{cliente_id}@bench.local',
+                               'telefone': f'(21) 9{rnd.randint(10000000, 99999999)}',
+                               'created_at': primeiro_dia, 'user_id': user_id})
+        clientes.append(cliente_id)
+
+    fornecedores = []
+    for i in range(perfil.fornecedores):
+        fornecedor_id = ids('fornecedor')
+        gravador.add(Fornecedor, {'id': fornecedor_id, 'nome': f'Fornecedor {i + 1}',
+                                  'created_at': primeiro_dia, 'user_id': user_id})
+        fornecedores.append(fornecedor_id)
+
+    dia = primeiro_dia
+    while dia <= hoje:
+        aberta = dia == hoje
+        sessao_id = ids('caixa_sessao')
+        abertura = dia.replace(hour=ABERTURA[0], minute=ABERTURA[1])
+        gravador.add(CaixaSessao, {
+            'id': sessao_id, 'data_abertura': abertura,
+            'data_fechamento': None if aberta else dia.replace(hour=FECHAMENTO[0], minute=FECHAMENTO[1]),
+            'status': 'aberto' if aberta else 'fechado', 'saldo_inicial': 200.0, 'user_id': user_id,
+        })
+        gravador.add(MovimentoCaixa, {'id': ids('movimento_caixa'), 'created_at': abertura, 'tipo': 'entrada',
+                                      'origem': 'suprimento', 'valor': 200.0, 'descricao': 'Troco inicial',
+                                      'sessao_id': sessao_id, 'user_id': user_id})
+
+        for _ in range(max(0, int(rnd.gauss(perfil.vendas_dia, perfil.vendas_dia / 4)))):
+            venda_id = ids('venda')
+            data_venda = dia.replace(hour=rnd.randint(8, 19), minute=rnd.randint(0, 59), second=rnd.randint(0, 59))
+            forma = rnd.choices(FORMAS_PAGAMENTO, PESOS_PAGAMENTO)[0]
+            itens = []
+            for _ in range(rnd.randint(1, perfil.itens_max)):
+                produto = _escolher_produto(rnd, produtos)
+                quantidade = rnd.randint(1, 5)
+                itens.append({'id': ids('item_venda'), 'quantidade': quantidade,
+                              'preco_unitario': produto['preco'],
+                              'subtotal': round(produto['preco'] * quantidade, 2),
+                              'venda_id': venda_id, 'produto_id': produto['id']})
+            total = round(sum(item['subtotal'] for item in itens), 2)
+            status = 'cancelada' if rnd.random() < 0.03 else 'finalizada'
+            gravador.add(Venda, {'id': venda_id, 'data_venda': data_venda, 'valor_total': total,
+                                 'valor_desconto': 0.0, 'valor_final': total, 'status': status,
+                                 'forma_pagamento': forma, 'user_id': user_id,
+                                 'cliente_id': rnd.choice(clientes) if clientes and rnd.random() < 0.7 else None})
+            for item in itens:
+                gravador.add(ItemVenda, item)
+            if status == 'finalizada' and rnd.random() < perfil.fracao_caixa:
+                gravador.add(MovimentoCaixa, {'id': ids('movimento_caixa'), 'created_at': data_venda,
+                                              'tipo': 'entrada', 'origem': 'venda', 'valor': total,
+                                              'descricao': f'Venda #{venda_id}', 'forma_pagamento': forma,
+                                              'referencia_id': venda_id, 'sessao_id': sessao_id,
+                                              'user_id': user_id})
+        if not aberta:
+            gravador.add(MovimentoCaixa, {'id': ids('movimento_caixa'),
+                                          'created_at': dia.replace(hour=19, minute=50), 'tipo': 'saida',
+                                          'origem': 'sangria', 'valor': round(rnd.uniform(100, 500), 2),
+                                          'descricao': 'Sangria do dia', 'sessao_id': sessao_id,
+                                          'user_id': user_id})
+
+        if fornecedores and rnd.random() < perfil.compras_mes / 30:
+            compra_id = ids('compra')
+            itens = []
+            for _ in range(rnd.randint(1, 5)):
+                produto = rnd.choice(produtos)
+                quantidade = rnd.randint(10, 100)
+                itens.append({'id': ids('item_compra'), 'quantidade': quantidade,
+                              'preco_unitario': produto['preco_compra'],
+                              'subtotal': round(produto['preco_compra'] * quantidade, 2),
+                              'compra_id': compra_id, 'produto_id': produto['id']})
+            gravador.add(Compra, {'id': compra_id, 'numero_compra': f'BENCH-{compra_id:08d}',
+                                  'data_compra': dia.replace(hour=10),
+                                  'valor_total': round(sum(item['subtotal'] for item in itens), 2),
+                                  'status': 'confirmada', 'forma_pagamento': 'boleto',
+                                  'fornecedor_id': rnd.choice(fornecedores), 'user_id': user_id})
+            for item in itens:
+                gravador.add(ItemCompra, item)
+        dia += timedelta(days=1)
+
+
+def _ajustar_sequencias(db, totais: dict) -> None:
+    """Postgres: leva as sequências dos ids ao maior id gravado"""
+    from sqlalchemy import text
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for tabela, total in totais.items():
+        if total:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{tabela}\"', 'id'), (SELECT MAX(id) FROM \"{tabela}\"))"
+            ))
+    db.session.commit()
+
+
+def _recalcular_derivados(db) -> dict:
+    """Tabelas e colunas mantidas por listeners, que o INSERT em lote não aciona"""
+    from sqlalchemy import bindparam, func, select, update
+    import busca
+    import resumo_diario
+    import sync_delta
+    from caixa_contadores import calcular_contadores
+    from app import CaixaSessao, ItemVenda, Produto, Venda
+    from app_cache import cache, CATALOGO, DADOS, GLOBAL
+
+    ultima = (select(func.max(Venda.data_venda))
+              .join(ItemVenda, ItemVenda.venda_id == Venda.id)
+              .where(ItemVenda.produto_id == Produto.id, Venda.status == 'finalizada')
+              .scalar_subquery())
+    db.session.execute(update(Produto).values(ultima_venda_em=ultima).execution_options(synchronize_session=False))
+    db.session.commit()
+
+    resumos = resumo_diario.rebuild()
+    # Mesmo cálculo de caixa_contadores.reconciliar, sem um AVISO por campo zerado
+    sessoes = db.session.execute(select(CaixaSessao.id)).scalars().all()
+    corretos = calcular_contadores(sessoes)
+    tabela = CaixaSessao.__table__
+    if corretos:
+        agora = datetime.utcnow()
+        db.session.execute(
+            update(tabela).where(tabela.c.id == bindparam('sessao_id'))
+            .values({**{campo: bindparam(campo) for campo in next(iter(corretos.values()))},
+                     'reconciliado_em': agora}),
+            [{'sessao_id': sid, **valores} for sid, valores in corretos.items()])
+        db.session.commit()
+    alteracoes = sync_delta.rebuild()
+    indice_busca = busca.criar_indices()
+    cache.invalidar({(DADOS, GLOBAL), (CATALOGO, GLOBAL)})
+    return {'resumo_diario': resumos, 'caixa_sessoes_reconciliadas': len(sessoes),
+            'sync_alteracao': alteracoes, 'indice_busca': indice_busca}
+
+
+def tenants_existentes() -> list:
+    """Tenants de um banco já gerado (--reusar)"""
+    from app import User
+    return [{'user_id': u.id, 'empresa_id': u.empresa_id, 'username': u.username, 'role': u.role}
+            for u in User.query.filter(User.username.like('bench_%')).order_by(User.id)]
+
+
+def adicionar_argumentos(parser) -> None:
+    """Opções do perfil e do banco (compartilhadas com bench_rotas.py)"""
+    padrao = Perfil()
+    parser.add_argument('--database-url', help='SQLite temporário se omitido')
+    parser.add_argument('--empresas', type=int, default=padrao.empresas)
+    parser.add_argument('--usuarios', type=int, default=padrao.usuarios, help='por empresa')
+    parser.add_argument('--produtos', type=int, default=padrao.produtos, help='por usuário')
+    parser.add_argument('--clientes', type=int, default=padrao.clientes, help='por usuário')
+    parser.add_argument('--meses', type=int, default=padrao.meses)
+    parser.add_argument('--vendas-dia', type=int, default=padrao.vendas_dia, help='média por usuário')
+    parser.add_argument('--semente', type=int, default=padrao.semente)
+    parser.add_argument('--recriar', action='store_true', help='apaga todas as tabelas antes de gerar')
+
+
+def perfil_dos_argumentos(args) -> Perfil:
+    return Perfil(empresas=args.empresas, usuarios=args.usuarios, produtos=args.produtos,
+                  clientes=args.clientes, meses=args.meses, vendas_dia=args.vendas_dia,
+                  semente=args.semente)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    print(f"Banco: {configurar_banco(args.database_url)}")
+
+    from app import app
+    with app.app_context():
+        resultado = gerar(perfil_dos_argumentos(args), recriar=args.recriar)
+    for tabela, total in resultado['linhas'].items():
+        print(f"  {tabela}: {total}")
+    print(f"  derivados: {resultado['derivados']}")
+    print(f"Gerado em {resultado['segundos']}s ({len(resultado['tenants'])} tenants, senha {SENHA})")
+
+
+if __name__ == '__main__':
+    main()
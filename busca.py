@@ -0,0 +1,322 @@
+"""
+Índice de busca textual de produtos, clientes e fornecedores
+
+A busca das listagens e o seletor de produtos do PDV filtravam com
+``ILIKE '%termo%'`` em várias colunas: varredura completa da tabela do
+tenant a cada tecla, sensível a acentos ("acucar" não achava "Açúcar") e
+sem ordem de relevância. O PDV ainda embutia o catálogo inteiro na página
+para filtrar no navegador.
+
+Cada entidade declara as colunas do seu documento de busca (INDICES), e o
+índice depende do banco:
+
+- PostgreSQL: extensões ``pg_trgm`` e ``unaccent`` e um índice GIN de
+  trigramas sobre ``busca_documento(colunas...)`` (minúsculas, sem
+  acentos). Cada palavra do termo vira um ``LIKE '%palavra%'`` atendido
+  pelo índice, e a ordem usa ``word_similarity``. Trigramas cobrem prefixo,
+  trecho de código e nome parcial, que é o que se digita em SKU e nome de
+  cliente; o tsvector (radicais, stopwords) não ajuda nesses campos;
+- SQLite (execução local): tabela FTS5 sem conteúdo com tokenizer
+  ``unicode61 remove_diacritics 2``, mantida por triggers; cada palavra
+  vira uma consulta de prefixo (``"palavra"*``) e a ordem usa o bm25;
+- sem o índice (banco criado por create_all e ainda sem
+  ``scripts/criar_indices_busca.py``, ou sem permissão para as extensões),
+  volta ao ILIKE nas colunas, com um AVISO.
+
+CPF/CNPJ e telefone entram também só com dígitos, para achar
+"12345678900" em "123.456.789-00".
+"""
+
+import unicodedata
+from dataclasses import dataclass
+
+from sqlalchemy import and_, case, column, func, literal_column, or_, select, table, text
+
+# Funções do PostgreSQL criadas junto com o índice
+_FUNCOES_PG = (
+    # unaccent() é STABLE; o wrapper com o dicionário fixo pode ser IMMUTABLE e indexado
+    "CREATE OR REPLACE FUNCTION busca_normalizar(text) RETURNS text AS "
+    "$$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1)) $$ "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+    "CREATE OR REPLACE FUNCTION busca_documento(VARIADIC text[]) RETURNS text AS "
+    "$$ SELECT busca_normalizar(array_to_string($1, ' ')) $$ "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE",
+)
+
+# Caracteres removidos na versão "só dígitos" de documentos e telefones
+_PONTUACAO = './-() '
+
+
+@dataclass(frozen=True)
+class Indice:
+    """Documento de busca de uma entidade"""
+
+    model_name: str
+    tabela: str
+    # (coluna, só dígitos) na ordem do documento
+    campos: tuple
+    # serializador das respostas (query_shapes.SERIALIZADORES)
+    serializador: str
+    # coluna de código exato, que vem antes de qualquer outro resultado
+    codigo: str | None = None
+
+    @property
+    def tabela_fts(self) -> str:
+        return f'busca_{self.tabela}'
+
+    @property
+    def indice_pg(self) -> str:
+        return f'ix_{self.tabela}_busca_trgm'
+
+
+INDICES = {
+    'produtos': Indice('Produto', 'produto', campos=(
+        ('nome', False), ('descricao', False), ('codigo_barras', False), ('categoria', False),
+    ), serializador='produto', codigo='codigo_barras'),
+    'clientes': Indice('Cliente', 'cliente', campos=(
+        ('nome', False), ('email', False), ('cpf_cnpj', False), ('cpf_cnpj', True),
+        ('telefone', True),
+    ), serializador='cliente'),
+    'fornecedores': Indice('Fornecedor', 'fornecedor', campos=(
+        ('nome', False), ('razao_social', False), ('cnpj', False), ('cnpj', True),
+    ), serializador='fornecedor', codigo='cnpj'),
+}
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 50
+
+# engine -> 'postgres' | 'fts5' | None (detectado uma vez por processo)
+_backends = {}
+
+
+def normalizar(termo: str) -> str:
+    """Minúsculas e sem acentos, como o documento indexado"""
+    decomposto = unicodedata.normalize('NFKD', termo or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+
+def palavras(termo: str) -> list:
+    return [p for p in normalizar(termo).split() if p]
+
+
+def _sql_digitos(expressao: str) -> str:
+    for caractere in _PONTUACAO:
+        expressao = f"replace({expressao}, '{caractere}', '')"
+    return expressao
+
+
+def _sql_campos(indice: Indice, prefixo: str = '') -> list:
+    return [_sql_digitos(f'{prefixo}{nome}') if digitos else f'{prefixo}{nome}'
+            for nome, digitos in indice.campos]
+
+
+def _ddl_postgres(indice: Indice) -> list:
+    documento = ', '.join(_sql_campos(indice))
+    return [f"CREATE INDEX IF NOT EXISTS {indice.indice_pg} ON {indice.tabela} "
+            f"USING gin (busca_documento({documento}) gin_trgm_ops)"]
+
+
+def _ddl_sqlite(indice: Indice) -> list:
+    fts = indice.tabela_fts
+    colunas = [f'c{i}' for i in range(len(indice.campos))]
+    lista = ', '.join(colunas)
+    novos = ', '.join(_sql_campos(indice, 'new.'))
+    antigos = ', '.join(_sql_campos(indice, 'old.'))
+    observadas = ', '.join(sorted({nome for nome, _ in indice.campos}))
+    apagar = f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos});"
+    inserir = f"INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {novos});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({lista}, content='', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {indice.tabela} BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {indice.tabela} BEGIN {apagar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {observadas} ON {indice.tabela} "
+        f"BEGIN {apagar} {inserir} END",
+    ]
+
+
+def _popular_sqlite(conn, indice: Indice):
+    fts = indice.tabela_fts
+    lista = ', '.join(f'c{i}' for i in range(len(indice.campos)))
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('delete-all')"))
+    conn.execute(text(
+        f"INSERT INTO {fts}(rowid, {lista}) "
+        f"SELECT id, {', '.join(_sql_campos(indice))} FROM {indice.tabela}"
+    ))
+
+
+def criar_indices(conn=None) -> bool:
+    """Cria (ou completa) os índices de busca no banco de `conn`.
+
+    Idempotente. No SQLite recria o conteúdo das tabelas FTS a partir das
+    tabelas de origem. Retorna False se o banco não suporta o índice (a
+    busca continua no ILIKE).
+    """
+    if conn is None:
+        from app import db
+        with db.engine.begin() as conexao:
+            return criar_indices(conexao)
+
+    dialeto = conn.dialect.name
+    if dialeto == 'postgresql':
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        except Exception as e:
+            print(f"AVISO: extensoes pg_trgm/unaccent indisponiveis, busca fica no ILIKE ({e})")
+            return False
+        for comando in _FUNCOES_PG:
+            conn.execute(text(comando))
+        for indice in INDICES.values():
+            for comando in _ddl_postgres(indice):
+                conn.execute(text(comando))
+        # O filtro de produtos por fornecedor compara fornecedor_nome com ILIKE '%nome%'
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_produto_fornecedor_nome_trgm ON produto "
+            "USING gin (fornecedor_nome gin_trgm_ops)"
+        ))
+    elif dialeto == 'sqlite':
+        for indice in INDICES.values():
+            for comando in _ddl_sqlite(indice):
+                conn.execute(text(comando))
+            _popular_sqlite(conn, indice)
+    else:
+        print(f"AVISO: indice de busca nao suportado no banco {dialeto}")
+        return False
+    _backends.clear()
+    return True
+
+
+def remover_indices(conn):
+    """Desfaz criar_indices (mantém as extensões do PostgreSQL)"""
+    dialeto = conn.dialect.name
+    if dialeto == 'postgresql':
+        conn.execute(text("DROP INDEX IF EXISTS ix_produto_fornecedor_nome_trgm"))
+        for indice in INDICES.values():
+            conn.execute(text(f"DROP INDEX IF EXISTS {indice.indice_pg}"))
+        conn.execute(text("DROP FUNCTION IF EXISTS busca_documento(VARIADIC text[])"))
+        conn.execute(text("DROP FUNCTION IF EXISTS busca_normalizar(text)"))
+    elif dialeto == 'sqlite':
+        for indice in INDICES.values():
+            for sufixo in ('ai', 'ad', 'au'):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {indice.tabela_fts}_{sufixo}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {indice.tabela_fts}"))
+    _backends.clear()
+
+
+def backend():
+    """'postgres', 'fts5' ou None (sem índice: ILIKE)"""
+    from app import db
+
+    engine = db.engine
+    if engine in _backends:
+        return _backends[engine]
+    resultado = None
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                existe = conn.execute(text(
+                    "SELECT 1 FROM pg_indexes WHERE indexname = :nome"
+                ), {'nome': INDICES['produtos'].indice_pg}).first()
+                resultado = 'postgres' if existe else None
+            elif engine.dialect.name == 'sqlite':
+                existe = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"
+                ), {'nome': INDICES['produtos'].tabela_fts}).first()
+                resultado = 'fts5' if existe else None
+    except Exception as e:
+        print(f"AVISO: falha ao detectar o indice de busca ({e})")
+    if resultado is None:
+        print("AVISO: indice de busca ausente, usando ILIKE (rode scripts/criar_indices_busca.py)")
+    _backends[engine] = resultado
+    return resultado
+
+
+def _modelo(indice: Indice):
+    import app as app_module
+    return getattr(app_module, indice.model_name)
+
+
+def _documento(indice: Indice, model):
+    partes = []
+    for nome, digitos in indice.campos:
+        coluna = getattr(model, nome)
+        if digitos:
+            for caractere in _PONTUACAO:
+                coluna = func.replace(coluna, literal_column(f"'{caractere}'"), literal_column("''"))
+        partes.append(coluna)
+    return func.busca_documento(*partes)
+
+
+def escapar_like(palavra: str) -> str:
+    return palavra.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _consulta_fts(termos: list) -> str:
+    # cada palavra entre aspas (sem operadores do FTS5) e com prefixo
+    return ' '.join('"{}"*'.format(p.replace('"', '""')) for p in termos)
+
+
+def _fts(indice: Indice):
+    return table(indice.tabela_fts, column('rowid'))
+
+
+def clausula(entidade: str, model, termo: str):
+    """Filtro do termo para a query de `model` (todas as palavras, qualquer coluna)"""
+    indice = INDICES[entidade]
+    termos = palavras(termo)
+    if not termos:
+        return None
+    modo = backend()
+    if modo == 'postgres':
+        documento = _documento(indice, model)
+        return and_(*[documento.like(f'%{escapar_like(p)}%', escape='\\') for p in termos])
+    if modo == 'fts5':
+        fts = _fts(indice)
+        combina = literal_column(indice.tabela_fts).op('MATCH')(_consulta_fts(termos))
+        return model.id.in_(select(fts.c.rowid).where(combina))
+    colunas = sorted({nome for nome, _ in indice.campos})
+    padrao = f'%{termo.strip()}%'
+    return or_(*[getattr(model, c).ilike(padrao) for c in colunas])
+
+
+def buscar(entidade: str, termo: str, user_id, limite: int = LIMITE_PADRAO) -> list:
+    """Até `limite` registros do tenant que casam com `termo`, do mais relevante.
+
+    Um código exato (código de barras, CNPJ) vem primeiro; depois nomes que
+    começam pelo termo e então a similaridade do índice. Termo vazio traz os
+    primeiros por nome. Devolve dicts do serializador da entidade.
+    """
+    import query_shapes
+
+    indice = INDICES[entidade]
+    model = _modelo(indice)
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    query = model.query.filter(model.user_id == user_id)
+    termos = palavras(termo)
+    if not termos:
+        return query_shapes.listar(indice.serializador,
+                                   query.order_by(model.nome, model.id).limit(limite))
+
+    ordem = []
+    if indice.codigo:
+        ordem.append(case((getattr(model, indice.codigo) == termo.strip(), 0), else_=1))
+    modo = backend()
+    if modo == 'postgres':
+        normalizado = ' '.join(termos)
+        query = query.filter(clausula(entidade, model, termo))
+        ordem.append(case((func.busca_normalizar(model.nome).like(
+            f'{escapar_like(normalizado)}%', escape='\\'), 0), else_=1))
+        ordem.append(func.word_similarity(normalizado, _documento(indice, model)).desc())
+    elif modo == 'fts5':
+        fts = _fts(indice)
+        combina = literal_column(indice.tabela_fts).op('MATCH')(_consulta_fts(termos))
+        query = query.join(fts, fts.c.rowid == model.id).filter(combina)
+        ordem.append(case((model.nome.ilike(f'{termo.strip()}%'), 0), else_=1))
+        ordem.append(literal_column(f'{indice.tabela_fts}.rank'))
+    else:
+        query = query.filter(clausula(entidade, model, termo))
+        ordem.append(case((model.nome.ilike(f'{termo.strip()}%'), 0), else_=1))
+    ordem.extend((model.nome, model.id))
+    return query_shapes.listar(indice.serializador, query.order_by(*ordem).limit(limite))
@@ -0,0 +1,279 @@
+"""
+Contadores da sessão de caixa (CaixaSessao)
+
+O painel do caixa, a API consultada pelo PDV, o fechamento e os detalhes da
+sessão recarregavam todas as vendas da janela da sessão (ou todos os
+movimentos) e somavam em Python, uma vez por forma de pagamento.
+
+Agora a própria CaixaSessao guarda os totais:
+
+- movimentos: total_entradas, total_saidas e qtd_movimentos;
+- vendas finalizadas feitas com a sessão aberta: vendas_qtd, vendas_total e
+  um total por forma de pagamento (vendas_dinheiro, vendas_cartao, ...).
+
+Um listener after_flush aplica, na mesma transação da escrita, a diferença
+de cada MovimentoCaixa/Venda criado, alterado ou excluído com
+``UPDATE ... SET campo = campo + delta`` (atômico com PDVs concorrentes).
+reconciliar() recalcula os totais a partir das tabelas, registra as
+divergências e corrige os contadores (job periódico e scripts/reconcile_caixa.py).
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, event, func, or_, select, update
+
+from resumo_diario import ativar_historico, valores_do_flush
+
+FORMAS_PAGAMENTO = ('dinheiro', 'cartao', 'pix', 'boleto', 'transferencia')
+CAMPOS_MOVIMENTO = ('total_entradas', 'total_saidas', 'qtd_movimentos')
+CAMPOS_VENDA = ('vendas_qtd', 'vendas_total') + tuple(f'vendas_{fp}' for fp in FORMAS_PAGAMENTO)
+# Diferença aceita entre contador e recálculo (arredondamento de float)
+TOLERANCIA = 0.005
+
+
+def _normalizar_forma(forma) -> str:
+    return (forma or '').lower().strip()
+
+
+# ==================== MANUTENÇÃO INCREMENTAL ====================
+
+def _contribuicao_movimento(obj, anteriores: bool):
+    v = valores_do_flush(obj, ('sessao_id', 'tipo', 'valor'), anteriores)
+    if v['sessao_id'] is None:
+        return None
+    return v['sessao_id'], v['tipo'], float(v['valor'] or 0)
+
+
+def _contribuicao_venda(obj, anteriores: bool):
+    v = valores_do_flush(obj, ('user_id', 'data_venda', 'valor_total', 'status', 'forma_pagamento'), anteriores)
+    if v['user_id'] is None or v['status'] != 'finalizada':
+        return None
+    return (v['user_id'], v['data_venda'] or datetime.utcnow(),
+            _normalizar_forma(v['forma_pagamento']), float(v['valor_total'] or 0))
+
+
+def _acumular_movimento(deltas: dict, contribuicao, sinal: int) -> None:
+    if contribuicao is None:
+        return
+    sessao_id, tipo, valor = contribuicao
+    linha = deltas.setdefault(sessao_id, dict.fromkeys(CAMPOS_MOVIMENTO, 0))
+    linha['qtd_movimentos'] += sinal
+    if tipo == 'entrada':
+        linha['total_entradas'] += sinal * valor
+    elif tipo == 'saida':
+        linha['total_saidas'] += sinal * valor
+
+
+def _acumular_venda(deltas: dict, contribuicao, sinal: int) -> None:
+    if contribuicao is None:
+        return
+    user_id, data_venda, forma, valor = contribuicao
+    linha = deltas.setdefault((user_id, data_venda), dict.fromkeys(CAMPOS_VENDA, 0))
+    linha['vendas_qtd'] += sinal
+    linha['vendas_total'] += sinal * valor
+    if forma in FORMAS_PAGAMENTO:
+        linha[f'vendas_{forma}'] += sinal * valor
+
+
+def _janela_contem(tabela, data_venda):
+    """Sessões do usuário abertas no instante da venda"""
+    return and_(tabela.c.data_abertura <= data_venda,
+                or_(tabela.c.data_fechamento.is_(None), tabela.c.data_fechamento >= data_venda))
+
+
+def _aplicar_deltas(session, flush_context):
+    """after_flush: leva movimentos e vendas aos contadores das sessões"""
+    from app import CaixaSessao
+
+    movimentos, vendas = {}, {}
+    for obj in session.new:
+        nome = type(obj).__name__
+        if nome == 'MovimentoCaixa':
+            _acumular_movimento(movimentos, _contribuicao_movimento(obj, False), 1)
+        elif nome == 'Venda':
+            _acumular_venda(vendas, _contribuicao_venda(obj, False), 1)
+    for obj in session.dirty:
+        nome = type(obj).__name__
+        if nome not in ('MovimentoCaixa', 'Venda') or not session.is_modified(obj, include_collections=False):
+            continue
+        if nome == 'MovimentoCaixa':
+            _acumular_movimento(movimentos, _contribuicao_movimento(obj, True), -1)
+            _acumular_movimento(movimentos, _contribuicao_movimento(obj, False), 1)
+        else:
+            _acumular_venda(vendas, _contribuicao_venda(obj, True), -1)
+            _acumular_venda(vendas, _contribuicao_venda(obj, False), 1)
+    for obj in session.deleted:
+        nome = type(obj).__name__
+        if nome == 'MovimentoCaixa':
+            _acumular_movimento(movimentos, _contribuicao_movimento(obj, True), -1)
+        elif nome == 'Venda':
+            _acumular_venda(vendas, _contribuicao_venda(obj, True), -1)
+    if not movimentos and not vendas:
+        return
+
+    tabela = CaixaSessao.__table__
+    conn = session.connection()
+    for sessao_id, delta in movimentos.items():
+        somar_movimentos(conn, sessao_id, delta)
+    for (user_id, data_venda), delta in vendas.items():
+        valores = {c: tabela.c[c] + delta[c] for c in CAMPOS_VENDA if delta[c]}
+        if valores:
+            conn.execute(update(tabela)
+                         .where(tabela.c.user_id == user_id, _janela_contem(tabela, data_venda))
+                         .values(**valores))
+
+
+def somar_movimentos(conn, sessao_id, delta: dict) -> None:
+    """Soma `delta` (total_entradas, total_saidas, qtd_movimentos) na sessão.
+
+    Usado pelo listener e por inserções em lote que não passam pelo ORM
+    (importação de movimentos).
+    """
+    from app import CaixaSessao
+
+    tabela = CaixaSessao.__table__
+    valores = {c: tabela.c[c] + delta[c] for c in CAMPOS_MOVIMENTO if delta.get(c)}
+    if valores:
+        conn.execute(update(tabela).where(tabela.c.id == sessao_id).values(**valores))
+
+
+def register_caixa_contadores(db, *models):
+    """Liga os contadores às escritas da sessão do Flask-SQLAlchemy.
+
+    `models` são MovimentoCaixa e Venda (para o histórico ativo dos atributos).
+    """
+    for model in models:
+        if model.__name__ == 'MovimentoCaixa':
+            ativar_historico(model, ('sessao_id', 'tipo', 'valor'))
+        else:
+            ativar_historico(model, ('user_id', 'data_venda', 'valor_total', 'status', 'forma_pagamento'))
+    if not event.contains(db.session, 'after_flush', _aplicar_deltas):
+        event.listen(db.session, 'after_flush', _aplicar_deltas)
+
+
+# ==================== LEITURA ====================
+
+def resumo_vendas(sessao) -> dict:
+    """Totais de vendas da sessão a partir dos contadores (sem consultar vendas)"""
+    total = float(sessao.vendas_total or 0)
+    qtd = int(sessao.vendas_qtd or 0)
+    return {
+        'total_vendas': total,
+        'qtd_vendas': qtd,
+        'ticket_medio': (total / qtd) if qtd else 0,
+        'por_pagamento': {fp: float(getattr(sessao, f'vendas_{fp}') or 0) for fp in FORMAS_PAGAMENTO},
+    }
+
+
+def resumo_vendas_periodo(user_id, inicio: datetime, fim: datetime) -> dict:
+    """Totais de vendas sem sessão aberta (dia atual): um GROUP BY por forma de pagamento"""
+    from app import db, Venda
+
+    forma = func.lower(func.coalesce(Venda.forma_pagamento, ''))
+    linhas = db.session.execute(
+        select(forma, func.count(Venda.id), func.coalesce(func.sum(Venda.valor_total), 0))
+        .where(Venda.user_id == user_id, Venda.data_venda.between(inicio, fim), Venda.status == 'finalizada')
+        .group_by(forma)
+    ).all()
+    por_pagamento = dict.fromkeys(FORMAS_PAGAMENTO, 0)
+    total, qtd = 0.0, 0
+    for nome, quantidade, valor in linhas:
+        total += float(valor or 0)
+        qtd += int(quantidade or 0)
+        if _normalizar_forma(nome) in por_pagamento:
+            por_pagamento[_normalizar_forma(nome)] += float(valor or 0)
+    return {
+        'total_vendas': total,
+        'qtd_vendas': qtd,
+        'ticket_medio': (total / qtd) if qtd else 0,
+        'por_pagamento': por_pagamento,
+    }
+
+
+def saldo_esperado(sessao) -> float:
+    return (sessao.saldo_inicial or 0) + (sessao.total_entradas or 0) - (sessao.total_saidas or 0)
+
+
+# ==================== RECONCILIAÇÃO ====================
+
+def calcular_contadores(sessao_ids) -> dict:
+    """Valores corretos dos contadores, calculados nas tabelas (2 consultas)"""
+    from app import db, CaixaSessao, MovimentoCaixa, Venda
+
+    sessao_ids = list(sessao_ids)
+    valores = {sid: dict.fromkeys(CAMPOS_MOVIMENTO + CAMPOS_VENDA, 0) for sid in sessao_ids}
+    if not sessao_ids:
+        return valores
+
+    for sid, entradas, saidas, qtd in db.session.execute(
+        select(MovimentoCaixa.sessao_id,
+               func.coalesce(func.sum(case((MovimentoCaixa.tipo == 'entrada', MovimentoCaixa.valor))), 0),
+               func.coalesce(func.sum(case((MovimentoCaixa.tipo == 'saida', MovimentoCaixa.valor))), 0),
+               func.count(MovimentoCaixa.id))
+        .where(MovimentoCaixa.sessao_id.in_(sessao_ids))
+        .group_by(MovimentoCaixa.sessao_id)
+    ):
+        valores[sid].update(total_entradas=float(entradas), total_saidas=float(saidas), qtd_movimentos=int(qtd))
+
+    forma = func.lower(func.coalesce(Venda.forma_pagamento, ''))
+    colunas = [func.count(Venda.id), func.coalesce(func.sum(Venda.valor_total), 0)] + [
+        func.coalesce(func.sum(case((forma == fp, Venda.valor_total))), 0) for fp in FORMAS_PAGAMENTO
+    ]
+    for sid, *totais in db.session.execute(
+        select(CaixaSessao.id, *colunas)
+        .join(Venda, and_(Venda.user_id == CaixaSessao.user_id,
+                          Venda.status == 'finalizada',
+                          Venda.data_venda >= CaixaSessao.data_abertura,
+                          or_(CaixaSessao.data_fechamento.is_(None),
+                              Venda.data_venda <= CaixaSessao.data_fechamento)))
+        .where(CaixaSessao.id.in_(sessao_ids))
+        .group_by(CaixaSessao.id)
+    ):
+        valores[sid].update({campo: (int(v) if campo == 'vendas_qtd' else float(v))
+                             for campo, v in zip(CAMPOS_VENDA, totais)})
+    return valores
+
+
+def reconciliar(sessao_ids=None, corrigir: bool = True, dias: int = 1) -> list:
+    """Compara os contadores com o recálculo e, com `corrigir`, grava os valores corretos.
+
+    Sem `sessao_ids`, verifica as sessões abertas e as fechadas nos últimos
+    `dias` dias. As sessões ficam bloqueadas (FOR UPDATE) durante a
+    verificação, para que vendas concorrentes não se percam na correção.
+    Retorna a lista de divergências ``{'sessao_id', 'campo', 'contador', 'correto'}``.
+    """
+    from app import db, CaixaSessao
+
+    consulta = select(CaixaSessao).order_by(CaixaSessao.id)
+    if sessao_ids is None:
+        consulta = consulta.where(or_(CaixaSessao.status == 'aberto',
+                                      CaixaSessao.data_fechamento >= datetime.utcnow() - timedelta(days=dias)))
+    else:
+        consulta = consulta.where(CaixaSessao.id.in_(list(sessao_ids)))
+    if db.engine.dialect.name != 'sqlite':
+        consulta = consulta.with_for_update()
+
+    try:
+        sessoes = db.session.execute(consulta.execution_options(populate_existing=True)).scalars().all()
+        corretos = calcular_contadores(s.id for s in sessoes)
+        divergencias = []
+        agora = datetime.utcnow()
+        for sessao in sessoes:
+            for campo, correto in corretos[sessao.id].items():
+                contador = getattr(sessao, campo) or 0
+                if abs(contador - correto) > TOLERANCIA:
+                    divergencias.append({'sessao_id': sessao.id, 'campo': campo,
+                                         'contador': contador, 'correto': correto})
+            if corrigir:
+                db.session.execute(update(CaixaSessao.__table__)
+                                   .where(CaixaSessao.__table__.c.id == sessao.id)
+                                   .values(**corretos[sessao.id], reconciliado_em=agora))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for d in divergencias:
+        print(f"AVISO: contador do caixa divergente (sessão {d['sessao_id']}, {d['campo']}): "
+              f"{d['contador']} != {d['correto']}")
+    return divergencias
@@ -0,0 +1,134 @@
+"""
+Catálogo do PDV: índice de códigos por tenant para a leitura do scanner
+
+A tela do caixa carregava todos os produtos do usuário (objetos ORM
+completos, ordenados por nome) a cada renderização só para montar o
+seletor, e embutia o catálogo inteiro no HTML. Agora a página não leva
+produto nenhum: o seletor busca por nome em /api/busca, e o código lido
+pelo scanner é resolvido em /api/caixa/produto por este índice:
+
+- por tenant, em memória de processo: código normalizado (código de
+  barras ou o código gerado por gerar_codigo_produto, que fica no mesmo
+  campo) -> ProdutoPdv (id, nome, preço, estoque, categoria);
+- validado pelo carimbo 'catalogo' do app_cache, que sobe após o commit
+  de escritas em Produto e da baixa de estoque do checkout (um UPDATE
+  fora do ORM), em todos os workers. Só com o backend compartilhado
+  (Redis): em memória cada worker tem os próprios carimbos, e o código é
+  procurado direto no banco, sem índice;
+- LRU de MAX_TENANTS tenants; uma falta relê só as colunas do índice,
+  em uma consulta.
+
+Uma leitura com o índice quente não vai ao banco. O estoque exibido é o
+do último carimbo; a baixa no checkout continua sendo o UPDATE
+condicional, que recusa a venda se o estoque acabou nesse meio-tempo.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import select
+
+# Tenants com índice mantido em memória por processo
+MAX_TENANTS = 1000
+
+
+@dataclass(frozen=True)
+class ProdutoPdv:
+    """Campos de um Produto usados pelo caixa ao ler um código"""
+    id: int
+    nome: str
+    preco: float
+    estoque: int
+    categoria: str | None
+    codigo_barras: str
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class _Indice:
+    versao: str | None
+    por_codigo: dict
+
+
+_indices = OrderedDict()  # user_id -> _Indice
+_lock = threading.Lock()
+
+
+def normalizar_codigo(codigo) -> str:
+    return (codigo or '').strip().upper()
+
+
+def _versao(user_id) -> str | None:
+    from app_cache import cache, CATALOGO, tenant
+    if cache.store is None or not getattr(cache.store, 'compartilhado', False):
+        # Carimbos por processo não veem as escritas de outro worker
+        return None
+    try:
+        return cache.versao(CATALOGO, tenant(user_id))
+    except Exception as e:
+        print(f"AVISO: carimbo do catalogo indisponivel ({e}); recarregando o indice")
+        return None
+
+
+def _carregar(user_id, codigos=None) -> dict:
+    """Códigos do tenant -> ProdutoPdv (só os valores gravados em `codigos`, se dados)"""
+    from app import db, Produto
+
+    tabela = Produto.__table__
+    consulta = (
+        select(tabela.c.id, tabela.c.nome, tabela.c.preco, tabela.c.estoque_atual,
+               tabela.c.categoria, tabela.c.codigo_barras)
+        .where(tabela.c.user_id == user_id, tabela.c.codigo_barras.isnot(None))
+    )
+    if codigos is not None:
+        # Compara com o valor gravado, para usar o índice único de codigo_barras
+        consulta = consulta.where(tabela.c.codigo_barras.in_(codigos))
+    linhas = db.session.execute(consulta).mappings()
+    por_codigo = {}
+    for linha in linhas:
+        codigo = normalizar_codigo(linha['codigo_barras'])
+        if codigo:
+            por_codigo[codigo] = ProdutoPdv(
+                id=linha['id'],
+                nome=linha['nome'],
+                preco=float(linha['preco'] or 0),
+                estoque=int(linha['estoque_atual'] or 0),
+                categoria=linha['categoria'],
+                codigo_barras=linha['codigo_barras'],
+            )
+    return por_codigo
+
+
+def indice(user_id, versao: str | None = None) -> _Indice:
+    """Índice de códigos do tenant (recarregado quando o carimbo muda; sem
+    carimbo compartilhado, lido do banco e não guardado)"""
+    versao = versao or _versao(user_id)
+    with _lock:
+        atual = _indices.get(user_id)
+        if atual is not None and versao is not None and atual.versao == versao:
+            _indices.move_to_end(user_id)
+            return atual
+    novo = _Indice(versao, _carregar(user_id))
+    if versao is not None:
+        with _lock:
+            _indices[user_id] = novo
+            _indices.move_to_end(user_id)
+            while len(_indices) > MAX_TENANTS:
+                _indices.popitem(last=False)
+    return novo
+
+
+def por_codigo(codigo, user_id) -> ProdutoPdv | None:
+    """Produto do tenant com o código lido (código de barras ou código gerado)"""
+    lido = (codigo or '').strip()
+    codigo = normalizar_codigo(lido)
+    if not codigo:
+        return None
+    versao = _versao(user_id)
+    if versao is None:
+        # Sem índice confiável: lê só o produto do código (como lido ou em maiúsculas)
+        return _carregar(user_id, {lido, codigo}).get(codigo)
+    return indice(user_id, versao).por_codigo.get(codigo)
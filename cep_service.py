@@ -0,0 +1,370 @@
+"""
+Consulta de CEP com cache local e dataset offline
+
+get_cep_data (app.py) e api_unified.api_cep chamavam o ViaCEP a cada
+consulta disparada pela digitação; a versão do api_unified nem tinha
+timeout, então um serviço lento prendia um worker do gunicorn.
+
+A resolução agora passa, em ordem, por:
+
+1. LRU em memória do processo (LRU_MAX_ENTRIES, TTL de LRU_TTL_SECONDS);
+2. tabela cep_cache: respostas do ViaCEP por CEP_CACHE_TTL_DAYS, CEPs
+   inexistentes por CEP_NEGATIVE_TTL_HOURS (cache negativo) e as linhas do
+   dataset offline carregado por carregar_dataset(), que não expiram;
+3. ViaCEP, por um requests.Session com pool de conexões, timeout
+   CEP_TIMEOUT e circuit breaker: após CEP_BREAKER_FAILURES falhas seguidas
+   o serviço fica sem chamadas por CEP_BREAKER_RESET_SECONDS (depois, uma
+   tentativa de teste).
+
+Consultas simultâneas do mesmo CEP no processo aguardam a primeira em vez
+de repetirem a ida ao banco e ao serviço. Com o ViaCEP indisponível, uma
+linha vencida ainda é devolvida; sem nenhuma, consultar() levanta
+CepIndisponivel.
+"""
+
+import csv
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete, insert, select
+
+LRU_MAX_ENTRIES = 10000
+LRU_TTL_SECONDS = 3600
+# Espera máxima por uma consulta do mesmo CEP já em andamento
+COALESCE_WAIT = 5
+DATASET_CHUNK_ROWS = 1000
+
+CAMPOS = ('logradouro', 'bairro', 'cidade', 'uf')
+TAMANHOS = {'logradouro': 200, 'bairro': 100, 'cidade': 100, 'uf': 2}
+
+# Nomes de coluna aceitos no dataset (minúsculos) para cada campo
+SINONIMOS_DATASET = {
+    'cep': ('cep',),
+    'logradouro': ('logradouro', 'endereco', 'rua'),
+    'bairro': ('bairro',),
+    'cidade': ('cidade', 'localidade', 'municipio'),
+    'uf': ('uf', 'estado'),
+}
+
+_AUSENTE = object()
+
+
+class CepIndisponivel(Exception):
+    """CEP fora do cache e serviço externo indisponível"""
+
+
+def normalizar_cep(cep) -> str | None:
+    """Só os 8 dígitos do CEP, ou None se o formato for inválido"""
+    digitos = re.sub(r'[^0-9]', '', str(cep or ''))
+    return digitos if len(digitos) == 8 else None
+
+
+def formatar_cep(cep: str) -> str:
+    return f'{cep[:5]}-{cep[5:]}'
+
+
+class CircuitBreaker:
+    """Abre após `falhas_max` falhas seguidas; meio-aberto após `reset_seconds`"""
+
+    def __init__(self, falhas_max: int, reset_seconds: float):
+        self.falhas_max = falhas_max
+        self.reset_seconds = reset_seconds
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def aberto(self) -> bool:
+        return self._falhas >= self.falhas_max and time.monotonic() < self._aberto_ate
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._falhas < self.falhas_max:
+                return True
+            agora = time.monotonic()
+            if agora < self._aberto_ate:
+                return False
+            # Meio-aberto: uma tentativa passa; as demais esperam o resultado dela
+            self._aberto_ate = agora + self.reset_seconds
+            return True
+
+    def sucesso(self) -> None:
+        with self._lock:
+            self._falhas = 0
+
+    def falha(self) -> None:
+        with self._lock:
+            self._falhas += 1
+            if self._falhas >= self.falhas_max:
+                self._aberto_ate = time.monotonic() + self.reset_seconds
+
+
+class _LRU:
+    """CEP -> dados (None = inexistente), com TTL e limite de entradas"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._itens = OrderedDict()  # cep -> (expira_em, dados)
+        self._lock = threading.Lock()
+
+    def get(self, cep):
+        with self._lock:
+            item = self._itens.get(cep)
+            if item is None:
+                return _AUSENTE
+            expira_em, dados = item
+            if expira_em < time.monotonic():
+                del self._itens[cep]
+                return _AUSENTE
+            self._itens.move_to_end(cep)
+            return dados
+
+    def set(self, cep, dados) -> None:
+        with self._lock:
+            self._itens[cep] = (time.monotonic() + self.ttl, dados)
+            self._itens.move_to_end(cep)
+            while len(self._itens) > self.max_entries:
+                self._itens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+
+_lru = _LRU(LRU_MAX_ENTRIES, LRU_TTL_SECONDS)
+_lock = threading.Lock()
+_em_andamento = {}  # cep -> threading.Event da consulta em curso
+_http = None
+_breaker = None
+
+
+def _config(chave, padrao=None):
+    from flask import current_app
+    return current_app.config.get(chave, padrao)
+
+
+def _sessao_http() -> requests.Session:
+    """Session compartilhada (keep-alive), sem retries automáticos"""
+    global _http
+    with _lock:
+        if _http is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+            sessao.mount('https://', adaptador)
+            sessao.mount('http://', adaptador)
+            _http = sessao
+        return _http
+
+
+def circuit_breaker() -> CircuitBreaker:
+    global _breaker
+    with _lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(_config('CEP_BREAKER_FAILURES', 5),
+                                      _config('CEP_BREAKER_RESET_SECONDS', 60))
+        return _breaker
+
+
+def consultar(cep) -> dict | None:
+    """Dados do CEP (logradouro, bairro, cidade, uf, cep) ou None se não existir.
+
+    Levanta CepIndisponivel quando o CEP não está em cache e o serviço
+    externo não responde.
+    """
+    cep = normalizar_cep(cep)
+    if cep is None:
+        return None
+    dados = _lru.get(cep)
+    if dados is not _AUSENTE:
+        return dados
+
+    with _lock:
+        evento = _em_andamento.get(cep)
+        dono = evento is None
+        if dono:
+            evento = _em_andamento[cep] = threading.Event()
+    if not dono:
+        evento.wait(COALESCE_WAIT)
+        dados = _lru.get(cep)
+        if dados is not _AUSENTE:
+            return dados
+        # A consulta em andamento falhou ou demorou: tentar por conta própria
+        return _resolver(cep)
+    try:
+        return _resolver(cep)
+    finally:
+        with _lock:
+            _em_andamento.pop(cep, None)
+        evento.set()
+
+
+def _resolver(cep: str) -> dict | None:
+    from app import db, CepCache
+
+    tabela = CepCache.__table__
+    linha = db.session.execute(select(tabela).where(tabela.c.cep == cep)).mappings().first()
+    if linha is not None and (linha['expira_em'] is None or linha['expira_em'] > datetime.utcnow()):
+        dados = _como_dados(linha)
+        _lru.set(cep, dados)
+        return dados
+
+    try:
+        dados = _buscar_remoto(cep)
+    except CepIndisponivel:
+        if linha is not None:
+            # Serviço fora do ar: a linha vencida é melhor que nenhuma
+            return _como_dados(linha)
+        raise
+
+    _gravar(cep, dados)
+    _lru.set(cep, dados)
+    return dados
+
+
+def _como_dados(linha) -> dict | None:
+    if not linha['encontrado']:
+        return None
+    return {**{campo: linha[campo] or '' for campo in CAMPOS}, 'cep': formatar_cep(linha['cep'])}
+
+
+def _buscar_remoto(cep: str) -> dict | None:
+    breaker = circuit_breaker()
+    if not breaker.permitir():
+        raise CepIndisponivel('Serviço de CEP temporariamente indisponível')
+    try:
+        resposta = _sessao_http().get(_config('CEP_LOOKUP_URL').format(cep=cep),
+                                      timeout=_config('CEP_TIMEOUT', 2.0))
+        if resposta.status_code == 400:
+            # ViaCEP: formato inválido (cache negativo, não é falha do serviço)
+            breaker.sucesso()
+            return None
+        resposta.raise_for_status()
+        data = resposta.json()
+    except (requests.RequestException, ValueError) as e:
+        breaker.falha()
+        print(f"AVISO: falha ao consultar o CEP {cep} ({e})")
+        raise CepIndisponivel(str(e)) from e
+
+    breaker.sucesso()
+    if 'erro' in data:
+        return None
+    return {
+        'logradouro': data.get('logradouro', ''),
+        'bairro': data.get('bairro', ''),
+        'cidade': data.get('localidade', ''),
+        'uf': data.get('uf', ''),
+        'cep': data.get('cep', '') or formatar_cep(cep),
+    }
+
+
+def _linha(cep: str, dados: dict | None, origem: str, expira_em) -> dict:
+    linha = {
+        'cep': cep,
+        'encontrado': dados is not None,
+        'origem': origem,
+        'atualizado_em': datetime.utcnow(),
+        'expira_em': expira_em,
+    }
+    for campo in CAMPOS:
+        linha[campo] = ((dados or {}).get(campo) or '')[:TAMANHOS[campo]] or None
+    return linha
+
+
+def _gravar(cep: str, dados: dict | None) -> None:
+    """Grava a resposta do serviço em transação própria (falha só gera aviso)"""
+    from app import db
+
+    if dados is None:
+        validade = timedelta(hours=_config('CEP_NEGATIVE_TTL_HOURS', 24))
+    else:
+        validade = timedelta(days=_config('CEP_CACHE_TTL_DAYS', 90))
+    try:
+        with db.engine.begin() as conn:
+            _upsert(conn, [_linha(cep, dados, 'viacep', datetime.utcnow() + validade)])
+    except Exception as e:
+        print(f"AVISO: não foi possível gravar o CEP {cep} no cache ({e})")
+
+
+def _upsert(conn, linhas: list) -> None:
+    from app import CepCache
+
+    tabela = CepCache.__table__
+    dialeto = conn.dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(tabela)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['cep'],
+            set_={nome: stmt.excluded[nome] for nome in linhas[0] if nome != 'cep'},
+        )
+        conn.execute(stmt, linhas)
+        return
+
+    # Demais bancos: DELETE das chaves e INSERT
+    conn.execute(delete(tabela).where(tabela.c.cep.in_([l['cep'] for l in linhas])))
+    conn.execute(insert(tabela), linhas)
+
+
+def carregar_dataset(caminho: str, lote: int = DATASET_CHUNK_ROWS) -> int:
+    """Carrega um CSV de CEPs (cep, logradouro, bairro, cidade, uf) em cep_cache.
+
+    As linhas entram como origem 'dataset', sem expiração, e substituem o
+    que houver em cache para o mesmo CEP. Aceita ',' ou ';' como separador.
+    Retorna o número de CEPs carregados.
+    """
+    from app import db
+
+    total = 0
+    with open(caminho, encoding='utf-8-sig', errors='ignore', newline='') as f:
+        amostra = f.read(4096)
+        f.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;')
+        except csv.Error:
+            dialeto = csv.excel
+        reader = csv.reader(f, dialeto)
+        headers = [h.strip().lower() for h in next(reader, None) or []]
+        indices = {
+            campo: next((i for i, h in enumerate(headers) if h in nomes), None)
+            for campo, nomes in SINONIMOS_DATASET.items()
+        }
+        if indices['cep'] is None:
+            raise ValueError('Dataset sem coluna de CEP.')
+
+        linhas = {}
+        with db.engine.begin() as conn:
+            for row in reader:
+                valor = lambda campo: (row[indices[campo]].strip()
+                                       if indices[campo] is not None and indices[campo] < len(row) else '')
+                cep = normalizar_cep(valor('cep'))
+                if cep is None:
+                    continue
+                # Chave repetida no mesmo lote quebraria o UPSERT: a última vence
+                linhas[cep] = _linha(cep, {campo: valor(campo) for campo in CAMPOS}, 'dataset', None)
+                if len(linhas) >= lote:
+                    _upsert(conn, list(linhas.values()))
+                    total += len(linhas)
+                    linhas = {}
+            if linhas:
+                _upsert(conn, list(linhas.values()))
+                total += len(linhas)
+    _lru.clear()
+    return total
+
+
+def limpar_expirados() -> int:
+    """Remove do cache as respostas vencidas do serviço (o dataset não expira)"""
+    from app import db, CepCache
+
+    tabela = CepCache.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(delete(tabela).where(tabela.c.expira_em < datetime.utcnow())).rowcount
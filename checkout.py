@@ -0,0 +1,217 @@
+"""
+Fechamento de venda (checkout) compartilhado
+
+Usado pelo formulário de nova venda, pela venda rápida do caixa e pela API.
+Uma venda é gravada em uma única transação:
+
+1. os produtos do carrinho são carregados em uma consulta IN, na ordem dos
+   ids e com SELECT ... FOR UPDATE (onde o banco suporta);
+2. o estoque é baixado com um único UPDATE condicional
+   (``estoque_atual = estoque_atual - q WHERE estoque_atual >= q``); se
+   alguma linha não for atualizada, nada é gravado - dois caixas vendendo o
+   último item ao mesmo tempo não deixam o estoque negativo;
+3. o uso do cupom é reservado com um UPDATE condicional ao limite
+   (cupom_service.resgatar) e lançado no livro de resgates;
+4. os itens são inseridos em lote, e o MovimentoCaixa (se houver sessão de
+   caixa) e o registro de auditoria entram no mesmo commit.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import case, insert, update
+
+
+class CheckoutError(ValueError):
+    """Venda recusada; a mensagem pode ser exibida ao usuário"""
+
+
+class EstoqueInsuficiente(CheckoutError):
+    def __init__(self, produto_nome: str, disponivel, solicitado: int):
+        self.produto_nome = produto_nome
+        self.disponivel = disponivel or 0
+        self.solicitado = solicitado
+        super().__init__(
+            f'Estoque insuficiente para {produto_nome}: '
+            f'disponível {self.disponivel}, solicitado {solicitado}.'
+        )
+
+
+@dataclass
+class ItemCarrinho:
+    produto_id: int
+    quantidade: int
+
+
+def parse_form_items(form) -> list:
+    """Itens do formulário de venda.
+
+    O formulário envia pares ``produto_<n>`` (id do produto) e
+    ``quantidade_<n>``; sem o par, ``produto_<id>`` = quantidade.
+    """
+    itens = []
+    for key, value in form.items():
+        if not key.startswith('produto_') or not value:
+            continue
+        linha = key.split('_', 1)[1]
+        try:
+            if f'quantidade_{linha}' in form:
+                itens.append(ItemCarrinho(int(value), int(form.get(f'quantidade_{linha}') or 0)))
+            else:
+                itens.append(ItemCarrinho(int(linha), int(value)))
+        except ValueError:
+            raise CheckoutError('Produto ou quantidade inválidos.')
+    return itens
+
+
+def parse_json_items(itens) -> list:
+    """Itens do corpo JSON da API: ``[{"produto_id": 1, "quantidade": 2}, ...]``"""
+    try:
+        return [ItemCarrinho(int(i['produto_id']), int(i.get('quantidade', 1))) for i in itens or []]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise CheckoutError('Itens da venda inválidos.')
+
+
+def _consolidar(itens) -> dict:
+    """produto_id -> quantidade total (linhas repetidas do carrinho são somadas)"""
+    quantidades = {}
+    for item in itens:
+        if item.quantidade <= 0:
+            raise CheckoutError('Informe uma quantidade válida (>= 1).')
+        quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+    return quantidades
+
+
+def _baixar_estoque(user_id, produtos: dict, quantidades: dict, data_venda: datetime):
+    """UPDATE único e condicional do estoque; CheckoutError se alguma linha falhar.
+
+    Atualiza também o snapshot Produto.ultima_venda_em na mesma instrução.
+    """
+    from app import db, Produto
+    from app_cache import cache, CATALOGO, tenant
+    from sync_delta import marcar
+
+    qtd = case(quantidades, value=Produto.id)
+    resultado = db.session.execute(
+        update(Produto)
+        .where(Produto.id.in_(quantidades), Produto.user_id == user_id,
+               Produto.estoque_atual >= qtd)
+        .values(estoque_atual=Produto.estoque_atual - qtd, ultima_venda_em=data_venda)
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != len(quantidades):
+        # Outra venda levou o estoque entre a leitura e a baixa
+        db.session.rollback()
+        atuais = dict(db.session.query(Produto.id, Produto.estoque_atual)
+                      .filter(Produto.id.in_(quantidades)).all())
+        for produto_id, quantidade in quantidades.items():
+            if (atuais.get(produto_id) or 0) < quantidade:
+                raise EstoqueInsuficiente(produtos[produto_id].nome, atuais.get(produto_id), quantidade)
+        raise CheckoutError('Não foi possível reservar o estoque. Tente novamente.')
+    # UPDATE fora da sessão: o estoque novo também vai para o delta-sync e
+    # para o índice de códigos do caixa
+    marcar(db.session.connection(), user_id, 'produtos', quantidades)
+    cache.agendar(db.session, {(CATALOGO, tenant(user_id))})
+    for produto in produtos.values():
+        db.session.expire(produto, ['estoque_atual', 'ultima_venda_em'])
+
+
+def registrar_venda(user_id, itens=(), *, forma_pagamento, cliente_id=None, observacoes=None,
+                    cupom_codigo=None, valor_avulso=None, sessao=None, descricao_movimento=None):
+    """Grava a venda, seus itens, a baixa de estoque, o movimento de caixa e a auditoria.
+
+    `itens` é uma lista de ItemCarrinho. Sem itens, `valor_avulso` registra uma
+    venda por valor (venda rápida do caixa). Com `sessao` (CaixaSessao aberta),
+    a entrada é lançada no caixa. Levanta CheckoutError (nada é gravado) se a
+    venda for recusada; retorna a Venda já commitada.
+    """
+    from app import db, Produto, Venda, ItemVenda, MovimentoCaixa, log_audit
+    from cupom_service import resgatar as resgatar_cupom, registrar_resgate
+
+    if not forma_pagamento:
+        raise CheckoutError('Informe a forma de pagamento.')
+    quantidades = _consolidar(itens)
+    if not quantidades and (valor_avulso is None or valor_avulso <= 0):
+        raise CheckoutError('Adicione ao menos um produto à venda.')
+
+    try:
+        agora = datetime.utcnow()
+        produtos = {}
+        linhas = []
+        total = float(valor_avulso or 0)
+        if quantidades:
+            produtos = {p.id: p for p in (
+                Produto.query
+                .filter(Produto.id.in_(quantidades), Produto.user_id == user_id)
+                .order_by(Produto.id)
+                .with_for_update()
+                .populate_existing()
+                .all()
+            )}
+            for produto_id, quantidade in quantidades.items():
+                produto = produtos.get(produto_id)
+                if produto is None:
+                    raise CheckoutError('Produto não encontrado.')
+                if (produto.estoque_atual or 0) < quantidade:
+                    raise EstoqueInsuficiente(produto.nome, produto.estoque_atual, quantidade)
+                preco = float(produto.preco)
+                linhas.append({'produto_id': produto_id, 'quantidade': quantidade,
+                               'preco_unitario': preco, 'subtotal': preco * quantidade})
+            total = sum(linha['subtotal'] for linha in linhas)
+            _baixar_estoque(user_id, produtos, quantidades, agora)
+
+        cupom, desconto = (None, 0)
+        if cupom_codigo:
+            # UPDATE condicional: o limite de uso vale com vendas simultâneas
+            cupom, desconto = resgatar_cupom(cupom_codigo, user_id, total, agora)
+
+        venda = Venda(
+            data_venda=agora,
+            cliente_id=cliente_id,
+            valor_total=total,
+            valor_desconto=desconto,
+            valor_final=total - desconto,
+            status='finalizada',
+            forma_pagamento=forma_pagamento,
+            observacoes=observacoes,
+            cupom_id=cupom.id if cupom else None,
+            user_id=user_id,
+        )
+        db.session.add(venda)
+        db.session.flush()  # obter venda.id
+
+        if linhas:
+            for linha in linhas:
+                linha['venda_id'] = venda.id
+            db.session.execute(insert(ItemVenda), linhas)
+
+        if cupom:
+            registrar_resgate(venda, cupom, desconto)
+
+        if sessao is not None:
+            if not descricao_movimento and len(linhas) == 1:
+                descricao_movimento = f"Venda rápida: {produtos[linhas[0]['produto_id']].nome} x{linhas[0]['quantidade']}"
+            db.session.add(MovimentoCaixa(
+                tipo='entrada',
+                origem='venda',
+                valor=venda.valor_final,
+                descricao=descricao_movimento or f'Venda #{venda.id}',
+                forma_pagamento=forma_pagamento,
+                referencia_id=venda.id,
+                sessao_id=sessao.id,
+                user_id=user_id,
+            ))
+
+        log_audit(user_id, 'venda', venda.id, 'add_sale', {
+            'valor_total': venda.valor_total,
+            'valor_final': venda.valor_final,
+            'itens': [
+                {'produto_id': l['produto_id'], 'quantidade': l['quantidade'], 'subtotal': l['subtotal']}
+                for l in linhas
+            ],
+        }, commit=False)
+        db.session.commit()
+        return venda
+    except Exception:
+        db.session.rollback()
+        raise
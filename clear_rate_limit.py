@@ -23,11 +23,10 @@ def clear_rate_limits():
     
     # Limpar middleware de segurança
     try:
-        from security_middleware import SecurityMiddleware
         # Reinicializar middleware
-        if hasattr(app, 'security_middleware'):
-            app.security_middleware.failed_attempts.clear()
-            app.security_middleware.blocked_ips.clear()
+        from app import security_middleware
+        if security_middleware and security_middleware.store:
+            security_middleware.store.clear()
             print("✅ Middleware de segurança limpo")
     except Exception as e:
         print(f"⚠️ Erro ao limpar middleware: {e}")
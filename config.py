@@ -1,5 +1,6 @@
 import os
 import secrets
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,8 +25,17 @@ class Config:
     
     # Configurações de rate limiting
     RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    # Store do SecurityMiddleware (contadores por IP e bloqueios); use redis:// para compartilhar entre workers
+    SECURITY_STORE_URL = os.environ.get('SECURITY_STORE_URL') or RATELIMIT_STORAGE_URL
     RATELIMIT_DEFAULT = "1000 per day, 500 per hour"  # Aumentado para desenvolvimento
     
+    # Cache compartilhado da aplicação (app_cache); use redis:// para compartilhar entre workers
+    CACHE_STORE_URL = os.environ.get('CACHE_STORE_URL') or os.environ.get('CACHE_REDIS_URL') or 'memory://'
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    # Sem Redis cada worker guarda os próprios resultados e não vê as invalidações
+    # dos outros: limite (segundos) de desatualização aceito; 0 não guarda nada
+    CACHE_LOCAL_TTL = int(os.environ.get('CACHE_LOCAL_TTL', 0))
+    
     # Configurações de segurança de headers
     SECURITY_HEADERS = {
         'X-Content-Type-Options': 'nosniff',
@@ -69,6 +79,9 @@ class Config:
             'sslmode': os.environ.get('PGSSLMODE', 'require'),
         }
     }
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # SQLite (desenvolvimento/benchmarks) não aceita pool nem keepalives do psycopg2
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
     
     # Configurações de email
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -96,6 +109,46 @@ class Config:
     # Configurações de 2FA
     TOTP_ISSUER_NAME = 'SaaS Sistema'
     BACKUP_CODES_COUNT = 10
+    
+    # Auditoria assíncrona: eventos vão para uma fila em memória e são gravados em lote
+    AUDIT_ASYNC = os.environ.get('AUDIT_ASYNC', 'true').lower() in ['true', 'on', '1']
+    AUDIT_QUEUE_MAX = int(os.environ.get('AUDIT_QUEUE_MAX', 10000))
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+
+    # Exportações em segundo plano (Celery quando disponível; senão pool local)
+    # Com Celery em outra máquina, EXPORT_DIR precisa ser um volume compartilhado
+    EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'saas_exports')
+    EXPORT_TTL_HOURS = int(os.environ.get('EXPORT_TTL_HOURS', 24))
+    EXPORT_BACKEND = os.environ.get('EXPORT_BACKEND', 'thread')  # thread | process
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+    # PDFs com mais linhas que isso vão automaticamente para segundo plano
+    EXPORT_SYNC_MAX_ROWS = int(os.environ.get('EXPORT_SYNC_MAX_ROWS', 5000))
+
+    # Importações CSV: o arquivo fica em disco (IMPORT_DIR) até a confirmação,
+    # em vez de ir para o cookie da sessão
+    IMPORT_DIR = os.environ.get('IMPORT_DIR') or os.path.join(tempfile.gettempdir(), 'saas_imports')
+    IMPORT_TTL_HOURS = int(os.environ.get('IMPORT_TTL_HOURS', 24))
+
+    # Consulta de CEP (cep_service): cache local com TTL, timeout curto e circuit breaker
+    CEP_LOOKUP_URL = os.environ.get('CEP_LOOKUP_URL', 'https://viacep.com.br/ws/{cep}/json/')
+    CEP_TIMEOUT = float(os.environ.get('CEP_TIMEOUT', 2.0))
+    CEP_CACHE_TTL_DAYS = int(os.environ.get('CEP_CACHE_TTL_DAYS', 90))
+    CEP_NEGATIVE_TTL_HOURS = int(os.environ.get('CEP_NEGATIVE_TTL_HOURS', 24))
+    CEP_BREAKER_FAILURES = int(os.environ.get('CEP_BREAKER_FAILURES', 5))
+    CEP_BREAKER_RESET_SECONDS = int(os.environ.get('CEP_BREAKER_RESET_SECONDS', 60))
+
+    # Instrumentação (instrumentation.py): /metrics, Server-Timing e detecção de N+1
+    # /metrics só responde com METRICS_TOKEN definido (Bearer), fora do modo debug
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
+
+    # Sincronização incremental (sync_delta): remoções guardadas por SYNC_RETENCAO_DIAS;
+    # alterações mais novas que SYNC_MARGEM_SEGUNDOS não avançam o cursor
+    SYNC_RETENCAO_DIAS = int(os.environ.get('SYNC_RETENCAO_DIAS', 30))
+    SYNC_MARGEM_SEGUNDOS = int(os.environ.get('SYNC_MARGEM_SEGUNDOS', 30))
+    SYNC_GZIP_MIN_BYTES = int(os.environ.get('SYNC_GZIP_MIN_BYTES', 1024))
 
 class DevelopmentConfig(Config):
     """Configurações para desenvolvimento"""
@@ -113,6 +166,7 @@ class TestingConfig(Config):
     """Configurações para testes"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    AUDIT_ASYNC = False
 
 config = {
     'development': DevelopmentConfig,
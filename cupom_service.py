@@ -0,0 +1,249 @@
+"""
+Cupons: índice por tenant, resgate atômico e livro de resgates
+
+validar_cupom e o checkout buscavam o Cupom pelo código e conferiam datas e
+limites em Python a cada chamada, e o uso era contado com
+``cupom.usos_realizados += 1`` (ler, somar, gravar): duas vendas simultâneas
+liam o mesmo valor e um cupom limitado passava do limite.
+
+Agora:
+
+- os cupons de cada tenant ficam em um índice em memória (código ->
+  CupomIndexado, mais a lista ordenada de códigos para a busca por
+  prefixo), validado pelo carimbo 'cupons' do app_cache: escritas em Cupom
+  e resgates de cupons limitados o invalidam em todos os workers. Só com
+  o backend compartilhado (Redis): em memória cada worker tem os próprios
+  carimbos, e o índice é relido do banco a cada chamada;
+- o resgate é um único ``UPDATE ... WHERE usos_realizados < limite_uso``
+  (com ativo e período na mesma condição); sem linha afetada, o cupom não
+  é aplicado;
+- cada resgate entra em cupom_resgate (cupom, venda, desconto, valor), de
+  onde saem as estatísticas de uso sem varrer Venda.
+"""
+
+import bisect
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from sqlalchemy import func, insert, or_, select, update
+
+# Tenants com índice mantido em memória por processo
+MAX_TENANTS = 1000
+SUGESTOES_MAX = 10
+
+
+@dataclass(frozen=True)
+class CupomIndexado:
+    """Cópia imutável dos campos de um Cupom usados na validação"""
+    id: int
+    codigo: str
+    descricao: str | None
+    tipo_desconto: str
+    valor_desconto: float
+    valor_minimo_compra: float
+    valor_maximo_desconto: float | None
+    limite_uso: int | None
+    usos_realizados: int
+    data_inicio: datetime | None
+    data_fim: datetime | None
+    ativo: bool
+
+    def motivo_invalido(self, agora: datetime | None = None) -> str | None:
+        """Mensagem de recusa, ou None se o cupom pode ser usado agora"""
+        agora = agora or datetime.utcnow()
+        if not self.ativo:
+            return 'Cupom inativo'
+        if self.data_inicio and agora < self.data_inicio:
+            return 'Cupom ainda não é válido'
+        if self.data_fim and agora > self.data_fim:
+            return 'Cupom expirado'
+        if self.limite_uso and self.usos_realizados >= self.limite_uso:
+            return 'Cupom esgotado'
+        return None
+
+    def desconto(self, total: float) -> float:
+        """Desconto sobre `total` (0 abaixo do valor mínimo de compra)"""
+        if total < self.valor_minimo_compra:
+            return 0
+        if self.tipo_desconto == 'percentual':
+            desconto = total * (self.valor_desconto / 100)
+            if self.valor_maximo_desconto:
+                desconto = min(desconto, self.valor_maximo_desconto)
+            return desconto
+        return min(self.valor_desconto, total)
+
+    def as_dict(self) -> dict:
+        """Campos expostos pela API de validação"""
+        dados = asdict(self)
+        return {chave: dados[chave] for chave in (
+            'id', 'codigo', 'descricao', 'tipo_desconto', 'valor_desconto',
+            'valor_minimo_compra', 'valor_maximo_desconto')}
+
+
+@dataclass
+class _Indice:
+    versao: str | None
+    por_codigo: dict
+    codigos: list  # ordenados, para a busca por prefixo
+
+
+_indices = OrderedDict()  # user_id -> _Indice
+_lock = threading.Lock()
+
+
+def normalizar_codigo(codigo) -> str:
+    return (codigo or '').strip().upper()
+
+
+def _versao(user_id) -> str | None:
+    from app_cache import cache, CUPONS, tenant
+    if cache.store is None or not getattr(cache.store, 'compartilhado', False):
+        # Carimbos por processo não veem as escritas de outro worker
+        return None
+    try:
+        return cache.versao(CUPONS, tenant(user_id))
+    except Exception as e:
+        print(f"AVISO: carimbo de cupons indisponivel ({e}); recarregando o indice")
+        return None
+
+
+def _carregar(user_id) -> dict:
+    from app import db, Cupom
+
+    tabela = Cupom.__table__
+    linhas = db.session.execute(select(tabela).where(tabela.c.user_id == user_id)).mappings()
+    return {
+        normalizar_codigo(linha['codigo']): CupomIndexado(
+            id=linha['id'],
+            codigo=linha['codigo'],
+            descricao=linha['descricao'],
+            tipo_desconto=linha['tipo_desconto'],
+            valor_desconto=float(linha['valor_desconto'] or 0),
+            valor_minimo_compra=float(linha['valor_minimo_compra'] or 0),
+            valor_maximo_desconto=linha['valor_maximo_desconto'],
+            limite_uso=linha['limite_uso'],
+            usos_realizados=int(linha['usos_realizados'] or 0),
+            data_inicio=linha['data_inicio'],
+            data_fim=linha['data_fim'],
+            ativo=bool(linha['ativo']),
+        )
+        for linha in linhas
+    }
+
+
+def indice(user_id) -> _Indice:
+    """Índice dos cupons do tenant (recarregado quando o carimbo muda; sem
+    carimbo compartilhado, lido do banco e não guardado)"""
+    versao = _versao(user_id)
+    with _lock:
+        atual = _indices.get(user_id)
+        if atual is not None and versao is not None and atual.versao == versao:
+            _indices.move_to_end(user_id)
+            return atual
+    por_codigo = _carregar(user_id)
+    novo = _Indice(versao, por_codigo, sorted(por_codigo))
+    if versao is not None:
+        with _lock:
+            _indices[user_id] = novo
+            _indices.move_to_end(user_id)
+            while len(_indices) > MAX_TENANTS:
+                _indices.popitem(last=False)
+    return novo
+
+
+def validar(codigo, user_id, agora: datetime | None = None):
+    """``(CupomIndexado, None)`` se válido; ``(None, mensagem)`` caso contrário"""
+    cupom = indice(user_id).por_codigo.get(normalizar_codigo(codigo))
+    if cupom is None:
+        return None, 'Cupom não encontrado'
+    motivo = cupom.motivo_invalido(agora)
+    if motivo:
+        return None, motivo
+    return cupom, None
+
+
+def sugestoes(prefixo, user_id, limite: int = SUGESTOES_MAX, agora: datetime | None = None) -> list:
+    """Cupons válidos cujo código começa com `prefixo` (busca enquanto digita)"""
+    prefixo = normalizar_codigo(prefixo)
+    if not prefixo:
+        return []
+    atual = indice(user_id)
+    encontrados = []
+    for codigo in atual.codigos[bisect.bisect_left(atual.codigos, prefixo):]:
+        if not codigo.startswith(prefixo) or len(encontrados) >= limite:
+            break
+        cupom = atual.por_codigo[codigo]
+        if cupom.motivo_invalido(agora) is None:
+            encontrados.append(cupom)
+    return encontrados
+
+
+def resgatar(codigo, user_id, total: float, agora: datetime | None = None):
+    """Reserva um uso do cupom na transação da sessão.
+
+    Retorna ``(cupom, desconto)``, ou ``(None, 0)`` se o cupom não se aplica
+    — inclusive quando outra venda levou o último uso entre a validação e o
+    UPDATE condicional. O resgate de um cupom limitado invalida o índice do
+    tenant no commit.
+    """
+    from app import db, Cupom
+    from app_cache import cache, CUPONS, tenant
+
+    agora = agora or datetime.utcnow()
+    cupom, _ = validar(codigo, user_id, agora)
+    if cupom is None:
+        return None, 0
+    if total < cupom.valor_minimo_compra:
+        return None, 0
+    desconto = cupom.desconto(total)
+
+    tabela = Cupom.__table__
+    usos = func.coalesce(tabela.c.usos_realizados, 0)
+    resultado = db.session.execute(
+        update(tabela)
+        .where(tabela.c.id == cupom.id, tabela.c.user_id == user_id,
+               tabela.c.ativo == True,  # noqa: E712
+               or_(tabela.c.limite_uso.is_(None), tabela.c.limite_uso == 0, usos < tabela.c.limite_uso),
+               or_(tabela.c.data_inicio.is_(None), tabela.c.data_inicio <= agora),
+               or_(tabela.c.data_fim.is_(None), tabela.c.data_fim >= agora))
+        .values(usos_realizados=usos + 1)
+    )
+    if resultado.rowcount != 1:
+        return None, 0
+    if cupom.limite_uso:
+        # O índice guarda os usos de cupons limitados (para 'Cupom esgotado')
+        cache.agendar(db.session, {(CUPONS, tenant(user_id))})
+    return cupom, desconto
+
+
+def registrar_resgate(venda, cupom: CupomIndexado, desconto: float) -> None:
+    """Lança o resgate no livro, na transação da venda"""
+    from app import db, CupomResgate
+
+    db.session.execute(insert(CupomResgate.__table__).values(
+        cupom_id=cupom.id,
+        venda_id=venda.id,
+        user_id=venda.user_id,
+        desconto=desconto,
+        valor_venda=venda.valor_total,
+        created_at=venda.data_venda,
+    ))
+
+
+def estatisticas(user_id) -> dict:
+    """cupom_id -> usos, desconto total e receita das vendas com o cupom (uma consulta)"""
+    from app import db, CupomResgate
+
+    tabela = CupomResgate.__table__
+    linhas = db.session.execute(
+        select(tabela.c.cupom_id, func.count(), func.coalesce(func.sum(tabela.c.desconto), 0),
+               func.coalesce(func.sum(tabela.c.valor_venda - tabela.c.desconto), 0))
+        .where(tabela.c.user_id == user_id)
+        .group_by(tabela.c.cupom_id)
+    ).all()
+    return {
+        cupom_id: {'usos': int(usos), 'desconto_total': float(desconto), 'receita': float(receita)}
+        for cupom_id, usos, desconto, receita in linhas
+    }
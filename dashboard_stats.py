@@ -0,0 +1,152 @@
+"""
+Agregação dos indicadores do dashboard
+
+Calcula todos os KPIs de um usuário em uma única instrução SQL (subconsultas
+escalares + agregados condicionais para a série de 7 dias) e carrega as
+vendas recentes em uma segunda instrução, já com o cliente via JOIN.
+"""
+
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+from sqlalchemy import select, func, case, and_
+from sqlalchemy.orm import joinedload
+
+
+@dataclass
+class DashboardStats:
+    """Resultado tipado do dashboard de um usuário"""
+    total_produtos: int = 0
+    total_clientes: int = 0
+    total_fornecedores: int = 0
+    total_produtos_auxiliares: int = 0
+    total_vendas_mes: float = 0.0
+    total_compras_mes: float = 0.0
+    produtos_estoque_baixo: int = 0
+    produtos_auxiliares_estoque_baixo: int = 0
+    tickets_abertos: int = 0
+    vendas_7_dias: List[Dict[str, Any]] = field(default_factory=list)
+    vendas_recentes: list = field(default_factory=list)
+
+    def as_template_context(self) -> Dict[str, Any]:
+        """Variáveis no formato esperado por dashboard.html"""
+        # Não usar asdict(): ele faria deepcopy das instâncias ORM
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+def _inicio_do_dia(valor: datetime) -> datetime:
+    return valor.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def build_kpi_statement(user_id: int, agora: datetime | None = None):
+    """Monta a instrução única com todos os KPIs e a série de vendas por dia.
+
+    Os dias são filtrados por intervalo (>= início, < fim) em vez de
+    ``date(data_venda) = dia`` para que o índice de ``data_venda`` seja usado.
+    Retorna ``(statement, dias)`` onde ``dias`` são as datas da série em ordem
+    cronológica.
+    """
+    from app import (Produto, Cliente, Fornecedor, ProdutoAuxiliar, Venda,
+                     Compra, TicketSuporte)
+
+    agora = agora or datetime.now()
+    inicio_mes = _inicio_do_dia(agora.replace(day=1))
+    hoje = _inicio_do_dia(agora)
+    dias = [hoje - timedelta(days=i) for i in range(6, -1, -1)]
+    inicio_janela = min(inicio_mes, dias[0])
+
+    def contar(model, *criterios):
+        return (select(func.count(model.id))
+                .where(model.user_id == user_id, *criterios)
+                .scalar_subquery())
+
+    # Uma única varredura em venda para o total do mês e os 7 dias
+    colunas_dias = [
+        func.coalesce(func.sum(case(
+            (and_(Venda.data_venda >= dia, Venda.data_venda < dia + timedelta(days=1)), 1),
+            else_=0,
+        )), 0).label(f'dia_{i}')
+        for i, dia in enumerate(dias)
+    ]
+    vendas_agg = (
+        select(
+            func.coalesce(func.sum(case(
+                (Venda.data_venda >= inicio_mes, Venda.valor_total),
+                else_=0,
+            )), 0).label('total_vendas_mes'),
+            *colunas_dias,
+        )
+        .where(
+            Venda.user_id == user_id,
+            Venda.status == 'finalizada',
+            Venda.data_venda >= inicio_janela,
+        )
+        .subquery('vendas_agg')
+    )
+
+    total_compras_mes = (
+        select(func.coalesce(func.sum(Compra.valor_total), 0))
+        .where(Compra.user_id == user_id, Compra.data_compra >= inicio_mes)
+        .scalar_subquery()
+    )
+
+    stmt = select(
+        contar(Produto).label('total_produtos'),
+        contar(Cliente).label('total_clientes'),
+        contar(Fornecedor, Fornecedor.status == 'ativo').label('total_fornecedores'),
+        contar(ProdutoAuxiliar, ProdutoAuxiliar.status == 'ativo').label('total_produtos_auxiliares'),
+        contar(Produto, Produto.estoque_atual <= Produto.estoque_minimo).label('produtos_estoque_baixo'),
+        contar(ProdutoAuxiliar, ProdutoAuxiliar.estoque_atual <= ProdutoAuxiliar.estoque_minimo).label('produtos_auxiliares_estoque_baixo'),
+        contar(TicketSuporte, TicketSuporte.status.in_(['aberto', 'em_andamento'])).label('tickets_abertos'),
+        total_compras_mes.label('total_compras_mes'),
+        vendas_agg,
+    ).select_from(vendas_agg)
+    return stmt, dias
+
+
+def compute_kpis(user_id: int, agora: datetime | None = None) -> Dict[str, Any]:
+    """KPIs e série de 7 dias do usuário (uma instrução), como valores simples."""
+    from app import db
+
+    stmt, dias = build_kpi_statement(user_id, agora)
+    row = db.session.execute(stmt).mappings().one()
+    return {
+        'total_produtos': int(row['total_produtos'] or 0),
+        'total_clientes': int(row['total_clientes'] or 0),
+        'total_fornecedores': int(row['total_fornecedores'] or 0),
+        'total_produtos_auxiliares': int(row['total_produtos_auxiliares'] or 0),
+        'total_vendas_mes': float(row['total_vendas_mes'] or 0),
+        'total_compras_mes': float(row['total_compras_mes'] or 0),
+        'produtos_estoque_baixo': int(row['produtos_estoque_baixo'] or 0),
+        'produtos_auxiliares_estoque_baixo': int(row['produtos_auxiliares_estoque_baixo'] or 0),
+        'tickets_abertos': int(row['tickets_abertos'] or 0),
+        'vendas_7_dias': [
+            {'data': dia.strftime('%d/%m'), 'vendas': int(row[f'dia_{i}'] or 0)}
+            for i, dia in enumerate(dias)
+        ],
+    }
+
+
+def get_dashboard_stats(user_id: int, agora: datetime | None = None,
+                        recentes: int = 5) -> DashboardStats:
+    """Indicadores do dashboard: KPIs do cache por tenant (ou uma instrução) + vendas recentes."""
+    from app import Venda
+    from app_cache import cache
+
+    if agora is None:
+        # O dia entra na chave: a série de 7 dias muda de janela à meia-noite
+        kpis = cache.obter('dashboard', user_id, lambda: compute_kpis(user_id),
+                           datetime.now().strftime('%Y-%m-%d'))
+    else:
+        kpis = compute_kpis(user_id, agora)
+
+    vendas_recentes = (
+        Venda.query.options(joinedload(Venda.cliente))
+        .filter_by(user_id=user_id)
+        .order_by(Venda.data_venda.desc())
+        .limit(recentes)
+        .all()
+    ) if recentes else []
+
+    return DashboardStats(vendas_recentes=vendas_recentes, **kpis)
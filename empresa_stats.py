@@ -0,0 +1,314 @@
+"""
+Estatísticas agregadas por empresa (admin_home)
+
+O painel administrativo lê um snapshot por Empresa (tabela empresa_stats) em
+uma única consulta. Escritas em vendas, compras, tickets e demais entidades
+marcam o snapshot da empresa como desatualizado na mesma transação; a próxima
+leitura (ou o job periódico) recalcula os números ao vivo.
+
+O cálculo ao vivo usa agregados condicionais por tabela, com JOIN em
+User.empresa_id em vez de listas IN com os ids dos funcionários, reunidos em
+uma única instrução.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, case, exists, true, insert, update, or_, event
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+# Tempo máximo de vida de um snapshot (segundos), mesmo sem escritas
+STATS_TTL_SECONDS = int(os.environ.get('EMPRESA_STATS_TTL', 300))
+
+# Modelos cujas escritas alteram os números do painel (nome -> atributo do dono)
+TRACKED_MODELS = {
+    'User': 'empresa_id',
+    'Cliente': 'user_id',
+    'Produto': 'user_id',
+    'Venda': 'user_id',
+    'Fornecedor': 'user_id',
+    'Compra': 'user_id',
+    'ProdutoAuxiliar': 'user_id',
+    'NotaFiscal': 'user_id',
+    'TicketSuporte': 'user_id',
+    'RespostaTicket': 'user_id',
+}
+
+# Campos monetários (float); os demais agregados são contagens
+CAMPOS_MONETARIOS = {'faturamento_mes', 'ticket_medio', 'valor_total_estoque',
+                     'valor_total_pendente', 'valor_total'}
+
+
+def _inicio_do_dia(valor: datetime) -> datetime:
+    return valor.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _contar(condicao):
+    return func.count(case((condicao, 1)))
+
+
+def _somar(coluna, condicao=None):
+    if condicao is None:
+        return func.coalesce(func.sum(coluna), 0)
+    return func.coalesce(func.sum(case((condicao, coluna))), 0)
+
+
+def build_live_statement(empresa_id, agora: datetime | None = None):
+    """Monta a instrução única com todos os agregados da empresa.
+
+    Cada tabela vira uma subconsulta de uma linha (agregados condicionais com
+    JOIN em User); as subconsultas são combinadas com JOIN ON true.
+    Retorna ``(statement, dias)``.
+    """
+    from app import (User, Cliente, Produto, Venda, Fornecedor, Compra,
+                     ProdutoAuxiliar, NotaFiscal, TicketSuporte, RespostaTicket)
+
+    agora = agora or datetime.now()
+    inicio_mes = _inicio_do_dia(agora.replace(day=1))
+    hoje = _inicio_do_dia(agora)
+    dias = [hoje - timedelta(days=i) for i in range(6, -1, -1)]
+
+    def agregado(model, grupo, colunas):
+        stmt = select(*[expr.label(f'{grupo}__{nome}') for nome, expr in colunas.items()])
+        if model is User:
+            stmt = stmt.where(User.empresa_id == empresa_id)
+        else:
+            stmt = (stmt.select_from(model)
+                    .join(User, User.id == model.user_id)
+                    .where(User.empresa_id == empresa_id))
+        return stmt.subquery(grupo)
+
+    vendas_cols = {
+        'total_vendas': func.count(Venda.id),
+        'vendas_este_mes': _contar((Venda.status == 'finalizada') & (Venda.data_venda >= inicio_mes)),
+        'faturamento_mes': _somar(Venda.valor_total, (Venda.status == 'finalizada') & (Venda.data_venda >= inicio_mes)),
+        'ticket_medio': func.coalesce(func.avg(case((Venda.status == 'finalizada', Venda.valor_total))), 0),
+    }
+    for i, dia in enumerate(dias):
+        vendas_cols[f'dia_{i}'] = _contar(
+            (Venda.status == 'finalizada')
+            & (Venda.data_venda >= dia)
+            & (Venda.data_venda < dia + timedelta(days=1))
+        )
+
+    sem_vendas = ~exists().where(Venda.cliente_id == Cliente.id)
+
+    subconsultas = [
+        agregado(User, 'stats', {
+            'total_usuarios': func.count(User.id),
+            'usuarios_ativos': _contar(User.created_at >= agora - timedelta(days=30)),
+            'usuarios_admin': _contar(User.role == 'admin'),
+        }),
+        agregado(Cliente, 'clientes_stats', {
+            'total': func.count(Cliente.id),
+            'novos_este_mes': _contar(Cliente.created_at >= inicio_mes),
+            'sem_vendas': _contar(sem_vendas),
+        }),
+        agregado(Produto, 'produtos_stats', {
+            'total': func.count(Produto.id),
+            'estoque_baixo': _contar(Produto.estoque_atual <= Produto.estoque_minimo),
+            'sem_estoque': _contar(Produto.estoque_atual == 0),
+            'valor_total_estoque': _somar(Produto.estoque_atual * Produto.preco),
+        }),
+        agregado(Venda, 'vendas_stats', vendas_cols),
+        agregado(Fornecedor, 'fornecedores_stats', {
+            'total': func.count(Fornecedor.id),
+            'ativos': _contar(Fornecedor.status == 'ativo'),
+            'inativos': _contar(Fornecedor.status == 'inativo'),
+        }),
+        agregado(Compra, 'compras_stats', {
+            'total': func.count(Compra.id),
+            'pendentes': _contar(Compra.status == 'pendente'),
+            'confirmadas': _contar(Compra.status == 'confirmada'),
+            'valor_total_pendente': _somar(Compra.valor_total, Compra.status == 'pendente'),
+        }),
+        agregado(ProdutoAuxiliar, 'produtos_aux_stats', {
+            'total': func.count(ProdutoAuxiliar.id),
+            'ativos': _contar(ProdutoAuxiliar.status == 'ativo'),
+            'estoque_baixo': _contar(ProdutoAuxiliar.estoque_atual <= ProdutoAuxiliar.estoque_minimo),
+        }),
+        agregado(NotaFiscal, 'notas_stats', {
+            'total': func.count(NotaFiscal.id),
+            'pendentes': _contar(NotaFiscal.status == 'pendente'),
+            'emitidas': _contar(NotaFiscal.status == 'emitida'),
+            'valor_total': _somar(NotaFiscal.valor_total),
+        }),
+        agregado(TicketSuporte, 'suporte_stats', {
+            'tickets_abertos': _contar(TicketSuporte.status.in_(['aberto', 'em_andamento'])),
+            'tickets_resolvidos': _contar(TicketSuporte.status == 'resolvido'),
+            'tickets_fechados': _contar(TicketSuporte.status == 'fechado'),
+        }),
+        agregado(RespostaTicket, 'respostas', {
+            'total_respostas': func.count(RespostaTicket.id),
+        }),
+    ]
+
+    origem = subconsultas[0]
+    for sq in subconsultas[1:]:
+        origem = origem.join(sq, true())
+    stmt = select(*[c for sq in subconsultas for c in sq.c]).select_from(origem)
+    return stmt, dias
+
+
+def compute_live_stats(empresa_id, agora: datetime | None = None) -> dict:
+    """Calcula as estatísticas da empresa diretamente nas tabelas (2 instruções)."""
+    from app import db, User, Produto, ItemVenda, Venda
+
+    stmt, dias = build_live_statement(empresa_id, agora)
+    row = db.session.execute(stmt).mappings().one()
+
+    payload = {}
+    for chave, valor in row.items():
+        grupo, nome = chave.split('__', 1)
+        valor = float(valor or 0) if nome in CAMPOS_MONETARIOS else int(valor or 0)
+        payload.setdefault(grupo, {})[nome] = valor
+
+    # Respostas fazem parte do bloco de suporte no template
+    payload['suporte_stats']['total_respostas'] = payload.pop('respostas')['total_respostas']
+
+    vendas_stats = payload['vendas_stats']
+    payload['vendas_7_dias'] = [
+        {'data': dia.strftime('%d/%m'), 'vendas': vendas_stats.pop(f'dia_{i}')}
+        for i, dia in enumerate(dias)
+    ]
+
+    top = db.session.execute(
+        select(Produto.nome, func.sum(ItemVenda.quantidade).label('total_vendido'))
+        .join(ItemVenda, ItemVenda.produto_id == Produto.id)
+        .join(Venda, Venda.id == ItemVenda.venda_id)
+        .join(User, User.id == Venda.user_id)
+        .where(User.empresa_id == empresa_id, Venda.status == 'finalizada')
+        .group_by(Produto.id, Produto.nome)
+        .order_by(func.sum(ItemVenda.quantidade).desc())
+        .limit(5)
+    ).all()
+    payload['top_produtos'] = [
+        {'nome': nome, 'total_vendido': int(total or 0)} for nome, total in top
+    ]
+    return payload
+
+
+def _snapshot_valido(snapshot, agora: datetime) -> bool:
+    if snapshot is None or snapshot.stale or not snapshot.computed_at or not snapshot.payload:
+        return False
+    # A série de 7 dias muda de janela à meia-noite
+    if snapshot.computed_at.date() != agora.date():
+        return False
+    return (agora - snapshot.computed_at).total_seconds() < STATS_TTL_SECONDS
+
+
+def refresh_empresa_stats(empresa_id, agora: datetime | None = None) -> dict:
+    """Recalcula e grava o snapshot da empresa.
+
+    Antes do cálculo o snapshot é reivindicado (stale=False, sem computed_at,
+    para ninguém o ler como válido); o resultado só é gravado se nenhuma
+    escrita o marcou de novo como desatualizado nesse meio-tempo. As
+    gravações usam transação própria: a leitura do painel (um GET) não
+    confirma o que estiver pendente na sessão da requisição.
+    """
+    from app import db, EmpresaStats
+
+    agora = agora or datetime.now()
+    tabela = EmpresaStats.__table__
+    do_snapshot = tabela.c.empresa_id == empresa_id
+    try:
+        with db.engine.begin() as conn:
+            reivindicados = conn.execute(
+                update(tabela).where(do_snapshot).values(stale=False, computed_at=None)
+            ).rowcount
+            if not reivindicados:
+                conn.execute(insert(tabela).values(empresa_id=empresa_id, stale=False))
+    except IntegrityError:
+        # Outro worker criou o snapshot ao mesmo tempo; a gravação abaixo é condicional
+        pass
+    except SQLAlchemyError as e:
+        # O snapshot é só um atalho: sem ele, a próxima leitura recalcula
+        print(f"AVISO: snapshot da empresa {empresa_id} nao reivindicado ({e})")
+        return compute_live_stats(empresa_id, agora)
+
+    payload = compute_live_stats(empresa_id, agora)
+    try:
+        with db.engine.begin() as conn:
+            # stale=True aqui: uma escrita chegou durante o cálculo e o resultado já nasceu velho
+            conn.execute(
+                update(tabela).where(do_snapshot, tabela.c.stale == False)  # noqa: E712
+                .values(payload=json.dumps(payload), computed_at=agora)
+            )
+    except SQLAlchemyError as e:
+        print(f"AVISO: snapshot da empresa {empresa_id} nao gravado ({e})")
+    return payload
+
+
+def get_empresa_stats(empresa_id, agora: datetime | None = None) -> dict:
+    """Estatísticas da empresa: snapshot válido (1 consulta) ou cálculo ao vivo."""
+    from app import EmpresaStats
+
+    agora = agora or datetime.now()
+    if empresa_id is None:
+        # Usuários legados sem Empresa vinculada não têm snapshot
+        return compute_live_stats(None, agora)
+
+    snapshot = EmpresaStats.query.filter_by(empresa_id=empresa_id).first()
+    if _snapshot_valido(snapshot, agora):
+        try:
+            return json.loads(snapshot.payload)
+        except (TypeError, ValueError):
+            pass
+    return refresh_empresa_stats(empresa_id, agora)
+
+
+def refresh_stale_snapshots(agora: datetime | None = None) -> int:
+    """Job periódico: recalcula snapshots desatualizados ou expirados."""
+    from app import EmpresaStats
+
+    agora = agora or datetime.now()
+    pendentes = [s.empresa_id for s in EmpresaStats.query.all() if not _snapshot_valido(s, agora)]
+    for empresa_id in pendentes:
+        refresh_empresa_stats(empresa_id, agora)
+    return len(pendentes)
+
+
+def _marcar_desatualizados(session, flush_context):
+    """after_flush: marca como desatualizado o snapshot das empresas afetadas."""
+    empresa_ids = set()
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        attr = TRACKED_MODELS.get(type(obj).__name__)
+        if not attr:
+            continue
+        valor = getattr(obj, attr, None)
+        if valor is None:
+            continue
+        (empresa_ids if attr == 'empresa_id' else user_ids).add(valor)
+    if not empresa_ids and not user_ids:
+        return
+    marcar_desatualizados(session.connection(), empresa_ids, user_ids)
+
+
+def marcar_desatualizados(conn, empresa_ids=(), user_ids=()) -> None:
+    """Marca o snapshot das empresas (ou das empresas dos usuários) como desatualizado.
+
+    Também para escritas fora da sessão (INSERT em massa), que não passam
+    pelo after_flush.
+    """
+    from app import User, EmpresaStats
+
+    condicoes = []
+    if empresa_ids:
+        condicoes.append(EmpresaStats.empresa_id.in_(empresa_ids))
+    if user_ids:
+        condicoes.append(EmpresaStats.empresa_id.in_(
+            select(User.empresa_id).where(User.id.in_(user_ids))
+        ))
+    conn.execute(
+        update(EmpresaStats.__table__)
+        .where(or_(*condicoes), EmpresaStats.__table__.c.stale == False)  # noqa: E712
+        .values(stale=True)
+    )
+
+
+def register_stats_invalidation(db):
+    """Liga a invalidação do snapshot às escritas da sessão do Flask-SQLAlchemy."""
+    if not event.contains(db.session, 'after_flush', _marcar_desatualizados):
+        event.listen(db.session, 'after_flush', _marcar_desatualizados)
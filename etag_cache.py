@@ -0,0 +1,88 @@
+"""
+Validação condicional (ETag / 304) das rotas JSON de leitura
+
+Nenhuma rota /api/* emitia validadores: cada refetch do TanStack Query no
+frontend React (e cada polling do app) refazia as consultas e a
+serialização, quase sempre para devolver os mesmos dados.
+
+O decorator ``versionado`` dá às rotas GET um ETag fraco derivado dos
+carimbos de versão do app_cache, os mesmos que invalidam o cache de
+resultados e que sobem após o commit de escritas nos modelos do tenant:
+
+- o ETag combina rota, URL com query string, usuário, papel, os carimbos
+  dos domínios declarados (DADOS por padrão) e, com ``diario=True``, o dia
+  (respostas que dependem do calendário, como os KPIs do mês);
+- If-None-Match que confere é respondido com 304 antes de a view rodar,
+  sem nenhuma consulta ORM: os carimbos são um MGET no Redis, memorizado
+  na requisição;
+- respostas 200 levam ``ETag: W/"..."`` e ``Cache-Control: private,
+  no-cache``, e o navegador guarda e revalida sozinho.
+
+Só vale com o backend compartilhado (Redis). Com o cache em memória cada
+worker tem os próprios carimbos, e um worker que não viu a escrita
+responderia 304 com dados velhos. Rotas cujos dados não passam pelos
+carimbos (caixa, cupons com validade por horário, escopo de empresa) não
+usam o decorator.
+"""
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import make_response, request, session
+
+from app_cache import DADOS, cache, tenant
+
+# Suba ao mudar o formato de uma resposta versionada: descarta os ETags já emitidos
+FORMATO = 1
+
+
+def usuario_sessao():
+    return session.get('user_id')
+
+
+def calcular_etag(user_id, dominios, diario: bool = False) -> str | None:
+    """ETag da requisição atual para o tenant, ou None sem carimbos compartilhados"""
+    if cache.store is None or not getattr(cache.store, 'compartilhado', False):
+        return None
+    try:
+        versoes = [cache.versao(dominio, tenant(user_id)) for dominio in dominios]
+    except Exception as e:
+        print(f"AVISO: carimbos indisponiveis para o ETag ({e})")
+        return None
+    partes = [str(FORMATO), request.endpoint or '', request.full_path, str(user_id),
+              session.get('role') or '', *versoes]
+    if diario:
+        partes.append(datetime.now().date().isoformat())
+    return hashlib.blake2b('|'.join(partes).encode(), digest_size=16).hexdigest()
+
+
+def versionado(*dominios, diario: bool = False, usuario=usuario_sessao):
+    """ETag fraco e 304 para a view (GET/HEAD); vem depois da autenticação.
+
+    `dominios`: carimbos do app_cache de que a resposta depende (DADOS se
+    omitido). `usuario`: função que devolve o user_id autenticado (o da
+    sessão por padrão).
+    """
+    dominios = dominios or (DADOS,)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+            user_id = usuario()
+            etag = calcular_etag(user_id, dominios, diario) if user_id is not None else None
+            if etag is None:
+                return f(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                resposta = make_response('', 304)
+            else:
+                resposta = make_response(f(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag, weak=True)
+            resposta.headers['Cache-Control'] = 'private, no-cache'
+            return resposta
+        return decorated_function
+    return decorator
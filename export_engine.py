@@ -0,0 +1,480 @@
+"""
+Exportação em streaming (CSV e XLSX)
+
+As exportações não carregam mais a tabela inteira em memória:
+
+- as linhas vêm de um SELECT só com as colunas exportadas (o nome do
+  cliente entra por OUTER JOIN, sem lazy load por linha), lido com
+  ``yield_per`` - cursor do lado do servidor no Postgres;
+- CSV é enviado por um gerador (Response em streaming), em blocos;
+- XLSX usa o modo write-only do openpyxl, que grava as linhas em disco à
+  medida que chegam; as larguras das colunas são calculadas a partir de uma
+  amostra das primeiras linhas, e o arquivo é enviado com send_file.
+
+O consumo de memória do worker fica constante, independente do número de
+linhas exportadas. Os mesmos escritores (write_csv, write_xlsx, write_pdf,
+write_caixa_sessao) são usados pelas exportações em segundo plano
+(export_jobs), que gravam o arquivo em disco e informam o progresso.
+"""
+
+import csv
+import io
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import islice
+
+from flask import Response, send_file, stream_with_context
+from sqlalchemy import case, func, select
+
+# Linhas buscadas por vez no cursor do banco
+YIELD_PER = 1000
+# Linhas acumuladas antes de enviar um bloco do CSV
+CSV_CHUNK_ROWS = 500
+# Linhas usadas para estimar a largura das colunas do XLSX
+XLSX_SAMPLE_ROWS = 200
+XLSX_MAX_WIDTH = 50
+# Linhas por tabela do PDF: tabelas menores evitam o custo de dividir uma
+# tabela gigante entre páginas no reportlab
+PDF_CHUNK_ROWS = 500
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'excel': XLSX_MIMETYPE,
+    'pdf': 'application/pdf',
+}
+EXTENSOES = {'csv': 'csv', 'excel': 'xlsx', 'pdf': 'pdf'}
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    """Colunas de um relatório exportável e como montar sua consulta"""
+
+    headers: tuple
+    # build(user_id) -> select() com as colunas na ordem dos headers
+    build: object
+    # format(row) -> lista de valores da linha
+    format: object
+    titulo: str = ''
+    # Índices das colunas em reais no PDF (None: todo float é moeda)
+    moeda: tuple | None = None
+
+
+def _data_br(valor):
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _vendas_stmt(user_id):
+    from app import Venda, Cliente
+    return (select(Venda.data_venda, Cliente.nome, Venda.valor_total, Venda.status)
+            .outerjoin(Cliente, Cliente.id == Venda.cliente_id)
+            .where(Venda.user_id == user_id)
+            .order_by(Venda.data_venda, Venda.id))
+
+
+def _produtos_stmt(user_id):
+    from app import Produto
+    return (select(Produto.nome, Produto.preco, Produto.estoque_atual, Produto.categoria)
+            .where(Produto.user_id == user_id)
+            .order_by(Produto.nome, Produto.id))
+
+
+def _rotatividade_stmt(user_id):
+    from inventory_analytics import rotatividade_stmt
+    stmt = rotatividade_stmt(user_id)
+    return stmt.order_by(stmt.selected_columns.rotatividade.desc(), stmt.selected_columns.id)
+
+
+def _produtos_parados_stmt(user_id):
+    from inventory_analytics import produtos_parados_stmt
+    return produtos_parados_stmt(user_id)
+
+
+def _parado_row(r):
+    from inventory_analytics import dias_sem_venda
+    return [r.nome, r.categoria or 'N/A', r.estoque_atual, float(r.valor_estoque or 0),
+            _data_br(r.ultima_venda_em) or 'Nunca vendido', dias_sem_venda(r.ultima_venda_em)]
+
+
+def _clientes_stmt(user_id):
+    from app import Cliente
+    return (select(Cliente.nome, Cliente.email, Cliente.telefone, Cliente.cpf_cnpj, Cliente.created_at)
+            .where(Cliente.user_id == user_id)
+            .order_by(Cliente.nome, Cliente.id))
+
+
+REPORTS = {
+    'vendas': ExportSpec(
+        headers=('Data', 'Cliente', 'Valor', 'Status'),
+        build=_vendas_stmt,
+        format=lambda r: [_data_br(r[0]), r[1] or 'N/A', r[2], r[3]],
+    ),
+    'produtos': ExportSpec(
+        headers=('Nome', 'Preço', 'Estoque', 'Categoria'),
+        build=_produtos_stmt,
+        format=lambda r: [r[0], r[1], r[2], r[3] or 'N/A'],
+    ),
+    'clientes': ExportSpec(
+        headers=('Nome', 'Email', 'Telefone', 'CPF/CNPJ', 'Cadastro'),
+        build=_clientes_stmt,
+        format=lambda r: [r[0], r[1] or '', r[2] or '', r[3] or '', _data_br(r[4])],
+    ),
+    'rotatividade': ExportSpec(
+        headers=('Produto', 'Categoria', 'Estoque', 'Vendas (30 dias)', 'Vendas (90 dias)', 'Rotatividade'),
+        build=_rotatividade_stmt,
+        format=lambda r: [r.nome, r.categoria or 'N/A', r.estoque_atual, r.vendido_30, r.vendido_90,
+                          round(float(r.rotatividade or 0), 2)],
+        titulo='Rotatividade de Estoque',
+        moeda=(),
+    ),
+    'produtos-parados': ExportSpec(
+        headers=('Produto', 'Categoria', 'Estoque', 'Valor em Estoque', 'Última Venda', 'Dias Parado'),
+        build=_produtos_parados_stmt,
+        format=_parado_row,
+        titulo='Produtos Parados',
+        moeda=(3,),
+    ),
+}
+
+
+def iter_rows(stmt, formatter=None, yield_per: int = YIELD_PER):
+    """Itera as linhas do SELECT em lotes de `yield_per`, sem materializar tudo"""
+    from app import db
+
+    resultado = db.session.execute(stmt.execution_options(yield_per=yield_per))
+    try:
+        for row in resultado:
+            yield formatter(row) if formatter else list(row)
+    finally:
+        resultado.close()
+
+
+def report_rows(tipo: str, user_id):
+    """(headers, gerador de linhas) do relatório `tipo`; KeyError se desconhecido"""
+    spec = REPORTS[tipo]
+    return spec.headers, iter_rows(spec.build(user_id), spec.format)
+
+
+def count_rows(stmt, limite: int | None = None) -> int:
+    """Quantidade de linhas do SELECT (até `limite` + 1, se informado)"""
+    from app import db
+
+    if limite is not None:
+        stmt = stmt.limit(limite + 1)
+    return db.session.execute(
+        select(func.count()).select_from(stmt.order_by(None).subquery())
+    ).scalar() or 0
+
+
+def count_report(tipo: str, user_id, limite: int | None = None) -> int:
+    return count_rows(REPORTS[tipo].build(user_id), limite)
+
+
+def with_progress(rows, callback, every: int = 1000):
+    """Repassa as linhas chamando callback(n) a cada `every` linhas e no final"""
+    n = 0
+    for row in rows:
+        yield row
+        n += 1
+        if n % every == 0:
+            callback(n)
+    callback(n)
+
+
+def _csv_chunks(headers, rows, chunk_rows: int = CSV_CHUNK_ROWS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    pendentes = 0
+    for row in rows:
+        writer.writerow(row)
+        pendentes += 1
+        if pendentes >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pendentes = 0
+    yield buffer.getvalue()
+
+
+def write_csv(fileobj, headers, rows):
+    """Grava o CSV em `fileobj` (binário), em UTF-8"""
+    for bloco in _csv_chunks(headers, rows):
+        fileobj.write(bloco.encode('utf-8'))
+
+
+def csv_response(filename: str, headers, rows, content_type: str = 'text/csv; charset=utf-8'):
+    """Response em streaming com o CSV das linhas"""
+    resp = Response(stream_with_context(_csv_chunks(headers, rows)), content_type=content_type)
+    resp.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return resp
+
+
+def _largura(valor) -> int:
+    if valor is None:
+        return 0
+    if isinstance(valor, float):
+        return len(f'{valor:.2f}')
+    return len(str(valor))
+
+
+def write_xlsx(fileobj, headers, rows, title: str = 'Relatório', sample_rows: int = XLSX_SAMPLE_ROWS):
+    """Grava o XLSX em `fileobj` no modo write-only do openpyxl"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])
+
+    # No modo write-only as larguras precisam ser definidas antes da primeira linha
+    amostra = list(islice(rows, sample_rows))
+    for idx, header in enumerate(headers, start=1):
+        maior = max([_largura(header)] + [_largura(r[idx - 1]) for r in amostra])
+        ws.column_dimensions[get_column_letter(idx)].width = min(maior + 2, XLSX_MAX_WIDTH)
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    cabecalho = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        cabecalho.append(cell)
+    ws.append(cabecalho)
+
+    for row in amostra:
+        ws.append(row)
+    for row in rows:
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def _pdf_celula(valor, moeda: bool) -> str:
+    if valor is None:
+        return ''
+    if isinstance(valor, float):
+        return f'R$ {valor:.2f}' if moeda else f'{valor:.2f}'
+    return str(valor)
+
+
+def write_pdf(fileobj, headers, rows, title: str = 'Relatório', chunk_rows: int = PDF_CHUNK_ROWS,
+              moeda: tuple | None = None):
+    """Grava o PDF (reportlab) em `fileobj`; floats nas colunas `moeda` (todos, se None) saem em reais"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    estilo = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+    story = [Paragraph(title, getSampleStyleSheet()['Title']), Spacer(1, 12)]
+    bloco = []
+    for row in rows:
+        bloco.append([_pdf_celula(v, moeda is None or i in moeda) for i, v in enumerate(row)])
+        if len(bloco) >= chunk_rows:
+            story.append(Table([list(headers)] + bloco, style=estilo))
+            bloco = []
+    if bloco or len(story) == 2:
+        story.append(Table([list(headers)] + bloco, style=estilo))
+    SimpleDocTemplate(fileobj, pagesize=A4).build(story)
+
+
+WRITERS = {'csv': write_csv, 'excel': write_xlsx, 'pdf': write_pdf}
+
+
+def write_report(fileobj, tipo: str, formato: str, user_id, progresso=None):
+    """Grava o relatório `tipo` no formato pedido; progresso(n) recebe as linhas escritas"""
+    spec = REPORTS[tipo]
+    headers, rows = report_rows(tipo, user_id)
+    if progresso is not None:
+        rows = with_progress(rows, progresso)
+    titulo = spec.titulo or f"Relatório {tipo.title()}"
+    if formato == 'csv':
+        write_csv(fileobj, headers, rows)
+    elif formato == 'pdf':
+        write_pdf(fileobj, headers, rows, title=titulo, moeda=spec.moeda)
+    else:
+        write_xlsx(fileobj, headers, rows, title=titulo)
+
+
+def file_response(filename: str, formato: str, escrever):
+    """Chama escrever(arquivo) sobre um arquivo temporário e o envia com send_file"""
+    tmp = tempfile.TemporaryFile()
+    try:
+        escrever(tmp)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    return send_file(tmp, mimetype=MIMETYPES[formato], as_attachment=True, download_name=filename)
+
+
+def _valor_serializado(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def table_rows(model, where=None):
+    """(headers, linhas) de todas as colunas de `model`, no formato do serialize_model"""
+    colunas = list(model.__table__.columns)
+    stmt = select(*colunas).order_by(model.__table__.primary_key.columns.values()[0])
+    if where is not None:
+        stmt = stmt.where(where)
+    headers = [c.name for c in colunas]
+    return headers, iter_rows(stmt, lambda r: [_valor_serializado(v) for v in r])
+
+
+# ==================== SESSÃO DO CAIXA ====================
+
+CAIXA_HEADERS = ('Data', 'Tipo', 'Origem', 'Forma pagamento', 'Origem dados', 'Valor', 'Descrição')
+
+
+def caixa_movimentos_stmt(sessao_id, de=None, ate=None):
+    """Movimentos da sessão (colunas exportadas), opcionalmente entre `de` e `ate`"""
+    from app import MovimentoCaixa
+
+    stmt = (select(MovimentoCaixa.created_at, MovimentoCaixa.tipo, MovimentoCaixa.origem,
+                   MovimentoCaixa.forma_pagamento, MovimentoCaixa.valor, MovimentoCaixa.descricao)
+            .where(MovimentoCaixa.sessao_id == sessao_id))
+    if de is not None:
+        stmt = stmt.where(MovimentoCaixa.created_at >= de)
+    if ate is not None:
+        stmt = stmt.where(MovimentoCaixa.created_at <= ate)
+    return stmt.order_by(MovimentoCaixa.created_at.asc(), MovimentoCaixa.id.asc())
+
+
+def _caixa_totais(stmt):
+    """(entradas, saídas) somadas no banco sobre o mesmo filtro da exportação"""
+    from app import db
+
+    mov = stmt.order_by(None).subquery()
+    entradas, saidas = db.session.execute(select(
+        func.coalesce(func.sum(case((mov.c.tipo == 'entrada', mov.c.valor), else_=0)), 0),
+        func.coalesce(func.sum(case((mov.c.tipo == 'saida', mov.c.valor), else_=0)), 0),
+    )).one()
+    return float(entradas), float(saidas)
+
+
+def _origem_dados(descricao) -> str:
+    return 'Importado' if (descricao and '[IMPORTADO]' in descricao) else 'Manual'
+
+
+def _fmt_data(valor, formato: str) -> str:
+    return valor.strftime(formato) if valor else ''
+
+
+def write_caixa_sessao(fileobj, formato: str, sessao, de=None, ate=None, progresso=None):
+    """Grava a exportação da sessão do caixa (CSV, Excel ou PDF) em `fileobj`"""
+    stmt = caixa_movimentos_stmt(sessao.id, de, ate)
+    entradas, saidas = _caixa_totais(stmt)
+    saldo_parcial = (sessao.saldo_inicial or 0) + entradas - saidas
+    rows = iter_rows(stmt)
+    if progresso is not None:
+        rows = with_progress(rows, progresso)
+
+    if formato == 'csv':
+        linhas = (
+            [m[0].isoformat() if m[0] else '', m[1] or '', m[2] or '', m[3] or '',
+             _origem_dados(m[5]), f'{(m[4] or 0):.2f}', m[5] or '']
+            for m in rows
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Sessão', sessao.id])
+        writer.writerow(['Início', sessao.data_abertura.isoformat() if sessao.data_abertura else '-'])
+        writer.writerow(['Fim', sessao.data_fechamento.isoformat() if sessao.data_fechamento else '-'])
+        writer.writerow([])
+        fileobj.write(buffer.getvalue().encode('utf-8'))
+        write_csv(fileobj, CAIXA_HEADERS, linhas)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([])
+        writer.writerow(['Entradas', f'{entradas:.2f}'])
+        writer.writerow(['Saídas', f'{saidas:.2f}'])
+        writer.writerow(['Saldo parcial', f'{saldo_parcial:.2f}'])
+        fileobj.write(buffer.getvalue().encode('utf-8'))
+
+    elif formato == 'excel':
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill, Alignment
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title='Movimentos')
+        ws.append(['Sessão', sessao.id])
+        ws.append(['Início', sessao.data_abertura.strftime('%Y-%m-%d %H:%M') if sessao.data_abertura else '-'])
+        ws.append(['Fim', sessao.data_fechamento.strftime('%Y-%m-%d %H:%M') if sessao.data_fechamento else '-'])
+        ws.append([])
+        cabecalho = []
+        for header in CAIXA_HEADERS:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = Font(bold=True)
+            cell.fill = PatternFill(start_color='EEEEEE', end_color='EEEEEE', fill_type='solid')
+            cell.alignment = Alignment(horizontal='center')
+            cabecalho.append(cell)
+        ws.append(cabecalho)
+        for m in rows:
+            ws.append([_fmt_data(m[0], '%Y-%m-%d %H:%M'), m[1] or '', m[2] or '', m[3] or '',
+                       _origem_dados(m[5]), round(m[4] or 0, 2), m[5] or ''])
+        ws.append([])
+        ws.append(['Entradas', entradas])
+        ws.append(['Saídas', saidas])
+        ws.append(['Saldo parcial', saldo_parcial])
+        wb.save(fileobj)
+
+    elif formato == 'pdf':
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+        styles = getSampleStyleSheet()
+        estilo = TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.black),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('GRID', (0,0), (-1,-1), 0.25, colors.grey),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightyellow]),
+        ])
+        cabecalho = ['Data', 'Tipo', 'Origem', 'Forma pgto.', 'Origem dados', 'Valor', 'Descrição']
+        elements = [
+            Paragraph(f'Sessão do Caixa #{sessao.id}', styles['Title']),
+            Paragraph(f'Início: {sessao.data_abertura.strftime("%d/%m/%Y %H:%M") if sessao.data_abertura else "-"}', styles['Normal']),
+            Paragraph(f'Fim: {sessao.data_fechamento.strftime("%d/%m/%Y %H:%M") if sessao.data_fechamento else "-"}', styles['Normal']),
+            Spacer(1, 12),
+        ]
+        bloco = []
+        tabelas = 0
+        for m in rows:
+            bloco.append([_fmt_data(m[0], '%d/%m/%Y %H:%M'), m[1] or '', m[2] or '', m[3] or '',
+                          _origem_dados(m[5]), f'R$ {(m[4] or 0):.2f}', (m[5] or '')[:80]])
+            if len(bloco) >= PDF_CHUNK_ROWS:
+                elements.append(Table([cabecalho] + bloco, repeatRows=1, style=estilo))
+                bloco = []
+                tabelas += 1
+        if bloco or not tabelas:
+            elements.append(Table([cabecalho] + bloco, repeatRows=1, style=estilo))
+        elements.append(Spacer(1, 12))
+        elements.append(Paragraph(f'Entradas: R$ {entradas:.2f}', styles['Normal']))
+        elements.append(Paragraph(f'Saídas: R$ {saidas:.2f}', styles['Normal']))
+        elements.append(Paragraph(f'Saldo parcial: R$ {saldo_parcial:.2f}', styles['Normal']))
+        SimpleDocTemplate(fileobj, pagesize=A4).build(elements)
+
+    else:
+        raise ValueError(f'Formato de exportação inválido: {formato}')
@@ -0,0 +1,251 @@
+"""
+Exportações em segundo plano (ExportJob)
+
+Relatórios grandes (principalmente PDFs do reportlab) não ocupam mais um
+worker web até estourar o timeout da requisição:
+
+1. criar_job() grava um ExportJob 'pendente' e o despacha;
+2. o job roda no Celery (tasks.exports.run_export_job) quando ele está
+   configurado; sem Celery/Redis, em um pool local por processo
+   (EXPORT_BACKEND = thread | process, EXPORT_WORKERS workers);
+3. executar_job() usa os mesmos escritores em streaming do export_engine,
+   grava o arquivo em EXPORT_DIR e atualiza progresso/linhas em uma conexão
+   separada (a cada 1000 linhas);
+4. o navegador consulta /relatorios/exportacoes/<id> até o status
+   'concluido' e baixa o arquivo, que expira após EXPORT_TTL_HOURS.
+"""
+
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+STATUS_EXPIRADO = 'expirado'
+
+TIPO_CAIXA_SESSAO = 'caixa_sessao'
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _config(chave, padrao=None):
+    from flask import current_app
+    return current_app.config.get(chave, padrao)
+
+
+def tipos_validos() -> set:
+    import export_engine
+    return set(export_engine.REPORTS) | {TIPO_CAIXA_SESSAO}
+
+
+def criar_job(user_id, tipo: str, formato: str, params: dict | None = None):
+    """Grava o ExportJob e o despacha; ValueError para tipo/formato inválidos"""
+    import export_engine
+    from app import db, ExportJob
+
+    if tipo not in tipos_validos():
+        raise ValueError('Tipo de relatório inválido.')
+    if formato not in export_engine.WRITERS:
+        raise ValueError('Formato de exportação inválido.')
+
+    limpar_expirados()
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        tipo=tipo,
+        formato=formato,
+        params=json.dumps(params or {}),
+        status=STATUS_PENDENTE,
+    )
+    db.session.add(job)
+    db.session.commit()
+    despachar(job.id)
+    return job
+
+
+def despachar(job_id: str) -> None:
+    """Envia o job ao Celery ou, sem ele, ao pool local"""
+    try:
+        from tasks.exports import celery, run_export_job
+    except Exception:
+        celery = None
+    if celery is not None:
+        try:
+            run_export_job.delay(job_id)
+            return
+        except Exception as e:
+            print(f"AVISO: Celery indisponível para exportação ({e}); usando pool local.")
+    _local_pool().submit(_executar_local, job_id)
+
+
+def _local_pool():
+    """Pool por processo (recriado após fork dos workers do gunicorn)"""
+    global _pool, _pool_pid
+    from flask import current_app
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = _config('EXPORT_WORKERS', 2)
+            if _config('EXPORT_BACKEND', 'thread') == 'process':
+                import multiprocessing
+                _pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            else:
+                _pool = _ThreadPool(current_app._get_current_object(), workers)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+class _ThreadPool:
+    """ThreadPoolExecutor que executa cada job dentro do app context"""
+
+    def __init__(self, app, workers: int):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+
+    def submit(self, fn, *args):
+        return self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        with self.app.app_context():
+            return fn(*args)
+
+
+def _executar_local(job_id: str):
+    from flask import has_app_context
+    if has_app_context():
+        return executar_job(job_id)
+    # Processo do ProcessPoolExecutor: carrega a aplicação
+    from tasks.exports import run_export_job_stub
+    return run_export_job_stub(job_id)
+
+
+def _atualizar(job_id: str, **valores) -> None:
+    """UPDATE do job em transação própria (não interfere no cursor da exportação)"""
+    from app import db, ExportJob
+
+    with db.engine.begin() as conn:
+        conn.execute(update(ExportJob.__table__).where(ExportJob.__table__.c.id == job_id).values(**valores))
+
+
+def caminho_arquivo(job) -> str:
+    import export_engine
+    return os.path.join(_config('EXPORT_DIR'), f'{job.id}.{export_engine.EXTENSOES[job.formato]}')
+
+
+def nome_download(job) -> str:
+    import export_engine
+    ext = export_engine.EXTENSOES[job.formato]
+    if job.tipo == TIPO_CAIXA_SESSAO:
+        return f"caixa_sessao_{json.loads(job.params or '{}').get('sessao_id')}.{ext}"
+    return f'relatorio_{job.tipo}.{ext}'
+
+
+def _parse_data(valor):
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def executar_job(job_id: str) -> dict:
+    """Gera o arquivo do job (chamado no worker, dentro do app context)"""
+    import export_engine
+    from app import db, ExportJob, CaixaSessao
+
+    job = db.session.get(ExportJob, job_id)
+    if job is None or job.status != STATUS_PENDENTE:
+        return {'status': job.status if job else 'inexistente', 'job_id': job_id}
+
+    params = json.loads(job.params or '{}')
+    destino = caminho_arquivo(job)
+    parcial = destino + '.part'
+    _atualizar(job_id, status=STATUS_EXECUTANDO, started_at=datetime.utcnow())
+    try:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if job.tipo == TIPO_CAIXA_SESSAO:
+            sessao = CaixaSessao.query.filter_by(id=params.get('sessao_id'), user_id=job.user_id).first()
+            if sessao is None:
+                raise ValueError('Sessão do caixa não encontrada.')
+            de, ate = _parse_data(params.get('de')), _parse_data(params.get('ate'))
+            total = export_engine.count_rows(export_engine.caixa_movimentos_stmt(sessao.id, de, ate))
+        else:
+            total = export_engine.count_report(job.tipo, job.user_id)
+        _atualizar(job_id, total_linhas=total)
+
+        # No SQLite uma escrita não pode ser gravada com o cursor de leitura aberto:
+        # lá o progresso só é atualizado no final
+        parcial_ok = db.engine.dialect.name != 'sqlite'
+
+        def progresso(n):
+            if not parcial_ok:
+                return
+            try:
+                _atualizar(job_id, linhas=n, progresso=min(99, int(n * 100 / total)) if total else 99)
+            except Exception as e:
+                print(f"AVISO: falha ao atualizar progresso da exportação {job_id}: {e}")
+
+        with open(parcial, 'wb') as f:
+            if job.tipo == TIPO_CAIXA_SESSAO:
+                export_engine.write_caixa_sessao(f, job.formato, sessao, de, ate, progresso=progresso)
+            else:
+                export_engine.write_report(f, job.tipo, job.formato, job.user_id, progresso=progresso)
+        os.replace(parcial, destino)
+        agora = datetime.utcnow()
+        _atualizar(job_id, status=STATUS_CONCLUIDO, progresso=100, linhas=total, arquivo=destino, finished_at=agora,
+                   expires_at=agora + timedelta(hours=_config('EXPORT_TTL_HOURS', 24)))
+        return {'status': STATUS_CONCLUIDO, 'job_id': job_id, 'path': destino}
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        print(f"AVISO: exportação {job_id} falhou: {e}")
+        _atualizar(job_id, status=STATUS_ERRO, erro=str(e)[:500], finished_at=datetime.utcnow())
+        return {'status': STATUS_ERRO, 'job_id': job_id, 'erro': str(e)}
+    finally:
+        db.session.remove()
+
+
+def limpar_expirados() -> int:
+    """Remove os arquivos vencidos e marca os jobs como 'expirado'"""
+    from app import db, ExportJob
+
+    vencidos = ExportJob.query.filter(ExportJob.status == STATUS_CONCLUIDO,
+                                      ExportJob.expires_at < datetime.utcnow()).all()
+    for job in vencidos:
+        if job.arquivo and os.path.exists(job.arquivo):
+            try:
+                os.remove(job.arquivo)
+            except OSError as e:
+                print(f"AVISO: não foi possível remover {job.arquivo}: {e}")
+        job.status = STATUS_EXPIRADO
+        job.arquivo = None
+    if vencidos:
+        db.session.commit()
+    return len(vencidos)
+
+
+def job_payload(job) -> dict:
+    """Status do job para o endpoint de consulta"""
+    from flask import url_for
+
+    concluido = job.status == STATUS_CONCLUIDO
+    return {
+        'id': job.id,
+        'tipo': job.tipo,
+        'formato': job.formato,
+        'status': job.status,
+        'progresso': job.progresso,
+        'linhas': job.linhas,
+        'total_linhas': job.total_linhas,
+        'erro': job.erro,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'download_url': url_for('reports.exportacao_download', job_id=job.id) if concluido else None,
+    }
@@ -18,6 +18,22 @@ export const queryKeys = {
   categorias: ['categorias'],
 }
 
+// Listagens paginadas por cursor: segue next_cursor até a última página e
+// devolve a resposta com todos os registros em data
+const fetchTodasPaginas = async (url) => {
+  const params = { per_page: 200 }
+  let resposta = null
+  const registros = []
+  do {
+    const { data } = await api.get(url, { params })
+    if (!data?.success) return data
+    resposta = data
+    registros.push(...data.data)
+    params.cursor = data.pagination?.next_cursor
+  } while (params.cursor)
+  return { ...resposta, data: registros }
+}
+
 // Auth Hooks
 export const useAuth = () => {
   return useQuery({
@@ -75,10 +91,7 @@ export const useDashboard = () => {
 export const useProdutos = () => {
   return useQuery({
     queryKey: queryKeys.produtos,
-    queryFn: async () => {
-      const response = await api.get('/produtos')
-      return response.data
-    },
+    queryFn: () => fetchTodasPaginas('/produtos'),
   })
 }
 
@@ -143,10 +156,7 @@ export const useDeleteProduto = () => {
 export const useClientes = () => {
   return useQuery({
     queryKey: queryKeys.clientes,
-    queryFn: async () => {
-      const response = await api.get('/clientes')
-      return response.data
-    },
+    queryFn: () => fetchTodasPaginas('/clientes'),
   })
 }
 
@@ -211,10 +221,7 @@ export const useDeleteCliente = () => {
 export const useVendas = () => {
   return useQuery({
     queryKey: queryKeys.vendas,
-    queryFn: async () => {
-      const response = await api.get('/vendas')
-      return response.data
-    },
+    queryFn: () => fetchTodasPaginas('/vendas'),
   })
 }
 
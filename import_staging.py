@@ -0,0 +1,664 @@
+"""
+Importações CSV em duas etapas (pré-visualização e confirmação)
+
+A importação de movimentos do caixa lia o arquivo inteiro para a memória e
+guardava até 1000 linhas em session['csv_import_caixa'], que o Flask grava
+no cookie a cada requisição (e o navegador descarta acima de ~4 KB).
+
+Agora:
+
+1. criar_staging() grava o upload em IMPORT_DIR, em blocos, e registra um
+   ImportJob com colunas, total de linhas e mapeamento sugerido; a leitura é
+   incremental e só as primeiras PREVIEW_ROWS linhas voltam para a tela. O
+   formulário carrega apenas o id da importação. Planilhas XLSX são
+   convertidas para CSV no upload, linha a linha (openpyxl em read_only).
+2. importar() relê o arquivo em streaming, converte cada linha com o
+   conversor do tipo e insere as válidas em lotes de CHUNK_ROWS (uma
+   transação); as rejeitadas vão para um CSV de rejeições com número da
+   linha e motivo. Validações que dependem do lote inteiro (colunas
+   validadas em bloco, duplicatas no banco e no próprio arquivo) e a cota
+   do plano também rejeitam linhas, sem interromper a importação.
+
+Produtos e clientes (cadastro inicial de lojas com milhares de itens) usam
+o mesmo caminho; ver a seção PRODUTOS E CLIENTES.
+
+Arquivos e registros vencem após IMPORT_TTL_HOURS (limpar_expirados()).
+"""
+
+import csv
+import itertools
+import json
+import os
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+
+STATUS_PENDENTE = 'pendente'
+STATUS_IMPORTANDO = 'importando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+STATUS_EXPIRADO = 'expirado'
+
+TIPO_CAIXA_MOVIMENTOS = 'caixa_movimentos'
+TIPO_PRODUTOS = 'produtos'
+TIPO_CLIENTES = 'clientes'
+
+PREVIEW_ROWS = 50
+CHUNK_ROWS = 1000
+# Bloco de cópia do upload para o disco
+SPOOL_CHUNK_BYTES = 64 * 1024
+
+# Campo do sistema -> nomes de coluna reconhecidos (minúsculos) no mapeamento sugerido
+SINONIMOS = {
+    TIPO_CAIXA_MOVIMENTOS: {
+        'tipo': ('tipo',),
+        'origem': ('origem',),
+        'valor': ('valor', 'amount'),
+        'descricao': ('descricao',),
+        'forma_pagamento': ('forma_pagamento', 'pagamento', 'payment_method'),
+        'referencia_id': ('referencia_id', 'ref_id', 'id'),
+        'data': ('data', 'date', 'created_at'),
+    },
+    TIPO_PRODUTOS: {
+        'nome': ('nome', 'produto', 'descricao_produto', 'name'),
+        'codigo_barras': ('codigo_barras', 'codigo', 'ean', 'gtin', 'sku', 'barcode'),
+        'preco': ('preco', 'preco_venda', 'valor', 'price'),
+        'preco_compra': ('preco_compra', 'custo', 'cost'),
+        'estoque_atual': ('estoque_atual', 'estoque', 'quantidade', 'stock'),
+        'estoque_minimo': ('estoque_minimo', 'minimo'),
+        'categoria': ('categoria', 'category'),
+        'descricao': ('descricao', 'description'),
+        'fornecedor_nome': ('fornecedor_nome', 'fornecedor'),
+    },
+    TIPO_CLIENTES: {
+        'nome': ('nome', 'cliente', 'name'),
+        'email': ('email', 'e-mail'),
+        'telefone': ('telefone', 'celular', 'fone', 'phone'),
+        'cpf_cnpj': ('cpf_cnpj', 'cpf', 'cnpj', 'documento'),
+        'endereco': ('endereco', 'address'),
+    },
+}
+
+
+# Campos da tela de mapeamento: (campo, rótulo, obrigatório)
+CAMPOS_CADASTRO = {
+    TIPO_PRODUTOS: (
+        ('nome', 'Nome', True),
+        ('preco', 'Preço de venda', True),
+        ('codigo_barras', 'Código de barras (vazio: gerado)', False),
+        ('estoque_atual', 'Estoque atual', False),
+        ('estoque_minimo', 'Estoque mínimo', False),
+        ('categoria', 'Categoria', False),
+        ('preco_compra', 'Preço de compra', False),
+        ('descricao', 'Descrição', False),
+        ('fornecedor_nome', 'Fornecedor', False),
+    ),
+    TIPO_CLIENTES: (
+        ('nome', 'Nome', True),
+        ('email', 'Email', False),
+        ('telefone', 'Telefone', False),
+        ('cpf_cnpj', 'CPF/CNPJ', False),
+        ('endereco', 'Endereço', False),
+    ),
+}
+
+
+class RejeitarLinha(ValueError):
+    """Linha inválida: o motivo vai para o relatório de rejeições"""
+
+
+def _config(chave, padrao=None):
+    from flask import current_app
+    return current_app.config.get(chave, padrao)
+
+
+def _caminho(nome: str) -> str:
+    return os.path.join(_config('IMPORT_DIR'), nome)
+
+
+def _atualizar(import_id: str, condicao=None, **valores) -> int:
+    """UPDATE do ImportJob em transação própria; retorna as linhas afetadas"""
+    from app import db, ImportJob
+
+    tabela = ImportJob.__table__
+    stmt = update(tabela).where(tabela.c.id == import_id)
+    if condicao is not None:
+        stmt = stmt.where(condicao)
+    with db.engine.begin() as conn:
+        return conn.execute(stmt.values(**valores)).rowcount
+
+
+def _abrir(caminho: str):
+    return open(caminho, encoding='utf-8-sig', errors='ignore', newline='')
+
+
+def iter_csv(caminho: str):
+    """Linhas do CSV como dicionários (valores sem espaços nas pontas), em streaming"""
+    with _abrir(caminho) as f:
+        reader = csv.reader(f)
+        headers = next(reader, None) or []
+        for row in reader:
+            if row:
+                yield dict(zip(headers, (v.strip() for v in row)))
+
+
+def ler_cabecalhos(caminho: str) -> list:
+    with _abrir(caminho) as f:
+        return next(csv.reader(f), None) or []
+
+
+def _contar_linhas(caminho: str) -> int:
+    with _abrir(caminho) as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return sum(1 for row in reader if row)
+
+
+def _nome_coluna(header: str) -> str:
+    """Cabeçalho comparável aos SINONIMOS: minúsculo, sem acentos, '_' nos espaços"""
+    sem_acentos = unicodedata.normalize('NFKD', header).encode('ascii', 'ignore').decode()
+    return '_'.join(sem_acentos.lower().split())
+
+
+def mapa_padrao(tipo: str, headers: list) -> dict:
+    """Coluna sugerida para cada campo, pelos nomes conhecidos"""
+    return {
+        campo: next((h for h in headers if _nome_coluna(h) in nomes), None)
+        for campo, nomes in SINONIMOS[tipo].items()
+    }
+
+
+def criar_staging(user_id, tipo: str, arquivo, params: dict | None = None):
+    """Grava o upload em disco e registra o ImportJob.
+
+    Retorna ``(job, preview)`` com as primeiras PREVIEW_ROWS linhas;
+    ValueError para CSV vazio ou inválido.
+    """
+    from app import db, ImportJob
+
+    limpar_expirados()
+    import_id = uuid.uuid4().hex
+    destino = _caminho(f'{import_id}.csv')
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    planilha = (arquivo.filename or '').lower().endswith('.xlsx')
+    with open(_caminho(f'{import_id}.xlsx') if planilha else destino, 'wb') as f:
+        while True:
+            bloco = arquivo.stream.read(SPOOL_CHUNK_BYTES)
+            if not bloco:
+                break
+            f.write(bloco)
+
+    try:
+        if planilha:
+            _xlsx_para_csv(_caminho(f'{import_id}.xlsx'), destino)
+        headers = ler_cabecalhos(destino)
+        preview = list(itertools.islice(iter_csv(destino), PREVIEW_ROWS))
+        total = _contar_linhas(destino) if preview else 0
+        if not headers or not total:
+            raise ValueError('CSV vazio ou inválido.')
+    except Exception:
+        _remover(destino)
+        raise
+    finally:
+        if planilha:
+            _remover(_caminho(f'{import_id}.xlsx'))
+
+    job = ImportJob(
+        id=import_id,
+        user_id=user_id,
+        tipo=tipo,
+        params=json.dumps(params or {}),
+        status=STATUS_PENDENTE,
+        arquivo=destino,
+        headers=json.dumps(headers),
+        default_map=json.dumps(mapa_padrao(tipo, headers)),
+        total_linhas=total,
+        expires_at=datetime.utcnow() + timedelta(hours=_config('IMPORT_TTL_HOURS', 24)),
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job, preview
+
+
+def _xlsx_para_csv(origem: str, destino: str) -> None:
+    """Primeira aba da planilha como CSV, linha a linha; ValueError se ilegível"""
+    import openpyxl
+
+    try:
+        livro = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f'Planilha XLSX inválida: {e}')
+    try:
+        with open(destino, 'w', encoding='utf-8', newline='') as f:
+            escritor = csv.writer(f)
+            for valores in livro.worksheets[0].iter_rows(values_only=True):
+                if any(v is not None and str(v).strip() for v in valores):
+                    escritor.writerow(['' if v is None else _celula(v) for v in valores])
+    finally:
+        livro.close()
+
+
+def _celula(valor) -> str:
+    # 7891000315507.0 (número do Excel) volta a ser o código digitado
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def obter_staging(import_id, user_id, tipo: str):
+    """ImportJob pendente e não vencido do usuário, ou None"""
+    from app import ImportJob
+
+    if not import_id:
+        return None
+    job = ImportJob.query.filter_by(id=import_id, user_id=user_id, tipo=tipo).first()
+    if job is None or job.status != STATUS_PENDENTE:
+        return None
+    if job.expires_at and job.expires_at < datetime.utcnow():
+        return None
+    return job
+
+
+def importar(job, mapeamento: dict, converter, modelo, apos_lote=None, chunk_rows: int = CHUNK_ROWS,
+             validar_lote=None, limite: int | None = None) -> dict:
+    """Converte e insere as linhas do arquivo em lotes, em uma única transação.
+
+    `converter(row, mapeamento)` devolve o dicionário da linha para `modelo`
+    ou levanta RejeitarLinha. `validar_lote(conn, linhas)` confere o lote
+    convertido de uma vez e devolve ``{posição no lote: motivo}`` das linhas
+    a rejeitar. `limite` é o máximo de linhas inseridas (cota do plano); as
+    excedentes são rejeitadas. `apos_lote(conn, linhas, ids)` roda após
+    cada INSERT (ex.: contadores do caixa), na mesma transação, com os ids
+    gerados (fora de ordem). Retorna
+    ``{'importadas', 'rejeitadas'}``.
+    """
+    from app import db, ImportJob
+
+    # Uma confirmação só: o job sai de 'pendente' antes de qualquer inserção
+    if not _atualizar(job.id, ImportJob.__table__.c.status == STATUS_PENDENTE, status=STATUS_IMPORTANDO):
+        raise ValueError('Importação já confirmada ou inexistente.')
+
+    caminho_rejeicoes = _caminho(f'{job.id}_rejeicoes.csv')
+    importadas = rejeitadas = 0
+    headers = json.loads(job.headers or '[]')
+    try:
+        conn = db.session.connection()
+        with open(caminho_rejeicoes, 'w', encoding='utf-8-sig', newline='') as f:
+            rejeicoes = csv.writer(f)
+            rejeicoes.writerow(['linha', 'motivo'] + headers)
+
+            def rejeitar(numero, row, motivo):
+                nonlocal rejeitadas
+                rejeitadas += 1
+                rejeicoes.writerow([numero, motivo] + [row.get(h, '') for h in headers])
+
+            def gravar(lote):
+                nonlocal importadas
+                motivos = validar_lote(conn, [linha for _, _, linha in lote]) if validar_lote else {}
+                validas = []
+                for posicao, (numero, row, linha) in enumerate(lote):
+                    motivo = motivos.get(posicao)
+                    if motivo is None and limite is not None and importadas + len(validas) >= limite:
+                        motivo = 'Limite do plano atingido'
+                    if motivo:
+                        rejeitar(numero, row, motivo)
+                    else:
+                        validas.append(linha)
+                if validas:
+                    importadas += _inserir(conn, modelo, validas, apos_lote)
+
+            lote = []
+            # Linha 1 é o cabeçalho
+            for numero, row in enumerate(iter_csv(job.arquivo), start=2):
+                try:
+                    lote.append((numero, row, converter(row, mapeamento)))
+                except RejeitarLinha as e:
+                    rejeitar(numero, row, str(e))
+                    continue
+                if len(lote) >= chunk_rows:
+                    gravar(lote)
+                    lote = []
+            if lote:
+                gravar(lote)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _atualizar(job.id, status=STATUS_ERRO, erro=str(e)[:500], finished_at=datetime.utcnow())
+        raise
+
+    _atualizar(job.id, status=STATUS_CONCLUIDO, importadas=importadas, rejeitadas=rejeitadas,
+               arquivo_rejeicoes=caminho_rejeicoes if rejeitadas else None, finished_at=datetime.utcnow())
+    if not rejeitadas:
+        os.remove(caminho_rejeicoes)
+    _remover(job.arquivo)
+    return {'importadas': importadas, 'rejeitadas': rejeitadas}
+
+
+def _inserir(conn, modelo, linhas: list, apos_lote) -> int:
+    tabela = modelo.__table__
+    if apos_lote is None:
+        conn.execute(insert(tabela), linhas)
+    elif conn.dialect.insert_executemany_returning:
+        # RETURNING sem ordem: com sort_by_parameter_order o SQLite volta a uma instrução por linha
+        ids = conn.execute(insert(tabela).returning(tabela.c.id), linhas).scalars().all()
+    else:
+        # Sem RETURNING em lote: os ids novos do dono, acima do maior id antes do INSERT
+        anterior = conn.execute(select(func.max(tabela.c.id))).scalar() or 0
+        conn.execute(insert(tabela), linhas)
+        novos = select(tabela.c.id).where(tabela.c.id > anterior)
+        if 'user_id' in linhas[0]:
+            novos = novos.where(tabela.c.user_id == linhas[0]['user_id'])
+        ids = conn.execute(novos).scalars().all()
+    if apos_lote is not None:
+        apos_lote(conn, linhas, ids)
+    return len(linhas)
+
+
+def _remover(caminho) -> None:
+    if caminho and os.path.exists(caminho):
+        try:
+            os.remove(caminho)
+        except OSError as e:
+            print(f"AVISO: não foi possível remover {caminho}: {e}")
+
+
+def limpar_expirados() -> int:
+    """Remove arquivos de importações vencidas e marca os jobs como 'expirado'"""
+    from app import db, ImportJob
+
+    vencidos = ImportJob.query.filter(ImportJob.status.in_([STATUS_PENDENTE, STATUS_CONCLUIDO, STATUS_ERRO]),
+                                      ImportJob.expires_at < datetime.utcnow()).all()
+    for job in vencidos:
+        _remover(job.arquivo)
+        _remover(job.arquivo_rejeicoes)
+        job.status = STATUS_EXPIRADO
+        job.arquivo = None
+        job.arquivo_rejeicoes = None
+    if vencidos:
+        db.session.commit()
+    return len(vencidos)
+
+
+# ==================== MOVIMENTOS DO CAIXA ====================
+
+def _coluna(row: dict, mapeamento: dict, campo: str) -> str:
+    coluna = mapeamento.get(campo)
+    return (row.get(coluna) or '').strip() if coluna else ''
+
+
+def conversor_movimentos_caixa(sessao_id, user_id):
+    """Conversor de linha do CSV para MovimentoCaixa da sessão"""
+    agora = datetime.utcnow()
+
+    def converter(row: dict, mapeamento: dict) -> dict:
+        tipo = _coluna(row, mapeamento, 'tipo').lower()
+        origem = _coluna(row, mapeamento, 'origem').lower()
+        valor_raw = _coluna(row, mapeamento, 'valor').replace(',', '.')
+        try:
+            valor = float(valor_raw) if valor_raw else None
+        except ValueError:
+            valor = None
+        if tipo not in ('entrada', 'saida'):
+            raise RejeitarLinha('Tipo deve ser entrada ou saida')
+        if not origem:
+            raise RejeitarLinha('Origem não informada')
+        if not valor or valor <= 0:
+            raise RejeitarLinha('Valor inválido')
+
+        descricao = _coluna(row, mapeamento, 'descricao')
+        if '[IMPORTADO]' not in descricao:
+            descricao = (descricao + ' ').strip() + '[IMPORTADO]'
+        referencia = _coluna(row, mapeamento, 'referencia_id')
+        return {
+            'created_at': agora,
+            'tipo': tipo,
+            'origem': origem[:30],
+            'valor': valor,
+            'descricao': descricao[:200],
+            'forma_pagamento': _coluna(row, mapeamento, 'forma_pagamento')[:30] or None,
+            'referencia_id': int(referencia) if referencia.isdigit() else None,
+            'sessao_id': sessao_id,
+            'user_id': user_id,
+        }
+
+    return converter
+
+
+def importar_movimentos_caixa(job, sessao, mapeamento: dict) -> dict:
+    """Insere os movimentos do CSV na sessão e atualiza os contadores do caixa"""
+    from app import MovimentoCaixa
+    from caixa_contadores import somar_movimentos
+
+    def contadores(conn, linhas, ids):
+        somar_movimentos(conn, sessao.id, {
+            'total_entradas': sum(l['valor'] for l in linhas if l['tipo'] == 'entrada'),
+            'total_saidas': sum(l['valor'] for l in linhas if l['tipo'] == 'saida'),
+            'qtd_movimentos': len(linhas),
+        })
+
+    return importar(job, mapeamento, conversor_movimentos_caixa(sessao.id, sessao.user_id),
+                    MovimentoCaixa, apos_lote=contadores)
+
+
+# ==================== PRODUTOS E CLIENTES ====================
+
+# Mesmo padrão do validate_email do cadastro, compilado uma vez
+_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_NAO_DIGITO = re.compile(r'\D')
+
+
+def _digitos(valor) -> str:
+    return _NAO_DIGITO.sub('', valor or '')
+
+
+def _numero(valor: str, campo: str, padrao=None, inteiro: bool = False):
+    """Número em formato brasileiro ("1.234,56") ou com ponto decimal"""
+    if not valor:
+        return padrao
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    try:
+        numero = float(valor)
+    except ValueError:
+        raise RejeitarLinha(f'{campo} inválido')
+    if numero < 0:
+        raise RejeitarLinha(f'{campo} negativo')
+    return int(numero) if inteiro else numero
+
+
+def conversor_produtos(user_id):
+    """Conversor de linha do arquivo para Produto do usuário"""
+    from app import gerar_codigo_produto
+    agora = datetime.utcnow()
+
+    def converter(row: dict, mapeamento: dict) -> dict:
+        nome = _coluna(row, mapeamento, 'nome')
+        if not nome:
+            raise RejeitarLinha('Nome não informado')
+        preco = _numero(_coluna(row, mapeamento, 'preco'), 'Preço')
+        if preco is None:
+            raise RejeitarLinha('Preço não informado')
+        codigo = _coluna(row, mapeamento, 'codigo_barras')
+        if len(codigo) > 50:
+            raise RejeitarLinha('Código de barras com mais de 50 caracteres')
+        return {
+            'nome': nome[:100],
+            'descricao': _coluna(row, mapeamento, 'descricao') or None,
+            'preco': preco,
+            'preco_compra': _numero(_coluna(row, mapeamento, 'preco_compra'), 'Preço de compra'),
+            'estoque_atual': _numero(_coluna(row, mapeamento, 'estoque_atual'), 'Estoque', 0, inteiro=True),
+            'estoque_minimo': _numero(_coluna(row, mapeamento, 'estoque_minimo'), 'Estoque mínimo', 0, inteiro=True),
+            'categoria': _coluna(row, mapeamento, 'categoria')[:50] or None,
+            'codigo_barras': codigo or gerar_codigo_produto('PROD', user_id),
+            'fornecedor_nome': _coluna(row, mapeamento, 'fornecedor_nome')[:100] or None,
+            'created_at': agora,
+            'user_id': user_id,
+        }
+
+    return converter
+
+
+def validador_produtos():
+    """Duplicatas de código de barras: no banco (único entre todos os tenants) e no arquivo"""
+    from app import Produto
+
+    tabela = Produto.__table__
+    vistos = set()
+
+    def validar(conn, linhas: list) -> dict:
+        codigos = [linha['codigo_barras'] for linha in linhas]
+        existentes = set(conn.execute(
+            select(tabela.c.codigo_barras).where(tabela.c.codigo_barras.in_(set(codigos)))
+        ).scalars())
+        motivos = {}
+        for posicao, codigo in enumerate(codigos):
+            # lotes anteriores já estão no banco (mesma transação): o arquivo vem primeiro
+            if codigo in vistos:
+                motivos[posicao] = 'Código de barras repetido no arquivo'
+            elif codigo in existentes:
+                motivos[posicao] = 'Código de barras já cadastrado'
+            else:
+                vistos.add(codigo)
+        return motivos
+
+    return validar
+
+
+def conversor_clientes(user_id):
+    """Conversor de linha do arquivo para Cliente do usuário (validações no lote)"""
+    from app import format_cpf_cnpj, format_phone
+    agora = datetime.utcnow()
+
+    def converter(row: dict, mapeamento: dict) -> dict:
+        nome = _coluna(row, mapeamento, 'nome')
+        if not nome:
+            raise RejeitarLinha('Nome não informado')
+        cpf_cnpj = _coluna(row, mapeamento, 'cpf_cnpj')
+        telefone = _coluna(row, mapeamento, 'telefone')
+        return {
+            'nome': nome[:100],
+            'email': _coluna(row, mapeamento, 'email')[:120] or None,
+            'telefone': (format_phone(telefone) or '')[:20] or None,
+            'endereco': _coluna(row, mapeamento, 'endereco') or None,
+            'cpf_cnpj': (format_cpf_cnpj(cpf_cnpj) or '')[:20] or None,
+            'tipo_cliente': 'pessoa_juridica' if len(_digitos(cpf_cnpj)) == 14 else 'pessoa_fisica',
+            'created_at': agora,
+            'user_id': user_id,
+        }
+
+    return converter
+
+
+def _documento_valido(digitos: str) -> bool:
+    from app import validate_cpf, validate_cnpj
+    if len(digitos) == 11:
+        return validate_cpf(digitos)
+    if len(digitos) == 14:
+        return validate_cnpj(digitos)
+    return False
+
+
+def validador_clientes(user_id):
+    """E-mail e CPF/CNPJ validados por coluna; duplicatas contra o tenant e o arquivo.
+
+    Os e-mails e documentos já cadastrados do usuário são lidos uma vez, na
+    primeira chamada; documentos são comparados só pelos dígitos.
+    """
+    from app import Cliente
+
+    tabela = Cliente.__table__
+    emails, documentos = set(), set()
+    # já aceitos neste arquivo (lotes anteriores já estão no banco, na mesma transação)
+    emails_arquivo, documentos_arquivo = set(), set()
+    carregado = False
+
+    def validar(conn, linhas: list) -> dict:
+        nonlocal carregado
+        if not carregado:
+            for email, cpf_cnpj in conn.execute(
+                    select(tabela.c.email, tabela.c.cpf_cnpj).where(tabela.c.user_id == user_id)):
+                if email:
+                    emails.add(email.lower())
+                if cpf_cnpj:
+                    documentos.add(_digitos(cpf_cnpj))
+            carregado = True
+
+        coluna_emails = [(linha['email'] or '').lower() for linha in linhas]
+        coluna_docs = [_digitos(linha['cpf_cnpj']) for linha in linhas]
+        emails_validos = [not e or _EMAIL.match(e) is not None for e in coluna_emails]
+        docs_validos = [not d or _documento_valido(d) for d in coluna_docs]
+
+        motivos = {}
+        for posicao, (email, doc) in enumerate(zip(coluna_emails, coluna_docs)):
+            if not emails_validos[posicao]:
+                motivos[posicao] = 'Email inválido'
+            elif not docs_validos[posicao]:
+                motivos[posicao] = 'CPF/CNPJ inválido'
+            elif email and email in emails_arquivo:
+                motivos[posicao] = 'Email repetido no arquivo'
+            elif doc and doc in documentos_arquivo:
+                motivos[posicao] = 'CPF/CNPJ repetido no arquivo'
+            elif email and email in emails:
+                motivos[posicao] = 'Email já cadastrado'
+            elif doc and doc in documentos:
+                motivos[posicao] = 'CPF/CNPJ já cadastrado'
+            else:
+                if email:
+                    emails_arquivo.add(email)
+                if doc:
+                    documentos_arquivo.add(doc)
+        return motivos
+
+    return validar
+
+
+def _derivados_cadastro(user_id, entidade: str):
+    """apos_lote: o que os listeners fariam para escritas pela sessão"""
+    from app import db
+    from app_cache import cache, CATALOGO, DADOS, tenant
+    from empresa_stats import marcar_desatualizados
+    import sync_delta
+
+    pares = {(DADOS, tenant(user_id))}
+    if entidade == 'produtos':
+        pares.add((CATALOGO, tenant(user_id)))
+
+    def apos_lote(conn, linhas, ids):
+        sync_delta.marcar(conn, user_id, entidade, ids)
+        marcar_desatualizados(conn, user_ids={user_id})
+        cache.agendar(db.session, pares)
+
+    return apos_lote
+
+
+def importar_cadastro(job, mapeamento: dict) -> dict:
+    """Importa produtos ou clientes do arquivo, com uma única conferência de cota.
+
+    Levanta ValueError se a cota do plano já estiver esgotada.
+    """
+    from app import db, Produto, Cliente
+    from plans import quota_remaining
+
+    if job.tipo == TIPO_PRODUTOS:
+        modelo, cota = Produto, 'produtos_max'
+        converter, validar = conversor_produtos(job.user_id), validador_produtos()
+    elif job.tipo == TIPO_CLIENTES:
+        modelo, cota = Cliente, 'clientes_max'
+        converter, validar = conversor_clientes(job.user_id), validador_clientes(job.user_id)
+    else:
+        raise ValueError(f'Tipo de importação desconhecido: {job.tipo}')
+
+    total = db.session.execute(
+        select(func.count()).select_from(modelo.__table__)
+        .where(modelo.__table__.c.user_id == job.user_id)
+    ).scalar()
+    restantes = quota_remaining(job.user_id, cota, total)
+    if restantes == 0:
+        raise ValueError('Limite do plano atingido. Faça upgrade para importar mais registros.')
+
+    return importar(job, mapeamento, converter, modelo,
+                    apos_lote=_derivados_cadastro(job.user_id, job.tipo),
+                    validar_lote=validar, limite=restantes)
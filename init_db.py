@@ -17,6 +17,11 @@ def init_database():
             db.create_all()
             print("✅ Tabelas criadas com sucesso!")
             
+            # Índices de busca textual (create_all não cria extensões, FTS5 nem triggers)
+            import busca
+            if busca.criar_indices():
+                print("✅ Índices de busca criados!")
+            
             # Verificar se já existe um usuário admin
             admin_user = User.query.filter_by(email='arthurnavarro160203@gmail.com').first()
             
@@ -0,0 +1,217 @@
+"""
+Instrumentação das requisições: latência, SQL por rota e detecção de N+1
+
+Não havia como saber quantas instruções SQL cada rota executa, e o único
+sinal de tempo era o cabeçalho X-Response-Time do SecurityMiddleware, que
+trazia time.time() (um instante, não uma duração). Este módulo:
+
+- mede cada requisição do primeiro before_request ao último after_request;
+- escuta before_cursor_execute/after_cursor_execute de todos os engines e,
+  dentro de uma requisição, conta as instruções e soma o tempo no banco;
+- agrupa as instruções pelo formato (literais e listas de parâmetros
+  removidos); um formato repetido mais de SQL_N_PLUS_ONE_THRESHOLD vezes na
+  mesma requisição é contado como N+1 e gera um AVISO com a rota;
+- exporta histogramas por endpoint (latência, instruções, tempo no banco),
+  o contador de N+1 e as métricas do app_cache em /metrics, no formato do
+  Prometheus;
+- com SERVER_TIMING ligado, devolve ``Server-Timing: app;dur=..,
+  db;dur=..;desc="N SQL"`` (visível no DevTools do navegador).
+
+Com gunicorn, defina PROMETHEUS_MULTIPROC_DIR para somar os workers na
+coleta. Sem prometheus_client, a medição continua (Server-Timing e AVISOs)
+e /metrics responde 503. /metrics exige METRICS_TOKEN em ``Authorization:
+Bearer <token>``; sem o token configurado responde 404 (exceto em debug),
+para não expor os endpoints e suas latências.
+"""
+
+import hmac
+import os
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter as PromCounter,
+                                   Histogram, generate_latest)
+    from prometheus_client.core import CounterMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+# Endpoint das requisições sem rota (404), para não abrir um rótulo por URL
+SEM_ROTA = '<sem_rota>'
+
+BUCKETS_LATENCIA = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+BUCKETS_INSTRUCOES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_DB = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+# Listas de parâmetros expandidas (IN (?, ?, ...), IN (%(id_1_1)s, ...), VALUES (...), (...))
+_RE_LISTA = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_RE_LISTAS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_RE_ESPACOS = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def formato_sql(statement: str) -> str:
+    """Formato da instrução: sem literais e com listas de parâmetros colapsadas"""
+    forma = _RE_STRING.sub('?', statement)
+    forma = _RE_NUMERO.sub('?', forma)
+    forma = _RE_LISTA.sub('(?)', forma)
+    forma = _RE_LISTAS.sub('(?)', forma)
+    return _RE_ESPACOS.sub(' ', forma).strip()
+
+
+class _CacheCollector:
+    """Acertos/faltas/esperas/erros do app_cache (já somados entre os workers)"""
+
+    def collect(self):
+        from app_cache import cache
+        familia = CounterMetricFamily('app_cache_events', 'Eventos do cache compartilhado por nome',
+                                      labels=['nome', 'evento'])
+        try:
+            metricas = cache.metricas()
+        except Exception as e:
+            print(f"AVISO: metricas do cache indisponiveis ({e})")
+            metricas = {}
+        for nome, eventos in metricas.items():
+            for evento, valor in eventos.items():
+                if evento != 'hit_ratio':
+                    familia.add_metric([nome, evento], valor)
+        yield familia
+
+
+class Instrumentation:
+    """Métricas por endpoint da aplicação Flask (ver docstring do módulo)"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.registry = None
+        self.n_plus_one_threshold = DEFAULT_N_PLUS_ONE_THRESHOLD
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registra os hooks; deve vir antes dos demais before_request para medir tudo"""
+        self.app = app
+        self.n_plus_one_threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+        if PROMETHEUS_AVAILABLE:
+            self._criar_metricas()
+        else:
+            print("AVISO: prometheus_client nao instalado; /metrics desabilitado")
+
+        # Nível de Engine: vale para o engine do Flask-SQLAlchemy e para os binds
+        if not event.contains(Engine, 'before_cursor_execute', _antes_execucao):
+            event.listen(Engine, 'before_cursor_execute', _antes_execucao)
+            event.listen(Engine, 'after_cursor_execute', _depois_execucao)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+        app.extensions['instrumentation'] = self
+
+    def _criar_metricas(self):
+        # Registro próprio: importar o app duas vezes não duplica as séries
+        self.registry = CollectorRegistry()
+        self.latencia = Histogram('http_request_duration_seconds', 'Latência da requisição',
+                                  ['endpoint', 'method', 'status'], buckets=BUCKETS_LATENCIA,
+                                  registry=self.registry)
+        self.instrucoes = Histogram('http_request_sql_statements', 'Instruções SQL por requisição',
+                                    ['endpoint'], buckets=BUCKETS_INSTRUCOES, registry=self.registry)
+        self.tempo_db = Histogram('http_request_db_seconds', 'Tempo no banco por requisição',
+                                  ['endpoint'], buckets=BUCKETS_DB, registry=self.registry)
+        self.n_plus_one = PromCounter('http_request_n_plus_one', 'Requisições com instrução repetida (N+1)',
+                                      ['endpoint'], registry=self.registry)
+        self.registry.register(_CacheCollector())
+
+    def _registro_coleta(self):
+        """Registro lido em /metrics (com PROMETHEUS_MULTIPROC_DIR, soma os workers)"""
+        if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            return self.registry
+        from prometheus_client import multiprocess
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        registro.register(_CacheCollector())
+        return registro
+
+    def before_request(self):
+        g._instr_inicio = time.perf_counter()
+        g._instr_instrucoes = 0
+        g._instr_tempo_db = 0.0
+        g._instr_formatos = Counter()
+        g._instr_n_plus_one = []
+
+    def after_request(self, response):
+        inicio = g.pop('_instr_inicio', None)
+        if inicio is None:
+            return response
+        duracao = time.perf_counter() - inicio
+        instrucoes = g.pop('_instr_instrucoes', 0)
+        tempo_db = g.pop('_instr_tempo_db', 0.0)
+        formatos = g.pop('_instr_formatos', Counter())
+        repetidas = g.pop('_instr_n_plus_one', [])
+        endpoint = request.endpoint or SEM_ROTA
+
+        for forma in repetidas:
+            print(f"AVISO: possivel N+1 em {endpoint}: {formatos[forma]}x {forma[:200]}")
+        if self.registry is not None:
+            self.latencia.labels(endpoint, request.method, str(response.status_code)).observe(duracao)
+            self.instrucoes.labels(endpoint).observe(instrucoes)
+            self.tempo_db.labels(endpoint).observe(tempo_db)
+            if repetidas:
+                self.n_plus_one.labels(endpoint).inc()
+
+        if current_app.config.get('SERVER_TIMING'):
+            response.headers['Server-Timing'] = (
+                f'app;dur={duracao * 1000:.1f}, '
+                f'db;dur={tempo_db * 1000:.1f};desc="{instrucoes} SQL"'
+            )
+        return response
+
+    def metrics_view(self):
+        if not PROMETHEUS_AVAILABLE:
+            return Response('prometheus_client nao instalado\n', status=503, mimetype='text/plain')
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token and not current_app.debug:
+            return Response('not found\n', status=404, mimetype='text/plain')
+        if token:
+            enviado = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(enviado.encode(), f'Bearer {token}'.encode()):
+                return Response('unauthorized\n', status=401, mimetype='text/plain')
+        return Response(generate_latest(self._registro_coleta()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _medindo() -> bool:
+    return has_request_context() and '_instr_inicio' in g
+
+
+def _antes_execucao(conn, cursor, statement, parameters, context, executemany):
+    if _medindo():
+        conn.info.setdefault('_instr_inicio', []).append(time.perf_counter())
+
+
+def _depois_execucao(conn, cursor, statement, parameters, context, executemany):
+    pilha = conn.info.get('_instr_inicio')
+    if not pilha:
+        return
+    inicio = pilha.pop()
+    if not _medindo():
+        return
+    g._instr_tempo_db += time.perf_counter() - inicio
+    g._instr_instrucoes += 1
+    forma = formato_sql(statement)
+    formatos = g._instr_formatos
+    formatos[forma] += 1
+    limite = current_app.extensions['instrumentation'].n_plus_one_threshold
+    if formatos[forma] == limite + 1:
+        g._instr_n_plus_one.append(forma)
+
+
+instrumentation = Instrumentation()
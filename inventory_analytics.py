@@ -0,0 +1,268 @@
+"""
+Análise de estoque: rotatividade e produtos parados
+
+Os relatórios faziam uma ou duas consultas por produto (soma de 30 dias,
+existência de venda em 90 dias e última venda). Agora:
+
+- as vendas dos últimos 90 dias são agregadas por produto em uma única
+  consulta (índices venda(user_id, data_venda) e item_venda(venda_id, ...)),
+  com as quantidades de 30 e 90 dias por agregação condicional;
+- os produtos entram por LEFT JOIN nessa agregação, e rotatividade,
+  ordenação e paginação são calculadas no banco;
+- a data da última venda de todo o histórico é o snapshot
+  Produto.ultima_venda_em, atualizado pelo checkout na mesma instrução que
+  baixa o estoque; refresh_ultima_venda() o reconstrói a partir das vendas.
+  Produtos parados são lidos direto dele, pelo índice
+  produto(user_id, ultima_venda_em).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import Float, and_, case, cast, func, or_, select, update
+
+JANELA_GIRO_DIAS = 30
+JANELA_PARADO_DIAS = 90
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+# Dias exibidos para produtos nunca vendidos (mantém a ordenação do relatório)
+DIAS_NUNCA_VENDIDO = 999
+
+ORDENS_ROTATIVIDADE = ('rotatividade', 'vendas', 'estoque', 'nome')
+
+
+@dataclass
+class EstoquePage:
+    """Página de um relatório de estoque (itens + paginação + resumo)"""
+    items: list
+    page: int
+    per_page: int
+    total: int
+    resumo: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.pages
+
+    def url_params(self, **extra) -> dict:
+        """Argumentos de url_for para outra página com os mesmos filtros"""
+        params = {k: v for k, v in self.params.items() if v}
+        params.update({k: v for k, v in extra.items() if v is not None})
+        return params
+
+
+def _int_arg(args, nome: str, padrao: int, maximo: int | None = None) -> int:
+    try:
+        valor = int(args.get(nome) or padrao)
+    except (TypeError, ValueError):
+        valor = padrao
+    valor = max(1, valor)
+    return min(valor, maximo) if maximo else valor
+
+
+def vendas_janela_subquery(user_id, agora: datetime | None = None):
+    """Quantidades vendidas por produto em 30 e 90 dias (uma varredura da janela)"""
+    from app import Venda, ItemVenda
+
+    agora = agora or datetime.now()
+    inicio_giro = agora - timedelta(days=JANELA_GIRO_DIAS)
+    inicio_janela = agora - timedelta(days=JANELA_PARADO_DIAS)
+    return (
+        select(
+            ItemVenda.produto_id.label('produto_id'),
+            func.sum(case((Venda.data_venda >= inicio_giro, ItemVenda.quantidade), else_=0)).label('vendido_30'),
+            func.sum(ItemVenda.quantidade).label('vendido_90'),
+        )
+        .join(Venda, Venda.id == ItemVenda.venda_id)
+        .where(Venda.user_id == user_id, Venda.data_venda >= inicio_janela,
+               Venda.status == 'finalizada')
+        .group_by(ItemVenda.produto_id)
+        .subquery('vendas_janela')
+    )
+
+
+def rotatividade_stmt(user_id, agora: datetime | None = None, busca: str | None = None):
+    """Produtos do tenant com vendas 30/90 dias e rotatividade (vendas 30d / estoque)"""
+    from app import Produto
+
+    janela = vendas_janela_subquery(user_id, agora)
+    vendido_30 = func.coalesce(janela.c.vendido_30, 0)
+    vendido_90 = func.coalesce(janela.c.vendido_90, 0)
+    rotatividade = case(
+        (Produto.estoque_atual > 0, cast(vendido_30, Float) / Produto.estoque_atual),
+        else_=0.0,
+    )
+    stmt = (
+        select(
+            Produto.id, Produto.nome, Produto.categoria, Produto.preco, Produto.estoque_atual,
+            Produto.ultima_venda_em,
+            vendido_30.label('vendido_30'),
+            vendido_90.label('vendido_90'),
+            rotatividade.label('rotatividade'),
+        )
+        .outerjoin(janela, janela.c.produto_id == Produto.id)
+        .where(Produto.user_id == user_id)
+    )
+    if busca:
+        stmt = stmt.where(Produto.nome.ilike(f'%{busca}%'))
+    return stmt
+
+
+def _ordenar_rotatividade(stmt, ordem: str):
+    from app import Produto
+
+    colunas = stmt.selected_columns
+    if ordem == 'vendas':
+        return stmt.order_by(colunas.vendido_30.desc(), Produto.id)
+    if ordem == 'estoque':
+        return stmt.order_by(Produto.estoque_atual.desc(), Produto.id)
+    if ordem == 'nome':
+        return stmt.order_by(Produto.nome, Produto.id)
+    return stmt.order_by(colunas.rotatividade.desc(), Produto.id)
+
+
+def classificar(rotatividade: float) -> str:
+    if rotatividade >= 1:
+        return 'alta'
+    if rotatividade >= 0.5:
+        return 'media'
+    if rotatividade > 0:
+        return 'baixa'
+    return 'parado'
+
+
+def _totais_rotatividade(rotatividade, janela: bool = True) -> list:
+    """Total e contagem por classificação (como funções de janela, por padrão)"""
+    def agregado(expr):
+        return expr.over() if janela else expr
+
+    def contar(condicao):
+        return agregado(func.sum(case((condicao, 1), else_=0)))
+
+    return [
+        agregado(func.count()).label('_total'),
+        contar(rotatividade >= 1).label('_alta'),
+        contar(and_(rotatividade >= 0.5, rotatividade < 1)).label('_media'),
+        contar(and_(rotatividade > 0, rotatividade < 0.5)).label('_baixa'),
+    ]
+
+
+def rotatividade_page(user_id, args=None, agora: datetime | None = None) -> EstoquePage:
+    """Página do relatório de rotatividade.
+
+    Total e resumo por classificação vêm na própria consulta da página
+    (funções de janela), então a agregação das vendas roda uma vez só.
+    """
+    from app import db
+
+    args = args or {}
+    busca = (args.get('q') or '').strip()
+    ordem = args.get('ordem') if args.get('ordem') in ORDENS_ROTATIVIDADE else 'rotatividade'
+    page = _int_arg(args, 'page', 1)
+    per_page = _int_arg(args, 'per_page', PER_PAGE, MAX_PER_PAGE)
+
+    stmt = rotatividade_stmt(user_id, agora, busca)
+    totais = _totais_rotatividade(stmt.selected_columns.rotatividade)
+    linhas = db.session.execute(
+        _ordenar_rotatividade(stmt.add_columns(*totais), ordem)
+        .limit(per_page).offset((page - 1) * per_page)
+    ).mappings().all()
+    if linhas:
+        total, alta, media, baixa = (linhas[0][c] for c in ('_total', '_alta', '_media', '_baixa'))
+    else:
+        # Página além do fim: os totais precisam de uma consulta própria
+        base = stmt.subquery('rotatividade')
+        total, alta, media, baixa = db.session.execute(
+            select(*_totais_rotatividade(base.c.rotatividade, janela=False))
+        ).one()
+    total, alta, media, baixa = (int(v or 0) for v in (total, alta, media, baixa))
+
+    items = [{**linha, 'classificacao': classificar(linha['rotatividade'] or 0)} for linha in linhas]
+    return EstoquePage(
+        items=items, page=page, per_page=per_page, total=total,
+        resumo={'alta': alta, 'media': media, 'baixa': baixa, 'parado': total - alta - media - baixa},
+        params={'q': busca, 'ordem': ordem if ordem != 'rotatividade' else '',
+                'per_page': per_page if per_page != PER_PAGE else ''},
+    )
+
+
+def produtos_parados_stmt(user_id, agora: datetime | None = None, busca: str | None = None):
+    """Produtos com estoque e sem venda nos últimos 90 dias, dos mais antigos aos recentes"""
+    from app import Produto
+
+    agora = agora or datetime.now()
+    inicio_janela = agora - timedelta(days=JANELA_PARADO_DIAS)
+    stmt = (
+        select(Produto.id, Produto.nome, Produto.categoria, Produto.preco, Produto.estoque_atual,
+               Produto.ultima_venda_em,
+               (Produto.estoque_atual * Produto.preco).label('valor_estoque'))
+        .where(Produto.user_id == user_id, Produto.estoque_atual > 0,
+               or_(Produto.ultima_venda_em.is_(None), Produto.ultima_venda_em < inicio_janela))
+    )
+    if busca:
+        stmt = stmt.where(Produto.nome.ilike(f'%{busca}%'))
+    return stmt.order_by(Produto.ultima_venda_em.asc().nulls_first(), Produto.id)
+
+
+def dias_sem_venda(ultima_venda, agora: datetime | None = None) -> int:
+    if not ultima_venda:
+        return DIAS_NUNCA_VENDIDO
+    return ((agora or datetime.now()) - ultima_venda).days
+
+
+def produtos_parados_page(user_id, args=None, agora: datetime | None = None) -> EstoquePage:
+    """Página do relatório de produtos parados (2 consultas: resumo + itens)"""
+    from app import db
+
+    args = args or {}
+    agora = agora or datetime.now()
+    busca = (args.get('q') or '').strip()
+    page = _int_arg(args, 'page', 1)
+    per_page = _int_arg(args, 'per_page', PER_PAGE, MAX_PER_PAGE)
+
+    stmt = produtos_parados_stmt(user_id, agora, busca)
+    base = stmt.order_by(None).subquery('parados')
+    total, valor_parado = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(base.c.valor_estoque), 0))
+    ).one()
+
+    linhas = db.session.execute(stmt.limit(per_page).offset((page - 1) * per_page)).mappings().all()
+    items = [{**linha, 'dias_sem_venda': dias_sem_venda(linha['ultima_venda_em'], agora)} for linha in linhas]
+    return EstoquePage(
+        items=items, page=page, per_page=per_page, total=total,
+        resumo={'valor_parado': float(valor_parado or 0)},
+        params={'q': busca, 'per_page': per_page if per_page != PER_PAGE else ''},
+    )
+
+
+def refresh_ultima_venda(user_id=None) -> int:
+    """Recalcula Produto.ultima_venda_em a partir das vendas finalizadas.
+
+    O checkout mantém o valor a cada venda; isto é para carga inicial ou
+    correção (por tenant, ou de todos sem `user_id`). Retorna as linhas
+    atualizadas.
+    """
+    from app import db, Produto, Venda, ItemVenda
+
+    ultima = (
+        select(func.max(Venda.data_venda))
+        .select_from(ItemVenda)
+        .join(Venda, Venda.id == ItemVenda.venda_id)
+        .where(ItemVenda.produto_id == Produto.id, Venda.status == 'finalizada')
+        .scalar_subquery()
+    )
+    stmt = update(Produto).values(ultima_venda_em=ultima).execution_options(synchronize_session=False)
+    if user_id is not None:
+        stmt = stmt.where(Produto.user_id == user_id)
+    resultado = db.session.execute(stmt)
+    db.session.commit()
+    return resultado.rowcount
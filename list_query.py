@@ -0,0 +1,352 @@
+"""
+Listagens paginadas por keyset (produtos, clientes, vendas, compras, suporte)
+
+As rotas HTML e a API JSON usam o mesmo componente: busca, filtros e
+ordenação são aplicados no banco, e a paginação avança por cursor sobre
+``(chave_de_ordenacao, id)`` em vez de OFFSET, de modo que o custo de cada
+página não cresce com a posição na lista.
+
+O escopo é sempre o do tenant: o usuário comum vê apenas os próprios
+registros; o admin vê os registros dos usuários da sua Empresa (nunca de
+outras empresas). O total exibido é uma contagem limitada (COUNT_CAP), que
+responde rápido mesmo em tenants com dezenas de milhares de linhas.
+"""
+
+import base64
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, or_, and_, literal
+
+DEFAULT_PER_PAGE = int(os.environ.get('LIST_PER_PAGE', 50))
+MAX_PER_PAGE = 200
+# Acima deste número o total é exibido como "COUNT_CAP+"
+COUNT_CAP = int(os.environ.get('LIST_COUNT_CAP', 1000))
+
+
+def _igual(atributo):
+    def filtro(model, valor):
+        return getattr(model, atributo) == valor
+    return filtro
+
+
+def _filtro_estoque(model, valor):
+    if valor == 'low':
+        return model.estoque_atual <= model.estoque_minimo
+    if valor == 'normal':
+        return and_(model.estoque_atual > model.estoque_minimo, model.estoque_atual > 0)
+    if valor == 'out':
+        return model.estoque_atual <= 0
+    return None
+
+
+def _filtro_data(atributo):
+    """Filtro por dia (YYYY-MM-DD) como intervalo, aproveitando o índice"""
+    def filtro(model, valor):
+        try:
+            dia = datetime.strptime(valor, '%Y-%m-%d')
+        except ValueError:
+            return None
+        coluna = getattr(model, atributo)
+        return and_(coluna >= dia, coluna < dia + timedelta(days=1))
+    return filtro
+
+
+@dataclass(frozen=True)
+class ListSpec:
+    """Como listar uma entidade: ordenações, colunas de busca e filtros"""
+
+    model_name: str
+    # nome da ordenação -> (atributo, 'asc' | 'desc')
+    sorts: dict
+    default_sort: str
+    search: tuple = ()
+    # parâmetro da query string -> filtro(model, valor) -> cláusula ou None
+    filters: dict = field(default_factory=dict)
+    # perfil de carregamento das páginas HTML (query_shapes.PERFIS)
+    perfil: str | None = None
+    # índice de busca textual (busca.INDICES); sem ele, ILIKE nas colunas de `search`
+    indice: str | None = None
+
+
+LIST_SPECS = {
+    'produtos': ListSpec(
+        'Produto',
+        sorts={'nome': ('nome', 'asc'), 'preco': ('preco', 'asc'),
+               'estoque': ('estoque_atual', 'asc'), 'recentes': ('created_at', 'desc')},
+        default_sort='nome',
+        search=('nome', 'codigo_barras', 'categoria'),
+        filters={'categoria': _igual('categoria'), 'estoque': _filtro_estoque},
+        indice='produtos',
+    ),
+    'clientes': ListSpec(
+        'Cliente',
+        sorts={'nome': ('nome', 'asc'), 'recentes': ('created_at', 'desc')},
+        default_sort='nome',
+        search=('nome', 'email', 'telefone', 'cpf_cnpj'),
+        indice='clientes',
+    ),
+    'vendas': ListSpec(
+        'Venda',
+        sorts={'recentes': ('data_venda', 'desc'), 'valor': ('valor_total', 'desc')},
+        default_sort='recentes',
+        search=('observacoes',),
+        filters={'status': _igual('status'), 'forma_pagamento': _igual('forma_pagamento'),
+                 'data': _filtro_data('data_venda')},
+        perfil='venda_lista',
+    ),
+    'compras': ListSpec(
+        'Compra',
+        sorts={'recentes': ('data_compra', 'desc'), 'valor': ('valor_total', 'desc')},
+        default_sort='recentes',
+        search=('numero_compra', 'observacoes'),
+        filters={'status': _igual('status'), 'data': _filtro_data('data_compra')},
+        perfil='compra_lista',
+    ),
+    'suporte': ListSpec(
+        'TicketSuporte',
+        sorts={'recentes': ('data_abertura', 'desc')},
+        default_sort='recentes',
+        search=('titulo',),
+        filters={'status': _igual('status'), 'prioridade': _igual('prioridade'),
+                 'categoria': _igual('categoria')},
+    ),
+}
+
+
+@dataclass
+class ListPage:
+    """Uma página da listagem e o necessário para navegar para a próxima"""
+
+    items: list
+    per_page: int
+    sort: str
+    # parâmetros ativos (busca, filtros, ordenação) para montar os links
+    params: dict
+    next_cursor: str | None = None
+    total: int = 0
+    total_exato: bool = True
+    primeira_pagina: bool = True
+    # paginação legada por número (?page=N, sem cursor): OFFSET e contagem exata
+    page: int | None = None
+    # query filtrada (sem cursor/ordenação), para resumos agregados da listagem
+    base_query: object = field(default=None, repr=False)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def total_label(self) -> str:
+        return str(self.total) if self.total_exato else f'{self.total}+'
+
+    def url_params(self, **extra) -> dict:
+        """Parâmetros da query string para url_for (filtros + extra)"""
+        params = dict(self.params)
+        params.update({k: v for k, v in extra.items() if v is not None})
+        return params
+
+    def as_dict(self) -> dict:
+        """Metadados de paginação para as respostas JSON"""
+        dados = {
+            'per_page': self.per_page,
+            'sort': self.sort,
+            'next_cursor': self.next_cursor,
+            'has_next': self.has_next,
+            'total': self.total,
+            'total_exato': self.total_exato,
+        }
+        if self.page is not None:
+            dados.update(page=self.page, pages=-(-self.total // self.per_page),
+                         has_prev=self.page > 1)
+        return dados
+
+
+def encode_cursor(sort: str, valor, item_id: int) -> str:
+    if isinstance(valor, datetime):
+        valor = {'dt': valor.isoformat()}
+    dados = json.dumps([sort, valor, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None, sort: str):
+    """(valor, id) do cursor, ou None se ausente, inválido ou de outra ordenação"""
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_cursor, valor, item_id = json.loads(dados)
+        if sort_cursor != sort:
+            return None
+        if isinstance(valor, dict):
+            valor = datetime.fromisoformat(valor['dt'])
+        return valor, int(item_id)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def tenant_filter(model, user_id, admin: bool = False):
+    """Cláusula de escopo: registros do usuário ou, para admin, da sua Empresa"""
+    from app import User
+    from principal import get_principal
+
+    empresa_id = None
+    if admin:
+        user = get_principal(user_id).user
+        empresa_id = getattr(user, 'empresa_id', None)
+    if empresa_id is None:
+        return model.user_id == user_id
+    return model.user_id.in_(select(User.id).where(User.empresa_id == empresa_id))
+
+
+def _parse_per_page(valor, padrao: int, maximo: int) -> int:
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return padrao
+    return max(1, min(valor, maximo))
+
+
+def _parse_page(valor) -> int | None:
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(1, valor)
+
+
+def _nullable(coluna) -> bool:
+    try:
+        return bool(coluna.property.columns[0].nullable)
+    except (AttributeError, IndexError):
+        return True
+
+
+def _keyset_predicate(coluna, id_coluna, direcao: str, valor, item_id: int):
+    """Linhas posteriores a (valor, id) na ordem (coluna, id), com NULLs no fim"""
+    id_depois = id_coluna < item_id if direcao == 'desc' else id_coluna > item_id
+    if valor is None:
+        return and_(coluna.is_(None), id_depois)
+    valor_depois = coluna < valor if direcao == 'desc' else coluna > valor
+    condicoes = [valor_depois, and_(coluna == valor, id_depois)]
+    if _nullable(coluna):
+        condicoes.append(coluna.is_(None))
+    return or_(*condicoes)
+
+
+def build_list_query(nome: str, args, user_id, admin: bool = False):
+    """Query filtrada e ordenada (sem paginação) e os parâmetros ativos.
+
+    Retorna ``(spec, model, query, sort, params)``.
+    """
+    import app as app_module
+
+    spec = LIST_SPECS[nome]
+    model = getattr(app_module, spec.model_name)
+
+    query = model.query.filter(tenant_filter(model, user_id, admin))
+    params = {}
+
+    termo = (args.get('q') or '').strip()
+    if termo and spec.indice:
+        import busca
+        clausula = busca.clausula(spec.indice, model, termo)
+        if clausula is not None:
+            query = query.filter(clausula)
+        params['q'] = termo
+    elif termo and spec.search:
+        padrao = f'%{termo}%'
+        query = query.filter(or_(*[getattr(model, c).ilike(padrao) for c in spec.search]))
+        params['q'] = termo
+
+    for param, filtro in spec.filters.items():
+        valor = (args.get(param) or '').strip()
+        if not valor:
+            continue
+        clausula = filtro(model, valor)
+        if clausula is not None:
+            query = query.filter(clausula)
+            params[param] = valor
+
+    sort = args.get('sort') or spec.default_sort
+    if sort not in spec.sorts:
+        sort = spec.default_sort
+    if sort != spec.default_sort:
+        params['sort'] = sort
+    return spec, model, query, sort, params
+
+
+def count_estimate(query, cap: int = COUNT_CAP):
+    """Contagem limitada a `cap` linhas: ``(total, exato)``"""
+    from app import db
+
+    limitada = query.order_by(None).with_entities(literal(1)).limit(cap + 1).subquery()
+    total = db.session.execute(select(func.count()).select_from(limitada)).scalar() or 0
+    if total > cap:
+        return cap, False
+    return total, True
+
+
+def list_page(nome: str, args, user_id, admin: bool = False, *,
+              per_page: int | None = None, max_per_page: int = MAX_PER_PAGE,
+              with_count: bool = True, serializador: str | None = None) -> ListPage:
+    """Página da listagem `nome` para os parâmetros da requisição (`args`).
+
+    Parâmetros reconhecidos: ``q`` (busca), ``sort``, ``cursor``, ``per_page``
+    e os filtros declarados no ListSpec. ``page`` (sem ``cursor``) mantém a
+    paginação por número dos clientes antigos: OFFSET, total exato e
+    ``page``/``pages``/``has_prev`` nos metadados. Com `serializador` (ver
+    query_shapes.SERIALIZADORES), a página traz só as colunas dele e
+    ``items`` são dicts prontos para o JSON, em vez de objetos ORM.
+    """
+    import query_shapes
+
+    spec, model, query, sort, params = build_list_query(nome, args, user_id, admin)
+    per_page = _parse_per_page(args.get('per_page'), per_page or DEFAULT_PER_PAGE, max_per_page)
+    if per_page != DEFAULT_PER_PAGE:
+        params['per_page'] = per_page
+
+    base_query = query
+    cursor = decode_cursor(args.get('cursor'), sort)
+    page = _parse_page(args.get('page')) if cursor is None else None
+    if page is not None:
+        total, exato = query.order_by(None).count(), True
+    else:
+        total, exato = count_estimate(query) if with_count else (0, False)
+
+    atributo, direcao = spec.sorts[sort]
+    coluna = getattr(model, atributo)
+    if cursor is not None:
+        query = query.filter(_keyset_predicate(coluna, model.id, direcao, *cursor))
+
+    if direcao == 'desc':
+        query = query.order_by(coluna.desc().nulls_last(), model.id.desc())
+    else:
+        query = query.order_by(coluna.asc().nulls_last(), model.id.asc())
+    if serializador:
+        query = query_shapes.selecionar(query, serializador, coluna.label('_cursor_valor'),
+                                        model.id.label('_cursor_id'))
+    elif spec.perfil:
+        query = query_shapes.carregar(query, spec.perfil)
+
+    if page is not None:
+        query = query.offset((page - 1) * per_page)
+
+    linhas = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(linhas) > per_page:
+        linhas = linhas[:per_page]
+        ultimo = linhas[-1]
+        if serializador:
+            next_cursor = encode_cursor(sort, ultimo._cursor_valor, ultimo._cursor_id)
+        else:
+            next_cursor = encode_cursor(sort, getattr(ultimo, atributo), ultimo.id)
+    if serializador:
+        linhas = query_shapes.serializar(serializador, linhas)
+
+    return ListPage(items=linhas, per_page=per_page, sort=sort, params=params,
+                    next_cursor=next_cursor, total=total, total_exato=exato,
+                    primeira_pagina=cursor is None and (page or 1) == 1, page=page,
+                    base_query=base_query)
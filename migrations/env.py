@@ -51,6 +51,16 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Tabelas FTS5 e índices de trigramas da busca textual são criados por
+    # busca.criar_indices, fora dos modelos: o autogenerate não deve removê-los
+    if reflected and compare_to is None and name and (
+            name.startswith('busca_') or name.endswith('_busca_trgm')
+            or name == 'ix_produto_fornecedor_nome_trgm'):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -93,6 +103,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
@@ -0,0 +1,29 @@
+"""add busca textual indexes
+
+Revision ID: af41f8ce59f4
+Revises: cffef8afc44c
+Create Date: 2026-10-18 14:37:05.184392
+
+"""
+from alembic import op
+
+import busca
+
+
+# revision identifiers, used by Alembic.
+revision = 'af41f8ce59f4'
+down_revision = 'cffef8afc44c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # PostgreSQL: pg_trgm/unaccent e índices GIN de trigramas; SQLite: tabelas
+    # FTS5 e triggers. O DDL fica em busca.py, o mesmo usado por
+    # scripts/criar_indices_busca.py em bancos criados por create_all, para
+    # que a expressão indexada e a das consultas não divirjam.
+    busca.criar_indices(op.get_bind())
+
+
+def downgrade():
+    busca.remover_indices(op.get_bind())
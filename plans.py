@@ -1,3 +1,4 @@
+import os
 from functools import wraps
 from flask import session, redirect, url_for, flash
 from markupsafe import Markup
@@ -59,54 +60,64 @@ PLAN_QUOTAS = {
 }
 
 
-def get_plan_tier_for_user(user_id: int) -> str:
-    """Resolve o plano efetivo para um usuário, preferindo Empresa (via empresa_id quando disponível).
-    Fallback: UserSettings do admin da mesma empresa."""
+def resolve_plan_tier(principal) -> str:
+    """Resolve o plano efetivo a partir do Principal, preferindo Empresa
+    (via empresa_id quando disponível). Fallback: UserSettings do admin da
+    mesma empresa."""
     try:
         # Import tardio para evitar ciclos
-        from app import User, Empresa, get_user_settings
+        from app import User, get_user_settings
     except Exception:
         return 'free'
 
-    user = User.query.get(user_id)
+    user = principal.user
     if not user:
         return 'free'
 
     # Preferir plano por Empresa, usando empresa_id se existir; fallback por nome
-    empresa_record = None
-    try:
-        if getattr(user, 'empresa_id', None):
-            empresa_record = Empresa.query.get(user.empresa_id)
-        if not empresa_record:
-            empresa_record = Empresa.query.filter_by(nome=user.empresa).first()
-    except Exception:
-        empresa_record = None
-
+    empresa_record = principal.empresa
     if empresa_record and empresa_record.plan_tier:
         tier = (empresa_record.plan_tier or 'free').lower()
         return tier if tier in PLAN_FEATURES else 'free'
 
     # Fallback: usar plano via UserSettings (admin da empresa)
     if user.role == 'admin':
-        s = get_user_settings(user_id)
+        s = principal.settings
     else:
         admin = User.query.filter_by(empresa=user.empresa, role='admin').first()
-        s = get_user_settings(admin.id) if admin else get_user_settings(user_id)
+        s = get_user_settings(admin.id) if admin else principal.settings
     tier = (s.plan_tier or 'free').lower()
     return tier if tier in PLAN_FEATURES else 'free'
 
 
+# TTL do plano no cache compartilhado (segundos; 0 desativa)
+PLAN_CACHE_TTL = int(os.environ.get('PLAN_CACHE_TTL', 60))
+
+
+def cached_plan_tier(principal) -> str:
+    """resolve_plan_tier com cache compartilhado entre os workers (domínio 'plano')."""
+    if PLAN_CACHE_TTL <= 0 or not principal.user_id:
+        return resolve_plan_tier(principal)
+    from app_cache import cache, PLANO
+    return cache.obter('plano', principal.user_id, lambda: resolve_plan_tier(principal),
+                       ttl=PLAN_CACHE_TTL, dominio=PLANO)
+
+
+def get_plan_tier_for_user(user_id: int) -> str:
+    """Plano efetivo do usuário (reaproveita o Principal da requisição)."""
+    try:
+        from principal import get_principal
+    except Exception:
+        return 'free'
+    return get_principal(user_id).plan_tier
+
+
 def has_feature(user_id: int, feature: str) -> bool:
     try:
-        from app import User
+        from principal import get_principal
     except Exception:
         return False
-    tier = get_plan_tier_for_user(user_id)
-    user = User.query.get(user_id)
-    # Bloqueio de relatórios para não-admin
-    if feature == 'reports' and user and user.role != 'admin':
-        return False
-    return bool(PLAN_FEATURES.get(tier, {}).get(feature, False))
+    return get_principal(user_id).has_feature(feature)
 
 
 def require_plan(feature: str):
@@ -133,4 +144,13 @@ def check_quota_exceeded(user_id: int, quota_key: str, current_count: int) -> bo
     limit = PLAN_QUOTAS.get(tier, {}).get(quota_key)
     if limit is None:
         return False
-    return current_count >= limit
\ No newline at end of file
+    return current_count >= limit
+
+
+def quota_remaining(user_id: int, quota_key: str, current_count: int) -> int | None:
+    """Quantos registros ainda cabem na cota (None = sem limite)"""
+    tier = get_plan_tier_for_user(user_id)
+    limit = PLAN_QUOTAS.get(tier, {}).get(quota_key)
+    if limit is None:
+        return None
+    return max(limit - current_count, 0)
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Identidade e plano resolvidos uma única vez por requisição
+
+O Principal reúne usuário, empresa, configurações, plano efetivo e recursos
+liberados. É montado no primeiro uso dentro da requisição e guardado em
+flask.g, de modo que login_required, require_plan, has_feature e o context
+processor dos templates compartilham as mesmas linhas carregadas.
+
+O plano resolvido fica no cache compartilhado entre os workers (domínio
+'plano' do app_cache; ver plans.cached_plan_tier), invalidado quando o plano
+da Empresa, o plan_tier do UserSettings ou o papel/empresa do usuário mudam.
+"""
+
+from flask import g, has_app_context, has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+
+def _pares_plano(user_id=None):
+    from app_cache import PLANO, GLOBAL, tenant
+    return {(PLANO, GLOBAL if user_id is None else tenant(user_id))}
+
+
+def invalidate_plan_cache(user_id=None):
+    """Invalida o plano em cache de um usuário (ou de todos, sem argumento)."""
+    from app_cache import cache
+    cache.invalidar(_pares_plano(user_id))
+    _reset_principals(user_id)
+
+
+def _reset_principals(user_id=None):
+    if has_app_context():
+        for principal in g.get('_principals', {}).values():
+            if user_id is None or principal.user_id == user_id:
+                principal.reset_plan()
+
+
+class Principal:
+    """Usuário autenticado e plano efetivo, com carregamento preguiçoso"""
+
+    _VAZIO = object()
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._user = self._VAZIO
+        self._empresa = self._VAZIO
+        self._settings = self._VAZIO
+        self._plan_tier = None
+
+    @property
+    def user(self):
+        if self._user is self._VAZIO:
+            from app import User
+            self._user = User.query.get(self.user_id) if self.user_id else None
+        return self._user
+
+    @property
+    def role(self):
+        return self.user.role if self.user else None
+
+    @property
+    def empresa(self):
+        """Empresa do usuário (via empresa_id; fallback pelo nome)"""
+        if self._empresa is self._VAZIO:
+            from app import Empresa
+            empresa = None
+            user = self.user
+            if user:
+                try:
+                    if getattr(user, 'empresa_id', None):
+                        empresa = Empresa.query.get(user.empresa_id)
+                    if not empresa:
+                        empresa = Empresa.query.filter_by(nome=user.empresa).first()
+                except Exception:
+                    empresa = None
+            self._empresa = empresa
+        return self._empresa
+
+    @property
+    def settings(self):
+        if self._settings is self._VAZIO:
+            from app import get_user_settings
+            self._settings = get_user_settings(self.user_id) if self.user_id else None
+        return self._settings
+
+    @property
+    def plan_tier(self):
+        if self._plan_tier is None:
+            from plans import cached_plan_tier
+            self._plan_tier = cached_plan_tier(self)
+        return self._plan_tier
+
+    @property
+    def features(self):
+        """Conjunto de recursos liberados para o usuário"""
+        from plans import PLAN_FEATURES
+        liberados = {nome for nome, ativo in PLAN_FEATURES.get(self.plan_tier, {}).items() if ativo}
+        # Bloqueio de relatórios para não-admin
+        if self.user and self.user.role != 'admin':
+            liberados.discard('reports')
+        return frozenset(liberados)
+
+    def has_feature(self, feature: str) -> bool:
+        return feature in self.features
+
+    def reset_plan(self):
+        self._plan_tier = None
+        self._empresa = self._VAZIO
+
+
+def get_principal(user_id):
+    """Principal do usuário, reaproveitado durante toda a requisição."""
+    if not has_request_context():
+        return Principal(user_id)
+    principals = g.setdefault('_principals', {})
+    principal = principals.get(user_id)
+    if principal is None:
+        principal = principals[user_id] = Principal(user_id)
+    return principal
+
+
+def _plan_tier_alterado(target):
+    try:
+        return inspect(target).attrs.plan_tier.history.has_changes()
+    except Exception:
+        return True
+
+
+def _invalidar_no_commit(target, user_id=None):
+    """Agenda a invalidação para o commit e descarta o plano já lido nesta requisição"""
+    from app_cache import cache
+    cache.agendar(object_session(target), _pares_plano(user_id))
+    _reset_principals(user_id)
+
+
+def register_plan_cache_invalidation(User, Empresa, UserSettings):
+    """Invalida o cache de planos quando os dados que o determinam mudam."""
+
+    def _empresa_ou_settings(mapper, connection, target):
+        # Mudança de plano afeta todos os usuários da empresa: invalidar tudo
+        if _plan_tier_alterado(target):
+            _invalidar_no_commit(target)
+
+    def _usuario(mapper, connection, target):
+        estado = inspect(target)
+        for attr in ('role', 'empresa', 'empresa_id'):
+            if estado.attrs[attr].history.has_changes():
+                # O papel de admin também muda o fallback dos funcionários
+                _invalidar_no_commit(target)
+                return
+
+    def _usuario_removido(mapper, connection, target):
+        _invalidar_no_commit(target, target.id)
+
+    for model in (Empresa, UserSettings):
+        event.listen(model, 'after_insert', _empresa_ou_settings)
+        event.listen(model, 'after_update', _empresa_ou_settings)
+    event.listen(User, 'after_update', _usuario)
+    event.listen(User, 'after_delete', _usuario_removido)
@@ -0,0 +1,208 @@
+"""
+Formato das consultas: perfis de carregamento e serializadores por colunas
+
+Os relacionamentos dos modelos são ``lazy=True``: cada ``venda.cliente`` ou
+``item.produto`` lido em um laço (template, confirmação de compra, JSON)
+dispara uma consulta por linha, e as respostas JSON montavam objetos ORM
+completos — com as 40+ colunas de Fornecedor ou Produto — para devolver
+meia dúzia de campos. As telas e a API passam a declarar o que vão ler:
+
+- PERFIS: receitas nomeadas de joinedload (muitos-para-um) e selectinload
+  (coleções) por modelo e tela, com load_only nos relacionados largos;
+  ``carregar(query, 'venda_detalhe')`` aplica a receita;
+- SERIALIZADORES: as colunas (e outer joins) de cada resposta JSON;
+  ``selecionar`` troca as entidades da query por essas colunas e
+  ``serializar`` converte as tuplas em dicts, sem objetos ORM nem identity
+  map. As listagens paginadas usam o mesmo serializador via
+  ``list_page(..., serializador=...)``.
+
+Um atributo fora do load_only ainda funciona, mas volta a custar uma
+consulta por objeto: ao mudar um template, atualize o perfil da tela.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+
+def _venda_lista(m):
+    return (
+        joinedload(m.Venda.cliente).load_only(m.Cliente.nome, m.Cliente.telefone),
+        # o template só conta os itens
+        selectinload(m.Venda.itens).load_only(m.ItemVenda.venda_id),
+    )
+
+
+def _venda_detalhe(m):
+    return (
+        joinedload(m.Venda.cliente).load_only(m.Cliente.nome, m.Cliente.telefone, m.Cliente.email),
+        selectinload(m.Venda.itens).joinedload(m.ItemVenda.produto).load_only(
+            m.Produto.nome, m.Produto.codigo_barras),
+    )
+
+
+def _compra_lista(m):
+    return (
+        joinedload(m.Compra.fornecedor).load_only(m.Fornecedor.nome),
+        selectinload(m.Compra.itens).load_only(m.ItemCompra.compra_id),
+    )
+
+
+def _compra_detalhe(m):
+    return (
+        joinedload(m.Compra.fornecedor).load_only(
+            m.Fornecedor.nome, m.Fornecedor.cidade, m.Fornecedor.estado,
+            m.Fornecedor.contato, m.Fornecedor.telefone, m.Fornecedor.email),
+        selectinload(m.Compra.itens).joinedload(m.ItemCompra.produto).load_only(
+            m.Produto.nome, m.Produto.categoria),
+    )
+
+
+def _compra_confirmar(m):
+    # Produtos completos: a confirmação altera o estoque e os listeners de
+    # derivados leem o objeto inteiro
+    return (selectinload(m.Compra.itens).joinedload(m.ItemCompra.produto),)
+
+
+def _cliente_opcao(m):
+    return (load_only(m.Cliente.nome, m.Cliente.telefone, m.Cliente.email),)
+
+
+def _fornecedor_opcao(m):
+    return (load_only(m.Fornecedor.nome),)
+
+
+# nome -> receita(modulo app) -> opções da query
+PERFIS = {
+    'venda_lista': _venda_lista,
+    'venda_detalhe': _venda_detalhe,
+    'compra_lista': _compra_lista,
+    'compra_detalhe': _compra_detalhe,
+    'compra_confirmar': _compra_confirmar,
+    'cliente_opcao': _cliente_opcao,
+    'fornecedor_opcao': _fornecedor_opcao,
+}
+
+
+@lru_cache(maxsize=None)
+def opcoes(nome: str) -> tuple:
+    """Opções de carregamento do perfil `nome` (montadas uma vez por processo)"""
+    import app as app_module
+    return PERFIS[nome](app_module)
+
+
+def carregar(query, nome: str):
+    """`query` com o perfil de carregamento `nome`"""
+    return query.options(*opcoes(nome))
+
+
+def _float(valor):
+    return float(valor) if valor is not None else None
+
+
+def _iso(valor):
+    return valor.isoformat() if isinstance(valor, date) else None
+
+
+def _cliente_nome(valor):
+    return valor or 'Cliente não informado'
+
+
+@dataclass(frozen=True)
+class Serializador:
+    """Colunas de uma resposta JSON: de onde vem cada campo e como formatá-lo"""
+
+    model_name: str
+    # (chave do JSON, 'coluna' do modelo ou 'Modelo.coluna', formatar | None)
+    campos: tuple
+    # outer joins: (modelo, coluna local, coluna do modelo), em ordem
+    joins: tuple = ()
+
+
+SERIALIZADORES = {
+    'produto': Serializador('Produto', campos=(
+        ('id', 'id', None),
+        ('nome', 'nome', None),
+        ('descricao', 'descricao', None),
+        ('preco', 'preco', _float),
+        ('estoque_atual', 'estoque_atual', None),
+        ('estoque_minimo', 'estoque_minimo', None),
+        ('categoria', 'categoria', None),
+        ('codigo_barras', 'codigo_barras', None),
+        ('created_at', 'created_at', _iso),
+    )),
+    'cliente': Serializador('Cliente', campos=(
+        ('id', 'id', None),
+        ('nome', 'nome', None),
+        ('email', 'email', None),
+        ('telefone', 'telefone', None),
+        ('endereco', 'endereco', None),
+        ('created_at', 'created_at', _iso),
+    )),
+    'venda': Serializador('Venda', campos=(
+        ('id', 'id', None),
+        ('cliente_id', 'cliente_id', None),
+        ('cliente_nome', 'Cliente.nome', _cliente_nome),
+        ('valor_total', 'valor_total', _float),
+        ('valor_final', 'valor_final', _float),
+        ('data_venda', 'data_venda', _iso),
+        ('status', 'status', None),
+        ('forma_pagamento', 'forma_pagamento', None),
+    ), joins=(('Cliente', 'cliente_id', 'id'),)),
+    'fornecedor': Serializador('Fornecedor', campos=(
+        ('id', 'id', None),
+        ('nome', 'nome', None),
+        ('razao_social', 'razao_social', None),
+        ('cnpj', 'cnpj', None),
+    )),
+}
+
+
+@lru_cache(maxsize=None)
+def _resolver(nome: str):
+    """(modelo, colunas rotuladas, joins, formatadores) do serializador `nome`"""
+    import app as app_module
+
+    spec = SERIALIZADORES[nome]
+    model = getattr(app_module, spec.model_name)
+    colunas = []
+    formatadores = []
+    for chave, origem, formatar in spec.campos:
+        dono, _, atributo = origem.rpartition('.')
+        coluna = getattr(getattr(app_module, dono) if dono else model, atributo)
+        colunas.append(coluna.label(chave))
+        formatadores.append((chave, formatar))
+    joins = []
+    for outro_nome, local, remota in spec.joins:
+        outro = getattr(app_module, outro_nome)
+        joins.append((outro, getattr(model, local) == getattr(outro, remota)))
+    return model, tuple(colunas), tuple(joins), tuple(formatadores)
+
+
+def selecionar(query, nome: str, *extras):
+    """`query` devolvendo só as colunas do serializador `nome` (mais `extras`)"""
+    model, colunas, joins, _ = _resolver(nome)
+    query = query.with_entities(*colunas, *extras)
+    for outro, condicao in joins:
+        query = query.outerjoin(outro, condicao)
+    return query
+
+
+def serializar(nome: str, linhas) -> list:
+    """Tuplas de `selecionar` como dicts prontos para o jsonify"""
+    formatadores = _resolver(nome)[3]
+    resultado = []
+    for linha in linhas:
+        dados = linha._mapping
+        resultado.append({
+            chave: formatar(dados[chave]) if formatar else dados[chave]
+            for chave, formatar in formatadores
+        })
+    return resultado
+
+
+def listar(nome: str, query) -> list:
+    """Executa `query` com as colunas do serializador `nome` e serializa"""
+    return serializar(nome, selecionar(query, nome).all())
@@ -0,0 +1,305 @@
+"""
+Resumo diário de vendas e compras (tabela resumo_diario)
+
+Fluxo de caixa, sazonalidade e os KPIs do dashboard carregavam todas as
+vendas e compras de cada mês para somar valor_total em Python, com meses
+calculados por timedelta(days=30*i) (que pula ou repete meses).
+
+Agora há uma linha por (usuário, dia) com quantidade e valor de vendas
+finalizadas e de compras, além de empresa_id, semana e mês do dia para
+agrupar por empresa e por período:
+
+- a linha é mantida na mesma transação da escrita: um listener after_flush
+  calcula, pelo histórico dos atributos, a diferença entre a contribuição
+  antiga e a nova de cada Venda/Compra e aplica um UPSERT com incremento
+  (seguro com checkouts concorrentes);
+- rebuild() reconstrói o resumo a partir das tabelas (carga inicial, ou após
+  exclusões em massa que não passam pela sessão, como limpar_banco.py);
+- serie() devolve qualquer intervalo por dia, semana ou mês em uma consulta
+  pelos índices (user_id, dia) / (empresa_id, dia), com períodos vazios
+  preenchidos com zero.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+
+GRANULARIDADES = ('dia', 'semana', 'mes')
+# Limite de períodos por consulta da série (evita intervalos absurdos por dia)
+MAX_PERIODOS = 1000
+CAMPOS = ('vendas_qtd', 'vendas_valor', 'compras_qtd', 'compras_valor')
+
+# Modelo -> (coluna da data, prefixo dos campos, filtro de status)
+TRACKED_MODELS = {
+    'Venda': ('data_venda', 'vendas', lambda status: status == 'finalizada'),
+    'Compra': ('data_compra', 'compras', lambda status: True),
+}
+
+
+def inicio_periodo(dia: date, granularidade: str = 'dia') -> date:
+    """Primeiro dia do período (semana começa na segunda-feira)"""
+    if granularidade == 'mes':
+        return dia.replace(day=1)
+    if granularidade == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    return dia
+
+
+def proximo_periodo(inicio: date, granularidade: str = 'dia') -> date:
+    if granularidade == 'mes':
+        return (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return inicio + timedelta(days=7 if granularidade == 'semana' else 1)
+
+
+def meses_atras(dia: date, meses: int) -> date:
+    """Primeiro dia do mês `meses` meses antes do mês de `dia` (aritmética de calendário)"""
+    total = dia.year * 12 + dia.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _como_data(valor) -> date | None:
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    # func.date() no SQLite devolve 'YYYY-MM-DD'
+    return date.fromisoformat(str(valor)[:10])
+
+
+# ==================== MANUTENÇÃO INCREMENTAL ====================
+
+def valores_do_flush(obj, atributos, anteriores: bool) -> dict:
+    """Valores atuais ou anteriores ao flush, pelo histórico do atributo"""
+    estado = inspect(obj)
+    valores = {}
+    for nome in atributos:
+        if not anteriores:
+            valores[nome] = getattr(obj, nome, None)
+            continue
+        historico = estado.attrs[nome].history
+        if historico.deleted:
+            valores[nome] = historico.deleted[0]
+        elif historico.unchanged:
+            valores[nome] = historico.unchanged[0]
+        else:
+            valores[nome] = getattr(obj, nome, None)
+    return valores
+
+
+def _contribuicao(obj, anteriores: bool):
+    """(user_id, dia, prefixo, valor) com que o objeto entra no resumo, ou None"""
+    coluna_data, prefixo, conta = TRACKED_MODELS[type(obj).__name__]
+    valores = valores_do_flush(obj, ('user_id', coluna_data, 'valor_total', 'status'), anteriores)
+    if valores['user_id'] is None or not conta(valores['status']):
+        return None
+    dia = _como_data(valores[coluna_data]) or datetime.utcnow().date()
+    return valores['user_id'], dia, prefixo, float(valores['valor_total'] or 0)
+
+
+def _acumular(deltas: dict, contribuicao, sinal: int) -> None:
+    if contribuicao is None:
+        return
+    user_id, dia, prefixo, valor = contribuicao
+    linha = deltas.setdefault((user_id, dia), dict.fromkeys(CAMPOS, 0))
+    linha[f'{prefixo}_qtd'] += sinal
+    linha[f'{prefixo}_valor'] += sinal * valor
+
+
+def _upsert(conn, user_id, dia: date, delta: dict) -> None:
+    """Soma o delta na linha (user_id, dia), criando-a se preciso"""
+    from app import ResumoDiario, User
+
+    tabela = ResumoDiario.__table__
+    incrementos = {campo: tabela.c[campo] + delta[campo] for campo in CAMPOS}
+    linha = {
+        'user_id': user_id,
+        'empresa_id': select(User.empresa_id).where(User.id == user_id).scalar_subquery(),
+        'dia': dia,
+        'semana': inicio_periodo(dia, 'semana'),
+        'mes': inicio_periodo(dia, 'mes'),
+        'updated_at': datetime.utcnow(),
+        **delta,
+    }
+
+    dialeto = conn.dialect.name
+    if dialeto in ('postgresql', 'sqlite'):
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        conn.execute(
+            dialect_insert(tabela).values(**linha).on_conflict_do_update(
+                index_elements=['user_id', 'dia'],
+                set_={**incrementos, 'updated_at': linha['updated_at']},
+            )
+        )
+        return
+
+    # Demais bancos: UPDATE e, se a linha ainda não existir, INSERT
+    resultado = conn.execute(
+        update(tabela)
+        .where(tabela.c.user_id == user_id, tabela.c.dia == dia)
+        .values(**incrementos, updated_at=linha['updated_at'])
+    )
+    if not resultado.rowcount:
+        conn.execute(insert(tabela).values(**linha))
+
+
+def _aplicar_deltas(session, flush_context):
+    """after_flush: leva as mudanças de Venda/Compra ao resumo diário"""
+    deltas = {}
+    for obj in session.new:
+        if type(obj).__name__ in TRACKED_MODELS:
+            _acumular(deltas, _contribuicao(obj, anteriores=False), 1)
+    for obj in session.dirty:
+        if type(obj).__name__ in TRACKED_MODELS and session.is_modified(obj, include_collections=False):
+            _acumular(deltas, _contribuicao(obj, anteriores=True), -1)
+            _acumular(deltas, _contribuicao(obj, anteriores=False), 1)
+    for obj in session.deleted:
+        if type(obj).__name__ in TRACKED_MODELS:
+            _acumular(deltas, _contribuicao(obj, anteriores=True), -1)
+
+    conn = None
+    for (user_id, dia), delta in deltas.items():
+        if not any(delta.values()):
+            continue
+        conn = conn or session.connection()
+        _upsert(conn, user_id, dia, delta)
+
+
+def _manter_valor_anterior(target, value, oldvalue, initiator):
+    return value
+
+
+def ativar_historico(model, atributos) -> None:
+    """active_history nos atributos: ao alterar um atributo expirado (após
+    commit), o valor antigo é carregado antes da troca e fica no histórico"""
+    for atributo in atributos:
+        alvo = getattr(model, atributo)
+        if not event.contains(alvo, 'set', _manter_valor_anterior):
+            event.listen(alvo, 'set', _manter_valor_anterior, active_history=True, retval=True)
+
+
+def register_resumo_diario(db, *models):
+    """Liga a manutenção do resumo diário às escritas da sessão do Flask-SQLAlchemy.
+
+    `models` são as classes de TRACKED_MODELS (Venda, Compra).
+    """
+    for model in models:
+        ativar_historico(model, ('user_id', TRACKED_MODELS[model.__name__][0], 'valor_total', 'status'))
+    if not event.contains(db.session, 'after_flush', _aplicar_deltas):
+        event.listen(db.session, 'after_flush', _aplicar_deltas)
+
+
+# ==================== RECONSTRUÇÃO ====================
+
+def rebuild(user_id=None, lote: int = 1000) -> int:
+    """Recalcula o resumo a partir de vendas e compras (de um usuário ou de todos).
+
+    Idempotente; durante a execução, escritas concorrentes do mesmo usuário
+    podem ser perdidas, então rode fora do horário de pico. Retorna o número
+    de linhas gravadas.
+    """
+    from app import db, ResumoDiario, User, Venda, Compra
+
+    def agregado(model, coluna_data, filtro=None):
+        dia = func.date(coluna_data)
+        stmt = (select(model.user_id, dia, func.count(model.id), func.coalesce(func.sum(model.valor_total), 0))
+                .group_by(model.user_id, dia))
+        if filtro is not None:
+            stmt = stmt.where(filtro)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        return db.session.execute(stmt)
+
+    linhas = {}
+    for prefixo, resultado in (
+        ('vendas', agregado(Venda, Venda.data_venda, Venda.status == 'finalizada')),
+        ('compras', agregado(Compra, Compra.data_compra)),
+    ):
+        for uid, dia, qtd, valor in resultado:
+            dia = _como_data(dia)
+            if dia is None:
+                continue
+            linha = linhas.setdefault((uid, dia), dict.fromkeys(CAMPOS, 0))
+            linha[f'{prefixo}_qtd'] += int(qtd or 0)
+            linha[f'{prefixo}_valor'] += float(valor or 0)
+
+    empresas_stmt = select(User.id, User.empresa_id)
+    if user_id is not None:
+        empresas_stmt = empresas_stmt.where(User.id == user_id)
+    empresas = dict(db.session.execute(empresas_stmt).all())
+
+    limpar = delete(ResumoDiario)
+    if user_id is not None:
+        limpar = limpar.where(ResumoDiario.user_id == user_id)
+    db.session.execute(limpar)
+
+    agora = datetime.utcnow()
+    registros = [
+        {'user_id': uid, 'empresa_id': empresas.get(uid), 'dia': dia,
+         'semana': inicio_periodo(dia, 'semana'), 'mes': inicio_periodo(dia, 'mes'),
+         'updated_at': agora, **valores}
+        for (uid, dia), valores in linhas.items()
+    ]
+    for i in range(0, len(registros), lote):
+        db.session.execute(insert(ResumoDiario), registros[i:i + lote])
+    db.session.commit()
+    return len(registros)
+
+
+# ==================== LEITURA ====================
+
+def serie(inicio: date, fim: date, granularidade: str = 'mes', user_id=None, empresa_id=None) -> list:
+    """Totais por período entre `inicio` e `fim` (inclusive), em ordem cronológica.
+
+    Escopo por usuário ou, com `empresa_id`, pela empresa inteira. Cada item:
+    periodo (date do início), vendas_qtd, vendas_valor, compras_qtd,
+    compras_valor e saldo (vendas - compras).
+    """
+    from app import db, ResumoDiario
+
+    if granularidade not in GRANULARIDADES:
+        raise ValueError('Granularidade inválida (use dia, semana ou mes).')
+    if user_id is None and empresa_id is None:
+        raise ValueError('Informe user_id ou empresa_id.')
+    if fim < inicio:
+        inicio, fim = fim, inicio
+
+    periodos = []
+    atual = inicio_periodo(inicio, granularidade)
+    while atual <= fim:
+        periodos.append(atual)
+        if len(periodos) > MAX_PERIODOS:
+            raise ValueError(f'Intervalo longo demais (máximo de {MAX_PERIODOS} períodos).')
+        atual = proximo_periodo(atual, granularidade)
+
+    periodo = getattr(ResumoDiario, granularidade)
+    escopo = ResumoDiario.empresa_id == empresa_id if empresa_id is not None else ResumoDiario.user_id == user_id
+    resultado = db.session.execute(
+        select(periodo, *[func.coalesce(func.sum(getattr(ResumoDiario, c)), 0) for c in CAMPOS])
+        .where(escopo, ResumoDiario.dia >= inicio, ResumoDiario.dia <= fim)
+        .group_by(periodo)
+    ).all()
+    totais = {_como_data(linha[0]): linha[1:] for linha in resultado}
+
+    itens = []
+    for p in periodos:
+        vendas_qtd, vendas_valor, compras_qtd, compras_valor = totais.get(p, (0, 0, 0, 0))
+        itens.append({
+            'periodo': p,
+            'vendas_qtd': int(vendas_qtd),
+            'vendas_valor': float(vendas_valor),
+            'compras_qtd': int(compras_qtd),
+            'compras_valor': float(compras_valor),
+            'saldo': float(vendas_valor) - float(compras_valor),
+        })
+    return itens
+
+
+def ultimos_meses(meses: int = 12, hoje: date | None = None, **escopo) -> list:
+    """Série mensal dos últimos `meses` meses de calendário, incluindo o atual"""
+    hoje = hoje or datetime.now().date()
+    return serie(meses_atras(hoje, meses - 1), hoje, 'mes', **escopo)
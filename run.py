@@ -58,6 +58,10 @@ if __name__ == '__main__':
                 print("Senha: admin123")
             else:
                 print("Usuario administrador ja existe!")
+            
+            # Índices de busca textual (idempotente; create_all não os cria)
+            import busca
+            busca.criar_indices()
                 
         except Exception as e:
             print(f"Erro ao inicializar banco de dados: {e}")
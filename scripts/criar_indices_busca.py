@@ -0,0 +1,21 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app
+import busca
+
+
+def main():
+    # Bancos criados por create_all: cria os índices de busca (SQLite: e repopula o FTS5)
+    with app.app_context():
+        if busca.criar_indices():
+            print(f"Indices de busca criados para: {', '.join(busca.INDICES)}")
+        else:
+            print("Indices de busca indisponiveis neste banco; a busca segue com ILIKE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app
+from cep_service import carregar_dataset, limpar_expirados
+
+
+def main():
+    # Uso: load_cep_dataset.py <arquivo.csv> | --limpar-expirados
+    if len(sys.argv) < 2:
+        print("Uso: python scripts/load_cep_dataset.py <arquivo.csv> | --limpar-expirados")
+        sys.exit(1)
+    with app.app_context():
+        if sys.argv[1] == '--limpar-expirados':
+            print(f"Removed {limpar_expirados()} CEPs expirados do cache")
+            return
+        total = carregar_dataset(sys.argv[1])
+        print(f"Loaded {total} CEPs into cep_cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app
+from resumo_diario import rebuild
+
+
+def main():
+    # Sem argumentos reconstrói o resumo de todos os usuários; com um user_id, só o dele
+    with app.app_context():
+        user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        total = rebuild(user_id)
+        print(f"Rebuilt resumo_diario with {total} linhas")
+
+
+if __name__ == "__main__":
+    main()
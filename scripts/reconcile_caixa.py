@@ -0,0 +1,21 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app, CaixaSessao
+from caixa_contadores import reconciliar
+
+
+def main():
+    # --all confere todas as sessões; --dry-run só relata as divergências
+    args = sys.argv[1:]
+    with app.app_context():
+        sessao_ids = [s.id for s in CaixaSessao.query.all()] if '--all' in args else None
+        divergencias = reconciliar(sessao_ids, corrigir='--dry-run' not in args)
+        print(f"Reconciled caixa counters: {len(divergencias)} divergencias")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app, Empresa
+from empresa_stats import refresh_empresa_stats, refresh_stale_snapshots
+
+
+def main():
+    # --all recalcula todas as empresas (inclusive as que ainda não têm snapshot)
+    with app.app_context():
+        if '--all' in sys.argv[1:]:
+            ids = [e.id for e in Empresa.query.all()]
+            for empresa_id in ids:
+                refresh_empresa_stats(empresa_id)
+            print(f"Refreshed {len(ids)} empresa snapshots")
+        else:
+            total = refresh_stale_snapshots()
+            print(f"Refreshed {total} stale empresa snapshots")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import sys, os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from app import app
+from inventory_analytics import refresh_ultima_venda
+
+
+def main():
+    # Sem argumentos recalcula todos os produtos; com um user_id, só os desse usuário
+    with app.app_context():
+        user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        total = refresh_ultima_venda(user_id)
+        print(f"Refreshed ultima_venda_em for {total} produtos")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,6 @@ Implementa várias camadas de proteção de segurança
 """
 
 import os
-import time
 import hashlib
 import hmac
 from functools import wraps
@@ -14,13 +13,17 @@ from datetime import datetime, timedelta
 import bleach
 import re
 
+from security_store import create_security_store
+
 class SecurityMiddleware:
     """Middleware de segurança centralizado"""
     
-    def __init__(self, app=None):
+    def __init__(self, app=None, store=None):
         self.app = app
-        self.failed_attempts = {}  # IP -> {count, last_attempt}
-        self.blocked_ips = set()    # IPs bloqueados temporariamente
+        # Contadores de requisições e IPs bloqueados (memória ou Redis)
+        self.store = store
+        self.rate_limit = 500          # requisições por janela e por IP
+        self.rate_limit_window = 3600  # 1 hora
         self.suspicious_patterns = [
             r'<script[^>]*>.*?</script>',  # XSS
             r'javascript:',                 # JavaScript injection
@@ -160,6 +163,10 @@ class SecurityMiddleware:
             r'<h6[^>]*>',                   # H6 injection
         ]
         
+        self.suspicious_agents = ['sqlmap', 'nikto', 'nmap', 'masscan', 'zap', 'burp']
+        self.sql_patterns = ['union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter']
+        self._suspicious_regex = None
+        
         if app:
             self.init_app(app)
     
@@ -167,6 +174,16 @@ class SecurityMiddleware:
         """Inicializa o middleware com a aplicação Flask"""
         self.app = app
         
+        # Compilar o scanner uma única vez
+        self.compile_scanner()
+        
+        # Store compartilhado: mesma URI do Flask-Limiter por padrão
+        if self.store is None:
+            uri = app.config.get('SECURITY_STORE_URL') or app.config.get('RATELIMIT_STORAGE_URL')
+            self.store = create_security_store(uri)
+        self.rate_limit = app.config.get('SECURITY_RATE_LIMIT', self.rate_limit)
+        self.rate_limit_window = app.config.get('SECURITY_RATE_LIMIT_WINDOW', self.rate_limit_window)
+        
         # Registrar hooks
         app.before_request(self.before_request)
         app.after_request(self.after_request)
@@ -176,12 +193,9 @@ class SecurityMiddleware:
     
     def before_request(self):
         """Executado antes de cada requisição"""
-        # Limpar IPs bloqueados expirados
-        self.cleanup_blocked_ips()
-        
-        # Verificar se IP está bloqueado
+        # Verificar se IP está bloqueado (expiração tratada pelo store)
         client_ip = self.get_client_ip()
-        if client_ip in self.blocked_ips:
+        if self.is_blocked(client_ip):
             abort(429)  # Too Many Requests
         
         # Verificar padrões suspeitos
@@ -202,9 +216,7 @@ class SecurityMiddleware:
         for header, value in self.app.config.get('SECURITY_HEADERS', {}).items():
             response.headers[header] = value
         
-        # Adicionar timestamp de resposta
-        response.headers['X-Response-Time'] = str(time.time())
-        
+        # Duração da requisição: Server-Timing (instrumentation.py)
         return response
     
     def get_client_ip(self):
@@ -216,78 +228,85 @@ class SecurityMiddleware:
         else:
             return request.remote_addr
     
+    def compile_scanner(self):
+        """Combina todos os padrões suspeitos em uma única regex compilada.
+        
+        Equivale a testar cada padrão com re.search(..., re.IGNORECASE) e as
+        palavras SQL como substring, mas percorre cada entrada uma única vez.
+        """
+        padroes = list(dict.fromkeys(self.suspicious_patterns))  # remove duplicados
+        padroes += [re.escape(p) for p in self.sql_patterns]
+        self._suspicious_regex = re.compile(
+            '|'.join(f'(?:{p})' for p in padroes),
+            re.IGNORECASE
+        )
+        return self._suspicious_regex
+    
+    def _payloads_to_scan(self):
+        """Representações textuais da requisição que podem conter ataques"""
+        # Arquivos estáticos não têm corpo nem chegam às rotas
+        if request.endpoint == 'static':
+            return []
+        payloads = []
+        # Em form/multipart o corpo é parseado para form/files e request.data fica vazio
+        data = request.data
+        if data:
+            payloads.append(str(data))
+        if request.form:
+            payloads.append(str(request.form))
+        if request.args:
+            payloads.append(str(request.args))
+        return payloads
+    
     def detect_suspicious_activity(self):
         """Detecta atividade suspeita na requisição"""
-        # Verificar padrões de XSS
-        for pattern in self.suspicious_patterns:
-            if re.search(pattern, str(request.data), re.IGNORECASE):
-                return True
-            if re.search(pattern, str(request.form), re.IGNORECASE):
-                return True
-            if re.search(pattern, str(request.args), re.IGNORECASE):
-                return True
-        
         # Verificar User-Agent suspeito
         user_agent = request.headers.get('User-Agent', '').lower()
-        suspicious_agents = ['sqlmap', 'nikto', 'nmap', 'masscan', 'zap', 'burp']
-        if any(agent in user_agent for agent in suspicious_agents):
+        if any(agent in user_agent for agent in self.suspicious_agents):
             return True
         
         # Verificar tentativas de path traversal
-        if '..' in request.path or '../' in request.path:
+        if '..' in request.path:
             return True
         
-        # Verificar tentativas de SQL injection básicas
-        sql_patterns = ['union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter']
-        for pattern in sql_patterns:
-            if pattern in str(request.data).lower():
-                return True
-            if pattern in str(request.form).lower():
-                return True
-            if pattern in str(request.args).lower():
+        # Verificar padrões de XSS e SQL injection (uma passada por entrada)
+        regex = self._suspicious_regex or self.compile_scanner()
+        for payload in self._payloads_to_scan():
+            if regex.search(payload):
                 return True
         
         return False
     
     def check_rate_limit(self, ip):
-        """Verifica rate limiting para um IP"""
-        now = time.time()
-        
-        if ip not in self.failed_attempts:
-            self.failed_attempts[ip] = {'count': 0, 'last_attempt': now}
+        """Verifica rate limiting para um IP (janela deslizante no store)"""
+        try:
+            return self.store.hit(ip, self.rate_limit, self.rate_limit_window)
+        except Exception as e:
+            # Falha do backend não deve derrubar a aplicação
+            print(f"AVISO: rate limit indisponivel: {e}")
             return True
-        
-        attempt_data = self.failed_attempts[ip]
-        
-        # Reset se passou muito tempo
-        if now - attempt_data['last_attempt'] > 3600:  # 1 hora
-            attempt_data['count'] = 0
-        
-        # Verificar limite (aumentado para desenvolvimento)
-        if attempt_data['count'] > 500:  # 500 tentativas por hora
+    
+    def is_blocked(self, ip):
+        """Verifica se o IP está bloqueado"""
+        try:
+            return self.store.is_blocked(ip)
+        except Exception as e:
+            print(f"AVISO: consulta de bloqueio indisponivel: {e}")
             return False
-        
-        attempt_data['count'] += 1
-        attempt_data['last_attempt'] = now
-        
-        return True
     
     def block_ip(self, ip, duration=3600):
         """Bloqueia um IP por um período"""
-        self.blocked_ips.add(ip)
-        # Remover após o tempo especificado
-        def remove_block():
-            time.sleep(duration)
-            self.blocked_ips.discard(ip)
-        
-        import threading
-        threading.Thread(target=remove_block, daemon=True).start()
+        try:
+            self.store.block(ip, duration)
+        except Exception as e:
+            print(f"AVISO: falha ao bloquear IP {ip}: {e}")
     
     def cleanup_blocked_ips(self):
-        """Remove IPs bloqueados expirados"""
-        # Esta função seria chamada periodicamente
-        # Por simplicidade, implementamos limpeza básica
-        pass
+        """Remove IPs bloqueados e contadores expirados"""
+        # O backend em memória já faz isso em um sweeper próprio; no Redis as chaves expiram
+        sweep = getattr(self.store, 'sweep', None)
+        if sweep:
+            sweep()
     
     def sanitize_inputs(self):
         """Sanitiza dados de entrada"""
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de rate limiting e bloqueio de IPs do SecurityMiddleware
+
+Dois backends com a mesma interface:
+- MemorySecurityStore: por processo, memória limitada (LRU) e janela
+  deslizante aproximada por dois baldes de tempo; um único sweeper remove
+  entradas expiradas.
+- RedisSecurityStore: compartilhado entre todos os workers do gunicorn (e
+  com o Flask-Limiter, quando usam a mesma URI).
+
+Use create_security_store(uri) com 'memory://' ou 'redis://...'.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class SecurityStore(ABC):
+    """Interface comum dos backends"""
+
+    @abstractmethod
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        """Registra uma requisição de `key`; False se excedeu `limit` na janela."""
+
+    @abstractmethod
+    def block(self, key: str, duration: int) -> None:
+        pass
+
+    @abstractmethod
+    def is_blocked(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def unblock(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+def _sliding_count(anterior: int, atual: int, window: int, now: float) -> float:
+    """Estimativa da janela deslizante a partir de dois baldes consecutivos"""
+    decorrido = (now % window) / window
+    return anterior * (1 - decorrido) + atual
+
+
+class MemorySecurityStore(SecurityStore):
+    """Backend em memória, limitado a `max_entries` chaves por tabela"""
+
+    def __init__(self, max_entries: int = 100000, sweep_interval: int = 60):
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        # key -> [indice_balde, contagem_anterior, contagem_atual, window]
+        self._counters = OrderedDict()
+        # key -> expira_em
+        self._blocked = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='security-store-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+    def sweep(self, now: float | None = None) -> int:
+        """Remove bloqueios expirados e contadores sem atividade recente"""
+        now = now or time.time()
+        removidos = 0
+        with self._lock:
+            for key in [k for k, expira in self._blocked.items() if expira <= now]:
+                del self._blocked[key]
+                removidos += 1
+            for key in [k for k, c in self._counters.items() if int(now // c[3]) - c[0] > 1]:
+                del self._counters[key]
+                removidos += 1
+        return removidos
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        balde = int(now // window)
+        with self._lock:
+            self._ensure_sweeper()
+            contador = self._counters.get(key)
+            if contador is None or contador[3] != window:
+                contador = [balde, 0, 0, window]
+                self._counters[key] = contador
+            elif balde != contador[0]:
+                # Avança a janela: o balde atual vira o anterior (ou zera, se houve um intervalo)
+                contador[1] = contador[2] if balde - contador[0] == 1 else 0
+                contador[2] = 0
+                contador[0] = balde
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_entries:
+                self._counters.popitem(last=False)
+
+            if _sliding_count(contador[1], contador[2], window, now) >= limit:
+                return False
+            contador[2] += 1
+            return True
+
+    def block(self, key, duration):
+        with self._lock:
+            self._ensure_sweeper()
+            self._blocked[key] = time.time() + duration
+            self._blocked.move_to_end(key)
+            while len(self._blocked) > self.max_entries:
+                self._blocked.popitem(last=False)
+
+    def is_blocked(self, key):
+        with self._lock:
+            expira = self._blocked.get(key)
+            if expira is None:
+                return False
+            if expira <= time.time():
+                del self._blocked[key]
+                return False
+            return True
+
+    def unblock(self, key):
+        with self._lock:
+            self._blocked.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._blocked.clear()
+
+
+class RedisSecurityStore(SecurityStore):
+    """Backend Redis: as chaves expiram sozinhas, sem sweeper"""
+
+    def __init__(self, client, prefix: str = 'security'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = 'security'):
+        import redis
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def _rl_key(self, key, window, balde):
+        return f"{self.prefix}:rl:{window}:{key}:{balde}"
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        balde = int(now // window)
+        atual_key = self._rl_key(key, window, balde)
+        anterior_key = self._rl_key(key, window, balde - 1)
+        # Incrementa antes de comparar (MULTI/EXEC): requisições simultâneas em
+        # outros workers veem contagens distintas e não passam juntas do limite
+        pipe = self.client.pipeline()
+        pipe.incr(atual_key)
+        pipe.expire(atual_key, window * 2)
+        pipe.get(anterior_key)
+        atual, _, anterior = pipe.execute()
+        if _sliding_count(int(anterior or 0), atual - 1, window, now) >= limit:
+            # Recusada não conta, como no backend em memória
+            self.client.decr(atual_key)
+            return False
+        return True
+
+    def block(self, key, duration):
+        self.client.set(f"{self.prefix}:block:{key}", 1, ex=int(duration))
+
+    def is_blocked(self, key):
+        return bool(self.client.exists(f"{self.prefix}:block:{key}"))
+
+    def unblock(self, key):
+        self.client.delete(f"{self.prefix}:block:{key}")
+
+    def clear(self):
+        for chave in self.client.scan_iter(match=f"{self.prefix}:*", count=1000):
+            self.client.delete(chave)
+
+
+def create_security_store(uri: str | None = None, **kwargs) -> SecurityStore:
+    """Cria o backend a partir da URI (memory:// ou redis://, rediss://)"""
+    uri = uri or 'memory://'
+    if uri.startswith(('redis://', 'rediss://', 'unix://')):
+        try:
+            store = RedisSecurityStore.from_url(uri, prefix=kwargs.get('prefix', 'security'))
+            store.client.ping()
+            return store
+        except Exception as e:
+            print(f"AVISO: Redis indisponivel para o middleware de seguranca ({e}); usando memoria")
+    return MemorySecurityStore(
+        max_entries=kwargs.get('max_entries', 100000),
+        sweep_interval=kwargs.get('sweep_interval', 60),
+    )
@@ -0,0 +1,303 @@
+"""
+Sincronização incremental (delta-sync) para o app Android e o frontend React
+
+O app e as telas React baixavam /api/produtos, /api/clientes e /api/vendas
+inteiros a cada abertura (api_unified.api_vendas sem paginação nenhuma), e
+o servidor serializava de novo o mesmo catálogo inalterado.
+
+Agora cada escrita em Produto, Cliente, Fornecedor e Venda deixa uma linha
+em sync_alteracao (tenant, entidade, id do registro, removido):
+
+- um listener after_flush grava, na transação da escrita, uma linha nova
+  por registro alterado e apaga a anterior do mesmo registro: a tabela tem
+  uma linha por registro vivo mais as remoções (tombstones), e o id
+  crescente é a sequência de alterações;
+- escritas fora da sessão (baixa de estoque do checkout, gerador de dados)
+  chamam marcar() ou rebuild();
+- GET /api/sync?tipos=produtos,clientes&cursor=... devolve, em uma resposta
+  para várias entidades, os registros alterados (só as colunas dos
+  serializadores de query_shapes) e os ids removidos depois do cursor, em
+  lotes de `limite` alterações com has_more;
+- o cursor é opaco (tipos, sequência, emissão). Sem cursor, com cursor de
+  outros tipos ou mais velho que a retenção das remoções, a resposta traz
+  reset=true e começa do zero: o cliente descarta a cópia local;
+- uma transação ainda sem commit (um checkout, uma importação em lotes)
+  pode ter pego uma sequência menor que a de outra já visível. Para não
+  pulá-la, o cursor de toda página só avança até a última alteração mais
+  velha que SYNC_MARGEM_SEGUNDOS; as mais novas são entregues agora e de
+  novo na próxima chamada (o cliente aplica tudo como upsert). Se o corte
+  não deixa o cursor avançar, has_more vem false: o cliente tenta de novo
+  na próxima sincronização, em vez de repetir a mesma página;
+- respostas a partir de SYNC_GZIP_MIN_BYTES vão com gzip quando o cliente
+  aceita.
+
+purgar_remocoes() (tasks/sync.py) apaga as remoções mais velhas que
+SYNC_RETENCAO_DIAS.
+"""
+
+import base64
+import gzip
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, insert, inspect, literal, select
+
+# entidade da API -> (modelo, serializador de query_shapes)
+ENTIDADES = {
+    'produtos': ('Produto', 'produto'),
+    'clientes': ('Cliente', 'cliente'),
+    'fornecedores': ('Fornecedor', 'fornecedor'),
+    'vendas': ('Venda', 'venda'),
+}
+_POR_MODELO = {modelo: entidade for entidade, (modelo, _) in ENTIDADES.items()}
+
+DEFAULT_LIMITE = 500
+MAX_LIMITE = 5000
+# ids por IN (...)
+LOTE = 500
+DEFAULT_RETENCAO_DIAS = 30
+DEFAULT_MARGEM_SEGUNDOS = 30
+DEFAULT_GZIP_MIN_BYTES = 1024
+
+
+class SyncError(ValueError):
+    """Parâmetros inválidos na sincronização (tipos desconhecidos)"""
+
+
+def _config(nome: str, padrao):
+    from flask import current_app, has_app_context
+    return current_app.config.get(nome, padrao) if has_app_context() else padrao
+
+
+# ==================== REGISTRO DAS ALTERAÇÕES ====================
+
+def registrar(conn, alteracoes: dict, agora: datetime | None = None) -> None:
+    """Grava `alteracoes` ({(user_id, entidade, registro_id): removido}) com sequência nova"""
+    if not alteracoes:
+        return
+    from app import SyncAlteracao
+
+    tabela = SyncAlteracao.__table__
+    agora = agora or datetime.utcnow()
+    por_grupo = defaultdict(list)
+    for user_id, entidade, registro_id in alteracoes:
+        por_grupo[(user_id, entidade)].append(registro_id)
+    for (user_id, entidade), ids in por_grupo.items():
+        for i in range(0, len(ids), LOTE):
+            conn.execute(delete(tabela).where(
+                tabela.c.user_id == user_id, tabela.c.entidade == entidade,
+                tabela.c.registro_id.in_(ids[i:i + LOTE])))
+    conn.execute(insert(tabela), [
+        {'user_id': user_id, 'entidade': entidade, 'registro_id': registro_id,
+         'removido': removido, 'alterado_em': agora}
+        for (user_id, entidade, registro_id), removido in alteracoes.items()
+    ])
+
+
+def marcar(conn, user_id, entidade: str, ids, removido: bool = False) -> None:
+    """Registra escritas feitas fora da sessão (UPDATE/INSERT em massa)"""
+    registrar(conn, {(user_id, entidade, registro_id): removido for registro_id in ids})
+
+
+def _anotar(alteracoes: dict, obj, removido: bool) -> None:
+    entidade = _POR_MODELO.get(type(obj).__name__)
+    if entidade is None:
+        return
+    if removido:
+        # Linha já apagada: só o que está carregado, sem ir ao banco
+        estado = inspect(obj)
+        user_id = estado.dict.get('user_id')
+        registro_id = estado.identity[0] if estado.identity else None
+    else:
+        user_id, registro_id = obj.user_id, obj.id
+    if user_id is not None and registro_id is not None:
+        alteracoes[(user_id, entidade, registro_id)] = removido
+
+
+def _registrar_alteracoes(session, flush_context):
+    """after_flush: anota os registros sincronizáveis escritos neste flush"""
+    alteracoes = {}
+    for obj in session.new:
+        _anotar(alteracoes, obj, False)
+    for obj in session.dirty:
+        if type(obj).__name__ in _POR_MODELO and session.is_modified(obj, include_collections=False):
+            _anotar(alteracoes, obj, False)
+    for obj in session.deleted:
+        _anotar(alteracoes, obj, True)
+    if alteracoes:
+        registrar(session.connection(), alteracoes)
+
+
+def register_sync_delta(db):
+    """Liga o registro de alterações às escritas da sessão do Flask-SQLAlchemy"""
+    if not event.contains(db.session, 'after_flush', _registrar_alteracoes):
+        event.listen(db.session, 'after_flush', _registrar_alteracoes)
+
+
+# ==================== CURSOR E CONSULTA ====================
+
+def encode_cursor(tipos, seq: int, emitido_em: datetime) -> str:
+    dados = json.dumps([sorted(tipos), seq, emitido_em.isoformat(timespec='seconds')], separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None, tipos):
+    """(sequência, emissão) do cursor, ou None se ausente, inválido ou de outros tipos"""
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        tipos_cursor, seq, emitido_em = json.loads(dados)
+        if tipos_cursor != sorted(tipos):
+            return None
+        return int(seq), datetime.fromisoformat(emitido_em)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_tipos(valor: str | None) -> list:
+    """Entidades pedidas (``produtos,clientes``); todas se omitido"""
+    if not valor:
+        return list(ENTIDADES)
+    tipos = []
+    for tipo in valor.split(','):
+        tipo = tipo.strip()
+        if not tipo:
+            continue
+        if tipo not in ENTIDADES:
+            raise SyncError(f'Tipo desconhecido: {tipo}')
+        if tipo not in tipos:
+            tipos.append(tipo)
+    if not tipos:
+        raise SyncError('Informe ao menos um tipo')
+    return tipos
+
+
+def delta(user_id, tipos, cursor: str | None = None, limite: int = DEFAULT_LIMITE,
+          agora: datetime | None = None) -> dict:
+    """Alterações de `tipos` depois do cursor, agrupadas por entidade.
+
+    Retorna ``{'alteracoes': {entidade: {'alterados': [...], 'removidos':
+    [ids]}}, 'cursor', 'has_more', 'reset'}``.
+    """
+    import app as app_module
+    import query_shapes
+    from app import db, SyncAlteracao
+
+    agora = agora or datetime.utcnow()
+    limite = max(1, min(int(limite), MAX_LIMITE))
+    retencao = timedelta(days=_config('SYNC_RETENCAO_DIAS', DEFAULT_RETENCAO_DIAS))
+    margem = timedelta(seconds=_config('SYNC_MARGEM_SEGUNDOS', DEFAULT_MARGEM_SEGUNDOS))
+
+    anterior = decode_cursor(cursor, tipos)
+    # Remoções posteriores a um cursor muito velho já podem ter sido purgadas
+    reset = anterior is None or anterior[1] < agora - retencao + margem
+    seq = 0 if reset else anterior[0]
+
+    tabela = SyncAlteracao.__table__
+    linhas = db.session.execute(
+        select(tabela.c.id, tabela.c.entidade, tabela.c.registro_id, tabela.c.removido, tabela.c.alterado_em)
+        .where(tabela.c.user_id == user_id, tabela.c.entidade.in_(tipos), tabela.c.id > seq)
+        .order_by(tabela.c.id)
+        .limit(limite + 1)
+    ).all()
+    has_more = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    proximo = seq
+    seguro = agora - margem
+    for linha in linhas:
+        if linha.alterado_em > seguro:
+            break
+        proximo = linha.id
+    if proximo == seq:
+        has_more = False
+
+    alterados = defaultdict(list)
+    removidos = defaultdict(list)
+    for linha in linhas:
+        (removidos if linha.removido else alterados)[linha.entidade].append(linha.registro_id)
+
+    resultado = {}
+    for entidade in tipos:
+        modelo_nome, serializador = ENTIDADES[entidade]
+        model = getattr(app_module, modelo_nome)
+        ids = alterados.get(entidade, [])
+        registros = []
+        for i in range(0, len(ids), LOTE):
+            registros += query_shapes.listar(serializador, model.query.filter(
+                model.user_id == user_id, model.id.in_(ids[i:i + LOTE])))
+        # Removido entre o registro da alteração e esta leitura
+        encontrados = {registro['id'] for registro in registros}
+        resultado[entidade] = {
+            'alterados': registros,
+            'removidos': removidos.get(entidade, []) + [i for i in ids if i not in encontrados],
+        }
+
+    return {
+        'alteracoes': resultado,
+        'cursor': encode_cursor(tipos, proximo, agora),
+        'has_more': has_more,
+        'reset': reset,
+    }
+
+
+def resposta(dados: dict):
+    """Response JSON, com gzip se o cliente aceitar e o corpo for grande"""
+    from flask import Response, request
+
+    corpo = json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    resultado = Response(corpo, mimetype='application/json')
+    resultado.vary.add('Accept-Encoding')
+    if len(corpo) >= _config('SYNC_GZIP_MIN_BYTES', DEFAULT_GZIP_MIN_BYTES) and request.accept_encodings['gzip']:
+        resultado.set_data(gzip.compress(corpo, compresslevel=6))
+        resultado.headers['Content-Encoding'] = 'gzip'
+    return resultado
+
+
+# ==================== MANUTENÇÃO ====================
+
+def rebuild(user_id=None, agora: datetime | None = None) -> int:
+    """Registra todos os registros vivos (de um usuário ou de todos) com sequência nova.
+
+    Para carga inicial ou após escritas em massa que não passam pela sessão;
+    as remoções são mantidas. Os clientes recebem tudo de novo como upsert.
+    """
+    import app as app_module
+    from app import db, SyncAlteracao
+
+    agora = agora or datetime.utcnow()
+    tabela = SyncAlteracao.__table__
+    apagar = delete(tabela).where(tabela.c.removido == False)  # noqa: E712
+    if user_id is not None:
+        apagar = apagar.where(tabela.c.user_id == user_id)
+    db.session.execute(apagar)
+
+    total = 0
+    for entidade, (modelo_nome, _) in ENTIDADES.items():
+        origem = getattr(app_module, modelo_nome).__table__
+        linhas = (select(origem.c.user_id, literal(entidade), origem.c.id, literal(False), literal(agora))
+                  .where(origem.c.user_id.isnot(None)))
+        if user_id is not None:
+            linhas = linhas.where(origem.c.user_id == user_id)
+        resultado = db.session.execute(insert(tabela).from_select(
+            ['user_id', 'entidade', 'registro_id', 'removido', 'alterado_em'], linhas.order_by(origem.c.id)))
+        total += resultado.rowcount or 0
+    db.session.commit()
+    return total
+
+
+def purgar_remocoes(agora: datetime | None = None, retencao_dias: int | None = None) -> int:
+    """Apaga as remoções mais velhas que a retenção; retorna quantas"""
+    from app import db, SyncAlteracao
+
+    agora = agora or datetime.utcnow()
+    if retencao_dias is None:
+        retencao_dias = _config('SYNC_RETENCAO_DIAS', DEFAULT_RETENCAO_DIAS)
+    tabela = SyncAlteracao.__table__
+    resultado = db.session.execute(delete(tabela).where(
+        tabela.c.removido == True,  # noqa: E712
+        tabela.c.alterado_em < agora - timedelta(days=retencao_dias)))
+    db.session.commit()
+    return resultado.rowcount or 0
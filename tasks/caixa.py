@@ -0,0 +1,20 @@
+try:
+    from .celery_app import celery
+except Exception:
+    celery = None
+
+def reconcile_caixa_stub():
+    """Confere os contadores das sessões de caixa recentes (execução síncrona)."""
+    from app import app
+    from caixa_contadores import reconciliar
+    with app.app_context():
+        divergencias = reconciliar()
+    return {'status': 'done', 'divergencias': len(divergencias)}
+
+if celery is not None:
+    @celery.task(name='caixa.reconcile_counters')
+    def reconcile_caixa():
+        return reconcile_caixa_stub()
+else:
+    def reconcile_caixa():
+        return reconcile_caixa_stub()
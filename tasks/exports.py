@@ -1,25 +1,21 @@
-import time
 try:
     from .celery_app import celery, make_celery
 except Exception:
     celery = None
     make_celery = None
 
-def export_report_stub(tipo: str, user_id: int, formato: str = 'csv'):
-    """Stub síncrono para exportação quando Celery indisponível."""
-    time.sleep(1)
-    return {
-        'status': 'done',
-        'tipo': tipo,
-        'user_id': user_id,
-        'formato': formato,
-        'path': f"/static/exports/{tipo}_{user_id}.{formato}"
-    }
+def run_export_job_stub(job_id: str):
+    """Executa o ExportJob de forma síncrona (pool local quando Celery indisponível)."""
+    from app import app
+    from export_jobs import executar_job
+    with app.app_context():
+        return executar_job(job_id)
 
 if celery is not None:
-    @celery.task(name='exports.export_report')
-    def export_report(tipo: str, user_id: int, formato: str = 'csv'):
-        return export_report_stub(tipo, user_id, formato)
+    @celery.task(name='exports.run_export_job')
+    def run_export_job(job_id: str):
+        from export_jobs import executar_job
+        return executar_job(job_id)
 else:
-    def export_report(tipo: str, user_id: int, formato: str = 'csv'):
-        return export_report_stub(tipo, user_id, formato)
\ No newline at end of file
+    def run_export_job(job_id: str):
+        return run_export_job_stub(job_id)
@@ -0,0 +1,20 @@
+try:
+    from .celery_app import celery
+except Exception:
+    celery = None
+
+def refresh_empresa_stats_stub():
+    """Recalcula snapshots de estatísticas desatualizados (execução síncrona)."""
+    from app import app
+    from empresa_stats import refresh_stale_snapshots
+    with app.app_context():
+        total = refresh_stale_snapshots()
+    return {'status': 'done', 'refreshed': total}
+
+if celery is not None:
+    @celery.task(name='stats.refresh_empresa_stats')
+    def refresh_empresa_stats():
+        return refresh_empresa_stats_stub()
+else:
+    def refresh_empresa_stats():
+        return refresh_empresa_stats_stub()
@@ -0,0 +1,20 @@
+try:
+    from .celery_app import celery
+except Exception:
+    celery = None
+
+def purge_sync_tombstones_stub():
+    """Apaga as remoções do delta-sync mais velhas que a retenção (execução síncrona)."""
+    from app import app
+    from sync_delta import purgar_remocoes
+    with app.app_context():
+        total = purgar_remocoes()
+    return {'status': 'done', 'purged': total}
+
+if celery is not None:
+    @celery.task(name='sync.purge_tombstones')
+    def purge_sync_tombstones():
+        return purge_sync_tombstones_stub()
+else:
+    def purge_sync_tombstones():
+        return purge_sync_tombstones_stub()
@@ -0,0 +1,80 @@
+"""
+Cursor do delta-sync com escritor concorrente ainda sem commit
+
+Uma transação que pegou a sequência 3 e só confirma depois que 4..6 já
+estão visíveis não pode ficar atrás do cursor de nenhum dispositivo.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.dados_sinteticos import configurar_banco  # noqa: E402
+
+configurar_banco(None)
+
+import app as app_module  # noqa: E402
+import sync_delta  # noqa: E402
+
+AGORA = datetime(2026, 1, 1, 12, 0, 0)
+VELHO = AGORA - timedelta(minutes=5)
+RECENTE = AGORA - timedelta(seconds=5)
+
+
+@pytest.fixture
+def user_id():
+    app = app_module.app
+    db = app_module.db
+    with app.app_context():
+        db.create_all()
+        user = app_module.User(username='sync_teste', email='sync_teste@example.com', empresa='Teste')
+        db.session.add(user)
+        db.session.commit()
+        yield user.id
+        db.session.execute(app_module.SyncAlteracao.__table__.delete())
+        db.session.delete(user)
+        db.session.commit()
+
+
+def _gravar(user_id, seq, alterado_em):
+    # Remoções: a resposta traz só os ids, sem depender dos registros
+    app_module.db.session.execute(app_module.SyncAlteracao.__table__.insert().values(
+        id=seq, user_id=user_id, entidade='produtos', registro_id=100 + seq,
+        removido=True, alterado_em=alterado_em))
+    app_module.db.session.commit()
+
+
+def _removidos(pagina):
+    return pagina['alteracoes']['produtos']['removidos']
+
+
+def test_pagina_cheia_nao_pula_escritor_sem_commit(user_id):
+    for seq in (1, 2):
+        _gravar(user_id, seq, VELHO)
+    # A sequência 3 está reservada por uma transação ainda aberta
+    for seq in (4, 5, 6):
+        _gravar(user_id, seq, RECENTE)
+
+    pagina = sync_delta.delta(user_id, ['produtos'], limite=3, agora=AGORA)
+    assert _removidos(pagina) == [101, 102, 104]
+    assert pagina['has_more']
+    assert sync_delta.decode_cursor(pagina['cursor'], ['produtos'])[0] == 2
+
+    # O escritor confirma depois das sequências maiores
+    _gravar(user_id, 3, RECENTE)
+    pagina = sync_delta.delta(user_id, ['produtos'], pagina['cursor'], limite=3, agora=AGORA)
+    assert _removidos(pagina) == [103, 104, 105]
+    # Nada com folga para avançar: o cursor fica e o cliente não repete a página
+    assert sync_delta.decode_cursor(pagina['cursor'], ['produtos'])[0] == 2
+    assert not pagina['has_more']
+
+    depois = AGORA + timedelta(minutes=1)
+    pagina = sync_delta.delta(user_id, ['produtos'], pagina['cursor'], limite=10, agora=depois)
+    assert _removidos(pagina) == [103, 104, 105, 106]
+    assert sync_delta.decode_cursor(pagina['cursor'], ['produtos'])[0] == 6
+    assert not pagina['has_more']